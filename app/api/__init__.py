@@ -10,6 +10,30 @@ API路由模块
 
 from .routes import router
 from .work_archive import router as work_archive_router
+from .upload_routes import router as upload_router
+from .image_routes import router as image_router
+from .storage_routes import router as storage_router
+from .document_routes import router as document_router
+from .stats_routes import router as stats_router
+from .gantt_routes import router as gantt_router
 
 # 注册工作档案路由
-router.include_router(work_archive_router, prefix="/work-archive", tags=["work-archive"])
\ No newline at end of file
+router.include_router(work_archive_router, prefix="/work-archive", tags=["work-archive"])
+
+# 注册断点续传上传路由
+router.include_router(upload_router, prefix="/uploads", tags=["uploads"])
+
+# 注册图像瓦片与预览图路由
+router.include_router(image_router, prefix="/images", tags=["images"])
+
+# 注册存储对象访问路由（local / memory 存储后端的预签名地址）
+router.include_router(storage_router, prefix="/storage", tags=["storage"])
+
+# 注册文档全文搜索路由
+router.include_router(document_router, prefix="/documents", tags=["documents"])
+
+# 注册统计路由
+router.include_router(stats_router, prefix="/stats", tags=["stats"])
+
+# 注册甘特图路由
+router.include_router(gantt_router, prefix="/gantt", tags=["gantt"])
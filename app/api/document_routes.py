@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""
+文档全文搜索API路由
+
+- GET /api/documents/search?q=&source=knowledge|archive&page=&limit=
+  在知识体系文件与工作档案本地文档的正文和文件名中搜索，按相关度排序，
+  返回命中位置附近的摘要（HTML转义，命中词以 <mark> 标记）
+
+索引由后台任务维护（见 services/document_index_service），新文件通常在几秒到一个对账周期内可被搜索到。
+
+作者: 王梓涵
+邮箱: wangzh011031@163.com
+时间: 2025年
+"""
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.orm import Session
+from typing import Optional
+import urllib.parse
+
+from ..auth import get_current_user
+from ..core.database import get_db
+from ..models import User
+from ..schemas import ResponseModel
+from ..services import document_index
+
+router = APIRouter()
+
+
+@router.get("/search", response_model=ResponseModel)
+def search_documents(
+    q: str = Query(..., min_length=1, max_length=200, description="搜索词，空格分隔的多个词须同时出现"),
+    source: Optional[str] = Query(None, pattern="^(knowledge|archive)$", description="knowledge 或 archive，不传时都搜索"),
+    page: int = Query(1, ge=1),
+    limit: int = Query(20, ge=1, le=100),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """全文搜索文档（同步函数，在线程池中执行查询）"""
+    # 多取一条判断是否还有下一页，不统计总数
+    items = document_index.search(db, q, source, offset=(page - 1) * limit, limit=limit + 1)
+    has_more = len(items) > limit
+    items = items[:limit]
+    for item in items:
+        if item["source"] == "knowledge":
+            item["id"] = int(item["key"])
+        else:
+            item["url"] = f"/api/work-archive/file?path={urllib.parse.quote(item['key'])}"
+    return ResponseModel(
+        success=True,
+        message="搜索成功",
+        data={"items": items, "page": page, "limit": limit, "has_more": has_more}
+    )
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""
+甘特图API路由
+
+- GET /api/gantt/tasks?start=2025-01-01&end=2025-03-31&offset=0&limit=200
+  与时间窗口重叠的任务（日期按 STATS_TIMEZONE 划分，end 含当天，不传时不限），按创建时间倒序；
+  offset/limit 用于分页或虚拟滚动，total 为窗口内的任务总数（见 services/gantt_service）
+
+响应带 ETag（由响应内容计算），If-None-Match 匹配时返回 304，浏览器按 no-cache 每次回源校验。
+
+作者: 王梓涵
+邮箱: wangzh011031@163.com
+时间: 2025年
+"""
+from datetime import date
+from typing import Optional
+import hashlib
+import json
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from sqlalchemy.orm import Session
+
+from ..auth import get_current_user
+from ..core.database import get_db
+from ..models import User
+from ..services import gantt, timeseries, TimeSeriesError
+from ..services.timeseries_service import day_after
+from ..utils.http_files import etag_matches
+
+router = APIRouter()
+
+
+@router.get("/tasks")
+def get_gantt_tasks(
+    request: Request,
+    start: Optional[date] = Query(None, description="时间窗口开始日期（含）"),
+    end: Optional[date] = Query(None, description="时间窗口结束日期（含）"),
+    offset: int = Query(0, ge=0, description="跳过的任务数"),
+    limit: int = Query(200, ge=1, le=2000, description="返回的任务数"),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """甘特图任务数据：{"total", "offset", "limit", "items": [任务, ...]}"""
+    try:
+        window_end = timeseries.local_midnight(day_after(end)) if end else None
+    except TimeSeriesError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    data = gantt.tasks(
+        db,
+        start=timeseries.local_midnight(start) if start else None,
+        end=window_end,
+        offset=offset,
+        limit=limit
+    )
+    body = json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    etag = f'W/"{hashlib.sha1(body).hexdigest()}"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
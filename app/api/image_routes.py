@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+"""
+图像瓦片与预览图API路由
+
+派生文件按内容摘要寻址、生成后不再改变，因此响应带一年期的 immutable 缓存头；
+接口需要登录，只允许浏览器私有缓存（private），共享缓存与CDN不保存。
+缩略图按需生成受 IMAGE_THUMBNAIL_MAX_PENDING 限制，超出时返回 503 与 Retry-After。
+
+- GET /api/images/{key}/pyramid.dzi                  Deep Zoom 描述（OpenSeadragon 可直接使用）
+- GET /api/images/{key}/pyramid_files/{level}/{col}_{row}.jpg
+                                                     瓦片（Deep Zoom 约定的地址，OpenSeadragon 按 .dzi 地址推算）
+- GET /api/images/{key}/pyramid.json                 金字塔描述与访问地址
+- GET /api/images/{key}/tiles/{level}/{col}_{row}.jpg 瓦片
+- GET /api/images/{key}/previews/{size}.jpg          固定尺寸预览图
+- GET /api/images/thumbnail?src=|path=&size=         缩略图（按 Accept 选择 AVIF/WebP，不存在时按需生成）
+
+作者: 王梓涵
+邮箱: wangzh011031@163.com
+时间: 2025年
+"""
+from fastapi import APIRouter, Depends, HTTPException, Path, Query, Request, Response
+from pathlib import Path as FilePath
+from typing import Optional
+import asyncio
+import json
+import logging
+
+from ..auth import get_current_user
+from ..core.config import settings
+from ..services import async_file_service, file_service, image_service, StorageTimeoutError
+from ..services.image_service import image_api_urls
+from ..utils.http_files import etag_matches
+from ..utils.image_thumbnails import (
+    THUMBNAIL_MIME, available_formats, is_thumbnailable, local_derived_key, thumbnail_object_name
+)
+from ..utils.image_tiles import PYRAMID_DESCRIPTOR, TILE_FORMAT, derived_key, derived_prefix
+from .work_archive import ALLOWED_ROOTS, PROJECT_ROOT, is_inside
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(dependencies=[Depends(get_current_user)])
+
+IMMUTABLE_CACHE = "private, max-age=31536000, immutable"
+# 缩略图生成繁忙时建议客户端等待的秒数
+THUMBNAIL_RETRY_AFTER = 5
+KEY_PATTERN = r"^[0-9a-f]{64}$"
+
+
+async def _load(object_name: str, bucket_name: Optional[str] = None, missing_ok: bool = False) -> Optional[dict]:
+    try:
+        stored = await async_file_service.get_object(object_name, bucket_name)
+    except StorageTimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    if stored is None and not missing_ok:
+        raise HTTPException(status_code=404, detail="文件不存在")
+    return stored
+
+
+def _cached_response(request: Request, content: bytes, etag: str, media_type: str) -> Response:
+    etag = f'"{etag}"'
+    headers = {"Cache-Control": IMMUTABLE_CACHE, "ETag": etag}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=content, media_type=media_type, headers=headers)
+
+
+async def _load_descriptor(key: str) -> dict:
+    stored = await _load(f"{derived_prefix(key)}/{PYRAMID_DESCRIPTOR}")
+    return json.loads(stored["data"])
+
+
+@router.get("/thumbnail")
+async def get_thumbnail(
+    request: Request,
+    src: Optional[str] = Query(None, description="对象存储文件地址"),
+    path: Optional[str] = Query(None, description="工作档案本地文件相对路径"),
+    size: int = Query(..., description="缩略图长边像素"),
+    v: Optional[int] = Query(None, description="本地文件修改时间（纳秒），用于缓存失效")
+):
+    """缩略图；尚未生成时在图像处理进程池中按需生成"""
+    if size not in settings.IMAGE_THUMBNAIL_SIZES:
+        raise HTTPException(status_code=400, detail="不支持的缩略图尺寸")
+
+    source_path = object_name = None
+    cache_control = IMMUTABLE_CACHE
+    if src:
+        location = file_service.parse_file_url(src)
+        if location is None or location[0] not in (settings.MINIO_BUCKET, "knowledge-files"):
+            raise HTTPException(status_code=400, detail="不支持的文件地址")
+        bucket, object_name = location
+        if not is_thumbnailable(object_name):
+            raise HTTPException(status_code=400, detail="该文件类型不支持缩略图")
+        key = derived_key(bucket, object_name)
+    elif path:
+        file_path = (PROJECT_ROOT / path).resolve()
+        if not any(is_inside(root, file_path) for root in ALLOWED_ROOTS.values()):
+            raise HTTPException(status_code=400, detail="Illegal file path.")
+        if not file_path.is_file() or not is_thumbnailable(file_path.name):
+            raise HTTPException(status_code=404, detail="File not found.")
+        st = file_path.stat()
+        # 派生文件写入默认存储桶，key 随文件修改时间与大小变化
+        bucket, source_path = settings.MINIO_BUCKET, str(file_path)
+        key = local_derived_key(FilePath(path).as_posix(), st.st_mtime_ns, st.st_size)
+        if v != st.st_mtime_ns:
+            cache_control = "no-cache"
+    else:
+        raise HTTPException(status_code=400, detail="缺少 src 或 path 参数")
+
+    formats = available_formats()
+    fmt = "avif" if "avif" in formats and "image/avif" in request.headers.get("accept", "") else "webp"
+    name = thumbnail_object_name(key, size, fmt)
+
+    stored = await _load(name, bucket, missing_ok=True)
+    if stored is None:
+        if not image_service.can_build_thumbnail(key):
+            raise HTTPException(status_code=503, detail="缩略图生成繁忙，请稍后重试",
+                                headers={"Retry-After": str(THUMBNAIL_RETRY_AFTER)})
+        try:
+            await image_service.build_thumbnails(bucket, key, object_name=object_name, source_path=source_path)
+            stored = await async_file_service.get_object(name, bucket)
+        except (StorageTimeoutError, asyncio.TimeoutError) as e:
+            raise HTTPException(status_code=504, detail=str(e) or "生成缩略图超时")
+        except Exception as e:
+            logger.error(f"生成缩略图失败 {src or path}: {e}")
+            raise HTTPException(status_code=404, detail="无法生成缩略图")
+    if stored is None:
+        raise HTTPException(status_code=404, detail="无法生成缩略图")
+
+    response = _cached_response(request, stored["data"], stored["etag"], THUMBNAIL_MIME[fmt])
+    response.headers["Cache-Control"] = cache_control
+    response.headers["Vary"] = "Accept"
+    return response
+
+
+@router.get("/{key}/pyramid.dzi")
+async def get_pyramid_dzi(request: Request, key: str = Path(..., pattern=KEY_PATTERN)):
+    """Deep Zoom 描述文件"""
+    descriptor = await _load_descriptor(key)
+    xml = (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        f'<Image xmlns="http://schemas.microsoft.com/deepzoom/2008" Format="{descriptor["tile_format"]}" '
+        f'Overlap="{descriptor["overlap"]}" TileSize="{descriptor["tile_size"]}">'
+        f'<Size Width="{descriptor["width"]}" Height="{descriptor["height"]}"/></Image>'
+    )
+    return _cached_response(request, xml.encode("utf-8"), f"dzi-{key}", "application/xml")
+
+
+@router.get("/{key}/pyramid.json")
+async def get_pyramid_descriptor(request: Request, key: str = Path(..., pattern=KEY_PATTERN)):
+    """金字塔描述与访问地址"""
+    descriptor = await _load_descriptor(key)
+    content = json.dumps(image_api_urls(descriptor), ensure_ascii=False).encode("utf-8")
+    return _cached_response(request, content, f"json-{key}", "application/json")
+
+
+@router.get("/{key}/tiles/{level}/{tile}")
+async def get_tile(
+    request: Request,
+    key: str = Path(..., pattern=KEY_PATTERN),
+    level: int = Path(..., ge=0, le=40),
+    tile: str = Path(..., pattern=rf"^\d+_\d+\.{TILE_FORMAT}$")
+):
+    """瓦片"""
+    return await _tile_response(request, key, level, tile)
+
+
+@router.get("/{key}/pyramid_files/{level}/{tile}")
+async def get_dzi_tile(
+    request: Request,
+    key: str = Path(..., pattern=KEY_PATTERN),
+    level: int = Path(..., ge=0, le=40),
+    tile: str = Path(..., pattern=rf"^\d+_\d+\.{TILE_FORMAT}$")
+):
+    """瓦片（Deep Zoom 地址：OpenSeadragon 从 pyramid.dzi 推算出 pyramid_files/{level}/{col}_{row}.jpg）"""
+    return await _tile_response(request, key, level, tile)
+
+
+async def _tile_response(request: Request, key: str, level: int, tile: str) -> Response:
+    stored = await _load(f"{derived_prefix(key)}/tiles/{level}/{tile}")
+    return _cached_response(request, stored["data"], stored["etag"], "image/jpeg")
+
+
+@router.get("/{key}/previews/{size}.jpg")
+async def get_preview(
+    request: Request,
+    key: str = Path(..., pattern=KEY_PATTERN),
+    size: int = Path(..., gt=0)
+):
+    """固定尺寸预览图"""
+    stored = await _load(f"{derived_prefix(key)}/previews/{size}.jpg")
+    return _cached_response(request, stored["data"], stored["etag"], "image/jpeg")
@@ -6,111 +6,198 @@ API路由扩展
 邮箱: wangzh011031@163.com
 时间: 2025年
 """
-from fastapi import APIRouter, Depends, HTTPException, status, Form as FormField, UploadFile, File, Request
+from fastapi import APIRouter, Depends, HTTPException, status, Form as FormField, UploadFile, File, Request, Query, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from sqlalchemy import desc, and_, or_, String
-from typing import List, Optional
+from typing import Dict, Iterator, List, Optional
 from uuid import UUID
+from datetime import datetime
+import base64
+import binascii
 import json
 
-from ..core.database import get_db
+from ..core.config import settings
+from ..core.database import get_db, SessionLocal
 from ..models import *
 from ..schemas import *
 from ..auth import *
-from ..services import file_service
+from ..services import file_service, async_file_service, image_service, object_index, storage_gc, document_index, dashboard_cache, FileTooLargeError, StorageTimeoutError
+from ..services.object_index_service import CATEGORY_EXTS, folder_tree
+from ..utils.multipart_stream import StreamingMultipartReader, MultipartStreamError
+from ..utils.image_thumbnails import is_thumbnailable, thumbnail_url
+from ..utils.file_search import FileFilter, parse_exts, stream_results, wants_event_stream
+from .work_archive import archive_tree
 from sqlalchemy import func
 
 router = APIRouter(prefix="/api")
 
+# 修复表单中允许上传的文件字段（另有任意数量的 image_file_N）
+FORM_FILE_FIELDS = ("image_desc_file", "opinion_file", "attachment_file")
+
+# create_form 手动解析请求体，字段在 OpenAPI 中单独声明
+FORM_REQUEST_BODY = {
+    "required": True,
+    "content": {
+        "multipart/form-data": {
+            "schema": {
+                "type": "object",
+                "required": ["workflow_id"],
+                "properties": {
+                    "workflow_id": {"type": "string", "format": "uuid",
+                                    "description": "工作流ID，必须位于所有文件字段之前"},
+                    "image_desc": {"type": "string", "description": "图片描述"},
+                    "restoration_opinion": {"type": "string", "description": "修复意见"},
+                    "opinion_tags": {"type": "string", "description": "意见标签：JSON数组字符串或逗号分隔"},
+                    "remark": {"type": "string", "description": "备注"},
+                    "image_file_0": {"type": "string", "format": "binary",
+                                     "description": "图片文件，image_file_0、image_file_1 … 任意数量，按字段顺序保存"},
+                    "image_desc_file": {"type": "string", "format": "binary", "description": "图片描述文件"},
+                    "opinion_file": {"type": "string", "format": "binary", "description": "修复意见文件"},
+                    "attachment_file": {"type": "string", "format": "binary", "description": "附件"}
+                },
+                "patternProperties": {
+                    "^image_file_[0-9]+$": {"type": "string", "format": "binary"}
+                }
+            }
+        }
+    }
+}
+
+
+def form_file_urls(form: Form) -> List[str]:
+    """表单引用的全部文件地址，每次上传对应一项（同一文件上传两次出现两次）"""
+    if form.image_meta:
+        urls = [meta.get("url") for meta in form.image_meta]
+    else:
+        urls = json.loads(form.image_url) if form.image_url else []
+    urls += [form.image_desc_file, form.opinion_file, form.attachment]
+    return [url for url in urls if url]
+
+
+def form_response(form: Form) -> FormResponse:
+    """
+    表单响应：文件地址转换为短期有效的预签名下载地址，浏览器直接从存储下载，不经过本应用
+    缩略图地址按数据库中保存的原始地址生成（不含签名，便于缓存）
+    """
+    presign = file_service.presign_file_url
+    image_meta = None
+    if form.image_meta:
+        image_meta = []
+        for meta in form.image_meta:
+            url = meta.get("url")
+            if url:
+                meta = dict(meta, url=presign(url))
+                if not meta.get("thumbnail_url") and is_thumbnailable(meta.get("filename") or url):
+                    meta["thumbnail_url"] = thumbnail_url(url)
+            image_meta.append(meta)
+    return FormResponse(
+        form_id=form.form_id,
+        workflow_id=form.workflow_id,
+        step_no=form.step_no,
+        submitter_name=form.submitter.full_name,
+        image_url=[presign(url) for url in json.loads(form.image_url)] if form.image_url else None,
+        image_meta=image_meta,
+        image_desc=form.image_desc,
+        image_desc_file=presign(form.image_desc_file) if form.image_desc_file else None,
+        restoration_opinion=form.restoration_opinion,
+        opinion_tags=form.opinion_tags,
+        opinion_file=presign(form.opinion_file) if form.opinion_file else None,
+        remark=form.remark,
+        attachment=presign(form.attachment) if form.attachment else None,
+        created_at=form.created_at
+    )
+
+
 # 修复表单API
-@router.post("/forms", response_model=FormResponse)
+@router.post("/forms", response_model=FormResponse, openapi_extra={"requestBody": FORM_REQUEST_BODY})
 async def create_form(
-    workflow_id: UUID = FormField(...),
-    image_desc: Optional[str] = FormField(None),
-    restoration_opinion: Optional[str] = FormField(None),
-    opinion_tags: Optional[str] = FormField(None),  # JSON字符串
-    remark: Optional[str] = FormField(None),
-    image_desc_file: Optional[UploadFile] = File(None),
-    opinion_file: Optional[UploadFile] = File(None),
-    attachment_file: Optional[UploadFile] = File(None),
+    request: Request,
     current_user: User = Depends(require_restorer),
-    db: Session = Depends(get_db),
-    request: Request = None
+    db: Session = Depends(get_db)
 ):
-    """创建修复表单"""
+    """
+    创建修复表单
+    
+    multipart/form-data 字段：workflow_id、image_desc、restoration_opinion、opinion_tags（JSON字符串）、remark；
+    文件字段：image_file_N（任意数量，按字段顺序保存）、image_desc_file、opinion_file、attachment_file。
+    请求体只读取一次，文件分片边接收边写入MinIO，不落临时文件。
+    workflow_id 必须位于文件字段之前：收到第一个文件时先校验工作流与权限，校验失败时不写入任何文件。
+    """
+    checked = {}
+    
+    def load_workflow(fields: dict) -> Workflow:
+        """校验工作流存在且当前用户有权提交（只有工作流发起人或管理员可以提交表单）"""
+        if "workflow" not in checked:
+            try:
+                workflow_id = UUID(fields.get("workflow_id", ""))
+            except ValueError:
+                raise HTTPException(status_code=400, detail="无效的工作流ID格式")
+            workflow = db.query(Workflow).filter(Workflow.workflow_id == workflow_id).first()
+            if not workflow:
+                raise HTTPException(status_code=404, detail="工作流不存在")
+            if current_user.role.role_key != 'admin' and workflow.initiator_id != current_user.user_id:
+                raise HTTPException(status_code=403, detail="无权限操作此工作流")
+            checked["workflow"] = workflow
+        return checked["workflow"]
+    
+    async def store_part(part):
+        # 空的文件输入框和未知的文件字段直接丢弃
+        if not part.filename:
+            return None
+        if not (part.field_name.startswith('image_file_') or part.field_name in FORM_FILE_FIELDS):
+            return None
+        if "workflow_id" not in reader.fields:
+            raise HTTPException(status_code=400, detail="workflow_id 字段必须位于文件之前")
+        load_workflow(reader.fields)
+        return await async_file_service.upload_chunks(part.chunks(), part.filename, part.content_type)
+    
+    reader = StreamingMultipartReader(
+        request.headers,
+        request.stream(),
+        max_concurrency=settings.FORM_UPLOAD_CONCURRENCY
+    )
+    committed = False
     
     try:
-        # 检查工作流是否存在
-        workflow = db.query(Workflow).filter(Workflow.workflow_id == workflow_id).first()
-        if not workflow:
-            raise HTTPException(status_code=404, detail="工作流不存在")
+        fields, parts = await reader.read(store_part)
         
-        # 检查权限（只有工作流发起人或管理员可以提交表单）
-        if current_user.role.role_key != 'admin' and workflow.initiator_id != current_user.user_id:
-            raise HTTPException(status_code=403, detail="无权限操作此工作流")
+        # 解析文本字段（没有文件时工作流在这里校验）
+        workflow = load_workflow(fields)
+        workflow_id = workflow.workflow_id
+        image_desc = fields.get("image_desc")
+        restoration_opinion = fields.get("restoration_opinion")
+        opinion_tags = fields.get("opinion_tags")
+        remark = fields.get("remark")
         
         # 获取下一个步骤号
         max_step = db.query(func.max(Form.step_no)).filter(Form.workflow_id == workflow_id).scalar()
         next_step = (max_step or 0) + 1
         
-        # 处理文件上传
+        # 整理已上传的文件（图片按字段顺序）
         image_urls = []
-        image_desc_file_url = None
-        opinion_file_url = None
-        attachment_url = None
         image_meta = []
+        named_urls = {}
+        for part in parts:
+            stored = part.result
+            if stored is None:
+                continue
+            if part.field_name.startswith('image_file_'):
+                image_urls.append(stored["url"])
+                # 图片元数据 - 存储为 JSONB 对象
+                image_meta.append({
+                    "filename": part.filename,
+                    "size": stored["size"],
+                    "content_type": part.content_type,
+                    "url": stored["url"],
+                    "sha256": stored["sha256"]
+                })
+            else:
+                named_urls[part.field_name] = stored["url"]
         
-        # 处理多张图片文件 - 从 request.form() 获取额外的图片文件
-        if request:
-            form_data = await request.form()
-            image_files = []
-            
-            # 收集所有图片文件
-            for key, value in form_data.items():
-                if key.startswith('image_file_') and hasattr(value, 'filename'):
-                    image_files.append(value)
-            
-            # 上传每张图片
-            for image_file in image_files:
-                if image_file:
-                    image_content = await image_file.read()
-                    image_url = file_service.upload_file(
-                        file_content=image_content,
-                        filename=image_file.filename,
-                        content_type=image_file.content_type
-                    )
-                    image_urls.append(image_url)
-                    # 图片元数据 - 存储为 JSONB 对象
-                    image_meta.append({
-                        "filename": image_file.filename,
-                        "size": len(image_content),
-                        "content_type": image_file.content_type,
-                        "url": image_url
-                    })
-        
-        if image_desc_file:
-            desc_content = await image_desc_file.read()
-            image_desc_file_url = file_service.upload_file(
-                file_content=desc_content,
-                filename=image_desc_file.filename,
-                content_type=image_desc_file.content_type
-            )
-        
-        if opinion_file:
-            opinion_content = await opinion_file.read()
-            opinion_file_url = file_service.upload_file(
-                file_content=opinion_content,
-                filename=opinion_file.filename,
-                content_type=opinion_file.content_type
-            )
-        
-        if attachment_file:
-            attachment_content = await attachment_file.read()
-            attachment_url = file_service.upload_file(
-                file_content=attachment_content,
-                filename=attachment_file.filename,
-                content_type=attachment_file.content_type
-            )
+        image_desc_file_url = named_urls.get("image_desc_file")
+        opinion_file_url = named_urls.get("opinion_file")
+        attachment_url = named_urls.get("attachment_file")
         
         # 处理标签
         tags_list = None
@@ -146,6 +233,7 @@ async def create_form(
         
         db.commit()
         db.refresh(form)
+        committed = True
         
         # 记录操作日志
         log = StepLog(
@@ -156,25 +244,29 @@ async def create_form(
         )
         db.add(log)
         db.commit()
+        await dashboard_cache.invalidate()
         
-        return FormResponse(
-            form_id=form.form_id,
-            workflow_id=form.workflow_id,
-            step_no=form.step_no,
-            submitter_name=form.submitter.full_name,
-            image_url=json.loads(form.image_url) if form.image_url else None,
-            image_meta=form.image_meta if form.image_meta else None,
-            image_desc=form.image_desc,
-            image_desc_file=form.image_desc_file,
-            restoration_opinion=form.restoration_opinion,
-            opinion_tags=form.opinion_tags,
-            opinion_file=form.opinion_file,
-            remark=form.remark,
-            attachment=form.attachment,
-            created_at=form.created_at
-        )
-    
+        # 后台生成图片瓦片金字塔与预览图
+        image_service.schedule_form_images(form.form_id, form.image_meta)
+        
+        return form_response(form)
+    
+    except (HTTPException, MultipartStreamError, FileTooLargeError) as e:
+        # 表单未保存时清理本次已写入存储的文件，避免产生孤儿对象
+        if not committed:
+            await async_file_service.delete_objects(reader.completed_results())
+        if isinstance(e, MultipartStreamError):
+            raise HTTPException(status_code=400, detail=str(e))
+        if isinstance(e, FileTooLargeError):
+            raise HTTPException(status_code=413, detail="文件大小超过限制")
+        raise
+    except StorageTimeoutError as e:
+        if not committed:
+            await async_file_service.delete_objects(reader.completed_results())
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
+        if not committed:
+            await async_file_service.delete_objects(reader.completed_results())
         print(f"创建表单时发生错误: {e}")
         import traceback
         traceback.print_exc()
@@ -203,22 +295,7 @@ async def get_workflow_forms(
     ).order_by(Form.step_no).all()
     
     return [
-        FormResponse(
-            form_id=f.form_id,
-            workflow_id=f.workflow_id,
-            step_no=f.step_no,
-            submitter_name=f.submitter.full_name,
-            image_url=json.loads(f.image_url) if f.image_url else None,
-            image_meta=f.image_meta if f.image_meta else None,
-            image_desc=f.image_desc,
-            image_desc_file=f.image_desc_file,
-            restoration_opinion=f.restoration_opinion,
-            opinion_tags=f.opinion_tags,
-            opinion_file=f.opinion_file,
-            remark=f.remark,
-            attachment=f.attachment,
-            created_at=f.created_at
-        ) for f in forms
+        form_response(f) for f in forms
     ]
 
 # 工作流最终化
@@ -263,6 +340,7 @@ async def finalize_workflow(
     db.add(log)
     
     db.commit()
+    await dashboard_cache.invalidate()
     
     return ResponseModel(
         success=True,
@@ -296,12 +374,15 @@ async def create_evaluation(
     support_file_url = None
     if support_file and support_file.filename:
         try:
-            file_content = await support_file.read()
-            support_file_url = file_service.upload_file(
-                file_content=file_content,
+            support_file_url = (await async_file_service.upload_stream(
+                support_file.file,
                 filename=support_file.filename,
                 content_type=support_file.content_type
-            )
+            ))["url"]
+        except FileTooLargeError:
+            raise HTTPException(status_code=413, detail="文件大小超过限制")
+        except StorageTimeoutError as e:
+            raise HTTPException(status_code=504, detail=str(e))
         except Exception as e:
             raise HTTPException(status_code=500, detail="文件上传失败")
     
@@ -331,6 +412,7 @@ async def create_evaluation(
     
     db.add(evaluation)
     db.commit()
+    await dashboard_cache.invalidate()
     db.refresh(evaluation)
     
     return EvaluationResponse(
@@ -467,12 +549,15 @@ async def create_rollback_request(
     support_file_url = None
     if support_file:
         try:
-            file_content = await support_file.read()
-            support_file_url = file_service.upload_file(
-                file_content=file_content,
+            support_file_url = (await async_file_service.upload_stream(
+                support_file.file,
                 filename=support_file.filename,
                 content_type=support_file.content_type
-            )
+            ))["url"]
+        except FileTooLargeError:
+            raise HTTPException(status_code=413, detail="文件大小超过限制")
+        except StorageTimeoutError as e:
+            raise HTTPException(status_code=504, detail=str(e))
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"文件上传失败: {str(e)}")
     
@@ -504,6 +589,7 @@ async def create_rollback_request(
     
     db.add(rollback_request)
     db.commit()
+    await dashboard_cache.invalidate()
     db.refresh(rollback_request)
     
     return RollbackRequestResponse(
@@ -585,6 +671,9 @@ async def approve_rollback_request(
             db.commit()
             db.refresh(new_form)
             
+            # 回溯表单与原表单共享文件，增加引用避免删除其一时文件被移除
+            await async_file_service.retain_file_urls(form_file_urls(new_form))
+            
             # 记录操作日志
             log = StepLog(
                 form_id=new_form.form_id,
@@ -600,6 +689,7 @@ async def approve_rollback_request(
     rollback_request.approved_at = func.now()
     
     db.commit()
+    await dashboard_cache.invalidate()
     
     return ResponseModel(
         success=True,
@@ -723,22 +813,7 @@ async def admin_get_all_forms(
     forms = query.order_by(desc(Form.created_at)).all()
     
     return [
-        FormResponse(
-            form_id=f.form_id,
-            workflow_id=f.workflow_id,
-            step_no=f.step_no,
-            submitter_name=f.submitter.full_name,
-            image_url=json.loads(f.image_url) if f.image_url else None,
-            image_meta=f.image_meta if f.image_meta else None,
-            image_desc=f.image_desc,
-            image_desc_file=f.image_desc_file,
-            restoration_opinion=f.restoration_opinion,
-            opinion_tags=f.opinion_tags,
-            opinion_file=f.opinion_file,
-            remark=f.remark,
-            attachment=f.attachment,
-            created_at=f.created_at
-        ) for f in forms
+        form_response(f) for f in forms
     ]
 
 @router.put("/admin/forms/{form_id}", response_model=FormResponse)
@@ -778,24 +853,10 @@ async def admin_update_form(
     db.add(log)
     
     db.commit()
+    await dashboard_cache.invalidate()
     db.refresh(form)
     
-    return FormResponse(
-        form_id=form.form_id,
-        workflow_id=form.workflow_id,
-        step_no=form.step_no,
-        submitter_name=form.submitter.full_name,
-        image_url=json.loads(form.image_url) if form.image_url else None,
-        image_meta=form.image_meta if form.image_meta else None,
-        image_desc=form.image_desc,
-        image_desc_file=form.image_desc_file,
-        restoration_opinion=form.restoration_opinion,
-        opinion_tags=form.opinion_tags,
-        opinion_file=form.opinion_file,
-        remark=form.remark,
-        attachment=form.attachment,
-        created_at=form.created_at
-    )
+    return form_response(form)
 
 @router.delete("/admin/forms/{form_id}")
 async def admin_delete_form(
@@ -813,6 +874,8 @@ async def admin_delete_form(
     if form_count == 1:
         raise HTTPException(status_code=400, detail="无法删除工作流的唯一表单")
     
+    file_urls = form_file_urls(form)
+    
     # 删除相关的操作日志
     db.query(StepLog).filter(StepLog.form_id == form_id).delete()
     
@@ -829,6 +892,10 @@ async def admin_delete_form(
     # 删除表单
     db.delete(form)
     db.commit()
+    await dashboard_cache.invalidate()
+    
+    # 释放表单文件的引用（无其他引用的文件从存储中删除）
+    await async_file_service.release_file_urls(file_urls)
     
     return ResponseModel(
         success=True,
@@ -862,9 +929,10 @@ async def delete_rollback_request(
     if rollback_request.status != 'pending':
         raise HTTPException(status_code=400, detail="只能删除待审批的回溯申请")
     
-    # 软删除：设置deleted_at字段
+    # 软删除：设置deleted_at字段（记录仍引用支撑文件，不释放文件引用）
     rollback_request.deleted_at = func.now()
     db.commit()
+    await dashboard_cache.invalidate()
     
     return ResponseModel(
         success=True,
@@ -890,9 +958,10 @@ async def admin_delete_rollback_request(
         raise HTTPException(status_code=404, detail="回溯申请不存在")
     
     # 管理员可以删除任何状态的回溯申请
-    # 软删除：设置deleted_at字段
+    # 软删除：设置deleted_at字段（记录仍引用支撑文件，不释放文件引用）
     rollback_request.deleted_at = func.now()
     db.commit()
+    await dashboard_cache.invalidate()
     
     return ResponseModel(
         success=True,
@@ -928,8 +997,11 @@ async def delete_evaluation(
         raise HTTPException(status_code=400, detail="只能删除24小时内的评估记录")
     
     # 直接删除评估记录
+    file_url = evaluation.evaluation_file
     db.delete(evaluation)
     db.commit()
+    await dashboard_cache.invalidate()
+    await async_file_service.release_file_urls([file_url])
     
     return ResponseModel(
         success=True,
@@ -954,8 +1026,11 @@ async def admin_delete_evaluation(
         raise HTTPException(status_code=404, detail="评估记录不存在")
     
     # 管理员可以删除任何评估记录
+    file_url = evaluation.evaluation_file
     db.delete(evaluation)
     db.commit()
+    await dashboard_cache.invalidate()
+    await async_file_service.release_file_urls([file_url])
     
     return ResponseModel(
         success=True,
@@ -983,13 +1058,14 @@ async def admin_batch_delete_rollback_requests(
     if not rollback_requests:
         raise HTTPException(status_code=404, detail="未找到要删除的回溯申请")
     
-    # 批量软删除
+    # 批量软删除（记录仍引用支撑文件，不释放文件引用）
     deleted_count = 0
     for request in rollback_requests:
         request.deleted_at = func.now()
         deleted_count += 1
     
     db.commit()
+    await dashboard_cache.invalidate()
     
     return BatchDeleteResponse(
         success=True,
@@ -1019,11 +1095,15 @@ async def admin_batch_delete_evaluations(
     
     # 批量删除
     deleted_count = 0
+    file_urls = []
     for evaluation in evaluations:
+        file_urls.append(evaluation.evaluation_file)
         db.delete(evaluation)
         deleted_count += 1
     
     db.commit()
+    await dashboard_cache.invalidate()
+    await async_file_service.release_file_urls(file_urls)
     
     return BatchDeleteResponse(
         success=True,
@@ -1053,6 +1133,7 @@ async def create_knowledge_file(
     
     db.add(knowledge_file)
     db.commit()
+    document_index.notify()
     db.refresh(knowledge_file)
     
     return KnowledgeSystemFileResponse(
@@ -1101,16 +1182,18 @@ async def get_knowledge_files(
     if status:
         query = query.filter(KnowledgeSystemFile.status == status)
     
-    # 关键词搜索
+    # 关键词搜索（同时搜索文件正文的全文索引）
     if keyword:
-        query = query.filter(
-            or_(
-                KnowledgeSystemFile.filename.contains(keyword),
-                KnowledgeSystemFile.unit.contains(keyword),
-                KnowledgeSystemFile.submission_info.contains(keyword),
-                KnowledgeSystemFile.remark.contains(keyword)
-            )
-        )
+        conditions = [
+            KnowledgeSystemFile.filename.contains(keyword),
+            KnowledgeSystemFile.unit.contains(keyword),
+            KnowledgeSystemFile.submission_info.contains(keyword),
+            KnowledgeSystemFile.remark.contains(keyword)
+        ]
+        content_keys = document_index.matching_keys(keyword, "knowledge")
+        if content_keys is not None:
+            conditions.append(KnowledgeSystemFile.id.cast(String).in_(content_keys))
+        query = query.filter(or_(*conditions))
     
     # 获取总数
     total_count = query.count()
@@ -1196,7 +1279,10 @@ async def update_knowledge_file(
         knowledge_file.unit = file_data.unit
     if file_data.filename is not None:
         knowledge_file.filename = file_data.filename
+    replaced_url = None
     if file_data.file_url is not None:
+        if file_data.file_url != knowledge_file.file_url:
+            replaced_url = knowledge_file.file_url
         knowledge_file.file_url = file_data.file_url
     if file_data.file_type is not None:
         knowledge_file.file_type = file_data.file_type
@@ -1210,8 +1296,13 @@ async def update_knowledge_file(
     knowledge_file.updated_at = func.now()
     
     db.commit()
+    document_index.notify()
     db.refresh(knowledge_file)
     
+    # 替换文件后释放旧文件的引用
+    if replaced_url:
+        await async_file_service.release_file_urls([replaced_url])
+    
     return KnowledgeSystemFileResponse(
         id=knowledge_file.id,
         unit=knowledge_file.unit,
@@ -1242,9 +1333,10 @@ async def delete_knowledge_file(
     if not knowledge_file:
         raise HTTPException(status_code=404, detail="文件不存在")
     
-    # 软删除
+    # 软删除（记录仍引用文件，不释放文件引用）
     knowledge_file.deleted_at = func.now()
     db.commit()
+    document_index.notify()
     
     return ResponseModel(
         success=True,
@@ -1271,13 +1363,14 @@ async def batch_delete_knowledge_files(
     if not knowledge_files:
         raise HTTPException(status_code=404, detail="未找到要删除的文件")
     
-    # 批量软删除
+    # 批量软删除（记录仍引用文件，不释放文件引用）
     deleted_count = 0
     for file in knowledge_files:
         file.deleted_at = func.now()
         deleted_count += 1
     
     db.commit()
+    document_index.notify()
     
     return BatchDeleteResponse(
         success=True,
@@ -1297,9 +1390,8 @@ async def upload_knowledge_file(
         raise HTTPException(status_code=400, detail="文件名不能为空")
     
     try:
-        file_content = await file.read()
-        file_url = file_service.upload_file(
-            file_content=file_content,
+        stored = await async_file_service.upload_stream(
+            file.file,
             filename=file.filename,
             content_type=file.content_type,
             bucket_name="knowledge-files"
@@ -1307,25 +1399,176 @@ async def upload_knowledge_file(
         
         return FileUploadResponse(
             filename=file.filename,
-            file_url=file_url,
-            file_size=len(file_content),
+            file_url=stored["url"],
+            file_size=stored["size"],
             content_type=file.content_type
         )
+    except FileTooLargeError:
+        raise HTTPException(status_code=413, detail="文件大小超过限制")
+    except StorageTimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"文件上传失败: {str(e)}")
 
-# 工作档案API（用于WorkArchive页面）
-@router.get("/work-archive/folders")
-async def get_work_archive_folders(
+# 文件访问API
+@router.post("/files/presign")
+async def presign_file_urls(
+    payload: FileUrlPresignRequest,
+    current_user: User = Depends(get_current_user)
+):
+    """把数据库中保存的文件地址批量转换为短期有效的预签名下载地址"""
+    if len(payload.urls) > 500:
+        raise HTTPException(status_code=400, detail="单次最多转换500个地址")
+    
+    allowed_buckets = {settings.MINIO_BUCKET, "knowledge-files"}
+    urls = {}
+    for url in payload.urls:
+        location = file_service.parse_file_url(url)
+        if location is None or location[0] not in allowed_buckets:
+            urls[url] = None
+            continue
+        urls[url] = file_service.presigned_get_url(location[1], location[0])
+    
+    return {"urls": urls, "expires_in": settings.PRESIGNED_GET_EXPIRE}
+
+# 存储维护API
+@router.post("/admin/storage/gc")
+async def run_storage_gc(
+    dry_run: bool = Query(default=True, description="只统计可回收的对象与空间，不删除"),
+    current_user: User = Depends(require_admin)
+):
+    """清理数据库不再引用的存储对象（默认试运行）"""
+    report = await storage_gc.run(dry_run=dry_run, archive_tree=archive_tree)
+    if report is None:
+        raise HTTPException(status_code=409, detail="已有清理任务正在执行")
+    return ResponseModel(
+        success=True,
+        message="试运行完成" if dry_run else f"已删除 {report['deleted']} 个对象",
+        data=report
+    )
+
+@router.get("/admin/storage/gc")
+def get_storage_gc_report(current_user: User = Depends(require_admin)):
+    """最近一次孤儿对象清理的报告"""
+    return ResponseModel(success=True, message="获取成功", data=storage_gc.last_report())
+
+@router.get("/admin/dashboard/cache")
+async def get_dashboard_cache_metrics(current_user: User = Depends(require_admin)):
+    """仪表板统计缓存的命中率与数据时长（本进程）"""
+    return ResponseModel(success=True, message="获取成功", data=dashboard_cache.metrics())
+
+# 知识库存档API（knowledge-files 存储桶的目录浏览）
+# 本地工作档案目录（doc/img/static）由 work_archive 路由提供（/work-archive/*），两者路径不能重叠
+def archive_file_filter(file_type: Optional[str]) -> tuple:
+    """file_type 参数 → (分类, 扩展名列表)；支持分类名（image）或逗号分隔的扩展名（jpg,png）"""
+    if not file_type:
+        return None, None
+    if file_type in CATEGORY_EXTS:
+        return file_type, None
+    return None, parse_exts(file_type)
+
+def original_name_matches(db: Session, bucket: str, keyword: Optional[str]) -> Dict[str, str]:
+    """
+    原始文件名包含关键词的内容寻址对象：{对象名: 原始文件名}
+    内容寻址对象（sha256/…）的 name 是摘要，关键词要按知识体系文件记录中的原始文件名匹配
+    """
+    if not keyword:
+        return {}
+    matches = {}
+    for file_url, filename in db.query(KnowledgeSystemFile.file_url, KnowledgeSystemFile.filename).filter(
+        KnowledgeSystemFile.filename.icontains(keyword, autoescape=True)
+    ):
+        location = file_service.parse_file_url(file_url)
+        if location is not None and location[0] == bucket and location[1].startswith("sha256/"):
+            matches[location[1]] = filename
+    return matches
+
+def archive_file_matcher(keyword: Optional[str], category: Optional[str], exts: Optional[List[str]],
+                         original_names: Optional[Dict[str, str]] = None):
+    """列举存储桶时逐个应用的筛选条件；original_names 见 original_name_matches"""
+    if not (keyword or category or exts):
+        return None
+    keyword = keyword.lower() if keyword else None
+    original_names = original_names or {}
+    def match(file: dict) -> bool:
+        if keyword and keyword not in file["name"].lower() and file["path"] not in original_names:
+            return False
+        if category and file["category"] != category:
+            return False
+        return not exts or file["ext"] in exts
+    return match
+
+def encode_archive_cursor(path: str) -> str:
+    """分页游标：上一页最后一个对象名（URL安全的Base64）"""
+    return base64.urlsafe_b64encode(path.encode("utf-8")).decode("ascii").rstrip("=")
+
+def decode_archive_cursor(cursor: Optional[str]) -> Optional[str]:
+    if not cursor:
+        return None
+    try:
+        return base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("utf-8")
+    except (binascii.Error, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="无效的分页游标")
+
+def archive_file_info(item: IndexedObject) -> dict:
+    """目录索引行 → 工作档案文件信息"""
+    return {
+        "name": item.name,
+        "path": item.path,
+        "ext": item.ext,
+        "size": item.size,
+        "mtime": item.mtime.isoformat() if item.mtime else None,
+        "category": item.category,
+        "url": file_service.presigned_get_url(item.path, item.bucket),
+        "thumbnail_url": thumbnail_url(file_service.get_file_url(item.path, item.bucket))
+        if is_thumbnailable(item.name) else None
+    }
+
+def with_original_names(db: Session, bucket: str, files: List[dict]) -> List[dict]:
+    """内容寻址对象（sha256/…）的文件名替换为知识体系文件记录中保存的原始文件名（每页一次查询）"""
+    urls = {file_service.get_file_url(f["path"], bucket): f["path"] for f in files if f["path"].startswith("sha256/")}
+    if not urls:
+        return files
+    names = {
+        urls[url]: filename
+        for url, filename in db.query(KnowledgeSystemFile.file_url, KnowledgeSystemFile.filename).filter(
+            KnowledgeSystemFile.file_url.in_(list(urls))
+        )
+        if filename
+    }
+    return [dict(f, name=names[f["path"]]) if f["path"] in names else f for f in files]
+
+def iter_with_original_names(bucket: str, files: Iterator[dict], batch_size: int = 100) -> Iterator[dict]:
+    """流式输出时按批替换原始文件名（使用独立会话：流式响应期间请求的会话可能已关闭）"""
+    db = SessionLocal()
+    try:
+        batch = []
+        for file in files:
+            batch.append(file)
+            if len(batch) >= batch_size:
+                yield from with_original_names(db, bucket, batch)
+                batch = []
+        yield from with_original_names(db, bucket, batch)
+    finally:
+        db.close()
+        close = getattr(files, "close", None)
+        if close is not None:
+            close()
+
+@router.get("/knowledge-archive/folders")
+async def get_knowledge_archive_folders(
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """获取工作档案文件夹结构 - 从MinIO knowledge-files桶获取"""
+    """获取知识库存档文件夹结构 - 优先查询目录索引，未建立索引时从MinIO knowledge-files桶获取"""
+    
+    if object_index.is_ready(db, "knowledge-files"):
+        return folder_tree(object_index.list_folders(db, "knowledge-files"))
     
     try:
         # 从MinIO获取knowledge-files桶的目录结构
         bucket_name = "knowledge-files"
-        directory_structure = file_service.get_directory_structure(bucket_name)
+        directory_structure = await async_file_service.get_directory_structure(bucket_name)
         
         # 构建树形结构
         folder_structure = []
@@ -1368,65 +1611,55 @@ async def get_work_archive_folders(
         
         return folder_structure
 
-@router.get("/work-archive/files")
-async def get_work_archive_files(
+@router.get("/knowledge-archive/files")
+async def get_knowledge_archive_files(
+    response: Response,
     dir: Optional[str] = None,
     keyword: Optional[str] = None,
     file_type: Optional[str] = None,
+    cursor: Optional[str] = Query(default=None, description="上一页响应头 X-Next-Cursor 的值"),
+    offset: int = Query(default=0, ge=0),
+    limit: Optional[int] = Query(default=None, ge=1, le=1000),
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """获取工作档案文件列表 - 从MinIO knowledge-files桶获取"""
+    """
+    获取知识库存档文件列表 - 优先查询目录索引，未建立索引时从MinIO knowledge-files桶获取
+    
+    指定 limit 时分页返回，下一页的 cursor 见 X-Next-Cursor 响应头（最后一页没有该响应头）；
+    筛选条件在列举过程中应用，取满一页即返回。
+    """
+    bucket_name = "knowledge-files"
+    category, exts = archive_file_filter(file_type)
+    after = decode_archive_cursor(cursor)
+    original_names = original_name_matches(db, bucket_name, keyword)
+    
+    if object_index.is_ready(db, bucket_name):
+        items, total = object_index.list_files(
+            db, bucket_name, directory=dir, keyword=keyword, category=category, exts=exts,
+            offset=offset, limit=limit + 1 if limit else None, after=after, keyword_paths=list(original_names)
+        )
+        if limit and len(items) > limit:
+            items = items[:limit]
+            response.headers["X-Next-Cursor"] = encode_archive_cursor(items[-1].path)
+        response.headers["X-Total-Count"] = str(total)
+        return with_original_names(db, bucket_name, [archive_file_info(item) for item in items])
     
     try:
-        # 从MinIO获取knowledge-files桶的文件列表
-        bucket_name = "knowledge-files"
-        
-        if dir:
-            # 获取指定目录下的文件
-            files = file_service.get_files_in_directory(dir, bucket_name)
-        else:
-            # 获取所有文件
-            directory_structure = file_service.get_directory_structure(bucket_name)
-            files = directory_structure["files"]
-        
-        # 应用筛选条件
-        filtered_files = []
-        
-        for file in files:
-            # 关键词搜索
-            if keyword:
-                if keyword.lower() not in file["name"].lower():
-                    continue
-            
-            # 文件类型筛选
-            if file_type:
-                # 将前端分类映射到文件扩展名
-                type_mapping = {
-                    'image': ['.jpg', '.jpeg', '.png', '.gif', '.webp', '.svg', '.tif', '.tiff'],
-                    'video': ['.mp4', '.mov', '.avi', '.mkv', '.webm', '.m4v'],
-                    'document': ['.pdf', '.doc', '.docx', '.txt', '.md', '.caj'],
-                    'code': ['.js', '.ts', '.vue', '.html', '.css', '.json', '.yaml', '.yml', '.py']
-                }
-                
-                if file_type in type_mapping:
-                    if file["ext"] not in type_mapping[file_type]:
-                        continue
-            
-            # 转换为前端需要的格式
-            file_info = {
-                "name": file["name"],
-                "path": file["path"],
-                "ext": file["ext"],
-                "size": file["size"],
-                "mtime": file["mtime"],
-                "category": file["category"],
-                "url": file["url"]
-            }
-            
-            filtered_files.append(file_info)
+        # 从MinIO列举（未指定目录时递归列举整个存储桶）
+        files, next_after = await async_file_service.list_files_page(
+            bucket_name, dir, start_after=after, limit=limit,
+            match=archive_file_matcher(keyword, category, exts, original_names)
+        )
+        if next_after:
+            response.headers["X-Next-Cursor"] = encode_archive_cursor(next_after)
         
-        return filtered_files
+        # 转换为前端需要的格式
+        return with_original_names(db, bucket_name, [
+            dict(file, thumbnail_url=thumbnail_url(file_service.get_file_url(file["path"], bucket_name))
+                 if is_thumbnailable(file["name"]) else None)
+            for file in files
+        ])
         
     except Exception as e:
         # 如果MinIO访问失败，回退到数据库方式
@@ -1481,7 +1714,101 @@ async def get_work_archive_files(
                 "size": 0,  # 文件大小暂时设为0，可以从MinIO获取
                 "mtime": file.created_at.isoformat(),
                 "category": category,
-                "url": file.file_url
+                "url": file.file_url,
+                "thumbnail_url": thumbnail_url(file.file_url) if is_thumbnailable(file.filename) else None
             })
         
-        return file_list
\ No newline at end of file
+        return file_list
+
+@router.get("/knowledge-archive/files/stream")
+async def stream_knowledge_archive_files(
+    dir: Optional[str] = None,
+    keyword: Optional[str] = None,
+    file_type: Optional[str] = None,
+    cursor: Optional[str] = Query(default=None, description="从该游标之后开始输出"),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    以 NDJSON 流式输出知识库存档文件列表（每行一个文件，格式同 /knowledge-archive/files）
+    
+    边查询边输出，前端收到第一批数据即可渲染，无需等待整个存储桶遍历完成。
+    """
+    bucket_name = "knowledge-files"
+    category, exts = archive_file_filter(file_type)
+    after = decode_archive_cursor(cursor)
+    original_names = original_name_matches(db, bucket_name, keyword)
+    
+    if object_index.is_ready(db, bucket_name):
+        files = (archive_file_info(item) for item in object_index.iter_files(
+            bucket_name, directory=dir, keyword=keyword, category=category, exts=exts, after=after,
+            keyword_paths=list(original_names)
+        ))
+    else:
+        match = archive_file_matcher(keyword, category, exts, original_names)
+        files = (
+            dict(file, thumbnail_url=thumbnail_url(file_service.get_file_url(file["path"], bucket_name))
+                 if is_thumbnailable(file["name"]) else None)
+            for file in file_service.iter_files(bucket_name, dir, start_after=after)
+            if match is None or match(file)
+        )
+    
+    # 同步生成器由 Starlette 在线程池中迭代，数据库查询与MinIO列举不阻塞事件循环
+    files = iter_with_original_names(bucket_name, files)
+    lines = (json.dumps(file, ensure_ascii=False) + "\n" for file in files)
+    return StreamingResponse(lines, media_type="application/x-ndjson", headers={"Cache-Control": "no-store"})
+
+@router.get("/knowledge-archive/files/search")
+async def search_knowledge_archive_files(
+    request: Request,
+    dir: Optional[str] = Query(default=None, description="只搜索该目录及其子目录"),
+    glob: Optional[str] = Query(default=None, description="文件名通配，如 *.tif；包含 / 时匹配对象完整路径"),
+    keyword: Optional[str] = Query(default=None, description="文件名关键词"),
+    file_type: Optional[str] = Query(default=None, description="分类名（image）或逗号分隔的扩展名（jpg,png）"),
+    min_size: Optional[int] = Query(default=None, ge=0, description="最小字节数"),
+    max_size: Optional[int] = Query(default=None, ge=0, description="最大字节数"),
+    modified_after: Optional[datetime] = Query(default=None, description="修改时间不早于"),
+    modified_before: Optional[datetime] = Query(default=None, description="修改时间早于"),
+    limit: int = Query(default=200, ge=1, le=10000, description="最多返回的条数，达到后停止搜索"),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    递归搜索 knowledge-files 存储桶（或 dir 目录树）中的文件，优先查询目录索引
+    结果以 NDJSON 流式返回（格式同 /knowledge-archive/files），请求头 Accept: text/event-stream 时返回 SSE
+    """
+    bucket_name = "knowledge-files"
+    category, exts = archive_file_filter(file_type)
+    file_filter = FileFilter(
+        glob=glob, keyword=keyword, exts=exts, category=category, min_size=min_size, max_size=max_size,
+        modified_after=modified_after, modified_before=modified_before
+    )
+    # 内容寻址对象按原始文件名匹配关键词
+    original_names = original_name_matches(db, bucket_name, keyword)
+    
+    if object_index.is_ready(db, bucket_name):
+        rows = object_index.iter_files(
+            bucket_name, keyword=keyword, category=category, exts=exts,
+            conditions=object_index.search_conditions(file_filter, dir), keyword_paths=list(original_names)
+        )
+        # SQL 条件对字符集合 [...] 只做了粗筛，逐条精确匹配
+        files = (
+            archive_file_info(item) for item in rows
+            if not file_filter.glob or file_filter.matches(
+                original_names.get(item.path, item.name), item.ext, item.category, item.size,
+                item.mtime.timestamp() if item.mtime else None, item.path
+            )
+        )
+    else:
+        # 未建立索引时以 dir 为前缀递归列举（未指定时列举整个存储桶），逐个应用筛选条件
+        directory = (dir or "").strip("/") or None
+        files = (
+            dict(file, thumbnail_url=thumbnail_url(file_service.get_file_url(file["path"], bucket_name))
+                 if is_thumbnailable(file["name"]) else None)
+            for file in file_service.iter_files(bucket_name, directory, recursive=True)
+            if file_filter.matches(
+                original_names.get(file["path"], file["name"]), file["ext"], file["category"], file["size"] or 0,
+                datetime.fromisoformat(file["mtime"]).timestamp() if file["mtime"] else None, file["path"]
+            )
+        )
+    return stream_results(iter_with_original_names(bucket_name, files), limit, wants_event_stream(request))
\ No newline at end of file
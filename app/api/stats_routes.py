@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""
+统计API路由
+
+- GET /api/stats/timeseries?entity=workflows&granularity=day&start=2025-01-01&end=2025-01-31
+  每天/每周/每月新建的记录数（日期按 STATS_TIMEZONE 划分，end 含当天，没有记录的区间为0）；
+  entity 可选 workflows、forms、evaluations、rollbacks，不传 start/end 时为最近30天/12周/12个月
+- GET /api/stats/evaluations
+  评分统计（数量、均值、中位数、标准差、高分率与分布，百分制）：管理员为全部评估（可按 evaluator_id /
+  initiator_id 筛选），评估专家为本人给出的评估，修复专家为本人发起的工作流收到的评估
+
+作者: 王梓涵
+邮箱: wangzh011031@163.com
+时间: 2025年
+"""
+from datetime import date, timedelta
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+from typing import Optional
+
+from ..auth import get_current_user
+from ..core.database import get_db
+from ..models import User
+from ..schemas import ResponseModel
+from ..services import evaluation_stats, timeseries, TimeSeriesError
+from ..services.timeseries_service import day_after
+
+router = APIRouter()
+
+
+@router.get("/timeseries", response_model=ResponseModel)
+def get_timeseries(
+    entity: str = Query("workflows", pattern="^(workflows|forms|evaluations|rollbacks)$", description="统计对象"),
+    granularity: str = Query("day", pattern="^(day|week|month)$", description="统计粒度"),
+    start: Optional[date] = Query(None, description="开始日期（含）"),
+    end: Optional[date] = Query(None, description="结束日期（含）"),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """按时间分桶的新建记录数"""
+    default_start, default_end = timeseries.default_range(granularity)
+    range_start = start or default_start
+    try:
+        range_end = day_after(end) if end else default_end
+        series = timeseries.series(db, entity, granularity, range_start, range_end)
+    except TimeSeriesError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return ResponseModel(
+        success=True,
+        message="获取成功",
+        data={
+            "entity": entity,
+            "granularity": granularity,
+            "timezone": timeseries.timezone,
+            "start": series[0]["start"].isoformat(),
+            "end": (range_end - timedelta(days=1)).isoformat(),
+            "buckets": [{"start": b["start"].isoformat(), "count": b["count"]} for b in series],
+            "total": sum(b["count"] for b in series)
+        }
+    )
+
+
+@router.get("/evaluations", response_model=ResponseModel)
+def get_evaluation_stats(
+    evaluator_id: Optional[int] = Query(None, description="评估专家ID（仅管理员可指定）"),
+    initiator_id: Optional[int] = Query(None, description="工作流发起人ID（仅管理员可指定）"),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """评分统计"""
+    role = current_user.role.role_key
+    if role == 'evaluator':
+        evaluator_id, initiator_id = current_user.user_id, None
+    elif role != 'admin':
+        evaluator_id, initiator_id = None, current_user.user_id
+    return ResponseModel(
+        success=True,
+        message="获取成功",
+        data=evaluation_stats.summary(db, evaluator_id=evaluator_id, initiator_id=initiator_id)
+    )
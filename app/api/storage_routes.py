@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""
+存储对象访问API路由（STORAGE_BACKEND 为 local / memory 时使用）
+
+MinIO 后端的预签名地址直接指向 MinIO；其他后端的预签名地址指向这里，
+以 expires 与 signature 查询参数校验（HMAC，与 MinIO 预签名一样无需登录）；直传地址的签名包含 Content-Type。
+
+- GET/HEAD /api/storage/objects/{bucket}/{object_name}  下载（local 后端按文件发送）
+- PUT      /api/storage/objects/{bucket}/{object_name}  浏览器直传（请求体为文件内容）
+
+local 后端配置 LOCAL_STORAGE_ACCEL_REDIRECT 时只返回 X-Accel-Redirect 头，由 nginx 以 sendfile 发送文件；
+否则服务器支持 ASGI zero-copy send 扩展时由服务器直接发送文件描述符，都不支持时按块读取发送。
+下载支持 Range、ETag 与 304 条件请求（见 utils/http_files）。
+
+作者: 王梓涵
+邮箱: wangzh011031@163.com
+时间: 2025年
+"""
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from typing import Optional
+from urllib.parse import quote
+import os
+import tempfile
+
+from ..core.config import settings
+from ..core.storage_backends import LocalBackend, verify_signature
+from ..services import async_file_service, file_service, StorageTimeoutError
+from ..services.object_index_service import file_category
+from ..utils.http_files import CACHE_CONTROL, file_response, object_response
+
+router = APIRouter()
+
+
+def _check_signature(method: str, bucket: str, object_name: str, expires: int, signature: str,
+                     content_type: Optional[str] = None):
+    if file_service.client.kind == "minio":
+        raise HTTPException(status_code=404, detail="当前存储后端不提供此接口")
+    if not verify_signature(method, bucket, object_name, expires, signature, content_type):
+        raise HTTPException(status_code=403, detail="访问地址无效或已过期")
+
+
+@router.api_route("/objects/{bucket}/{object_name:path}", methods=["GET", "HEAD"])
+async def get_object(
+    bucket: str,
+    object_name: str,
+    request: Request,
+    expires: int = Query(0),
+    signature: str = Query("")
+):
+    """按预签名地址下载对象"""
+    _check_signature("GET", bucket, object_name, expires, signature)
+    backend = file_service.client
+    cache_control = CACHE_CONTROL[file_category(os.path.splitext(object_name)[1])]
+
+    if isinstance(backend, LocalBackend):
+        try:
+            path = backend.object_path(bucket, object_name)
+        except Exception:
+            raise HTTPException(status_code=400, detail="对象名无效")
+        if not os.path.isfile(path):
+            raise HTTPException(status_code=404, detail="文件不存在")
+        media_type = backend.stat_object(bucket, object_name).content_type
+        if settings.LOCAL_STORAGE_ACCEL_REDIRECT:
+            # nginx 发送文件时自行处理 Range 与条件请求
+            return Response(headers={
+                "X-Accel-Redirect": f"{settings.LOCAL_STORAGE_ACCEL_REDIRECT.rstrip('/')}/{quote(bucket)}/{quote(object_name)}",
+                "Content-Type": media_type,
+                "Cache-Control": cache_control
+            })
+        return file_response(request, path, media_type, cache_control)
+
+    try:
+        stat = await async_file_service.stat_object(object_name, bucket)
+    except StorageTimeoutError:
+        raise HTTPException(status_code=504, detail="存储服务响应超时")
+    if stat is None:
+        raise HTTPException(status_code=404, detail="文件不存在")
+    return object_response(
+        request, stat["size"], stat["etag"], stat["last_modified"], stat["content_type"], cache_control,
+        lambda offset, length: file_service.iter_object(object_name, bucket, offset, length)
+    )
+
+
+@router.put("/objects/{bucket}/{object_name:path}")
+async def put_object(
+    bucket: str,
+    object_name: str,
+    request: Request,
+    expires: int = Query(0),
+    signature: str = Query("")
+):
+    """按预签名地址直传对象（对应 MinIO 的预签名PUT）"""
+    # 直传地址签名时包含 Content-Type，请求必须使用签发时的类型
+    _check_signature("PUT", bucket, object_name, expires, signature, request.headers.get("content-type"))
+    content_type = request.headers.get("content-type") or "application/octet-stream"
+
+    # 请求体先写入临时文件（小文件在内存中），再在线程池中写入存储后端
+    with tempfile.SpooledTemporaryFile(max_size=settings.UPLOAD_PART_SIZE) as body:
+        size = 0
+        async for chunk in request.stream():
+            size += len(chunk)
+            if size > settings.RESUMABLE_MAX_FILE_SIZE:
+                raise HTTPException(status_code=413, detail="文件过大")
+            body.write(chunk)
+        body.seek(0)
+
+        def store():
+            file_service._ensure_named_bucket(bucket)
+            return file_service.client.put_object(bucket, object_name, body, size, content_type=content_type)
+
+        try:
+            result = await run_in_threadpool(store)
+        except Exception:
+            raise HTTPException(status_code=400, detail="写入对象失败")
+    return Response(headers={"ETag": f'"{result.etag}"'})
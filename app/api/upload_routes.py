@@ -0,0 +1,277 @@
+# -*- coding: utf-8 -*-
+"""
+上传API路由
+
+断点续传流程:
+1. POST   /api/uploads                          创建会话，返回分片大小与分片数量
+2. PUT    /api/uploads/{session_id}/chunks/{n}   上传第n个分片（请求体为原始字节，可乱序、并行、重传）
+3. GET    /api/uploads/{session_id}              查询已完成/缺失的分片，用于中断后续传
+4. POST   /api/uploads/{session_id}/complete     合并分片，返回文件信息
+5. DELETE /api/uploads/{session_id}              取消上传
+
+预签名直传流程（文件数据不经过应用服务器）:
+1. POST   /api/uploads/presigned                 获取预签名PUT地址
+2. 浏览器 PUT 文件到 upload_url
+3. POST   /api/uploads/presigned/form-commit     登记为修复表单图片
+   POST   /api/uploads/presigned/knowledge-commit 登记为知识体系文件
+
+作者: 王梓涵
+邮箱: wangzh011031@163.com
+时间: 2025年
+"""
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from sqlalchemy.orm import Session
+import json
+import os
+
+from ..core.config import settings
+from ..core.database import get_db
+from ..models import User, Form, KnowledgeSystemFile
+from ..schemas import (
+    UploadSessionCreate,
+    UploadSessionResponse,
+    FileUploadResponse,
+    ResponseModel,
+    PresignedUploadRequest,
+    PresignedUploadResponse,
+    PresignedFormCommit,
+    PresignedKnowledgeCommit,
+    FormResponse,
+    KnowledgeSystemFileResponse
+)
+from ..auth import get_current_user
+from ..services import upload_session_service, image_service, document_index, dashboard_cache, UploadSessionError, StorageTimeoutError
+from ..services.upload_session_service import KNOWLEDGE_BUCKET
+from .routes import form_response
+
+router = APIRouter()
+
+
+def _raise_http(e: UploadSessionError):
+    raise HTTPException(status_code=e.status_code, detail=str(e))
+
+
+@router.post("/presigned", response_model=PresignedUploadResponse)
+async def create_presigned_upload(
+    payload: PresignedUploadRequest,
+    current_user: User = Depends(get_current_user)
+):
+    """签发预签名直传地址"""
+    if not payload.filename:
+        raise HTTPException(status_code=400, detail="文件名不能为空")
+
+    if payload.target == "form":
+        allowed_types = settings.ALLOWED_IMAGE_TYPES + settings.ALLOWED_FILE_TYPES
+        if payload.content_type not in allowed_types:
+            raise HTTPException(status_code=400, detail="不支持的文件类型")
+        bucket_name, max_size = settings.MINIO_BUCKET, settings.MAX_FILE_SIZE
+    elif payload.target == "knowledge":
+        bucket_name, max_size = KNOWLEDGE_BUCKET, settings.RESUMABLE_MAX_FILE_SIZE
+    else:
+        raise HTTPException(status_code=400, detail="不支持的上传目标")
+
+    try:
+        return await upload_session_service.create_presigned_upload(
+            current_user.user_id, payload.filename, payload.content_type, payload.size, bucket_name, max_size
+        )
+    except UploadSessionError as e:
+        _raise_http(e)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"生成上传地址失败: {str(e)}")
+
+
+@router.post("/presigned/form-commit", response_model=FormResponse)
+async def commit_presigned_form_image(
+    payload: PresignedFormCommit,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """把直传完成的图片登记到修复表单"""
+    form = db.query(Form).filter(Form.form_id == payload.form_id, Form.deleted_at.is_(None)).first()
+    if not form:
+        raise HTTPException(status_code=404, detail="表单不存在")
+    if form.submitter_id != current_user.user_id:
+        raise HTTPException(status_code=403, detail="无权限修改此表单")
+
+    try:
+        stored = await upload_session_service.verify_presigned_upload(payload.ticket_id, current_user.user_id)
+    except UploadSessionError as e:
+        _raise_http(e)
+    except StorageTimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e))
+
+    image_urls = json.loads(form.image_url) if form.image_url else []
+    image_urls.append(stored["url"])
+    form.image_url = json.dumps(image_urls)
+    # ARRAY(JSONB) 需要整体赋值才能被识别为修改
+    form.image_meta = (form.image_meta or []) + [{
+        "filename": stored["filename"],
+        "size": stored["size"],
+        "content_type": stored["content_type"],
+        "url": stored["url"],
+        "etag": stored["etag"]
+    }]
+    db.commit()
+    await dashboard_cache.invalidate()
+    db.refresh(form)
+    await upload_session_service.discard_presigned_upload(payload.ticket_id)
+    image_service.schedule_form_images(form.form_id, form.image_meta)
+
+    return form_response(form)
+
+
+@router.post("/presigned/knowledge-commit", response_model=KnowledgeSystemFileResponse)
+async def commit_presigned_knowledge_file(
+    payload: PresignedKnowledgeCommit,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """把直传完成的文件登记为知识体系文件"""
+    try:
+        stored = await upload_session_service.verify_presigned_upload(payload.ticket_id, current_user.user_id)
+    except UploadSessionError as e:
+        _raise_http(e)
+    except StorageTimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e))
+
+    file_type = payload.file_type or os.path.splitext(stored["filename"])[1].lstrip(".").lower()[:20] or "other"
+    knowledge_file = KnowledgeSystemFile(
+        unit=payload.unit,
+        filename=stored["filename"],
+        file_url=stored["url"],
+        file_type=file_type,
+        submission_info=payload.submission_info,
+        remark=payload.remark,
+        status='active'
+    )
+    db.add(knowledge_file)
+    db.commit()
+    document_index.notify()
+    db.refresh(knowledge_file)
+    await upload_session_service.discard_presigned_upload(payload.ticket_id)
+
+    return KnowledgeSystemFileResponse(
+        id=knowledge_file.id,
+        unit=knowledge_file.unit,
+        filename=knowledge_file.filename,
+        file_url=knowledge_file.file_url,
+        file_type=knowledge_file.file_type,
+        submission_info=knowledge_file.submission_info,
+        status=knowledge_file.status,
+        remark=knowledge_file.remark,
+        created_at=knowledge_file.created_at,
+        updated_at=knowledge_file.updated_at,
+        deleted_at=knowledge_file.deleted_at
+    )
+
+
+@router.post("", response_model=UploadSessionResponse)
+async def create_upload_session(
+    payload: UploadSessionCreate,
+    current_user: User = Depends(get_current_user)
+):
+    """创建断点续传会话"""
+    if not payload.filename:
+        raise HTTPException(status_code=400, detail="文件名不能为空")
+
+    # 默认存储桶与 /api/upload 保持相同的文件类型限制
+    if payload.bucket in (None, settings.MINIO_BUCKET):
+        allowed_types = settings.ALLOWED_IMAGE_TYPES + settings.ALLOWED_FILE_TYPES
+        if payload.content_type not in allowed_types:
+            raise HTTPException(status_code=400, detail="不支持的文件类型")
+
+    try:
+        session = await upload_session_service.create_session(
+            current_user.user_id, payload.filename, payload.content_type, payload.total_size, payload.bucket
+        )
+        return await upload_session_service.describe(session)
+    except UploadSessionError as e:
+        _raise_http(e)
+    except StorageTimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"创建上传会话失败: {str(e)}")
+
+
+@router.put("/{session_id}/chunks/{chunk_no}", response_model=ResponseModel)
+async def upload_chunk(
+    session_id: str,
+    chunk_no: int,
+    request: Request,
+    current_user: User = Depends(get_current_user)
+):
+    """上传一个分片，请求体为分片的原始字节"""
+    try:
+        session = await upload_session_service.get_session(session_id, current_user.user_id)
+        expected = upload_session_service.expected_chunk_size(session, chunk_no)
+
+        # 读取请求体时即检查大小，超出分片大小立即拒绝
+        data = bytearray()
+        async for block in request.stream():
+            data += block
+            if len(data) > expected:
+                raise HTTPException(
+                    status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                    detail=f"分片 {chunk_no} 大小应为 {expected} 字节"
+                )
+
+        result = await upload_session_service.upload_chunk(session_id, current_user.user_id, chunk_no, bytes(data))
+        return ResponseModel(success=True, message="分片上传成功", data=result)
+    except UploadSessionError as e:
+        _raise_http(e)
+    except HTTPException:
+        raise
+    except StorageTimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"分片上传失败: {str(e)}")
+
+
+@router.get("/{session_id}", response_model=UploadSessionResponse)
+async def get_upload_session(
+    session_id: str,
+    current_user: User = Depends(get_current_user)
+):
+    """查询上传会话状态"""
+    try:
+        session = await upload_session_service.get_session(session_id, current_user.user_id)
+        return await upload_session_service.describe(session)
+    except UploadSessionError as e:
+        _raise_http(e)
+
+
+@router.post("/{session_id}/complete", response_model=FileUploadResponse)
+async def complete_upload_session(
+    session_id: str,
+    current_user: User = Depends(get_current_user)
+):
+    """合并全部分片，完成上传"""
+    try:
+        stored = await upload_session_service.complete(session_id, current_user.user_id)
+        return FileUploadResponse(
+            filename=stored["filename"],
+            file_url=stored["url"],
+            file_size=stored["size"],
+            content_type=stored["content_type"]
+        )
+    except UploadSessionError as e:
+        _raise_http(e)
+    except StorageTimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"合并分片失败: {str(e)}")
+
+
+@router.delete("/{session_id}", response_model=ResponseModel)
+async def abort_upload_session(
+    session_id: str,
+    current_user: User = Depends(get_current_user)
+):
+    """取消上传会话"""
+    try:
+        await upload_session_service.abort(session_id, current_user.user_id)
+        return ResponseModel(success=True, message="上传已取消")
+    except UploadSessionError as e:
+        _raise_http(e)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"取消上传失败: {str(e)}")
@@ -1,14 +1,18 @@
 # app/api/work_archive.py
 from __future__ import annotations
-from fastapi import APIRouter, HTTPException, Query
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, HTTPException, Query, Request
 from pydantic import BaseModel
 from pathlib import Path
-from typing import List, Optional, Dict
+from typing import Iterator, List, Optional, Dict
 import mimetypes
 import urllib.parse
 import datetime
 
+from ..utils.archive_tree import ArchiveTree
+from ..utils.file_search import FileFilter, parse_exts, stream_results, wants_event_stream
+from ..utils.http_files import CACHE_CONTROL, file_response
+from ..utils.image_thumbnails import is_thumbnailable, local_thumbnail_url
+
 router = APIRouter()
 
 # 项目根目录：.../Mural-Restoration-System
@@ -24,6 +28,9 @@ CANDIDATE_ROOTS: Dict[str, Path] = {
 # 只保留存在的目录
 ALLOWED_ROOTS = {k: v for k, v in CANDIDATE_ROOTS.items() if v.exists()}
 
+# 目录树与文件列表缓存（目录变化时失效）
+archive_tree = ArchiveTree(PROJECT_ROOT, ALLOWED_ROOTS)
+
 # ----- 工具 -----
 def is_inside(parent: Path, child: Path) -> bool:
     try:
@@ -62,65 +69,77 @@ class FileItem(BaseModel):
     mtime: str              # ISO 字符串
     category: str           # image/video/document/code/other
     url: str                # 预览/下载用
+    thumbnail_url: Optional[str] = None  # 图片缩略图（首次访问时生成）
 
-def build_tree(root_name: str, root_path: Path) -> FolderNode:
-    def walk_dir(base: Path) -> List[FolderNode]:
-        nodes: List[FolderNode] = []
-        for p in sorted(base.iterdir()):
-            if p.is_dir() and not p.name.startswith("."):
-                rel = norm_rel(p.relative_to(PROJECT_ROOT))
-                nodes.append(FolderNode(label=p.name, key=rel, children=walk_dir(p)))
-        return nodes
-    return FolderNode(label=root_name, key=norm_rel(root_path.relative_to(PROJECT_ROOT)), children=walk_dir(root_path))
+def file_suffix(name: str) -> str:
+    """与 Path.suffix 相同的扩展名（不构造 Path 对象）"""
+    i = name.rfind(".")
+    return name[i:] if 0 < i < len(name) - 1 else ""
 
-def list_files_in(dir_rel: Optional[str], q: str, category: Optional[str]) -> List[FileItem]:
+def target_dirs(dir_rel: Optional[str]) -> List[Path]:
+    """dir 参数 → 要列出/搜索的目录（未指定时为全部根目录）"""
     roots = ALLOWED_ROOTS.values()
-    targets: List[Path] = []
-
     if dir_rel:
         candidate = (PROJECT_ROOT / dir_rel).resolve()
         # 必须在允许的根目录里
         if not any(is_inside(root, candidate) for root in roots):
             raise HTTPException(status_code=400, detail="Illegal directory path.")
-        if not candidate.exists() or not candidate.is_dir():
-            return []
-        targets = [candidate]
-    else:
-        targets = [r for r in roots]
+        return [candidate]
+    return [r for r in roots]
+
+def file_info(dir_rel: str, name: str, size: int, mtime_ns: int) -> dict:
+    """缓存的扫描结果 → 文件信息（FileItem 的字段）"""
+    ext = file_suffix(name)
+    rel = f"{dir_rel}/{name}"
+    return {
+        "name": name,
+        "path": rel,
+        "ext": ext,
+        "size": size,
+        "mtime": datetime.datetime.fromtimestamp(mtime_ns / 1e9).isoformat(timespec="seconds"),
+        "category": ext_category(ext),
+        "url": f"/api/work-archive/file?path={urllib.parse.quote(rel)}",
+        "thumbnail_url": local_thumbnail_url(rel, mtime_ns) if is_thumbnailable(name) else None
+    }
 
+def list_files_in(dir_rel: Optional[str], q: str, category: Optional[str]) -> List[FileItem]:
     result: List[FileItem] = []
-    for base in targets:
-        # 只列出当前目录下一层文件（不递归）
-        for p in sorted(base.iterdir()):
-            if p.is_file():
-                ext = p.suffix or ""
-                cat = ext_category(ext)
-                if category and cat != category:
-                    continue
-                if q and q.lower() not in p.name.lower():
-                    continue
-                st = p.stat()
-                rel = norm_rel(p.relative_to(PROJECT_ROOT))
-                url = f"/api/work-archive/file?path={urllib.parse.quote(rel)}"
-                result.append(FileItem(
-                    name=p.name,
-                    path=rel,
-                    ext=ext,
-                    size=st.st_size,
-                    mtime=datetime.datetime.fromtimestamp(st.st_mtime).isoformat(timespec="seconds"),
-                    category=cat,
-                    url=url
-                ))
+    for base in target_dirs(dir_rel):
+        # 只列出当前目录下一层文件（不递归），大小与修改时间取自缓存的扫描结果
+        base_rel = norm_rel(base.relative_to(PROJECT_ROOT))
+        for name, size, mtime_ns in archive_tree.listing(base) or ():
+            if category and ext_category(file_suffix(name)) != category:
+                continue
+            if q and q.lower() not in name.lower():
+                continue
+            result.append(FileItem(**file_info(base_rel, name, size, mtime_ns)))
     return result
 
+def search_files_in(dir_rel: Optional[str], file_filter: FileFilter) -> Iterator[dict]:
+    """递归查找符合条件的文件（按目录深度优先），调用方取够即可停止"""
+    min_size, max_size = file_filter.size_range
+    after_ns, before_ns = (t * 1e9 for t in file_filter.mtime_range)
+    for base in target_dirs(dir_rel):
+        for dir_path, files, names in archive_tree.walk_files(base):
+            # 按整个目录的文件名预筛选，大多数目录不必逐个文件检查
+            if not file_filter.may_match_names(names):
+                continue
+            dir_rel_path = norm_rel(Path(dir_path).relative_to(PROJECT_ROOT))
+            for name, size, mtime_ns in files:
+                if not (min_size <= size <= max_size and after_ns <= mtime_ns < before_ns):
+                    continue
+                ext = file_suffix(name)
+                path = f"{dir_rel_path}/{name}" if file_filter.match_path else None
+                if file_filter.matches(name, ext, ext_category(ext), size, mtime_ns / 1e9, path):
+                    yield file_info(dir_rel_path, name, size, mtime_ns)
+
 # ----- API -----
 
 @router.get("/folders", response_model=List[FolderNode])
 def get_folders():
     if not ALLOWED_ROOTS:
         return []
-    trees = [build_tree(name, path) for name, path in ALLOWED_ROOTS.items()]
-    return trees
+    return archive_tree.tree()
 
 @router.get("/files", response_model=List[FileItem])
 def get_files(
@@ -130,12 +149,37 @@ def get_files(
 ):
     return list_files_in(dir, q, category)
 
-@router.get("/file")
-def get_file(path: str = Query(..., description="相对路径，如 img/a.png")):
+@router.get("/search")
+def search_files(
+    request: Request,
+    dir: Optional[str] = Query(default=None, description="只搜索该目录及其子目录，如 img/sub"),
+    glob: Optional[str] = Query(default=None, description="文件名通配，如 *.tif；包含 / 时匹配相对路径，如 img/*/2024*.png"),
+    q: str = Query(default="", description="文件名关键词"),
+    ext: Optional[str] = Query(default=None, description="扩展名，逗号分隔，如 jpg,png"),
+    category: Optional[str] = Query(default=None, description="image/video/document/code/other"),
+    min_size: Optional[int] = Query(default=None, ge=0, description="最小字节数"),
+    max_size: Optional[int] = Query(default=None, ge=0, description="最大字节数"),
+    modified_after: Optional[datetime.datetime] = Query(default=None, description="修改时间不早于"),
+    modified_before: Optional[datetime.datetime] = Query(default=None, description="修改时间早于"),
+    limit: int = Query(default=200, ge=1, le=10000, description="最多返回的条数，达到后停止搜索"),
+):
+    """
+    递归搜索全部根目录（或 dir 目录树）中的文件，基于目录缓存，不逐个访问磁盘
+    结果以 NDJSON 流式返回（每行一个文件，格式同 /files），请求头 Accept: text/event-stream 时返回 SSE
+    """
+    file_filter = FileFilter(
+        glob=glob, keyword=q, exts=parse_exts(ext), category=category, min_size=min_size, max_size=max_size,
+        modified_after=modified_after, modified_before=modified_before
+    )
+    return stream_results(search_files_in(dir, file_filter), limit, wants_event_stream(request))
+
+@router.api_route("/file", methods=["GET", "HEAD"])
+def get_file(request: Request, path: str = Query(..., description="相对路径，如 img/a.png")):
+    # 支持 Range（视频拖动、大PDF分段加载）与 ETag/Last-Modified 条件请求
     file_path = (PROJECT_ROOT / path).resolve()
     if not any(is_inside(root, file_path) for root in ALLOWED_ROOTS.values()):
         raise HTTPException(status_code=400, detail="Illegal file path.")
     if not file_path.exists() or not file_path.is_file():
         raise HTTPException(status_code=404, detail="File not found.")
     media_type, _ = mimetypes.guess_type(str(file_path))
-    return FileResponse(str(file_path), media_type=media_type or "application/octet-stream")
+    return file_response(request, str(file_path), media_type, CACHE_CONTROL[ext_category(file_path.suffix)])
@@ -8,7 +8,7 @@
 时间: 2025年
 """
 import os
-from typing import List
+from typing import List, Optional
 from pydantic import Field, validator
 from pydantic_settings import BaseSettings
 
@@ -35,6 +35,13 @@ class Settings(BaseSettings):
     MINIO_SECRET_KEY: str = "minioadmin"
     MINIO_BUCKET: str = "repair-file"
     MINIO_SECURE: bool = False
+    MINIO_PUBLIC_ENDPOINT: Optional[str] = Field(default=None, description="浏览器访问MinIO的地址（用于预签名URL），为空时使用 MINIO_ENDPOINT")
+    MINIO_REGION: str = Field(default="us-east-1", description="MinIO区域，预签名时使用，避免签名前查询服务端")
+    PRESIGNED_PUT_EXPIRE: int = Field(default=900, description="预签名直传地址有效期，单位秒")
+    PRESIGNED_GET_EXPIRE: int = Field(default=3600, description="预签名下载地址有效期，单位秒")
+    STORAGE_BACKEND: str = Field(default="minio", description="存储后端：minio（MinIO/S3）、local（本地文件系统，单机部署）、memory（进程内存，仅供基准测试）")
+    LOCAL_STORAGE_ROOT: str = Field(default="data/storage", description="local 后端的存储根目录，每个存储桶一个子目录")
+    LOCAL_STORAGE_ACCEL_REDIRECT: Optional[str] = Field(default=None, description="local 后端由nginx发送文件时的internal location前缀（如 /protected-storage），为空时由应用发送")
     
     # Redis配置
     REDIS_HOST: str = "localhost"
@@ -48,11 +55,67 @@ class Settings(BaseSettings):
     
     # 前端配置
     VUE_WEB: bool = Field(default=True, description="是否使用Vue3前端，False使用static目录，True使用Vue3前端")
+    STATIC_PRECOMPRESS: bool = Field(default=True, description="启动时在后台为前端构建目录 webapp/dist 生成gzip/brotli压缩副本（也可在构建后执行 python -m app.utils.static_assets webapp/dist）")
     
     # 文件上传配置
     MAX_FILE_SIZE: int = Field(default=100 * 1024 * 1024, description="最大文件大小，单位字节")
     ALLOWED_IMAGE_TYPES: List[str] = Field(default=["image/jpeg", "image/png", "image/bmp", "image/tiff"], description="允许的图片类型")
     ALLOWED_FILE_TYPES: List[str] = Field(default=["application/pdf", "application/msword", "application/vnd.openxmlformats-officedocument.wordprocessingml.document", "text/plain"], description="允许的文件类型")
+    UPLOAD_PART_SIZE: int = Field(default=16 * 1024 * 1024, description="流式上传的分片大小，单位字节（MinIO要求不小于5MB）")
+    UPLOAD_PART_CONCURRENCY: int = Field(default=4, description="大文件分片上传时单个文件同时上传的分片数量")
+    UPLOAD_PART_RETRIES: int = Field(default=3, description="单个分片上传失败后的重试次数")
+    
+    # 存储I/O配置
+    STORAGE_MAX_CONCURRENCY: int = Field(default=8, description="同时进行的MinIO调用数量上限（存储线程池大小）")
+    STORAGE_CALL_TIMEOUT: float = Field(default=30.0, description="普通存储调用超时时间，单位秒")
+    STORAGE_UPLOAD_TIMEOUT: float = Field(default=600.0, description="单个文件上传超时时间，单位秒")
+    FORM_UPLOAD_CONCURRENCY: int = Field(default=4, description="单次表单提交中并发上传的文件数量上限")
+    STORAGE_CONTENT_ADDRESSED: bool = Field(default=True, description="是否按SHA-256内容寻址存储（相同文件只存一份，按引用计数删除）")
+    RESUMABLE_MAX_FILE_SIZE: int = Field(default=50 * 1024 * 1024 * 1024, description="断点续传单个文件大小上限，单位字节")
+    RESUMABLE_SESSION_TTL: int = Field(default=24 * 3600, description="断点续传会话无活动后的过期时间，单位秒")
+    RESUMABLE_SWEEP_INTERVAL: int = Field(default=600, description="过期上传会话清理间隔，单位秒")
+    OBJECT_INDEX_BUCKETS: List[str] = Field(default=["knowledge-files"], description="在数据库中维护目录索引的存储桶")
+    OBJECT_INDEX_RECONCILE_INTERVAL: int = Field(default=300, description="目录索引与存储桶对账间隔，单位秒")
+    OBJECT_INDEX_RECONCILE_BATCH: int = Field(default=5000, description="每轮对账最多列举的对象数（从上次停下的位置继续），0 表示每轮列举整个存储桶")
+    GC_GRACE_PERIOD: int = Field(default=24 * 3600, description="未被引用的对象超过该时间才会被孤儿清理删除，单位秒")
+    GC_INTERVAL: int = Field(default=0, description="孤儿对象自动清理间隔，单位秒，0 表示只通过管理接口手动执行")
+    GC_DRY_RUN: bool = Field(default=True, description="自动清理是否只统计不删除")
+    GC_DELETE_BATCH_SIZE: int = Field(default=500, description="孤儿清理每批删除的对象数（不超过1000）")
+    GC_DELETE_RATE: float = Field(default=200.0, description="孤儿清理每秒最多删除的对象数，0 表示不限速")
+    
+    # 工作档案本地目录缓存配置
+    WORK_ARCHIVE_WATCH: bool = Field(default=True, description="安装watchdog时是否监听工作档案目录变化（否则按目录修改时间校验缓存）")
+    WORK_ARCHIVE_CHECK_INTERVAL: float = Field(default=2.0, description="未监听目录变化时，同一目录两次校验修改时间的最小间隔，单位秒")
+    WORK_ARCHIVE_CACHE_TTL: float = Field(default=300.0, description="未监听目录变化时，工作档案文件列表（大小、修改时间）的最长缓存时间，单位秒")
+    WORK_ARCHIVE_SNAPSHOT: str = Field(default="data/cache/work_archive_tree.json", description="工作档案目录缓存的磁盘快照（多个worker共用），为空时不写快照")
+    
+    # 文档全文索引配置
+    DOC_INDEX_WORKERS: int = Field(default=1, description="文档文本抽取进程池大小")
+    DOC_INDEX_INTERVAL: int = Field(default=600, description="全文索引与知识体系文件、工作档案文档对账的间隔，单位秒")
+    DOC_INDEX_TASK_TIMEOUT: float = Field(default=300.0, description="单个文档文本抽取超时时间，单位秒")
+    DOC_INDEX_MAX_FILE_SIZE: int = Field(default=100 * 1024 * 1024, description="超过该大小的文档只索引文件名，单位字节")
+    DOC_INDEX_MAX_CHARS: int = Field(default=1_000_000, description="单个文档抽取并索引的最大字符数")
+    
+    # 统计配置
+    STATS_TIMEZONE: str = Field(default="Asia/Shanghai", description="按天/周/月统计时划分日期使用的时区")
+    DASHBOARD_CACHE_TTL: float = Field(default=30.0, description="仪表板统计结果缓存时间（写入工作流、表单、评估、回溯申请时立即失效），单位秒，0表示不缓存")
+    
+    # 启动与外部服务连接配置
+    SERVICE_CONNECT_TIMEOUT: float = Field(default=3.0, description="连接MinIO、Redis、PostgreSQL的超时时间，单位秒")
+    STARTUP_WARMUP_TIMEOUT: float = Field(default=5.0, description="启动时每项服务预热（建表、存储桶检查、Redis连通性）的最长等待时间，单位秒")
+    STARTUP_BUDGET: float = Field(default=10.0, description="worker冷启动（导入到可以接收请求）的时间预算，超出时记录告警，单位秒")
+    
+    # 图像派生文件配置（切片金字塔、预览图）
+    DERIVED_PREFIX: str = Field(default="derived", description="派生对象（瓦片、预览图）在存储桶中的前缀")
+    IMAGE_WORKERS: int = Field(default=2, description="图像处理进程池大小")
+    IMAGE_TASK_TIMEOUT: float = Field(default=1800.0, description="单张图像处理超时时间，单位秒")
+    IMAGE_MAX_PIXELS: int = Field(default=1_000_000_000, description="允许解码的最大像素数（防止解压炸弹）")
+    IMAGE_TILE_SIZE: int = Field(default=254, description="Deep Zoom瓦片边长（不含重叠），单位像素")
+    IMAGE_TILE_OVERLAP: int = Field(default=1, description="Deep Zoom瓦片重叠像素")
+    IMAGE_TILE_QUALITY: int = Field(default=85, description="瓦片与预览图JPEG质量")
+    IMAGE_PREVIEW_SIZES: List[int] = Field(default=[1024, 2048], description="固定尺寸预览图的长边像素")
+    IMAGE_THUMBNAIL_SIZES: List[int] = Field(default=[200, 400], description="缩略图长边像素（WebP，安装AVIF编码插件时另生成AVIF）")
+    IMAGE_THUMBNAIL_MAX_PENDING: int = Field(default=8, description="同时按需生成的缩略图数量上限，超出时缩略图接口返回503")
     
     # 邮件服务配置
     SMTP_HOST: str = "smtp.163.com"
@@ -76,6 +139,20 @@ class Settings(BaseSettings):
             return v
         return v
     
+    @validator('OBJECT_INDEX_BUCKETS', pre=True)
+    def parse_index_buckets(cls, v):
+        """解析存储桶名称字符串为列表"""
+        if isinstance(v, str):
+            return [item.strip() for item in v.split(',') if item.strip()]
+        return v
+    
+    @validator('IMAGE_PREVIEW_SIZES', 'IMAGE_THUMBNAIL_SIZES', pre=True)
+    def parse_preview_sizes(cls, v):
+        """解析预览图/缩略图尺寸字符串为列表"""
+        if isinstance(v, str):
+            return [int(item.strip()) for item in v.split(',') if item.strip()]
+        return v
+    
     @validator('ALLOWED_FILE_TYPES', pre=True)
     def parse_file_types(cls, v):
         """解析文件类型字符串为列表"""
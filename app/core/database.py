@@ -6,17 +6,20 @@
 邮箱: wangzh011031@163.com
 时间: 2025年
 """
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text
 from sqlalchemy.orm import sessionmaker
 from ..models import Base, Role, User, SystemConfig
-from .config import DATABASE_URL
+from .config import DATABASE_URL, settings
 from passlib.context import CryptContext
 
 # 密码加密
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 # 创建数据库引擎
-engine = create_engine(DATABASE_URL)
+engine = create_engine(
+    DATABASE_URL,
+    connect_args={"connect_timeout": max(2, int(settings.SERVICE_CONNECT_TIMEOUT))}
+)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 def get_db():
@@ -30,8 +33,44 @@ def get_db():
 def create_tables():
     """创建所有表"""
     Base.metadata.create_all(bind=engine)
+    create_search_indexes()
+    create_stats_indexes()
     print("数据库表创建完成")
 
+def create_search_indexes():
+    """
+    工作档案文件名搜索（通配/关键词）使用的三元组索引
+    需要 pg_trgm 扩展，数据库账号无权创建扩展时跳过，搜索改为按目录索引顺序扫描
+    """
+    try:
+        with engine.begin() as conn:
+            conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+            conn.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_object_index_name_trgm ON object_index USING gin (lower(name) gin_trgm_ops)"
+            ))
+    except Exception as e:
+        print(f"⚠️  文件名搜索索引创建失败: {e}")
+
+def create_stats_indexes():
+    """
+    按时间统计（仪表板趋势、按天/周/月计数）与甘特图分页使用的创建时间索引
+    已有数据库的表不会由 create_all 补建索引，这里单独创建
+    """
+    statements = [
+        "CREATE INDEX IF NOT EXISTS ix_workflows_created_at ON workflows (created_at) WHERE deleted_at IS NULL",
+        # 甘特图按 created_at DESC, workflow_id 排序分页，索引顺序一致时 LIMIT 不需要排序整张表
+        "CREATE INDEX IF NOT EXISTS ix_workflows_gantt ON workflows (created_at DESC, workflow_id) WHERE deleted_at IS NULL",
+        "CREATE INDEX IF NOT EXISTS ix_forms_created_at ON forms (created_at) WHERE deleted_at IS NULL",
+        "CREATE INDEX IF NOT EXISTS ix_evaluations_created_at ON evaluations (created_at)",
+        "CREATE INDEX IF NOT EXISTS ix_rollback_requests_created_at ON rollback_requests (created_at) WHERE deleted_at IS NULL",
+    ]
+    try:
+        with engine.begin() as conn:
+            for statement in statements:
+                conn.execute(text(statement))
+    except Exception as e:
+        print(f"⚠️  统计索引创建失败: {e}")
+
 def init_data():
     """初始化基础数据"""
     db = SessionLocal()
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""
+外部服务客户端的延迟创建与启动预热
+
+导入模块时只登记工厂函数，不连接 MinIO、Redis 等外部服务；
+首次访问属性时才创建实例。应用启动时在 lifespan 中并发执行各服务的预热（连通性检查、创建存储桶等），
+每项预热都有超时，服务缓慢或不可用时只记录告警，不阻塞 worker 启动。
+
+作者: 王梓涵
+邮箱: wangzh011031@163.com
+时间: 2025年
+"""
+from typing import Any, Callable, Dict, Optional
+import asyncio
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class LazyService:
+    """服务实例代理：首次访问属性时调用工厂函数创建实例（线程安全），之后的属性读写都转发给实例"""
+
+    def __init__(self, name: str, factory: Callable[[], Any], warm_up: Optional[Callable[[Any], None]] = None):
+        object.__setattr__(self, "_name", name)
+        object.__setattr__(self, "_factory", factory)
+        object.__setattr__(self, "_warm_up", warm_up)
+        object.__setattr__(self, "_instance", None)
+        object.__setattr__(self, "_lock", threading.Lock())
+
+    def get(self) -> Any:
+        """返回服务实例，尚未创建时创建"""
+        instance = self._instance
+        if instance is None:
+            with self._lock:
+                instance = self._instance
+                if instance is None:
+                    instance = self._factory()
+                    object.__setattr__(self, "_instance", instance)
+        return instance
+
+    @property
+    def created(self) -> bool:
+        return self._instance is not None
+
+    def warm_up(self):
+        """创建实例并执行预热（阻塞调用）"""
+        instance = self.get()
+        if self._warm_up is not None:
+            self._warm_up(instance)
+
+    def __getattr__(self, item):
+        return getattr(self.get(), item)
+
+    def __setattr__(self, key, value):
+        setattr(self.get(), key, value)
+
+    def __repr__(self):
+        state = "已创建" if self.created else "未创建"
+        return f"<LazyService {self._name} ({state})>"
+
+
+# 已登记的服务，按登记顺序预热
+_services: Dict[str, LazyService] = {}
+
+
+def lazy_service(name: str, factory: Callable[[], Any],
+                 warm_up: Optional[Callable[[Any], None]] = None) -> LazyService:
+    """登记一个延迟创建的服务，返回其代理"""
+    service = LazyService(name, factory, warm_up)
+    _services[name] = service
+    return service
+
+
+def warm_up_steps() -> Dict[str, Callable[[], None]]:
+    """全部已登记服务的预热函数"""
+    return {name: service.warm_up for name, service in _services.items()}
+
+
+async def warm_up(steps: Dict[str, Callable[[], None]], timeout: float) -> Dict[str, dict]:
+    """
+    并发执行预热步骤，返回每一步的结果 {name: {ok, seconds, error}}
+    每一步在独立的守护线程中执行：超时的步骤不再等待（在后台继续执行）并记为失败，
+    也不会在进程退出时阻塞线程池的回收
+    """
+    loop = asyncio.get_running_loop()
+    started = time.perf_counter()
+
+    def run(future: asyncio.Future, step: Callable[[], None]):
+        begin = time.perf_counter()
+        try:
+            step()
+            outcome = (True, time.perf_counter() - begin, None)
+        except Exception as e:
+            outcome = (False, time.perf_counter() - begin, str(e) or type(e).__name__)
+        try:
+            loop.call_soon_threadsafe(lambda: future.done() or future.set_result(outcome))
+        except RuntimeError:
+            pass  # 事件循环已关闭（超时后应用已退出）
+
+    futures = {}
+    for name, step in steps.items():
+        futures[name] = loop.create_future()
+        threading.Thread(target=run, args=(futures[name], step), name=f"warm-up-{name}", daemon=True).start()
+    await asyncio.wait(futures.values(), timeout=timeout)
+
+    results: Dict[str, dict] = {}
+    for name, future in futures.items():
+        if future.done():
+            ok, seconds, error = future.result()
+        else:
+            future.cancel()
+            ok, seconds, error = False, time.perf_counter() - started, f"超过 {timeout} 秒未完成"
+        results[name] = {"ok": ok, "seconds": round(seconds, 3), "error": error}
+        if not ok:
+            logger.warning(f"服务预热失败 {name}: {error}")
+    return results
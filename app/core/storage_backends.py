@@ -0,0 +1,714 @@
+# -*- coding: utf-8 -*-
+"""
+对象存储后端
+
+FileService、目录索引、孤儿对象清理与图像处理进程都通过 minio-py 的 Minio 客户端接口访问存储，
+因此存储后端沿用同名同参的方法（上传、按范围读取、元数据、按前缀列举、删除、分片上传、预签名），
+由 STORAGE_BACKEND 选择实现：
+
+- minio：MinIO / S3（默认，即 Minio 客户端本身，行为不变）
+- local：本地文件系统，供野外工作站等单机部署省去 MinIO；
+  对象按对象名的目录层级存放（对象名本身已按日期或摘要前缀分目录），
+  写入先落到临时文件再原子重命名，下载由 /api/storage/objects 以文件方式发送
+- memory：进程内存，供基准测试在没有外部服务时走同一套代码路径（不跨进程共享）
+
+非 MinIO 后端的错误同样以 S3Error 抛出（NoSuchKey、NoSuchBucket、NoSuchUpload），
+调用方的异常处理无需区分后端；预签名地址指向本应用，由 HMAC 签名校验。
+
+作者: 王梓涵
+邮箱: wangzh011031@163.com
+时间: 2025年
+"""
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta, timezone
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import SplitResult, quote, urlunsplit
+import bisect
+import hashlib
+import hmac
+import io
+import json
+import mimetypes
+import os
+import shutil
+import threading
+import time
+import uuid
+
+import certifi
+import urllib3
+from minio import Minio
+from minio import signer
+from minio import time as minio_time
+from minio.datatypes import Object
+from minio.deleteobjects import DeleteError
+from minio.error import S3Error
+from minio.helpers import ObjectWriteResult, queryencode
+
+from .config import settings
+
+# 非 MinIO 后端的对象访问地址前缀（数据库中保存的文件地址与预签名地址都以此开头）
+OBJECT_ROUTE = "/api/storage/objects"
+
+COPY_CHUNK_SIZE = 1024 * 1024
+
+
+def _http_client() -> urllib3.PoolManager:
+    """
+    与MinIO客户端的默认连接池相同，只把连接超时改为 SERVICE_CONNECT_TIMEOUT（服务不可用时尽快失败），
+    并按可能同时发出请求的线程数确定连接数：存储线程池 STORAGE_MAX_CONCURRENCY 个，
+    加上分片上传线程池 STORAGE_MAX_CONCURRENCY × UPLOAD_PART_CONCURRENCY 个（默认 10 个连接会让多余的线程
+    每次新建连接、用完即弃）
+    """
+    threads = max(1, settings.STORAGE_MAX_CONCURRENCY) * (max(1, settings.UPLOAD_PART_CONCURRENCY) + 1)
+    return urllib3.PoolManager(
+        timeout=urllib3.util.Timeout(connect=settings.SERVICE_CONNECT_TIMEOUT, read=300),
+        maxsize=max(10, threads),
+        cert_reqs="CERT_REQUIRED",
+        ca_certs=os.environ.get("SSL_CERT_FILE") or certifi.where(),
+        retries=urllib3.Retry(total=5, backoff_factor=0.2, status_forcelist=[500, 502, 503, 504])
+    )
+
+
+def _error(code: str, message: str, bucket: Optional[str] = None, name: Optional[str] = None) -> S3Error:
+    return S3Error(code, message, f"/{bucket or ''}/{name or ''}", None, None, None, bucket, name)
+
+
+def _content_type(name: str) -> str:
+    return mimetypes.guess_type(name)[0] or "application/octet-stream"
+
+
+# ----- 预签名 -----
+
+def _signature(method: str, bucket: str, name: str, expires: int, content_type: Optional[str] = None) -> str:
+    message = f"{method}\n{bucket}/{name}\n{expires}"
+    if content_type:
+        message += f"\n{content_type}"
+    return hmac.new(settings.SECRET_KEY.encode("utf-8"), message.encode("utf-8"), hashlib.sha256).hexdigest()
+
+
+def object_url(bucket: str, name: str) -> str:
+    """非 MinIO 后端的对象地址（不带签名，只作为数据库中保存的文件标识）"""
+    return f"{OBJECT_ROUTE}/{quote(bucket, safe='')}/{quote(name)}"
+
+
+def sign_url(method: str, bucket: str, name: str, expires: timedelta, content_type: Optional[str] = None) -> str:
+    """content_type 参与签名时，请求必须带相同的 Content-Type"""
+    deadline = int(time.time() + expires.total_seconds())
+    signature = _signature(method, bucket, name, deadline, content_type)
+    return f"{object_url(bucket, name)}?expires={deadline}&signature={signature}"
+
+
+def verify_signature(method: str, bucket: str, name: str, expires: int, signature: str,
+                     content_type: Optional[str] = None) -> bool:
+    if expires < time.time():
+        return False
+    return hmac.compare_digest(_signature(method, bucket, name, expires, content_type), signature or "")
+
+
+def presign_v4(method: str, url: SplitResult, region: str, credentials, date: datetime, expires: int,
+               headers: Dict[str, str]) -> SplitResult:
+    """
+    同 minio.signer.presign_v4（查询参数签名 V4），另外把 headers 一并签名（minio-py 只签 host）；
+    使用地址的请求必须带相同的请求头，否则服务端返回 SignatureDoesNotMatch
+    """
+    signed = {"host": url.netloc, **{k.lower(): " ".join(str(v).split()) for k, v in headers.items()}}
+    signed_headers = ";".join(sorted(signed))
+    scope = f"{minio_time.to_signer_date(date)}/{region}/s3/aws4_request"
+    query = (url.query + "&" if url.query else "") + (
+        f"X-Amz-Algorithm=AWS4-HMAC-SHA256"
+        f"&X-Amz-Credential={queryencode(credentials.access_key + '/' + scope)}"
+        f"&X-Amz-Date={minio_time.to_amz_date(date)}"
+        f"&X-Amz-Expires={expires}"
+        f"&X-Amz-SignedHeaders={queryencode(signed_headers)}"
+    )
+    canonical_request = "\n".join([
+        method,
+        url.path or "/",
+        signer._get_canonical_query_string(query),
+        "".join(f"{name}:{signed[name]}\n" for name in sorted(signed)),
+        signed_headers,
+        "UNSIGNED-PAYLOAD"
+    ])
+    string_to_sign = signer._get_string_to_sign(
+        date, scope, hashlib.sha256(canonical_request.encode("utf-8")).hexdigest()
+    )
+    signature = signer._get_signature(
+        signer._get_signing_key(credentials.secret_key, date, region, "s3"), string_to_sign
+    )
+    return url._replace(query=f"{query}&X-Amz-Signature={queryencode(signature)}")
+
+
+class StorageBackend(ABC):
+    """
+    存储后端接口（方法名与参数同 minio-py 的 Minio 客户端）
+
+    - put_object(bucket, name, data, length, content_type, part_size)  上传，length=-1 表示长度未知
+    - get_object(bucket, name, offset=0, length=0)                     按范围读取，length=0 表示读到末尾
+    - stat_object(bucket, name)                                        元数据（size、etag、last_modified、content_type）
+    - list_objects(bucket, prefix, recursive, start_after)             按前缀列举，按对象名字典序
+    - remove_object / remove_objects                                   删除（后者惰性执行，返回失败项）
+    - compose_object                                                   服务端复制/拼接
+    - _create/_upload_part/_complete/_abort_multipart_upload           分片上传
+    - presigned_get_object / presigned_put_object                      预签名下载/直传地址
+    """
+
+    kind = ""
+
+    @abstractmethod
+    def bucket_exists(self, bucket_name: str) -> bool:
+        raise NotImplementedError
+
+    @abstractmethod
+    def make_bucket(self, bucket_name: str):
+        raise NotImplementedError
+
+    @abstractmethod
+    def put_object(self, bucket_name: str, object_name: str, data: BinaryIO, length: int,
+                   content_type: str = "application/octet-stream", part_size: int = 0, **kwargs) -> ObjectWriteResult:
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_object(self, bucket_name: str, object_name: str, offset: int = 0, length: int = 0, **kwargs):
+        raise NotImplementedError
+
+    @abstractmethod
+    def stat_object(self, bucket_name: str, object_name: str, **kwargs) -> Object:
+        raise NotImplementedError
+
+    @abstractmethod
+    def list_objects(self, bucket_name: str, prefix: Optional[str] = None, recursive: bool = False,
+                     start_after: Optional[str] = None, **kwargs) -> Iterator[Object]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def remove_object(self, bucket_name: str, object_name: str, **kwargs):
+        raise NotImplementedError
+
+    def remove_objects(self, bucket_name: str, delete_object_list, **kwargs) -> Iterator[DeleteError]:
+        """逐个删除，删除失败的对象以 DeleteError 返回（与 Minio 一样需要迭代结果才会执行）"""
+        for item in delete_object_list:
+            try:
+                self.remove_object(bucket_name, item._name)
+            except S3Error as e:
+                yield DeleteError(e.code, e.message, item._name, None)
+            except OSError as e:
+                yield DeleteError("InternalError", str(e), item._name, None)
+
+    @abstractmethod
+    def compose_object(self, bucket_name: str, object_name: str, sources, **kwargs) -> ObjectWriteResult:
+        raise NotImplementedError
+
+    def presigned_get_object(self, bucket_name: str, object_name: str,
+                             expires: timedelta = timedelta(days=7), **kwargs) -> str:
+        return sign_url("GET", bucket_name, object_name, expires)
+
+    def presigned_put_object(self, bucket_name: str, object_name: str,
+                             expires: timedelta = timedelta(days=7), content_type: Optional[str] = None) -> str:
+        """直传地址；指定 content_type 时 Content-Type 参与签名，上传时必须使用同一类型"""
+        return sign_url("PUT", bucket_name, object_name, expires, content_type)
+
+    @abstractmethod
+    def _create_multipart_upload(self, bucket_name: str, object_name: str, headers=None) -> str:
+        raise NotImplementedError
+
+    @abstractmethod
+    def _upload_part(self, bucket_name: str, object_name: str, data: bytes, headers, upload_id: str,
+                     part_number: int) -> str:
+        raise NotImplementedError
+
+    @abstractmethod
+    def _complete_multipart_upload(self, bucket_name: str, object_name: str, upload_id: str,
+                                   parts) -> ObjectWriteResult:
+        raise NotImplementedError
+
+    @abstractmethod
+    def _abort_multipart_upload(self, bucket_name: str, object_name: str, upload_id: str):
+        raise NotImplementedError
+
+
+class MinioBackend(Minio, StorageBackend):
+    """MinIO / S3 后端（Minio 客户端本身）"""
+
+    kind = "minio"
+
+    def __init__(self, endpoint: Optional[str] = None, **kwargs):
+        kwargs.setdefault("http_client", _http_client())
+        super().__init__(
+            endpoint or settings.MINIO_ENDPOINT,
+            access_key=settings.MINIO_ACCESS_KEY,
+            secret_key=settings.MINIO_SECRET_KEY,
+            secure=settings.MINIO_SECURE,
+            **kwargs
+        )
+
+    def presigned_put_object(self, bucket_name: str, object_name: str,
+                             expires: timedelta = timedelta(days=7), content_type: Optional[str] = None) -> str:
+        """直传地址；指定 content_type 时 Content-Type 参与签名，上传时必须使用同一类型"""
+        if not content_type:
+            return super().presigned_put_object(bucket_name, object_name, expires)
+        region = self._get_region(bucket_name)
+        credentials = self._provider.retrieve() if self._provider else None
+        query_params = {"X-Amz-Security-Token": credentials.session_token} \
+            if credentials and credentials.session_token else {}
+        url = self._base_url.build("PUT", region, bucket_name=bucket_name, object_name=object_name,
+                                   query_params=query_params)
+        if credentials:
+            url = presign_v4("PUT", url, region, credentials, minio_time.utcnow(), int(expires.total_seconds()),
+                             {"Content-Type": content_type})
+        return urlunsplit(url)
+
+
+class _ObjectReader:
+    """读取结果，接口与 Minio.get_object 返回的 HTTPResponse 相同（read/stream/close/release_conn/headers）"""
+
+    def __init__(self, raw: BinaryIO, length: int, headers: Dict[str, str]):
+        self._raw = raw
+        self._remaining = length
+        self.headers = headers
+
+    def read(self, amt: Optional[int] = None) -> bytes:
+        size = self._remaining if amt is None or amt < 0 else min(amt, self._remaining)
+        data = self._raw.read(size) if size > 0 else b""
+        self._remaining -= len(data)
+        return data
+
+    def stream(self, amt: int = 64 * 1024) -> Iterator[bytes]:
+        while True:
+            data = self.read(amt)
+            if not data:
+                return
+            yield data
+
+    def close(self):
+        self._raw.close()
+
+    def release_conn(self):
+        pass
+
+
+def _read_range(size: int, offset: int, length: int) -> Tuple[int, int]:
+    """get_object 的 offset/length → 实际读取的 (起点, 长度)"""
+    if offset < 0 or offset > size or (offset == size and size > 0):
+        raise _error("InvalidRange", "The requested range is not satisfiable")
+    return offset, (size - offset if not length else min(length, size - offset))
+
+
+def _multipart_etag(part_etags: List[str]) -> str:
+    """与S3相同的分片对象ETag：各分片MD5拼接后再取MD5，后缀分片数"""
+    digest = hashlib.md5(b"".join(bytes.fromhex(etag) for etag in part_etags)).hexdigest()
+    return f"{digest}-{len(part_etags)}"
+
+
+class LocalBackend(StorageBackend):
+    """
+    本地文件系统后端
+
+    <root>/<bucket>/<对象名> 为对象数据，<root>/.meta/<bucket>/<对象名> 保存写入时的 Content-Type，
+    <root>/.tmp 存放写入中的临时文件，<root>/.uploads/<upload_id> 存放分片；
+    ETag 由文件修改时间与大小生成（与nginx等静态文件服务一致），文件被替换后随之改变。
+    直接放入目录（没有 .meta 记录）的文件按扩展名推断类型；列举结果同样按扩展名推断，不逐个读取记录
+    """
+
+    kind = "local"
+
+    def __init__(self, root: str):
+        self.root = os.path.abspath(root)
+        self._tmp = os.path.join(self.root, ".tmp")
+        self._uploads = os.path.join(self.root, ".uploads")
+        self._meta = os.path.join(self.root, ".meta")
+        os.makedirs(self._tmp, exist_ok=True)
+        os.makedirs(self._uploads, exist_ok=True)
+
+    # ----- 路径 -----
+
+    def _bucket_dir(self, bucket_name: str) -> str:
+        if not bucket_name or bucket_name.startswith(".") or "/" in bucket_name:
+            raise _error("InvalidBucketName", "Invalid bucket name", bucket_name)
+        return os.path.join(self.root, bucket_name)
+
+    def object_path(self, bucket_name: str, object_name: str) -> str:
+        """对象在本地的文件路径（拒绝越出存储桶目录的对象名）"""
+        parts = (object_name or "").split("/")
+        if any(part in ("", ".", "..") for part in parts):
+            raise _error("InvalidObjectName", "Invalid object name", bucket_name, object_name)
+        return os.path.join(self._bucket_dir(bucket_name), *parts)
+
+    def _meta_path(self, bucket_name: str, object_name: str) -> str:
+        """对象 Content-Type 记录的文件路径"""
+        path = self.object_path(bucket_name, object_name)
+        return os.path.join(self._meta, os.path.relpath(path, self.root))
+
+    def _existing(self, bucket_name: str, object_name: str) -> str:
+        path = self.object_path(bucket_name, object_name)
+        if not os.path.isfile(path):
+            if not os.path.isdir(self._bucket_dir(bucket_name)):
+                raise _error("NoSuchBucket", "The specified bucket does not exist", bucket_name)
+            raise _error("NoSuchKey", "The specified key does not exist.", bucket_name, object_name)
+        return path
+
+    @staticmethod
+    def _etag(stat: os.stat_result) -> str:
+        return f"{stat.st_mtime_ns:x}-{stat.st_size:x}"
+
+    def _object(self, bucket_name: str, object_name: str, stat: os.stat_result,
+                content_type: Optional[str] = None) -> Object:
+        return Object(
+            bucket_name, object_name,
+            last_modified=datetime.fromtimestamp(stat.st_mtime, tz=timezone.utc),
+            etag=self._etag(stat), size=stat.st_size, content_type=content_type or _content_type(object_name)
+        )
+
+    def _content_type(self, bucket_name: str, object_name: str) -> str:
+        """写入时记录的 Content-Type，没有记录时按扩展名推断"""
+        try:
+            with open(self._meta_path(bucket_name, object_name), "r", encoding="utf-8") as meta:
+                return meta.read().strip() or _content_type(object_name)
+        except OSError:
+            return _content_type(object_name)
+
+    def _save_content_type(self, bucket_name: str, object_name: str, content_type: Optional[str]):
+        meta_path = self._meta_path(bucket_name, object_name)
+        if not content_type:
+            self._remove_file(meta_path, os.path.join(self._meta, bucket_name))
+            return
+        os.makedirs(os.path.dirname(meta_path), exist_ok=True)
+        os.replace(self._write_temp([content_type.encode("utf-8")]), meta_path)
+
+    @staticmethod
+    def _remove_file(path: str, base: str) -> bool:
+        """删除文件并清理留下的空目录（不超出 base），文件不存在时返回 False"""
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            return False
+        parent = os.path.dirname(path)
+        while parent != base:
+            try:
+                os.rmdir(parent)
+            except OSError:
+                break
+            parent = os.path.dirname(parent)
+        return True
+
+    def _commit(self, temp_path: str, bucket_name: str, object_name: str,
+                content_type: Optional[str]) -> ObjectWriteResult:
+        """把写好的临时文件原子地移动到对象路径，并记录 Content-Type"""
+        path = self.object_path(bucket_name, object_name)
+        if not os.path.isdir(self._bucket_dir(bucket_name)):
+            os.unlink(temp_path)
+            raise _error("NoSuchBucket", "The specified bucket does not exist", bucket_name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(temp_path, path)
+        self._save_content_type(bucket_name, object_name, content_type)
+        return ObjectWriteResult(bucket_name, object_name, None, self._etag(os.stat(path)), None)
+
+    def _write_temp(self, chunks) -> str:
+        temp_path = os.path.join(self._tmp, uuid.uuid4().hex)
+        try:
+            with open(temp_path, "wb") as temp:
+                for chunk in chunks:
+                    temp.write(chunk)
+                temp.flush()
+                os.fsync(temp.fileno())
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            raise
+        return temp_path
+
+    # ----- 存储桶 -----
+
+    def bucket_exists(self, bucket_name: str) -> bool:
+        return os.path.isdir(self._bucket_dir(bucket_name))
+
+    def make_bucket(self, bucket_name: str, *args, **kwargs):
+        os.makedirs(self._bucket_dir(bucket_name), exist_ok=True)
+
+    # ----- 对象 -----
+
+    def put_object(self, bucket_name: str, object_name: str, data: BinaryIO, length: int,
+                   content_type: str = "application/octet-stream", part_size: int = 0, **kwargs) -> ObjectWriteResult:
+        chunk_size = part_size or COPY_CHUNK_SIZE
+
+        def chunks():
+            remaining = length
+            while remaining != 0:
+                block = data.read(chunk_size if remaining < 0 else min(chunk_size, remaining))
+                if not block:
+                    if remaining > 0:
+                        raise ValueError(f"数据长度不足 {length} 字节")
+                    return
+                if remaining > 0:
+                    remaining -= len(block)
+                yield block
+
+        return self._commit(self._write_temp(chunks()), bucket_name, object_name, content_type)
+
+    def get_object(self, bucket_name: str, object_name: str, offset: int = 0, length: int = 0, **kwargs):
+        path = self._existing(bucket_name, object_name)
+        raw = open(path, "rb")
+        stat = os.fstat(raw.fileno())
+        try:
+            offset, count = _read_range(stat.st_size, offset, length)
+        except S3Error:
+            raw.close()
+            raise
+        raw.seek(offset)
+        return _ObjectReader(raw, count, {
+            "ETag": f'"{self._etag(stat)}"',
+            "Content-Type": self._content_type(bucket_name, object_name),
+            "Content-Length": str(count),
+        })
+
+    def stat_object(self, bucket_name: str, object_name: str, **kwargs) -> Object:
+        stat = os.stat(self._existing(bucket_name, object_name))
+        return self._object(bucket_name, object_name, stat, self._content_type(bucket_name, object_name))
+
+    def list_objects(self, bucket_name: str, prefix: Optional[str] = None, recursive: bool = False,
+                     start_after: Optional[str] = None, **kwargs) -> Iterator[Object]:
+        prefix = prefix or ""
+        base = self._bucket_dir(bucket_name)
+        if not os.path.isdir(base):
+            raise _error("NoSuchBucket", "The specified bucket does not exist", bucket_name)
+        directory = prefix.rpartition("/")[0]
+        start = os.path.join(base, *directory.split("/")) if directory else base
+        yield from self._walk(bucket_name, start, f"{directory}/" if directory else "", prefix,
+                              recursive, start_after or "")
+
+    def _walk(self, bucket_name: str, path: str, key_prefix: str, prefix: str, recursive: bool,
+              start_after: str) -> Iterator[Object]:
+        """
+        按对象名字典序遍历目录：同一目录下按 "文件名" 与 "目录名/" 排序，
+        即与完整对象名的排序一致（S3 的列举顺序）
+        """
+        try:
+            entries = list(os.scandir(path))
+        except (FileNotFoundError, NotADirectoryError):
+            return
+        keyed = sorted((key_prefix + entry.name + ("/" if entry.is_dir() else ""), entry) for entry in entries)
+        for key, entry in keyed:
+            if not key.startswith(prefix):
+                continue
+            if entry.is_dir():
+                # 整个目录都不晚于 start_after 时跳过
+                if key < start_after and not start_after.startswith(key):
+                    continue
+                if recursive:
+                    yield from self._walk(bucket_name, entry.path, key, prefix, recursive, start_after)
+                elif key > start_after:
+                    yield Object(bucket_name, key)
+            elif key > start_after:
+                yield self._object(bucket_name, key, entry.stat())
+
+    def remove_object(self, bucket_name: str, object_name: str, **kwargs):
+        # 同时清理删除后留下的空目录
+        if self._remove_file(self.object_path(bucket_name, object_name), self._bucket_dir(bucket_name)):
+            self._remove_file(self._meta_path(bucket_name, object_name), os.path.join(self._meta, bucket_name))
+
+    def compose_object(self, bucket_name: str, object_name: str, sources, **kwargs) -> ObjectWriteResult:
+        paths = [self._existing(source.bucket_name, source.object_name) for source in sources]
+        # 与 S3 一样沿用第一个来源的 Content-Type
+        content_type = self._content_type(sources[0].bucket_name, sources[0].object_name)
+        temp_path = os.path.join(self._tmp, uuid.uuid4().hex)
+        if len(paths) == 1:
+            # 单一来源：硬链接即可，不复制数据
+            try:
+                os.link(paths[0], temp_path)
+                return self._commit(temp_path, bucket_name, object_name, content_type)
+            except OSError:
+                pass
+
+        def chunks():
+            for path in paths:
+                with open(path, "rb") as source:
+                    yield from iter(lambda: source.read(COPY_CHUNK_SIZE), b"")
+
+        return self._commit(self._write_temp(chunks()), bucket_name, object_name, content_type)
+
+    # ----- 分片上传 -----
+
+    def _upload_dir(self, upload_id: str) -> str:
+        if not upload_id or not upload_id.isalnum():
+            raise _error("NoSuchUpload", "The specified multipart upload does not exist.")
+        path = os.path.join(self._uploads, upload_id)
+        if not os.path.isdir(path):
+            raise _error("NoSuchUpload", "The specified multipart upload does not exist.")
+        return path
+
+    def _create_multipart_upload(self, bucket_name: str, object_name: str, headers=None) -> str:
+        self.object_path(bucket_name, object_name)
+        if not self.bucket_exists(bucket_name):
+            raise _error("NoSuchBucket", "The specified bucket does not exist", bucket_name)
+        upload_id = uuid.uuid4().hex
+        os.makedirs(os.path.join(self._uploads, upload_id))
+        with open(os.path.join(self._uploads, upload_id, "upload.json"), "w", encoding="utf-8") as meta:
+            json.dump({"bucket": bucket_name, "object": object_name,
+                       "content_type": (headers or {}).get("Content-Type")}, meta)
+        return upload_id
+
+    def _upload_part(self, bucket_name: str, object_name: str, data: bytes, headers, upload_id: str,
+                     part_number: int) -> str:
+        directory = self._upload_dir(upload_id)
+        temp_path = self._write_temp([data])
+        os.replace(temp_path, os.path.join(directory, f"{int(part_number):05d}"))
+        return hashlib.md5(data).hexdigest()
+
+    def _complete_multipart_upload(self, bucket_name: str, object_name: str, upload_id: str,
+                                   parts) -> ObjectWriteResult:
+        directory = self._upload_dir(upload_id)
+        paths = []
+        for part in parts:
+            path = os.path.join(directory, f"{int(part.part_number):05d}")
+            if not os.path.isfile(path):
+                raise _error("InvalidPart", "One or more of the specified parts could not be found.",
+                             bucket_name, object_name)
+            paths.append(path)
+
+        def chunks():
+            for path in paths:
+                with open(path, "rb") as source:
+                    yield from iter(lambda: source.read(COPY_CHUNK_SIZE), b"")
+
+        with open(os.path.join(directory, "upload.json"), "r", encoding="utf-8") as meta:
+            content_type = json.load(meta).get("content_type")
+        result = self._commit(self._write_temp(chunks()), bucket_name, object_name, content_type)
+        shutil.rmtree(directory, ignore_errors=True)
+        etag = _multipart_etag([part.etag.strip('"') for part in parts])
+        return ObjectWriteResult(bucket_name, object_name, None, etag or result.etag, None)
+
+    def _abort_multipart_upload(self, bucket_name: str, object_name: str, upload_id: str):
+        shutil.rmtree(self._upload_dir(upload_id))
+
+
+class MemoryBackend(StorageBackend):
+    """进程内存后端（基准测试用；不持久化，也不在进程之间共享）"""
+
+    kind = "memory"
+
+    def __init__(self):
+        self._buckets: Dict[str, Dict[str, Tuple[bytes, str, str, datetime]]] = {}
+        self._uploads: Dict[str, Dict[int, bytes]] = {}
+        self._upload_types: Dict[str, Optional[str]] = {}
+        self._lock = threading.Lock()
+
+    def _bucket(self, bucket_name: str) -> Dict[str, Tuple[bytes, str, str, datetime]]:
+        bucket = self._buckets.get(bucket_name)
+        if bucket is None:
+            raise _error("NoSuchBucket", "The specified bucket does not exist", bucket_name)
+        return bucket
+
+    def _get(self, bucket_name: str, object_name: str) -> Tuple[bytes, str, str, datetime]:
+        item = self._bucket(bucket_name).get(object_name)
+        if item is None:
+            raise _error("NoSuchKey", "The specified key does not exist.", bucket_name, object_name)
+        return item
+
+    def _store(self, bucket_name: str, object_name: str, data: bytes, content_type: Optional[str],
+               etag: Optional[str] = None) -> ObjectWriteResult:
+        etag = etag or hashlib.md5(data).hexdigest()
+        with self._lock:
+            self._bucket(bucket_name)[object_name] = (
+                data, content_type or _content_type(object_name), etag, datetime.now(timezone.utc)
+            )
+        return ObjectWriteResult(bucket_name, object_name, None, etag, None)
+
+    def bucket_exists(self, bucket_name: str) -> bool:
+        return bucket_name in self._buckets
+
+    def make_bucket(self, bucket_name: str, *args, **kwargs):
+        with self._lock:
+            self._buckets.setdefault(bucket_name, {})
+
+    def put_object(self, bucket_name: str, object_name: str, data: BinaryIO, length: int,
+                   content_type: str = "application/octet-stream", part_size: int = 0, **kwargs) -> ObjectWriteResult:
+        return self._store(bucket_name, object_name, data.read() if length < 0 else data.read(length), content_type)
+
+    def get_object(self, bucket_name: str, object_name: str, offset: int = 0, length: int = 0, **kwargs):
+        data, content_type, etag, _ = self._get(bucket_name, object_name)
+        offset, count = _read_range(len(data), offset, length)
+        return _ObjectReader(io.BytesIO(data[offset:offset + count]), count, {
+            "ETag": f'"{etag}"', "Content-Type": content_type, "Content-Length": str(count)
+        })
+
+    def stat_object(self, bucket_name: str, object_name: str, **kwargs) -> Object:
+        data, content_type, etag, modified = self._get(bucket_name, object_name)
+        return Object(bucket_name, object_name, last_modified=modified, etag=etag, size=len(data),
+                      content_type=content_type)
+
+    def list_objects(self, bucket_name: str, prefix: Optional[str] = None, recursive: bool = False,
+                     start_after: Optional[str] = None, **kwargs) -> Iterator[Object]:
+        prefix = prefix or ""
+        with self._lock:
+            items = sorted(self._bucket(bucket_name).items())
+        names = [name for name, _ in items]
+        index = bisect.bisect_left(names, prefix)
+        if start_after:
+            index = max(index, bisect.bisect_right(names, start_after))
+        last_dir = None
+        for name, (data, content_type, etag, modified) in items[index:]:
+            if not name.startswith(prefix):
+                break
+            if not recursive and "/" in name[len(prefix):]:
+                directory = prefix + name[len(prefix):].split("/", 1)[0] + "/"
+                if directory != last_dir:
+                    last_dir = directory
+                    yield Object(bucket_name, directory)
+                continue
+            yield Object(bucket_name, name, last_modified=modified, etag=etag, size=len(data),
+                         content_type=content_type)
+
+    def remove_object(self, bucket_name: str, object_name: str, **kwargs):
+        with self._lock:
+            self._bucket(bucket_name).pop(object_name, None)
+
+    def compose_object(self, bucket_name: str, object_name: str, sources, **kwargs) -> ObjectWriteResult:
+        data = b"".join(self._get(source.bucket_name, source.object_name)[0] for source in sources)
+        return self._store(bucket_name, object_name, data, self._get(sources[0].bucket_name, sources[0].object_name)[1])
+
+    def _create_multipart_upload(self, bucket_name: str, object_name: str, headers=None) -> str:
+        self._bucket(bucket_name)
+        upload_id = uuid.uuid4().hex
+        self._uploads[upload_id] = {}
+        self._upload_types[upload_id] = (headers or {}).get("Content-Type")
+        return upload_id
+
+    def _parts(self, upload_id: str) -> Dict[int, bytes]:
+        parts = self._uploads.get(upload_id)
+        if parts is None:
+            raise _error("NoSuchUpload", "The specified multipart upload does not exist.")
+        return parts
+
+    def _upload_part(self, bucket_name: str, object_name: str, data: bytes, headers, upload_id: str,
+                     part_number: int) -> str:
+        self._parts(upload_id)[int(part_number)] = bytes(data)
+        return hashlib.md5(data).hexdigest()
+
+    def _complete_multipart_upload(self, bucket_name: str, object_name: str, upload_id: str,
+                                   parts) -> ObjectWriteResult:
+        stored = self._parts(upload_id)
+        if any(part.part_number not in stored for part in parts):
+            raise _error("InvalidPart", "One or more of the specified parts could not be found.",
+                         bucket_name, object_name)
+        data = b"".join(stored[part.part_number] for part in parts)
+        result = self._store(bucket_name, object_name, data, self._upload_types.pop(upload_id, None),
+                             _multipart_etag([part.etag.strip('"') for part in parts]))
+        self._uploads.pop(upload_id, None)
+        return result
+
+    def _abort_multipart_upload(self, bucket_name: str, object_name: str, upload_id: str):
+        self._parts(upload_id)
+        self._uploads.pop(upload_id, None)
+        self._upload_types.pop(upload_id, None)
+
+
+def create_backend(kind: Optional[str] = None) -> StorageBackend:
+    """按 STORAGE_BACKEND 创建存储后端"""
+    kind = kind or settings.STORAGE_BACKEND
+    if kind == "minio":
+        return MinioBackend()
+    if kind == "local":
+        return LocalBackend(settings.LOCAL_STORAGE_ROOT)
+    if kind == "memory":
+        return MemoryBackend()
+    raise ValueError(f"未知的存储后端: {kind}")
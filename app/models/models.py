@@ -6,10 +6,10 @@
 邮箱: wangzh011031@163.com
 时间: 2025年
 """
-from sqlalchemy import Column, Integer, String, Text, Boolean, TIMESTAMP, ForeignKey, SmallInteger, CheckConstraint, ARRAY
+from sqlalchemy import Column, Integer, BigInteger, String, Text, Boolean, TIMESTAMP, ForeignKey, SmallInteger, CheckConstraint, UniqueConstraint, Index, ARRAY
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
-from sqlalchemy.dialects.postgresql import UUID, JSONB
+from sqlalchemy.dialects.postgresql import UUID, JSONB, TSVECTOR
 from sqlalchemy.sql import func
 import uuid
 
@@ -178,4 +178,61 @@ class KnowledgeSystemFile(Base):
     updated_at = Column(TIMESTAMP(timezone=True), server_default=func.now(), onupdate=func.now())
     deleted_at = Column(TIMESTAMP(timezone=True), nullable=True)  # 软删除字段
 
+class StoredObject(Base):
+    """对象存储中的文件及其被业务记录引用的次数（引用数归零时删除对象）"""
+    __tablename__ = "stored_objects"
+    __table_args__ = (
+        UniqueConstraint('bucket', 'object_name', name='uq_stored_objects_bucket_object'),
+        CheckConstraint('ref_count >= 0', name='ck_stored_objects_ref_count'),
+    )
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    bucket = Column(String(63), nullable=False)  # 存储桶
+    object_name = Column(Text, nullable=False)  # 对象名（内容寻址模式下为 sha256/xx/<digest>.ext）
+    sha256 = Column(String(64), index=True)  # 内容摘要（预签名直传等无法计算时为空）
+    size = Column(BigInteger)  # 字节数
+    content_type = Column(String(255))
+    ref_count = Column(Integer, nullable=False, default=1)  # 引用次数
+    created_at = Column(TIMESTAMP(timezone=True), server_default=func.now())
+    updated_at = Column(TIMESTAMP(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class IndexedObject(Base):
+    """对象存储目录索引（工作档案等按目录浏览的存储桶），由写入时更新与定期对账维护"""
+    __tablename__ = "object_index"
+    __table_args__ = (
+        UniqueConstraint('bucket', 'path', name='uq_object_index_bucket_path'),
+        Index('ix_object_index_bucket_parent_name', 'bucket', 'parent', 'name'),
+        Index('ix_object_index_bucket_category', 'bucket', 'category'),
+    )
+    
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    bucket = Column(String(63), nullable=False)  # 存储桶
+    path = Column(Text, nullable=False)  # 对象名
+    parent = Column(Text, nullable=False, default='')  # 所在目录（根目录为空字符串）
+    name = Column(Text, nullable=False)  # 文件名
+    ext = Column(String(20), nullable=False, default='')  # 小写扩展名（含点）
+    category = Column(String(20), nullable=False, default='other')  # image/video/document/code/other
+    size = Column(BigInteger, nullable=False, default=0)  # 字节数
+    etag = Column(String(100))
+    mtime = Column(TIMESTAMP(timezone=True))  # 对象最后修改时间
+    indexed_at = Column(TIMESTAMP(timezone=True), server_default=func.now(), onupdate=func.now())  # 最近一次写入索引的时间
 
+class DocumentText(Base):
+    """文档全文索引（知识体系文件与工作档案本地文档抽取的纯文本与分词），由后台文本抽取任务维护"""
+    __tablename__ = "document_texts"
+    __table_args__ = (
+        UniqueConstraint('source', 'source_key', name='uq_document_texts_source_key'),
+        Index('ix_document_texts_search_vector', 'search_vector', postgresql_using='gin'),
+    )
+    
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    source = Column(String(20), nullable=False)  # 来源：knowledge（知识体系文件）、archive（工作档案本地文件）
+    source_key = Column(Text, nullable=False)  # 知识体系文件ID / 工作档案相对路径
+    title = Column(Text, nullable=False, default='')  # 文件名
+    file_type = Column(String(20), nullable=False, default='')  # 小写扩展名（不含点）
+    version = Column(String(100))  # 源文件版本，变化时重新抽取
+    status = Column(String(20), nullable=False, default='ok')  # ok / unsupported / too_large / failed
+    error = Column(Text)  # 抽取失败原因
+    content = Column(Text)  # 抽取的纯文本（截断到 DOC_INDEX_MAX_CHARS）
+    search_vector = Column(TSVECTOR)  # 文件名（权重A）与正文的分词（中文为单字与相邻二字）
+    indexed_at = Column(TIMESTAMP(timezone=True), server_default=func.now(), onupdate=func.now())
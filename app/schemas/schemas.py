@@ -211,6 +211,55 @@ class FileUploadResponse(BaseModel):
     file_size: int
     content_type: str
 
+# 断点续传上传会话
+class UploadSessionCreate(BaseModel):
+    filename: str
+    total_size: int
+    content_type: Optional[str] = None
+    bucket: Optional[str] = None  # 默认存储桶或 knowledge-files
+
+class UploadSessionResponse(BaseModel):
+    session_id: str
+    filename: str
+    content_type: str
+    total_size: int
+    chunk_size: int
+    total_chunks: int
+    received_chunks: List[int]
+    missing_chunks: List[int]
+    expires_at: datetime
+
+# 预签名直传
+class PresignedUploadRequest(BaseModel):
+    filename: str
+    size: int
+    content_type: Optional[str] = None
+    target: str = "form"  # form: 修复表单图片; knowledge: 知识体系文件
+
+class PresignedUploadResponse(BaseModel):
+    ticket_id: str
+    object_name: str
+    bucket: str
+    upload_url: str
+    method: str
+    headers: dict
+    expires_at: datetime
+
+class PresignedFormCommit(BaseModel):
+    ticket_id: str
+    form_id: UUID
+
+class PresignedKnowledgeCommit(BaseModel):
+    ticket_id: str
+    unit: str
+    submission_info: str
+    file_type: Optional[str] = None  # 为空时取文件扩展名
+    remark: Optional[str] = None
+
+# 预签名下载地址
+class FileUrlPresignRequest(BaseModel):
+    urls: List[str]
+
 # 批量删除请求模型
 class BatchDeleteRequest(BaseModel):
     ids: List[int]
@@ -8,4 +8,15 @@
 时间: 2025年
 """
 
-from .file_service import file_service
\ No newline at end of file
+from .file_service import file_service, FileTooLargeError
+from .async_file_service import async_file_service, StorageTimeoutError
+from .upload_session_service import upload_session_service, UploadSessionError
+from .image_service import image_service
+from .object_index_service import object_index
+from .storage_gc_service import storage_gc
+from .document_index_service import document_index
+from .dashboard_service import dashboard_stats
+from .timeseries_service import timeseries, TimeSeriesError
+from .evaluation_stats_service import evaluation_stats
+from .dashboard_cache_service import dashboard_cache
+from .gantt_service import gantt
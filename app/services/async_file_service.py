@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+"""
+异步文件存储门面
+
+minio-py 是同步客户端，直接在 async 路由中调用会阻塞事件循环。
+本模块把 FileService 的调用放到有界线程池中执行，并提供并发上限与单次调用超时。
+
+作者: 王梓涵
+邮箱: wangzh011031@163.com
+时间: 2025年
+"""
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, BinaryIO, List, Optional
+import asyncio
+import functools
+import logging
+
+from ..core.config import settings
+from .file_service import FileService, file_service
+
+logger = logging.getLogger(__name__)
+
+
+class StorageTimeoutError(Exception):
+    """存储调用超时"""
+
+
+class AsyncFileService:
+    """
+    FileService 的异步版本
+
+    - 所有MinIO调用在独立的有界线程池中执行，不占用事件循环线程
+    - 信号量限制同时进行的存储调用数量，超出的请求在事件循环上排队等待
+    - 每次调用都有超时时间，可按调用单独指定
+    """
+
+    def __init__(self, service: FileService, max_concurrency: int, call_timeout: float, upload_timeout: float):
+        self.service = service
+        self.max_concurrency = max_concurrency
+        self.call_timeout = call_timeout
+        self.upload_timeout = upload_timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="storage-io")
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def _run(self, func, *args, timeout: Optional[float] = None, **kwargs):
+        """在存储线程池中执行同步调用"""
+        loop = asyncio.get_running_loop()
+        async with self._semaphore:
+            future = loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+            try:
+                return await asyncio.wait_for(future, timeout or self.call_timeout)
+            except asyncio.TimeoutError:
+                # 线程中的MinIO请求无法强制中断，这里只释放等待方
+                logger.error(f"存储调用超时: {getattr(func, '__name__', func)}")
+                raise StorageTimeoutError("存储服务响应超时")
+
+    async def upload_file(self, file_content: bytes, filename: str, content_type: str = None,
+                          bucket_name: str = None, timeout: Optional[float] = None) -> str:
+        return await self._run(self.service.upload_file, file_content, filename, content_type, bucket_name,
+                               timeout=timeout or self.upload_timeout)
+
+    async def upload_stream(self, stream: BinaryIO, filename: str, content_type: str = None,
+                            bucket_name: str = None, max_size: Optional[int] = None,
+                            timeout: Optional[float] = None) -> dict:
+        return await self._run(self.service.upload_stream, stream, filename, content_type, bucket_name, max_size,
+                               timeout=timeout or self.upload_timeout)
+
+    async def upload_chunks(self, chunks: AsyncIterator[bytes], filename: str, content_type: str = None,
+                            bucket_name: str = None, max_size: Optional[int] = None,
+                            timeout: Optional[float] = None) -> dict:
+        """
+        从异步分块迭代器上传文件（如 multipart 请求中的文件分片）
+
+        数据在事件循环侧缓冲满一个分片（UPLOAD_PART_SIZE）后才交给存储线程池上传，
+        信号量与存储线程只在单个分片的存储调用期间占用，等待慢速客户端发送数据时不占用；
+        不超过一个分片的文件单次写入，更大的文件同时最多 UPLOAD_PART_CONCURRENCY 个分片在上传。
+        timeout 为单次存储调用（一个分片）的超时时间。
+        """
+        upload = self.service.open_stream_upload(filename, content_type, bucket_name, max_size)
+        part_size = settings.UPLOAD_PART_SIZE
+        concurrency = max(1, settings.UPLOAD_PART_CONCURRENCY)
+        timeout = timeout or self.upload_timeout
+        buffer = bytearray()
+        pending = set()
+        part_number = 0
+
+        async def send_part(data: bytes):
+            nonlocal part_number, pending
+            if upload.upload_id is None:
+                await self._run(upload.begin)
+            part_number += 1
+            pending.add(asyncio.ensure_future(self._run(upload.upload_part, part_number, data, timeout=timeout)))
+            if len(pending) >= concurrency:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    task.result()
+
+        try:
+            async for chunk in chunks:
+                upload.update(chunk)
+                buffer += chunk
+                # 多于一个分片时才开始multipart上传，保证最后一个分片非空
+                while len(buffer) > part_size:
+                    data = bytes(buffer[:part_size])
+                    del buffer[:part_size]
+                    await send_part(data)
+            if upload.upload_id is not None:
+                await send_part(bytes(buffer))
+                buffer = bytearray()
+            if pending:
+                done, pending = await asyncio.wait(pending)
+                for task in done:
+                    task.result()
+            return await self._run(upload.finish, bytes(buffer), timeout=timeout)
+        except BaseException:
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+            try:
+                await self._run(upload.abort)
+            except Exception as e:
+                logger.error(f"放弃分片上传失败: {e}")
+            raise
+
+    async def upload_many(self, uploads: List[dict], concurrency: Optional[int] = None) -> List[dict]:
+        """
+        并发上传多个文件
+
+        uploads 中每项为 upload_stream 的关键字参数（stream、filename、content_type、bucket_name）。
+        返回结果与传入顺序一致；任意一个上传失败时，删除本批次已写入的对象后抛出第一个异常。
+        """
+        limit = asyncio.Semaphore(concurrency or settings.FORM_UPLOAD_CONCURRENCY)
+
+        async def upload_one(item: dict) -> dict:
+            async with limit:
+                return await self.upload_stream(**item)
+
+        results = await asyncio.gather(*[upload_one(item) for item in uploads], return_exceptions=True)
+        errors = [r for r in results if isinstance(r, BaseException)]
+        if errors:
+            stored = [r for r in results if not isinstance(r, BaseException)]
+            await self.delete_objects(stored)
+            raise errors[0]
+        return results
+
+    async def create_multipart_upload(self, filename: str, content_type: str = None,
+                                      bucket_name: str = None) -> dict:
+        return await self._run(self.service.create_multipart_upload, filename, content_type, bucket_name)
+
+    async def upload_part(self, object_name: str, upload_id: str, part_number: int, data: bytes,
+                          bucket_name: str = None, timeout: Optional[float] = None) -> str:
+        return await self._run(self.service.upload_part, object_name, upload_id, part_number, data, bucket_name,
+                               timeout=timeout or self.upload_timeout)
+
+    async def complete_multipart_upload(self, object_name: str, upload_id: str, parts: list,
+                                        bucket_name: str = None) -> str:
+        return await self._run(self.service.complete_multipart_upload, object_name, upload_id, parts, bucket_name)
+
+    async def abort_multipart_upload(self, object_name: str, upload_id: str, bucket_name: str = None) -> bool:
+        return await self._run(self.service.abort_multipart_upload, object_name, upload_id, bucket_name)
+
+    async def get_object(self, object_name: str, bucket_name: str = None) -> Optional[dict]:
+        return await self._run(self.service.get_object, object_name, bucket_name)
+    
+    async def stat_object(self, object_name: str, bucket_name: str = None) -> Optional[dict]:
+        return await self._run(self.service.stat_object, object_name, bucket_name)
+
+    async def delete_file(self, file_url: str, timeout: Optional[float] = None) -> bool:
+        return await self._run(self.service.delete_file, file_url, timeout=timeout)
+
+    async def delete_objects(self, stored: List[dict]):
+        """回滚一批 upload_stream 的上传结果：释放本次登记的引用，无其他引用的对象被删除"""
+        if not stored:
+            return
+        outcomes = await asyncio.gather(*[
+            self._run(self.service.release_object, item["object_name"], item.get("bucket"), True)
+            for item in stored
+        ], return_exceptions=True)
+        for item, outcome in zip(stored, outcomes):
+            if isinstance(outcome, BaseException):
+                logger.warning(f"清理已上传对象失败: {item['object_name']}: {outcome}")
+    
+    async def record_reference(self, object_name: str, bucket_name: str = None, sha256: Optional[str] = None,
+                               size: Optional[int] = None, content_type: Optional[str] = None) -> int:
+        return await self._run(self.service.record_reference, object_name, bucket_name, sha256, size, content_type)
+    
+    async def index_object(self, object_name: str, bucket_name: str = None, size: Optional[int] = None,
+                           etag: Optional[str] = None):
+        await self._run(self.service.index_object, object_name, bucket_name, size, etag)
+    
+    async def retain_file_urls(self, urls: List[str]):
+        """业务记录复制了已有文件地址时为每个地址增加一次引用"""
+        outcomes = await asyncio.gather(*[
+            self._run(self.service.retain_file_url, url) for url in urls if url
+        ], return_exceptions=True)
+        for outcome in outcomes:
+            if isinstance(outcome, BaseException):
+                logger.error(f"增加对象引用失败: {outcome}")
+    
+    async def release_file_urls(self, urls: List[str]):
+        """
+        业务记录删除后释放其引用的文件，最后一个引用释放时删除对象
+        失败只记录日志：业务删除已生效，遗留对象由孤儿对象清理兜底
+        """
+        outcomes = await asyncio.gather(*[
+            self._run(self.service.release_file_url, url) for url in urls if url
+        ], return_exceptions=True)
+        for outcome in outcomes:
+            if isinstance(outcome, BaseException):
+                logger.error(f"释放对象引用失败: {outcome}")
+
+    async def list_objects(self, prefix: str = "", recursive: bool = True, timeout: Optional[float] = None) -> list:
+        return await self._run(self.service.list_objects, prefix, recursive, timeout=timeout)
+
+    async def get_directory_structure(self, bucket_name: str = None, timeout: Optional[float] = None) -> dict:
+        return await self._run(self.service.get_directory_structure, bucket_name, timeout=timeout)
+
+    async def get_files_in_directory(self, directory_path: str, bucket_name: str = None,
+                                     timeout: Optional[float] = None) -> list:
+        return await self._run(self.service.get_files_in_directory, directory_path, bucket_name, timeout=timeout)
+
+    async def list_files_page(self, bucket_name: str = None, directory_path: Optional[str] = None,
+                              start_after: Optional[str] = None, limit: Optional[int] = None,
+                              match=None, timeout: Optional[float] = None) -> tuple:
+        return await self._run(self.service.list_files_page, bucket_name, directory_path, start_after, limit, match,
+                               timeout=timeout)
+
+    def shutdown(self):
+        """关闭存储线程池与分片上传线程池（应用退出时调用）"""
+        self._executor.shutdown(wait=False)
+        self.service.shutdown()
+
+
+# 全局异步文件服务实例
+async_file_service = AsyncFileService(
+    file_service,
+    max_concurrency=settings.STORAGE_MAX_CONCURRENCY,
+    call_timeout=settings.STORAGE_CALL_TIMEOUT,
+    upload_timeout=settings.STORAGE_UPLOAD_TIMEOUT
+)
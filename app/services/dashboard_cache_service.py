@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+"""
+仪表板统计结果缓存
+
+统计数据只在工作流、表单、评估、回溯申请被写入时变化，缓存按以下方式失效：
+- 写接口提交后调用 invalidate()，递增 Redis 中的版本号（dashboard:version）
+- 缓存项记录计算时的版本号，版本号变化后不再使用；TTL（DASHBOARD_CACHE_TTL）兜底“今天”“本月”等随时间变化的数据
+- 管理员看到的是全局数据，按角色缓存；修复专家与评估专家含个人数据，按角色 + 用户缓存
+
+两级缓存：进程内 L1 与 Redis L2（多个 worker 共享）。一次读取用 MGET 同时取版本号与 L2 缓存项；
+Redis 不可用时只使用 L1（其他 worker 的写入要等 TTL 过期后才可见）。
+Redis 客户端是同步的，命令在线程池中执行，get() 与 invalidate() 是协程，不阻塞事件循环。
+命中率与命中时数据的时长（staleness）按进程统计，通过 metrics() 查看。
+
+作者: 王梓涵
+邮箱: wangzh011031@163.com
+时间: 2025年
+"""
+from collections import OrderedDict
+from typing import Callable, Optional, Tuple
+import asyncio
+import json
+import logging
+import threading
+import time
+
+from ..core.config import settings
+from .email_service import redis_client
+
+logger = logging.getLogger(__name__)
+
+VERSION_KEY = "dashboard:version"
+ENTRY_KEY_PREFIX = "dashboard:stats:"
+
+# 进程内缓存的最大条目数（按角色/用户，超出时淘汰最久未使用的）
+L1_MAX_ENTRIES = 1024
+
+# Redis 出错后暂停访问的时间（秒），避免每次请求都等待连接超时
+REDIS_RETRY_INTERVAL = 30.0
+
+# 按用户缓存的角色（含个人统计）
+PERSONAL_ROLES = ("restorer", "evaluator")
+
+
+class DashboardCache:
+    """仪表板统计结果的两级缓存（版本号失效 + TTL）"""
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[int, float, dict]]" = OrderedDict()  # 键 → (版本号, 计算时间, 数据)
+        self._local_version = 0
+        self._redis_retry_at = 0.0
+        self._lock = threading.Lock()
+        self._stats = {"l1_hits": 0, "l2_hits": 0, "misses": 0, "invalidations": 0, "errors": 0}
+        self._age_total = 0.0
+        self._age_max = 0.0
+        self._compute_total = 0.0
+
+    @staticmethod
+    def scope(role: str, user_id: int) -> str:
+        return f"{role}:{user_id}" if role in PERSONAL_ROLES else role
+
+    def _record_hit(self, kind: str, computed_at: float):
+        age = max(0.0, time.time() - computed_at)
+        with self._lock:
+            self._stats[kind] += 1
+            self._age_total += age
+            self._age_max = max(self._age_max, age)
+
+    def _redis_failed(self, e: Exception):
+        with self._lock:
+            self._stats["errors"] += 1
+        self._redis_retry_at = time.time() + REDIS_RETRY_INTERVAL
+        logger.warning(f"仪表板缓存访问Redis失败，{REDIS_RETRY_INTERVAL:.0f}秒内只使用进程内缓存: {e}")
+
+    @staticmethod
+    async def _redis(func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, func, *args)
+
+    async def _read_remote(self, scope: str) -> Tuple[Optional[int], Optional[dict]]:
+        """(当前版本号, L2 缓存项)；Redis 不可用时返回 (None, None)"""
+        if time.time() < self._redis_retry_at:
+            return None, None
+        try:
+            version, raw = await self._redis(redis_client.mget, VERSION_KEY, ENTRY_KEY_PREFIX + scope)
+        except Exception as e:
+            self._redis_failed(e)
+            return None, None
+        entry = None
+        if raw:
+            try:
+                entry = json.loads(raw)
+            except ValueError:
+                entry = None
+        return int(version or 0), entry
+
+    async def get(self, role: str, user_id: int, compute: Callable[[], dict]) -> dict:
+        """返回缓存的统计数据，版本号变化或过期时调用 compute() 重新计算并写入缓存"""
+        if self.ttl <= 0:
+            return compute()
+        scope = self.scope(role, user_id)
+        now = time.time()
+        version, remote = await self._read_remote(scope)
+        shared = version is not None
+        if not shared:
+            version = self._local_version
+
+        local = self._entries.get(scope)
+        if local is not None and local[0] == version and now - local[1] < self.ttl:
+            self._record_hit("l1_hits", local[1])
+            return local[2]
+        if (remote is not None and remote.get("version") == version
+                and now - remote.get("computed_at", 0) < self.ttl):
+            self._store_local(scope, version, remote["computed_at"], remote["data"])
+            self._record_hit("l2_hits", remote["computed_at"])
+            return remote["data"]
+
+        # 使用计算之前读取的版本号：计算期间发生的写入会使这次结果立即失效
+        started = time.time()
+        data = compute()
+        with self._lock:
+            self._stats["misses"] += 1
+            self._compute_total += time.time() - started
+        self._store_local(scope, version, started, data)
+        if shared:
+            try:
+                await self._redis(
+                    redis_client.setex, ENTRY_KEY_PREFIX + scope, max(1, int(self.ttl)),
+                    json.dumps({"version": version, "computed_at": started, "data": data},
+                               ensure_ascii=False, default=str)
+                )
+            except Exception as e:
+                self._redis_failed(e)
+        return data
+
+    def _store_local(self, scope: str, version: int, computed_at: float, data: dict):
+        with self._lock:
+            self._entries[scope] = (version, computed_at, data)
+            self._entries.move_to_end(scope)
+            while len(self._entries) > L1_MAX_ENTRIES:
+                self._entries.popitem(last=False)
+
+    async def invalidate(self):
+        """统计数据相关的写入提交后调用，使所有 worker 的缓存失效"""
+        with self._lock:
+            self._stats["invalidations"] += 1
+            self._local_version += 1
+            # Redis 不可用时各 worker 只能清空自己的 L1
+            self._entries.clear()
+        # 即使暂停访问期间也尝试递增，保证其他 worker 能看到这次写入
+        try:
+            await self._redis(redis_client.incr, VERSION_KEY)
+        except Exception as e:
+            self._redis_failed(e)
+
+    def metrics(self) -> dict:
+        """本进程的缓存命中率与命中数据的时长（秒）"""
+        with self._lock:
+            stats = dict(self._stats)
+            hits = stats["l1_hits"] + stats["l2_hits"]
+            requests = hits + stats["misses"]
+            return {
+                **stats,
+                "ttl": self.ttl,
+                "entries": len(self._entries),
+                "hit_rate": round(hits / requests * 100, 1) if requests else None,
+                "avg_staleness": round(self._age_total / hits, 3) if hits else None,
+                "max_staleness": round(self._age_max, 3),
+                "avg_compute_ms": round(self._compute_total / stats["misses"] * 1000, 2) if stats["misses"] else None
+            }
+
+
+# 全局仪表板缓存实例
+dashboard_cache = DashboardCache(ttl=settings.DASHBOARD_CACHE_TTL)
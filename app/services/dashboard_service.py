@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+"""
+仪表板统计服务
+
+/api/dashboard 的全部计数合并为一条聚合查询：工作流、回溯申请、评估各自用 COUNT(*) FILTER (WHERE ...)
+在一次扫描中算出所有计数（每个表一个单行子查询，互相交叉连接），
+管理员的近两周每日新建数量由 timeseries_service 用一条按本地日期分组的查询取得，
+评分分布与平均分、高分率由 evaluation_stats_service 在数据库中聚合，最近活动一次性预加载操作人与工作流。
+返回数据的结构与 DashboardStats 一致。
+
+作者: 王梓涵
+邮箱: wangzh011031@163.com
+时间: 2025年
+"""
+from datetime import datetime, timedelta
+from typing import Dict, List
+import random
+
+from sqlalchemy import and_, desc, exists, select, true
+from sqlalchemy.orm import Session, joinedload
+from sqlalchemy.sql import func
+
+from ..models import Evaluation, Form, RollbackRequest, StepLog, User, Workflow
+from .evaluation_stats_service import evaluation_stats
+from .timeseries_service import timeseries
+
+WEEKDAY_LABELS = ['周一', '周二', '周三', '周四', '周五', '周六', '周日']
+
+RECENT_ACTIVITY_LIMIT = 10
+
+
+def _count(*conditions):
+    """COUNT(*) FILTER (WHERE ...)，没有条件时为 COUNT(*)"""
+    return func.count().filter(and_(*conditions)) if conditions else func.count()
+
+
+class DashboardStatsService:
+    """仪表板统计数据"""
+
+    @staticmethod
+    def counts(db: Session, role: str, user_id: int, month_start: datetime) -> Dict[str, int]:
+        """按角色所需的全部计数（一条查询）"""
+        live = Workflow.deleted_at.is_(None)
+        workflow_columns = [
+            _count().label("total_workflows"),
+            _count(Workflow.status == 'running').label("running_workflows"),
+            _count(Workflow.status == 'finished').label("finished_workflows"),
+        ]
+        if role in ('admin', 'evaluator'):
+            evaluated = exists().where(Evaluation.workflow_id == Workflow.workflow_id)
+            workflow_columns.append(_count(Workflow.status == 'finished', ~evaluated).label("pending_evaluations"))
+        if role == 'restorer':
+            mine = Workflow.initiator_id == user_id
+            workflow_columns += [
+                _count(mine).label("my_workflows"),
+                _count(mine, Workflow.status == 'running').label("my_running_workflows"),
+                _count(mine, Workflow.status == 'finished').label("my_finished_workflows"),
+                _count(mine, Workflow.created_at >= month_start).label("monthly_submissions"),
+            ]
+        subqueries = [select(*workflow_columns).where(live).subquery()]
+
+        if role == 'admin':
+            subqueries.append(select(
+                _count(RollbackRequest.status == 'pending').label("pending_rollbacks")
+            ).subquery())
+        elif role == 'restorer':
+            subqueries.append(select(
+                _count().label("my_rollback_requests")
+            ).where(RollbackRequest.requester_id == user_id).subquery())
+        elif role == 'evaluator':
+            subqueries.append(select(
+                _count().label("completed_evaluations"),
+                _count(Evaluation.created_at >= month_start).label("monthly_evaluations")
+            ).where(Evaluation.evaluator_id == user_id).subquery())
+
+        # 每个子查询只有一行，交叉连接后仍是一行
+        joined = subqueries[0]
+        for subquery in subqueries[1:]:
+            joined = joined.join(subquery, true())
+        columns = [column for subquery in subqueries for column in subquery.c]
+        row = db.execute(select(*columns).select_from(joined)).one()
+        return dict(row._mapping)
+
+    @staticmethod
+    def recent_activities(db: Session) -> List[dict]:
+        """最近的操作记录（一次查询预加载操作人、表单与工作流）"""
+        logs = db.query(StepLog).options(
+            joinedload(StepLog.operator),
+            joinedload(StepLog.form).joinedload(Form.workflow)
+        ).order_by(desc(StepLog.created_at)).limit(RECENT_ACTIVITY_LIMIT).all()
+        return [
+            {
+                "action": log.action,
+                "operator": log.operator.full_name,
+                "time": log.created_at.strftime("%Y-%m-%d %H:%M"),
+                "form_id": str(log.form_id),
+                "workflow_title": log.form.workflow.title if log.form and log.form.workflow else None,
+                "comment": log.comment
+            }
+            for log in logs
+        ]
+
+    def build(self, db: Session, user: User) -> dict:
+        """
+        仪表板数据（DashboardStats 的字段）
+        - 管理员：全局统计、近7天趋势与评分分布
+        - 修复专家：个人工作流统计
+        - 评估专家：评估工作统计与个人评分分布
+        """
+        role = user.role.role_key
+        today = timeseries.today()
+        month_start = timeseries.local_midnight(today.replace(day=1))
+        counts = self.counts(db, role, user.user_id, month_start)
+
+        total = counts["total_workflows"]
+        data = {
+            "total_workflows": total,
+            "running_workflows": counts["running_workflows"],
+            "finished_workflows": counts["finished_workflows"],
+            "pending_evaluations": counts.get("pending_evaluations", 0),
+            "pending_rollbacks": counts.get("pending_rollbacks", 0),
+            "my_workflows": counts.get("my_workflows"),
+            "recent_activities": self.recent_activities(db),
+            "completion_rate": round((counts["finished_workflows"] / total * 100) if total > 0 else 0, 1)
+        }
+
+        if role == 'admin':
+            # 近两周每日新建数量（一条按本地日期分组的查询）：后7天为本周趋势，前7天合计为上周
+            daily = timeseries.series(db, "workflows", "day", today - timedelta(days=13), today + timedelta(days=1))
+            days = [bucket["start"] for bucket in daily[7:]]
+            values = [bucket["count"] for bucket in daily[7:]]
+            this_week_total = sum(values)
+            last_week_total = sum(bucket["count"] for bucket in daily[:7])
+            if last_week_total > 0:
+                workflow_trend = round(((this_week_total - last_week_total) / last_week_total) * 100, 1)
+            else:
+                workflow_trend = 0.0 if this_week_total == 0 else 100.0
+            data["workflow_trend"] = workflow_trend
+            data["workflow_trend_data"] = {
+                "labels": [WEEKDAY_LABELS[d.weekday()] for d in days],
+                "values": values
+            }
+            data["score_distribution"] = evaluation_stats.summary(db)["distribution"]
+
+        elif role == 'restorer':
+            # 本人发起的工作流收到的平均评分（十分制）
+            received = evaluation_stats.summary(db, initiator_id=user.user_id)
+            data.update({
+                "my_running_workflows": counts["my_running_workflows"],
+                "my_finished_workflows": counts["my_finished_workflows"],
+                "my_rollback_requests": counts["my_rollback_requests"],
+                "monthly_submissions": counts["monthly_submissions"],
+                "average_score": evaluation_stats.ten_point(received["mean"])
+            })
+            # 个人工作进度和质量指标（模拟数据）
+            data["personal_progress"] = {
+                "monthly_completion": round(random.uniform(60, 95), 1),
+                "quality_score": round(random.uniform(75, 95), 1)
+            }
+
+        elif role == 'evaluator':
+            given = evaluation_stats.summary(db, evaluator_id=user.user_id)
+            data.update({
+                "completed_evaluations": counts["completed_evaluations"],
+                "monthly_evaluations": counts["monthly_evaluations"],
+                "average_given_score": evaluation_stats.ten_point(given["mean"]),
+                "high_score_rate": given["high_score_rate"],
+                # 评估效率（模拟数据）
+                "evaluation_efficiency": round(random.uniform(2, 5), 1)
+            })
+            data["score_distribution"] = given["distribution"]
+
+        return data
+
+
+# 全局仪表板统计服务实例
+dashboard_stats = DashboardStatsService()
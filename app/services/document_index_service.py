@@ -0,0 +1,312 @@
+# -*- coding: utf-8 -*-
+"""
+文档全文索引服务
+
+document_texts 表保存知识体系文件与工作档案本地文档（doc/ 等目录下的 md、txt、docx、pdf）的纯文本与分词：
+- 后台任务定期对账：文件新增或变化（知识体系文件的地址或文件名、本地文件的大小或修改时间）时重新抽取，
+  已删除的文件删除索引行；新增、修改、删除知识体系文件后立即触发一次对账
+- 文本抽取与分词在独立的进程池中执行（见 utils/document_text），结果写入 tsvector（文件名权重A），GIN索引
+- 搜索先用 tsvector 粗筛，再用原词在正文/文件名中精确查找，按 ts_rank 排序并截取命中位置附近的摘要
+
+多个worker之间通过Redis锁互斥（Redis不可用时各自执行，写入为幂等的upsert）。
+
+作者: 王梓涵
+邮箱: wangzh011031@163.com
+时间: 2025年
+"""
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import asyncio
+import hashlib
+import logging
+import multiprocessing
+import os
+
+from sqlalchemy import cast, delete, literal, or_, select
+from sqlalchemy.dialects.postgresql import ARRAY, TSQUERY, insert as pg_insert
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import func
+from sqlalchemy.types import Text
+
+from ..core.config import settings
+from ..core.database import SessionLocal
+from ..models import DocumentText, KnowledgeSystemFile
+from ..utils.archive_tree import ArchiveTree
+from ..utils.document_text import EXTRACTABLE_EXTS, build_query, extract_document, highlight, tokenize
+from .email_service import redis_client
+from .file_service import file_service
+
+logger = logging.getLogger(__name__)
+
+INDEX_LOCK_KEY = "document_index:sync_lock"
+INDEX_LOCK_TTL = 3600
+BATCH_SIZE = 500
+
+# 摘要：命中位置之前保留的字符数与摘要总长度
+SNIPPET_BEFORE = 40
+SNIPPET_LENGTH = 160
+
+
+def _vector(title_tokens: List[str], tokens: List[str]):
+    """分词 → tsvector（文件名权重A，正文默认权重D；不记录位置，避免超出 tsvector 大小上限）"""
+    return func.setweight(func.array_to_tsvector(literal(title_tokens, ARRAY(Text))), "A").op("||")(
+        func.array_to_tsvector(literal(tokens, ARRAY(Text)))
+    )
+
+
+class DocumentIndexService:
+    """全文索引的维护（文本抽取进程池）与查询"""
+
+    def __init__(self, max_workers: int, task_timeout: float, interval: int):
+        self.max_workers = max_workers
+        self.task_timeout = task_timeout
+        self.interval = interval
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._wake: Optional[asyncio.Event] = None
+        self.last_result: Optional[dict] = None
+
+    def _pool(self) -> ProcessPoolExecutor:
+        # 延迟创建；使用spawn避免fork时复制存储线程池等线程状态
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._executor
+
+    # ----- 对账 -----
+
+    @staticmethod
+    def _sources(db: Session, archive_tree: Optional[ArchiveTree]) -> Dict[Tuple[str, str], dict]:
+        """当前应被索引的文档：{(来源, 键): {title, ext, version, path | bucket/object_name}}"""
+        sources: Dict[Tuple[str, str], dict] = {}
+        for file_id, filename, file_url, file_type in db.query(
+            KnowledgeSystemFile.id, KnowledgeSystemFile.filename,
+            KnowledgeSystemFile.file_url, KnowledgeSystemFile.file_type
+        ).filter(KnowledgeSystemFile.deleted_at.is_(None)):
+            location = file_service.parse_file_url(file_url)
+            sources[("knowledge", str(file_id))] = {
+                "title": filename,
+                "ext": os.path.splitext(filename)[1].lower() or f".{(file_type or '').lower()}",
+                "version": hashlib.md5(f"{file_url}\n{filename}".encode("utf-8")).hexdigest(),
+                "bucket": location[0] if location else None,
+                "object_name": location[1] if location else None,
+            }
+        if archive_tree is not None:
+            for root in archive_tree.roots.values():
+                for dir_path, files, _ in archive_tree.walk_files(root):
+                    for name, size, mtime_ns in files:
+                        ext = os.path.splitext(name)[1].lower()
+                        if ext not in EXTRACTABLE_EXTS:
+                            continue
+                        path = os.path.join(dir_path, name)
+                        sources[("archive", Path(os.path.relpath(path, archive_tree.base)).as_posix())] = {
+                            "title": name, "ext": ext, "version": f"{size}:{mtime_ns}", "path": path,
+                        }
+        return sources
+
+    def _plan(self, archive_tree: Optional[ArchiveTree]) -> Tuple[List[dict], int]:
+        """比对索引与当前文档，删除已不存在的行，返回 (需要重新抽取的文档, 删除的行数)"""
+        db = SessionLocal()
+        try:
+            known = {
+                (source, key): version for source, key, version in db.query(
+                    DocumentText.source, DocumentText.source_key, DocumentText.version
+                )
+            }
+            sources = self._sources(db, archive_tree)
+            jobs = [
+                dict(info, source=source, key=key)
+                for (source, key), info in sources.items() if known.get((source, key)) != info["version"]
+            ]
+            missing = [key for key in known if key not in sources]
+            for i in range(0, len(missing), BATCH_SIZE):
+                batch = missing[i:i + BATCH_SIZE]
+                db.execute(delete(DocumentText).where(
+                    or_(*(
+                        (DocumentText.source == source) & (DocumentText.source_key == key)
+                        for source, key in batch
+                    ))
+                ))
+            db.commit()
+            return jobs, len(missing)
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    @staticmethod
+    def _store(job: dict, result: dict):
+        row = {
+            "source": job["source"],
+            "source_key": job["key"],
+            "title": job["title"],
+            "file_type": job["ext"].lstrip(".")[:20],
+            "version": job["version"],
+            "status": result["status"],
+            "error": result["error"],
+            "content": result["content"],
+            "search_vector": _vector(result["title_tokens"], result["tokens"]),
+        }
+        stmt = pg_insert(DocumentText).values(row)
+        db = SessionLocal()
+        try:
+            db.execute(stmt.on_conflict_do_update(
+                constraint="uq_document_texts_source_key",
+                set_={
+                    **{column: stmt.excluded[column] for column in row if column not in ("source", "source_key")},
+                    "indexed_at": func.now(),
+                }
+            ))
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    async def _index(self, job: dict) -> str:
+        loop = asyncio.get_running_loop()
+        try:
+            if job.get("path") or job.get("bucket"):
+                result = await asyncio.wait_for(loop.run_in_executor(
+                    self._pool(), extract_document,
+                    job["ext"], job["title"], job.get("path"), job.get("bucket"), job.get("object_name")
+                ), self.task_timeout)
+            else:
+                # 外部链接等无法读取的文件只索引文件名
+                result = {"status": "unsupported", "error": None, "content": None, "tokens": []}
+                result["title_tokens"] = tokenize(job["title"])
+        except Exception as e:
+            error = "抽取超时" if isinstance(e, asyncio.TimeoutError) else f"{type(e).__name__}: {e}"
+            result = {"status": "failed", "error": error[:500], "content": None, "tokens": [],
+                      "title_tokens": tokenize(job["title"])}
+        await loop.run_in_executor(None, self._store, job, result)
+        return result["status"]
+
+    async def sync(self, archive_tree: Optional[ArchiveTree] = None) -> dict:
+        """对账一次：抽取新增/变化的文档，删除已不存在文档的索引"""
+        loop = asyncio.get_running_loop()
+        jobs, removed = await loop.run_in_executor(None, self._plan, archive_tree)
+        semaphore = asyncio.Semaphore(self.max_workers)
+        statuses: Dict[str, int] = {}
+
+        async def index(job: dict):
+            async with semaphore:
+                try:
+                    status = await self._index(job)
+                except Exception as e:
+                    logger.error(f"写入全文索引失败 {job['source']}:{job['key']}: {e}")
+                    status = "failed"
+                statuses[status] = statuses.get(status, 0) + 1
+
+        await asyncio.gather(*(index(job) for job in jobs))
+        result = {"indexed": len(jobs), "removed": removed, "statuses": statuses}
+        if jobs or removed:
+            logger.info(f"全文索引对账完成: {result}")
+        return result
+
+    @staticmethod
+    def _acquire() -> bool:
+        try:
+            return bool(redis_client.set(INDEX_LOCK_KEY, "1", nx=True, ex=INDEX_LOCK_TTL))
+        except Exception:
+            return True
+
+    @staticmethod
+    def _release():
+        try:
+            redis_client.delete(INDEX_LOCK_KEY)
+        except Exception:
+            pass
+
+    async def run_indexer(self, archive_tree: Optional[ArchiveTree] = None):
+        """后台对账循环（在应用启动时创建任务）；notify() 可提前唤醒"""
+        self._wake = asyncio.Event()
+        while True:
+            self._wake.clear()
+            try:
+                loop = asyncio.get_running_loop()
+                if await loop.run_in_executor(None, self._acquire):
+                    try:
+                        self.last_result = await self.sync(archive_tree)
+                    finally:
+                        await loop.run_in_executor(None, self._release)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"全文索引对账任务出错: {e}")
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def notify(self):
+        """知识体系文件变化后调用，尽快对账（需在事件循环线程中调用）"""
+        if self._wake is not None:
+            self._wake.set()
+
+    # ----- 查询 -----
+
+    @staticmethod
+    def _conditions(query: str, terms: List[str]) -> list:
+        tsquery = cast(query, TSQUERY)
+        conditions = [DocumentText.search_vector.op("@@")(tsquery)]
+        for term in terms:
+            conditions.append(or_(
+                func.strpos(func.lower(DocumentText.title), term) > 0,
+                func.strpos(func.lower(DocumentText.content), term) > 0
+            ))
+        return conditions
+
+    def matching_keys(self, q: str, source: str):
+        """正文或文件名包含搜索词的文档键（子查询），搜索词无可检索内容时返回 None"""
+        parsed = build_query(q)
+        if parsed is None:
+            return None
+        return select(DocumentText.source_key).where(DocumentText.source == source, *self._conditions(*parsed))
+
+    def search(self, db: Session, q: str, source: Optional[str] = None,
+               offset: int = 0, limit: int = 20) -> List[dict]:
+        """按相关度排序的搜索结果（含高亮摘要，HTML转义后以 <mark> 标记命中词）"""
+        parsed = build_query(q)
+        if parsed is None:
+            return []
+        query, terms = parsed
+        rank = func.ts_rank(DocumentText.search_vector, cast(query, TSQUERY))
+        position = func.strpos(func.lower(DocumentText.content), terms[0])
+        start = func.greatest(position - SNIPPET_BEFORE, 1)
+        rows = db.query(
+            DocumentText.source, DocumentText.source_key, DocumentText.title, DocumentText.file_type,
+            DocumentText.status, rank.label("rank"), start.label("start"),
+            func.substr(DocumentText.content, start, SNIPPET_LENGTH).label("snippet")
+        ).filter(*self._conditions(query, terms))
+        if source:
+            rows = rows.filter(DocumentText.source == source)
+        rows = rows.order_by(rank.desc(), DocumentText.id.desc()).offset(offset).limit(limit)
+        return [
+            {
+                "source": row.source,
+                "key": row.source_key,
+                "title": row.title,
+                "file_type": row.file_type,
+                "status": row.status,
+                "rank": round(float(row.rank), 6),
+                "snippet": ("…" if (row.start or 1) > 1 else "") + highlight(row.snippet or "", terms),
+            }
+            for row in rows
+        ]
+
+    def shutdown(self):
+        """关闭进程池（应用退出时调用）"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+# 全局文档全文索引服务实例
+document_index = DocumentIndexService(
+    max_workers=settings.DOC_INDEX_WORKERS,
+    task_timeout=settings.DOC_INDEX_TASK_TIMEOUT,
+    interval=settings.DOC_INDEX_INTERVAL
+)
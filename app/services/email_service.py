@@ -15,17 +15,19 @@ from email.mime.multipart import MIMEMultipart
 from typing import Optional
 from sqlalchemy.orm import Session
 from ..core.config import settings
+from ..core.providers import lazy_service
 from ..models import User
 import redis
 import json
 
-# Redis连接（用于存储验证码）
-redis_client = redis.Redis(
+# Redis连接（用于存储验证码；首次使用时创建，应用启动时预热检查连通性）
+redis_client = lazy_service("redis", lambda: redis.Redis(
     host=settings.REDIS_HOST,
     port=settings.REDIS_PORT,
     db=settings.REDIS_DB,
-    decode_responses=True
-)
+    decode_responses=True,
+    socket_connect_timeout=settings.SERVICE_CONNECT_TIMEOUT
+), warm_up=lambda client: client.ping())
 
 class EmailService:
     """邮件服务类"""
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""
+评估评分统计服务
+
+评分分布与均值、中位数、标准差、高分率在数据库中用一条聚合查询算出：
+- 分布：width_bucket(score, ARRAY[60, 70, 80, 90]) 把分数分到 0-6 ... 9-10 五个区间，
+  每个区间一个 COUNT(*) FILTER，不需要把评估记录逐条取回
+- 中位数：percentile_cont(0.5) WITHIN GROUP (ORDER BY score)
+无论评估记录有多少，传输的数据量都是一行。
+
+统计范围可以是全部评估、某位评估专家给出的评估，或某位修复专家发起的（未删除）工作流收到的评估。
+
+作者: 王梓涵
+邮箱: wangzh011031@163.com
+时间: 2025年
+"""
+from typing import Optional
+
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import array
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import func
+
+from ..models import Evaluation, Workflow
+
+# 分布区间的下边界（width_bucket 的阈值）与区间名称；0-6 为60分以下，9-10 含100分
+SCORE_THRESHOLDS = [60, 70, 80, 90]
+SCORE_LABELS = ["0-6", "6-7", "7-8", "8-9", "9-10"]
+
+# 高分线（含），高分率为达到高分线的评估占比
+HIGH_SCORE = 80
+
+
+def _round(value, digits: int = 1) -> Optional[float]:
+    return round(float(value), digits) if value is not None else None
+
+
+class EvaluationStatsService:
+    """评分统计（百分制分数；仪表板展示时按十分制换算）"""
+
+    def summary(self, db: Session, evaluator_id: Optional[int] = None,
+                initiator_id: Optional[int] = None) -> dict:
+        """
+        评分统计（一条查询）：
+        {"count", "mean", "median", "stddev", "min", "max", "high_score_rate", "distribution"}
+        没有评估时 count 为0，均值等为 None；high_score_rate 为百分比
+        """
+        score = Evaluation.score
+        bucket = func.width_bucket(score, array(SCORE_THRESHOLDS))
+        columns = [
+            func.count(score).label("count"),
+            func.avg(score).label("mean"),
+            func.percentile_cont(0.5).within_group(score).label("median"),
+            func.stddev_samp(score).label("stddev"),
+            func.min(score).label("min"),
+            func.max(score).label("max"),
+            func.count(score).filter(score >= HIGH_SCORE).label("high"),
+        ] + [
+            func.count(score).filter(bucket == index).label(f"bucket_{index}")
+            for index in range(len(SCORE_LABELS))
+        ]
+        query = select(*columns)
+        if evaluator_id is not None:
+            query = query.where(Evaluation.evaluator_id == evaluator_id)
+        if initiator_id is not None:
+            query = query.join(Workflow, Workflow.workflow_id == Evaluation.workflow_id).where(
+                Workflow.initiator_id == initiator_id,
+                Workflow.deleted_at.is_(None)
+            )
+        row = db.execute(query).one()
+
+        count = row.count
+        return {
+            "count": count,
+            "mean": _round(row.mean, 2),
+            "median": _round(row.median, 2),
+            "stddev": _round(row.stddev, 2),
+            "min": row.min,
+            "max": row.max,
+            "high_score_rate": _round(row.high * 100 / count) if count else None,
+            "distribution": {
+                label: getattr(row, f"bucket_{index}") for index, label in enumerate(SCORE_LABELS)
+            }
+        }
+
+    @staticmethod
+    def ten_point(value: Optional[float]) -> Optional[float]:
+        """百分制 → 十分制（保留一位小数）"""
+        return round(value / 10, 1) if value is not None else None
+
+
+# 全局评分统计服务实例
+evaluation_stats = EvaluationStatsService()
@@ -6,26 +6,108 @@
 邮箱: wangzh011031@163.com
 时间: 2025年
 """
-from minio import Minio
-from minio.error import S3Error
+from minio.commonconfig import ComposeSource
+from minio.datatypes import Part
+from minio.deleteobjects import DeleteObject
+from minio.error import S3Error, ServerError
 from ..core.config import settings
+from ..core.providers import lazy_service
+from ..core.storage_backends import OBJECT_ROUTE, MinioBackend, create_backend, object_url
+from .object_index_service import file_category, object_index
+from .object_ref_service import object_refs
+from typing import BinaryIO, Callable, Iterator, List, Optional, Tuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import hashlib
+import io
 import os
+import threading
+import time
 import uuid
-from datetime import datetime
+from datetime import datetime, timedelta
+from urllib.parse import unquote, urlsplit
 import logging
+import urllib3
 
 logger = logging.getLogger(__name__)
 
+# 服务端暂时不可用的 S3 错误码（其余错误码重试也不会成功）
+TRANSIENT_S3_CODES = {"InternalError", "ServiceUnavailable", "SlowDown", "RequestTimeout"}
+
+
+class FileTooLargeError(Exception):
+    """上传内容超过 MAX_FILE_SIZE 限制"""
+
+
+def is_transient_error(error: BaseException) -> bool:
+    """网络错误（连接中断、超时）与服务端 5xx 可以重试"""
+    if isinstance(error, ServerError):
+        return True
+    if isinstance(error, S3Error):
+        return error.code in TRANSIENT_S3_CODES or (error.response is not None and error.response.status >= 500)
+    return isinstance(error, (ConnectionError, TimeoutError, urllib3.exceptions.HTTPError))
+
+
+class HashingReader:
+    """
+    文件流包装器
+    在MinIO按分片读取数据的同时累计大小并计算SHA-256，超过大小上限时立即中断
+    """
+
+    def __init__(self, raw: BinaryIO, max_size: Optional[int] = None):
+        self.raw = raw
+        self.max_size = max_size
+        self.size = 0
+        self._sha256 = hashlib.sha256()
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.raw.read(size)
+        if data:
+            self.size += len(data)
+            if self.max_size is not None and self.size > self.max_size:
+                raise FileTooLargeError(f"文件大小超过限制（{self.max_size} 字节）")
+            self._sha256.update(data)
+        return data
+
+    @property
+    def sha256(self) -> str:
+        return self._sha256.hexdigest()
+
+
+class _PrefixedReader:
+    """先返回已读出的前缀数据，再继续读取原始流"""
+
+    def __init__(self, prefix: bytes, raw):
+        self._prefix = prefix
+        self.raw = raw
+
+    def read(self, size: int = -1) -> bytes:
+        if self._prefix:
+            if size is None or size < 0:
+                data, self._prefix = self._prefix + self.raw.read(), b""
+                return data
+            data, self._prefix = self._prefix[:size], self._prefix[size:]
+            return data
+        return self.raw.read(size)
+
+
 class FileService:
     def __init__(self):
-        self.client = Minio(
-            settings.MINIO_ENDPOINT,
-            access_key=settings.MINIO_ACCESS_KEY,
-            secret_key=settings.MINIO_SECRET_KEY,
-            secure=settings.MINIO_SECURE
-        )
+        # 存储后端由 STORAGE_BACKEND 选择（minio / local / memory），接口同 Minio 客户端
+        self.client = create_backend()
+        if self.client.kind == "minio":
+            # 预签名URL使用浏览器可访问的地址签名；指定region避免签名时请求服务端
+            self.presign_client = MinioBackend(
+                settings.MINIO_PUBLIC_ENDPOINT or settings.MINIO_ENDPOINT,
+                region=settings.MINIO_REGION, http_client=None
+            )
+        else:
+            # 其他后端的预签名地址指向本应用的 /api/storage/objects
+            self.presign_client = self.client
         self.bucket_name = settings.MINIO_BUCKET
-        self._ensure_bucket_exists()
+        # 默认存储桶在启动预热或首次写入时检查，构造时不访问MinIO
+        self._bucket_ready = False
+        self._part_executor: Optional[ThreadPoolExecutor] = None
+        self._part_executor_lock = threading.Lock()
     
     def _ensure_bucket_exists(self):
         """确保存储桶存在"""
@@ -33,47 +115,372 @@ class FileService:
             if not self.client.bucket_exists(self.bucket_name):
                 self.client.make_bucket(self.bucket_name)
                 logger.info(f"创建存储桶: {self.bucket_name}")
+            self._bucket_ready = True
+        except S3Error as e:
+            logger.error(f"创建存储桶失败: {e}")
+            raise
+    
+    def _generate_object_name(self, filename: str) -> str:
+        """生成按日期分目录的唯一对象名"""
+        file_ext = os.path.splitext(filename or "")[1]
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        unique_filename = f"{uuid.uuid4()}_{timestamp}{file_ext}"
+        date_path = datetime.now().strftime("%Y/%m/%d")
+        return f"{date_path}/{unique_filename}"
+    
+    def _content_object_name(self, digest: str, filename: str) -> str:
+        """内容寻址对象名：sha256/<前两位>/<摘要><扩展名>"""
+        file_ext = os.path.splitext(filename or "")[1].lower()
+        return f"sha256/{digest[:2]}/{digest}{file_ext}"
+    
+    def _ensure_named_bucket(self, bucket_name: str):
+        """确保写入的存储桶存在（如 knowledge-files；默认存储桶只在预热失败时补做一次检查）"""
+        if bucket_name == self.bucket_name:
+            if not self._bucket_ready:
+                self._ensure_bucket_exists()
+            return
+        try:
+            if not self.client.bucket_exists(bucket_name):
+                self.client.make_bucket(bucket_name)
+                logger.info(f"创建存储桶: {bucket_name}")
         except S3Error as e:
             logger.error(f"创建存储桶失败: {e}")
             raise
     
-    def upload_file(self, file_content: bytes, filename: str, content_type: str = None) -> str:
+    def upload_file(self, file_content: bytes, filename: str, content_type: str = None,
+                    bucket_name: str = None) -> str:
         """
         上传文件到MinIO
         返回文件的访问URL
         """
+        from io import BytesIO
+        result = self.upload_stream(BytesIO(file_content), filename, content_type, bucket_name)
+        return result["url"]
+    
+    def upload_stream(self, stream: BinaryIO, filename: str, content_type: str = None,
+                      bucket_name: str = None, max_size: Optional[int] = None) -> dict:
+        """
+        以流式方式上传文件到MinIO（长度未知）
+        
+        数据按 UPLOAD_PART_SIZE 分片读取并以multipart方式写入，内存占用只与分片大小相关；
+        上传过程中同步计算文件大小与SHA-256。
+        返回包含 url、object_name、size、sha256、etag 的字典
+        """
+        target_bucket = bucket_name or self.bucket_name
+        reader = HashingReader(stream, max_size=settings.MAX_FILE_SIZE if max_size is None else max_size)
+        
+        if settings.STORAGE_CONTENT_ADDRESSED:
+            return self._upload_content_addressed(reader, filename, content_type, target_bucket)
+        
+        object_name = self._generate_object_name(filename)
         try:
-            # 生成唯一文件名
-            file_ext = os.path.splitext(filename)[1]
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            unique_filename = f"{uuid.uuid4()}_{timestamp}{file_ext}"
-            
-            # 按日期组织目录结构
-            date_path = datetime.now().strftime("%Y/%m/%d")
-            object_name = f"{date_path}/{unique_filename}"
-            
-            # 上传文件
-            from io import BytesIO
-            self.client.put_object(
-                self.bucket_name,
-                object_name,
-                BytesIO(file_content),
-                length=len(file_content),
-                content_type=content_type
-            )
-            
-            # 生成访问URL
-            if settings.MINIO_SECURE:
-                protocol = "https"
-            else:
-                protocol = "http"
-            
-            file_url = f"{protocol}://{settings.MINIO_ENDPOINT}/{self.bucket_name}/{object_name}"
-            return file_url
-            
+            self._ensure_named_bucket(target_bucket)
+            result = self._put_stream(target_bucket, object_name, reader, content_type or "application/octet-stream")
+        except FileTooLargeError:
+            raise
         except S3Error as e:
             logger.error(f"文件上传失败: {e}")
             raise Exception(f"文件上传失败: {str(e)}")
+        
+        return self._commit_named(object_name, target_bucket, reader.sha256, reader.size, content_type, result.etag)
+    
+    def _commit_named(self, object_name: str, target_bucket: str, digest: str, size: int,
+                      content_type: Optional[str], etag: Optional[str]) -> dict:
+        """已写入的普通对象：登记引用与目录索引，返回上传结果"""
+        try:
+            self.record_reference(object_name, target_bucket, digest, size, content_type)
+        except Exception as e:
+            # 未登记的对象不会被引用计数删除，由孤儿对象清理兜底
+            logger.error(f"登记对象引用失败 {object_name}: {e}")
+        self.index_object(object_name, target_bucket, size, etag)
+        
+        return {
+            "url": self.get_file_url(object_name, target_bucket),
+            "object_name": object_name,
+            "bucket": target_bucket,
+            "size": size,
+            "sha256": digest,
+            "etag": etag,
+            "deduplicated": False
+        }
+    
+    def _upload_content_addressed(self, reader: HashingReader, filename: str, content_type: Optional[str],
+                                  target_bucket: str) -> dict:
+        """
+        内容寻址上传：对象名由SHA-256决定，相同内容只存一份
+        
+        不超过一个分片的文件在内存中算出摘要，已存在时完全跳过PUT；
+        更大的文件先流式写入临时对象，算出摘要后在服务端复制到内容地址（已存在则直接丢弃临时对象）。
+        """
+        content_type = content_type or "application/octet-stream"
+        part_size = settings.UPLOAD_PART_SIZE
+        temp_name = None
+        try:
+            self._ensure_named_bucket(target_bucket)
+            head = bytearray()
+            while len(head) < part_size:
+                block = reader.read(part_size - len(head))
+                if not block:
+                    break
+                head += block
+            tail = reader.read(1) if len(head) == part_size else b""
+            if tail:
+                temp_name = f"tmp/{uuid.uuid4().hex}"
+                self._put_stream(target_bucket, temp_name, _PrefixedReader(bytes(head) + tail, reader), content_type)
+                head = b""
+        except FileTooLargeError:
+            if temp_name:
+                self.delete_object(temp_name, target_bucket)
+            raise
+        except S3Error as e:
+            if temp_name:
+                self.delete_object(temp_name, target_bucket)
+            logger.error(f"文件上传失败: {e}")
+            raise Exception(f"文件上传失败: {str(e)}")
+        
+        return self._commit_content_addressed(target_bucket, filename, reader.sha256, reader.size, content_type,
+                                              head=bytes(head), temp_name=temp_name)
+    
+    def _commit_content_addressed(self, target_bucket: str, filename: str, digest: str, size: int,
+                                  content_type: str, head: bytes = b"", temp_name: Optional[str] = None) -> dict:
+        """
+        把已算出摘要的内容写入内容地址：数据在 head 中（不超过一个分片）或已写入临时对象 temp_name
+        内容地址已存在时只增加引用；临时对象无论成功与否都会被删除
+        """
+        object_name = self._content_object_name(digest, filename)
+        try:
+            with object_refs.locked(target_bucket, object_name) as db:
+                refs = object_refs.acquire(db, target_bucket, object_name, digest, size, content_type)
+                deduplicated = refs > 1
+                if not deduplicated:
+                    if temp_name:
+                        result = self.client.compose_object(
+                            target_bucket, object_name, [ComposeSource(target_bucket, temp_name)]
+                        )
+                    else:
+                        result = self.client.put_object(
+                            target_bucket, object_name, io.BytesIO(head), length=len(head),
+                            content_type=content_type
+                        )
+                    etag = result.etag
+                else:
+                    etag = None
+            if not deduplicated:
+                self.index_object(object_name, target_bucket, size, etag)
+        except S3Error as e:
+            logger.error(f"文件上传失败: {e}")
+            raise Exception(f"文件上传失败: {str(e)}")
+        finally:
+            if temp_name:
+                self.delete_object(temp_name, target_bucket)
+        
+        return {
+            "url": self.get_file_url(object_name, target_bucket),
+            "object_name": object_name,
+            "bucket": target_bucket,
+            "size": size,
+            "sha256": digest,
+            "etag": etag,
+            "deduplicated": deduplicated
+        }
+    
+    def open_stream_upload(self, filename: str, content_type: str = None, bucket_name: str = None,
+                           max_size: Optional[int] = None) -> "StreamUpload":
+        """创建由调用方逐块提供数据的上传（见 StreamUpload），不访问存储"""
+        return StreamUpload(self, filename, content_type, bucket_name, max_size)
+    
+    # ----- 大文件并行分片上传 -----
+    
+    def _part_pool(self) -> ThreadPoolExecutor:
+        """分片上传线程池（所有上传共用，大小为 STORAGE_MAX_CONCURRENCY × UPLOAD_PART_CONCURRENCY）"""
+        if self._part_executor is None:
+            with self._part_executor_lock:
+                if self._part_executor is None:
+                    self._part_executor = ThreadPoolExecutor(
+                        max_workers=max(1, settings.STORAGE_MAX_CONCURRENCY * settings.UPLOAD_PART_CONCURRENCY),
+                        thread_name_prefix="upload-part"
+                    )
+        return self._part_executor
+    
+    def shutdown(self):
+        """关闭分片上传线程池（应用退出时调用）"""
+        if self._part_executor is not None:
+            self._part_executor.shutdown(wait=False, cancel_futures=True)
+    
+    def _upload_part_with_retry(self, bucket_name: str, object_name: str, upload_id: str, part_number: int,
+                                data: bytes) -> str:
+        """
+        上传单个分片，网络错误或服务端 5xx 时只重试该分片（指数退避，最多 UPLOAD_PART_RETRIES 次）；
+        NoSuchUpload、AccessDenied 等永久错误直接抛出
+        """
+        for attempt in range(settings.UPLOAD_PART_RETRIES + 1):
+            try:
+                return self.client._upload_part(bucket_name, object_name, data, None, upload_id, part_number)
+            except Exception as e:
+                if attempt >= settings.UPLOAD_PART_RETRIES or not is_transient_error(e):
+                    raise
+                delay = 0.5 * 2 ** attempt
+                logger.warning(f"分片 {part_number} 上传失败，{delay}秒后重试: {e}")
+                time.sleep(delay)
+    
+    def _put_stream(self, bucket_name: str, object_name: str, reader: BinaryIO, content_type: str):
+        """
+        写入长度未知的数据流，返回写入结果（含 etag）
+        
+        不超过一个分片的数据直接单次PUT；更大的数据按 UPLOAD_PART_SIZE 切分为multipart上传，
+        同时最多 UPLOAD_PART_CONCURRENCY 个分片在线程池中并行上传（内存占用不超过该数量的分片），
+        单个分片失败只重试该分片，最终失败时放弃整个multipart上传。
+        """
+        part_size = settings.UPLOAD_PART_SIZE
+        concurrency = max(1, settings.UPLOAD_PART_CONCURRENCY)
+        
+        def read_part() -> bytes:
+            buffer = bytearray()
+            while len(buffer) < part_size:
+                block = reader.read(part_size - len(buffer))
+                if not block:
+                    break
+                buffer += block
+            return bytes(buffer)
+        
+        data = read_part()
+        following = read_part() if len(data) == part_size else b""
+        if not following:
+            return self.client.put_object(bucket_name, object_name, io.BytesIO(data), length=len(data),
+                                          content_type=content_type)
+        
+        upload_id = self.client._create_multipart_upload(bucket_name, object_name, {"Content-Type": content_type})
+        pool = self._part_pool()
+        pending = {}
+        etags = {}
+        part_number = 0
+        try:
+            while data:
+                part_number += 1
+                pending[pool.submit(
+                    self._upload_part_with_retry, bucket_name, object_name, upload_id, part_number, data
+                )] = part_number
+                if len(pending) >= concurrency:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        etags[pending.pop(future)] = future.result()
+                data, following = following, (read_part() if following else b"")
+            for future in list(pending):
+                etags[pending.pop(future)] = future.result()
+            return self.client._complete_multipart_upload(
+                bucket_name, object_name, upload_id, [Part(number, etags[number]) for number in sorted(etags)]
+            )
+        except BaseException:
+            for future in pending:
+                future.cancel()
+            wait(pending)
+            try:
+                self.client._abort_multipart_upload(bucket_name, object_name, upload_id)
+            except Exception as e:
+                logger.error(f"放弃分片上传失败 {object_name}: {e}")
+            raise
+    
+    # ----- 分片上传（multipart upload）底层操作 -----
+    # minio-py 未公开 S3 multipart 的单步API，这里封装其内部方法供断点续传等功能使用
+    
+    def create_multipart_upload(self, filename: str, content_type: str = None, bucket_name: str = None) -> dict:
+        """创建multipart上传，返回 upload_id、object_name、bucket"""
+        target_bucket = bucket_name or self.bucket_name
+        object_name = self._generate_object_name(filename)
+        try:
+            self._ensure_named_bucket(target_bucket)
+            upload_id = self.client._create_multipart_upload(
+                target_bucket, object_name, {"Content-Type": content_type or "application/octet-stream"}
+            )
+        except S3Error as e:
+            logger.error(f"创建分片上传失败: {e}")
+            raise Exception(f"创建分片上传失败: {str(e)}")
+        return {"upload_id": upload_id, "object_name": object_name, "bucket": target_bucket}
+    
+    def upload_part(self, object_name: str, upload_id: str, part_number: int, data: bytes,
+                    bucket_name: str = None) -> str:
+        """上传单个分片，返回分片ETag"""
+        try:
+            return self.client._upload_part(
+                bucket_name or self.bucket_name, object_name, data, None, upload_id, part_number
+            )
+        except S3Error as e:
+            logger.error(f"分片上传失败: {e}")
+            raise Exception(f"分片上传失败: {str(e)}")
+    
+    def complete_multipart_upload(self, object_name: str, upload_id: str, parts: list,
+                                  bucket_name: str = None) -> str:
+        """
+        合并分片，parts 为按分片号排序的 (part_number, etag) 列表
+        返回合并后对象的ETag
+        """
+        try:
+            result = self.client._complete_multipart_upload(
+                bucket_name or self.bucket_name, object_name, upload_id,
+                [Part(number, etag) for number, etag in parts]
+            )
+        except S3Error as e:
+            logger.error(f"合并分片失败: {e}")
+            raise Exception(f"合并分片失败: {str(e)}")
+        self.index_object(object_name, bucket_name or self.bucket_name, etag=result.etag)
+        return result.etag
+    
+    def abort_multipart_upload(self, object_name: str, upload_id: str, bucket_name: str = None) -> bool:
+        """放弃multipart上传并释放已上传的分片"""
+        try:
+            self.client._abort_multipart_upload(bucket_name or self.bucket_name, object_name, upload_id)
+            return True
+        except S3Error as e:
+            # NoSuchUpload 说明已被合并或清理，视为成功
+            if e.code == "NoSuchUpload":
+                return True
+            logger.error(f"取消分片上传失败: {e}")
+            return False
+    
+    # ----- 引用计数 -----
+    
+    def record_reference(self, object_name: str, bucket_name: str = None, sha256: Optional[str] = None,
+                         size: Optional[int] = None, content_type: Optional[str] = None) -> int:
+        """登记一次对象引用（新上传的对象），返回当前引用数"""
+        target_bucket = bucket_name or self.bucket_name
+        with object_refs.locked(target_bucket, object_name) as db:
+            return object_refs.acquire(db, target_bucket, object_name, sha256, size, content_type)
+    
+    def retain_object(self, object_name: str, bucket_name: str = None) -> Optional[int]:
+        """已有对象被新的业务记录引用（如回溯复制表单）时增加引用，未登记的对象返回 None"""
+        target_bucket = bucket_name or self.bucket_name
+        with object_refs.locked(target_bucket, object_name) as db:
+            return object_refs.retain(db, target_bucket, object_name)
+    
+    def release_object(self, object_name: str, bucket_name: str = None, delete_untracked: bool = False) -> bool:
+        """
+        释放一次对象引用，最后一个引用释放时删除对象，返回对象是否被删除
+        未登记引用的旧对象默认保留；delete_untracked=True 时直接删除（用于回滚刚上传的对象）
+        """
+        target_bucket = bucket_name or self.bucket_name
+        with object_refs.locked(target_bucket, object_name) as db:
+            remaining = object_refs.release(db, target_bucket, object_name)
+            if remaining == 0 or (remaining is None and delete_untracked):
+                # 在锁内删除对象，失败时回滚引用计数
+                self.client.remove_object(target_bucket, object_name)
+                deleted = True
+            else:
+                deleted = False
+        if deleted:
+            self._unindex_object(object_name, target_bucket)
+        return deleted
+    
+    def retain_file_url(self, file_url: str) -> Optional[int]:
+        location = self.parse_file_url(file_url)
+        if location is None:
+            return None
+        return self.retain_object(location[1], location[0])
+    
+    def release_file_url(self, file_url: str) -> bool:
+        location = self.parse_file_url(file_url)
+        if location is None:
+            return False
+        return self.release_object(location[1], location[0])
     
     def delete_file(self, file_url: str) -> bool:
         """删除文件"""
@@ -81,18 +488,156 @@ class FileService:
             # 从URL中提取object_name
             object_name = file_url.split(f"/{self.bucket_name}/")[1]
             self.client.remove_object(self.bucket_name, object_name)
+            self._unindex_object(object_name, self.bucket_name)
             return True
         except Exception as e:
             logger.error(f"文件删除失败: {e}")
             return False
     
-    def get_file_url(self, object_name: str) -> str:
+    def remove_objects(self, object_names: List[str], bucket_name: str = None) -> List[str]:
+        """
+        批量删除对象（每次请求最多1000个），返回删除失败的对象名
+        不处理引用计数与目录索引，由调用方负责（如孤儿对象清理）
+        """
+        target_bucket = bucket_name or self.bucket_name
+        failed = []
+        for i in range(0, len(object_names), 1000):
+            batch = [DeleteObject(name) for name in object_names[i:i + 1000]]
+            # remove_objects 惰性执行，需要迭代结果才会发出请求
+            for error in self.client.remove_objects(target_bucket, batch):
+                logger.error(f"批量删除对象失败 {error.name}: {error.code} {error.message}")
+                failed.append(error.name)
+        return failed
+    
+    def delete_object(self, object_name: str, bucket_name: str = None) -> bool:
+        """按对象名删除文件"""
+        try:
+            self.client.remove_object(bucket_name or self.bucket_name, object_name)
+            self._unindex_object(object_name, bucket_name or self.bucket_name)
+            return True
+        except Exception as e:
+            logger.error(f"文件删除失败: {e}")
+            return False
+    
+    # ----- 目录索引 -----
+    
+    def index_object(self, object_name: str, bucket_name: str = None, size: Optional[int] = None,
+                     etag: Optional[str] = None):
+        """对象写入后更新目录索引（只处理建立了索引的存储桶）；失败只记录日志，由定期对账修正"""
+        target_bucket = bucket_name or self.bucket_name
+        if not object_index.tracks(target_bucket, object_name):
+            return
+        try:
+            if size is None:
+                stat = self.client.stat_object(target_bucket, object_name)
+                size, etag = stat.size, stat.etag
+            object_index.upsert(target_bucket, object_name, size, etag)
+        except Exception as e:
+            logger.error(f"更新目录索引失败 {object_name}: {e}")
+    
+    def _unindex_object(self, object_name: str, bucket_name: str):
+        if not object_index.tracks(bucket_name, object_name):
+            return
+        try:
+            object_index.remove(bucket_name, object_name)
+        except Exception as e:
+            logger.error(f"更新目录索引失败 {object_name}: {e}")
+    
+    def get_file_url(self, object_name: str, bucket_name: str = None) -> str:
         """获取文件访问URL"""
+        if self.client.kind != "minio":
+            return object_url(bucket_name or self.bucket_name, object_name)
         if settings.MINIO_SECURE:
             protocol = "https"
         else:
             protocol = "http"
-        return f"{protocol}://{settings.MINIO_ENDPOINT}/{self.bucket_name}/{object_name}"
+        return f"{protocol}://{settings.MINIO_ENDPOINT}/{bucket_name or self.bucket_name}/{object_name}"
+    
+    def parse_file_url(self, file_url: str) -> Optional[tuple]:
+        """
+        从 get_file_url 生成的地址（或其预签名形式）中解析出 (bucket, object_name)
+        不是本存储服务的地址时返回 None
+        """
+        if not file_url:
+            return None
+        parts = urlsplit(file_url)
+        if not parts.netloc and parts.path.startswith(f"{OBJECT_ROUTE}/"):
+            path = parts.path[len(OBJECT_ROUTE):]
+        elif parts.netloc and parts.netloc in (settings.MINIO_ENDPOINT, settings.MINIO_PUBLIC_ENDPOINT):
+            path = parts.path
+        else:
+            return None
+        bucket, _, object_name = unquote(path).lstrip("/").partition("/")
+        if not bucket or not object_name:
+            return None
+        return bucket, object_name
+    
+    def presigned_get_url(self, object_name: str, bucket_name: str = None, expires: Optional[int] = None) -> str:
+        """生成短期有效的下载地址"""
+        return self.presign_client.presigned_get_object(
+            bucket_name or self.bucket_name, object_name,
+            expires=timedelta(seconds=expires or settings.PRESIGNED_GET_EXPIRE)
+        )
+    
+    def presigned_put_url(self, object_name: str, bucket_name: str = None, expires: Optional[int] = None,
+                          content_type: Optional[str] = None) -> str:
+        """生成短期有效的直传地址（浏览器直接PUT到存储桶）；指定 content_type 时上传必须使用该 Content-Type"""
+        return self.presign_client.presigned_put_object(
+            bucket_name or self.bucket_name, object_name,
+            expires=timedelta(seconds=expires or settings.PRESIGNED_PUT_EXPIRE), content_type=content_type
+        )
+    
+    def presign_file_url(self, file_url: str) -> str:
+        """把数据库中保存的文件地址转换为预签名下载地址，无法识别的地址原样返回"""
+        location = self.parse_file_url(file_url)
+        if location is None:
+            return file_url
+        return self.presigned_get_url(location[1], location[0])
+    
+    def get_object(self, object_name: str, bucket_name: str = None) -> Optional[dict]:
+        """读取小对象（瓦片、预览图等）的全部内容，对象不存在时返回 None"""
+        try:
+            response = self.client.get_object(bucket_name or self.bucket_name, object_name)
+        except S3Error as e:
+            if e.code in ("NoSuchKey", "NoSuchObject", "NoSuchBucket"):
+                return None
+            logger.error(f"读取对象失败: {e}")
+            raise Exception(f"读取对象失败: {str(e)}")
+        try:
+            return {
+                "data": response.read(),
+                "etag": (response.headers.get("ETag") or "").strip('"'),
+                "content_type": response.headers.get("Content-Type")
+            }
+        finally:
+            response.close()
+            response.release_conn()
+    
+    def iter_object(self, object_name: str, bucket_name: str = None, offset: int = 0, length: int = 0,
+                    chunk_size: int = 64 * 1024) -> Iterator[bytes]:
+        """按块读取对象的一个字节范围（length=0 表示读到末尾），用于流式下载"""
+        response = self.client.get_object(bucket_name or self.bucket_name, object_name, offset=offset, length=length)
+        try:
+            yield from response.stream(chunk_size)
+        finally:
+            response.close()
+            response.release_conn()
+    
+    def stat_object(self, object_name: str, bucket_name: str = None) -> Optional[dict]:
+        """查询对象元数据，对象不存在时返回 None"""
+        try:
+            stat = self.client.stat_object(bucket_name or self.bucket_name, object_name)
+        except S3Error as e:
+            if e.code in ("NoSuchKey", "NoSuchObject", "NoSuchBucket"):
+                return None
+            logger.error(f"查询对象失败: {e}")
+            raise Exception(f"查询对象失败: {str(e)}")
+        return {
+            "size": stat.size,
+            "etag": stat.etag,
+            "content_type": stat.content_type,
+            "last_modified": stat.last_modified
+        }
     
     def list_objects(self, prefix: str = "", recursive: bool = True) -> list:
         """列出存储桶中的对象"""
@@ -129,13 +674,18 @@ class FileService:
                     continue
                 
                 # 获取文件信息
+                file_ext = os.path.splitext(object_name)[1].lower()
+                mtime = obj.last_modified.isoformat() if obj.last_modified else None
                 file_info = {
                     "name": object_name.split('/')[-1],
                     "path": object_name,
+                    "ext": file_ext,
                     "size": obj.size,
-                    "last_modified": obj.last_modified.isoformat() if obj.last_modified else None,
+                    "mtime": mtime,
+                    "last_modified": mtime,
+                    "category": file_category(file_ext),
                     "etag": obj.etag,
-                    "url": self.get_file_url(object_name)
+                    "url": self.presigned_get_url(object_name, target_bucket)
                 }
                 files.append(file_info)
                 
@@ -157,63 +707,162 @@ class FileService:
             logger.error(f"获取目录结构失败: {e}")
             return {"folders": [], "files": []}
     
-    def get_files_in_directory(self, directory_path: str, bucket_name: str = None) -> list:
-        """获取指定目录下的文件列表"""
-        try:
-            target_bucket = bucket_name or self.bucket_name
-            if not self.client.bucket_exists(target_bucket):
-                return []
-            
+    def iter_files(self, bucket_name: str = None, directory_path: Optional[str] = None,
+                   start_after: Optional[str] = None, recursive: bool = False) -> Iterator[dict]:
+        """
+        按对象名顺序逐个返回文件信息（惰性列举，调用方取够即可停止）
+        directory_path 为 None 时递归列出整个存储桶（跳过临时对象与派生文件），否则只列出该目录下一层；
+        recursive=True 时递归列出 directory_path 目录树（以该目录为列举前缀）
+        """
+        target_bucket = bucket_name or self.bucket_name
+        if not self.client.bucket_exists(target_bucket):
+            return
+        
+        recursive = recursive or directory_path is None
+        prefix = None
+        if directory_path:
             # 确保目录路径以/结尾
-            if directory_path and not directory_path.endswith('/'):
-                directory_path += '/'
+            prefix = directory_path if directory_path.endswith('/') else directory_path + '/'
+        
+        for obj in self.client.list_objects(target_bucket, prefix=prefix, recursive=recursive,
+                                            start_after=start_after):
+            object_name = obj.object_name
             
-            objects = self.client.list_objects(
-                target_bucket,
-                prefix=directory_path,
-                recursive=False
-            )
+            # 跳过目录标记
+            if object_name.endswith('/'):
+                continue
+            if recursive and object_name.startswith(object_index.excluded_prefixes):
+                continue
             
-            files = []
-            for obj in objects:
-                object_name = obj.object_name
-                
-                # 跳过目录标记
-                if object_name.endswith('/'):
+            # 获取文件扩展名
+            file_ext = os.path.splitext(object_name)[1].lower()
+            
+            yield {
+                "name": object_name.split('/')[-1],
+                "path": object_name,
+                "ext": file_ext,
+                "size": obj.size,
+                "mtime": obj.last_modified.isoformat() if obj.last_modified else None,
+                "category": file_category(file_ext),
+                "url": self.presigned_get_url(object_name, target_bucket)
+            }
+    
+    def list_files_page(self, bucket_name: str = None, directory_path: Optional[str] = None,
+                        start_after: Optional[str] = None, limit: Optional[int] = None,
+                        match: Optional[Callable[[dict], bool]] = None) -> Tuple[List[dict], Optional[str]]:
+        """
+        列举一页符合条件的文件，返回 (文件列表, 下一页起始位置)；已到末尾时起始位置为 None
+        筛选在列举过程中进行，取满一页即停止，不遍历整个存储桶
+        """
+        files = []
+        try:
+            for file_info in self.iter_files(bucket_name, directory_path, start_after):
+                if match and not match(file_info):
                     continue
-                
-                # 获取文件扩展名
-                file_ext = os.path.splitext(object_name)[1].lower()
-                
-                # 确定文件类别
-                category = "other"
-                if file_ext in ['.jpg', '.jpeg', '.png', '.gif', '.webp', '.svg', '.tif', '.tiff']:
-                    category = "image"
-                elif file_ext in ['.mp4', '.mov', '.avi', '.mkv', '.webm', '.m4v']:
-                    category = "video"
-                elif file_ext in ['.pdf', '.doc', '.docx', '.txt', '.md', '.caj']:
-                    category = "document"
-                elif file_ext in ['.js', '.ts', '.vue', '.html', '.css', '.json', '.yaml', '.yml', '.py']:
-                    category = "code"
-                
-                file_info = {
-                    "name": object_name.split('/')[-1],
-                    "path": object_name,
-                    "ext": file_ext,
-                    "size": obj.size,
-                    "mtime": obj.last_modified.isoformat() if obj.last_modified else None,
-                    "category": category,
-                    "url": self.get_file_url(object_name)
-                }
+                if limit is not None and len(files) == limit:
+                    return files, files[-1]["path"]
                 files.append(file_info)
-            
-            return files
-            
         except S3Error as e:
             logger.error(f"获取目录文件失败: {e}")
-            return []
+        return files, None
+    
+    def get_files_in_directory(self, directory_path: str, bucket_name: str = None) -> list:
+        """获取指定目录下的文件列表"""
+        return self.list_files_page(bucket_name, directory_path or "")[0]
+
+
+class StreamUpload:
+    """
+    由调用方逐块提供数据的上传（AsyncFileService.upload_chunks 在事件循环侧缓冲分片后使用）
+
+    - update(): 接收数据时累计大小与SHA-256，超过大小上限立即抛出 FileTooLargeError
+    - 超过一个分片时先 begin() 创建multipart上传，再用 upload_part() 上传各分片（可并行）
+    - finish(): 不超过一个分片的数据单次写入，否则合并分片；随后登记引用与目录索引
+    - 出错时调用 abort() 放弃未完成的multipart上传
+    update() 之外的方法都会访问存储，应在存储线程池中执行。
+    内容寻址模式下数据先写入临时对象，finish() 算出摘要后再复制到内容地址。
+    """
+
+    def __init__(self, service: FileService, filename: str, content_type: Optional[str],
+                 bucket_name: Optional[str], max_size: Optional[int]):
+        self.service = service
+        self.filename = filename
+        self.content_type = content_type or "application/octet-stream"
+        self.bucket = bucket_name or service.bucket_name
+        self.max_size = settings.MAX_FILE_SIZE if max_size is None else max_size
+        self.size = 0
+        self.upload_id: Optional[str] = None
+        if settings.STORAGE_CONTENT_ADDRESSED:
+            self.object_name = f"tmp/{uuid.uuid4().hex}"
+        else:
+            self.object_name = service._generate_object_name(filename)
+        self._sha256 = hashlib.sha256()
+        self._etags = {}
+
+    def update(self, data: bytes):
+        self.size += len(data)
+        if self.max_size is not None and self.size > self.max_size:
+            raise FileTooLargeError(f"文件大小超过限制（{self.max_size} 字节）")
+        self._sha256.update(data)
+
+    def begin(self):
+        self.service._ensure_named_bucket(self.bucket)
+        self.upload_id = self.service.client._create_multipart_upload(
+            self.bucket, self.object_name, {"Content-Type": self.content_type}
+        )
+
+    def upload_part(self, part_number: int, data: bytes):
+        self._etags[part_number] = self.service._upload_part_with_retry(
+            self.bucket, self.object_name, self.upload_id, part_number, data
+        )
+
+    def finish(self, data: bytes = b"") -> dict:
+        """
+        完成上传，返回与 upload_stream 相同的结果
+        已开始multipart上传时 data 须为空（最后一个分片也通过 upload_part 上传）
+        """
+        digest = self._sha256.hexdigest()
+        service = self.service
+        try:
+            if self.upload_id is None:
+                service._ensure_named_bucket(self.bucket)
+                if settings.STORAGE_CONTENT_ADDRESSED:
+                    return service._commit_content_addressed(
+                        self.bucket, self.filename, digest, self.size, self.content_type, head=data
+                    )
+                result = service.client.put_object(
+                    self.bucket, self.object_name, io.BytesIO(data), length=len(data),
+                    content_type=self.content_type
+                )
+            else:
+                result = service.client._complete_multipart_upload(
+                    self.bucket, self.object_name, self.upload_id,
+                    [Part(number, self._etags[number]) for number in sorted(self._etags)]
+                )
+                self.upload_id = None
+                if settings.STORAGE_CONTENT_ADDRESSED:
+                    return service._commit_content_addressed(
+                        self.bucket, self.filename, digest, self.size, self.content_type,
+                        temp_name=self.object_name
+                    )
+        except S3Error as e:
+            logger.error(f"文件上传失败: {e}")
+            raise Exception(f"文件上传失败: {str(e)}")
+        return service._commit_named(self.object_name, self.bucket, digest, self.size, self.content_type,
+                                     result.etag)
+
+    def abort(self):
+        """放弃未完成的multipart上传（已合并或未开始时不做任何事）"""
+        if self.upload_id is None:
+            return
+        try:
+            self.service.client._abort_multipart_upload(self.bucket, self.object_name, self.upload_id)
+        except Exception as e:
+            logger.error(f"放弃分片上传失败 {self.object_name}: {e}")
+        self.upload_id = None
+
 
-# 全局文件服务实例
-file_service = FileService()
+# 全局文件服务实例（首次使用时创建，应用启动时预热：检查并创建默认存储桶）
+file_service = lazy_service("storage", FileService, warm_up=FileService._ensure_bucket_exists)
 
 
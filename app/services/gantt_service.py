@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+甘特图任务数据服务
+
+一页任务用一条查询取得：
+- 内层子查询按时间窗口筛选未删除的工作流，按创建时间倒序取 [offset, offset + limit) 一段，
+  COUNT(*) OVER () 在 LIMIT 之前算出窗口内的任务总数（供分页/虚拟滚动使用）
+- 外层只对这一页的工作流 LEFT JOIN 发起人与表单，GROUP BY 得到发起人姓名与表单数量
+不再逐个工作流查询表单数量、加载发起人，查询次数与工作流总数无关。
+内层子查询的筛选与排序由部分索引 ix_workflows_gantt (created_at DESC, workflow_id) WHERE deleted_at IS NULL
+支持（见 core/database.create_stats_indexes），取一页只需按索引顺序读取，不必排序全部工作流。
+
+时间窗口按任务条与 [start, end) 是否重叠筛选：开始时间为创建时间，结束时间与原来的估算规则一致
+（已完成为最后更新时间，进行中为 创建时间 + 已完成步骤×2天 + 剩余步骤×3天），在数据库中计算。
+
+作者: 王梓涵
+邮箱: wangzh011031@163.com
+时间: 2025年
+"""
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import case, select
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import func
+
+from ..models import Form, User, Workflow
+
+# 工作流步骤数（前4步按步骤计进度，占80%；表单数量占其余20%）
+TOTAL_STEPS = 5
+
+
+def estimated_end():
+    """任务条的结束时间（SQL 表达式）"""
+    remaining_days = Workflow.current_step * 2 + (TOTAL_STEPS - Workflow.current_step) * 3
+    return case(
+        (Workflow.status == 'completed', func.coalesce(Workflow.updated_at, Workflow.created_at)),
+        else_=Workflow.created_at + func.make_interval(0, 0, 0, remaining_days)
+    )
+
+
+def progress(status: str, current_step: int, total_forms: int) -> float:
+    """任务进度（百分比）"""
+    if status == 'completed':
+        return 100
+    if status == 'cancelled':
+        return 0
+    base_progress = (current_step / TOTAL_STEPS) * 80
+    form_progress = min(20, total_forms * 5)
+    return round(min(100, base_progress + form_progress), 1)
+
+
+class GanttService:
+    """甘特图任务（时间窗口 + 分页）"""
+
+    def tasks(self, db: Session, start: Optional[datetime] = None, end: Optional[datetime] = None,
+              offset: int = 0, limit: int = 200) -> dict:
+        """
+        与 [start, end) 重叠的任务，按创建时间倒序取第 offset 条起的 limit 条：
+        {"total": 窗口内任务总数, "offset", "limit", "items": [...]}
+        """
+        end_at = estimated_end()
+        conditions = [Workflow.deleted_at.is_(None)]
+        if end is not None:
+            conditions.append(Workflow.created_at < end)
+        if start is not None:
+            conditions.append(end_at >= start)
+
+        page = select(
+            Workflow.workflow_id,
+            Workflow.title,
+            Workflow.status,
+            Workflow.current_step,
+            Workflow.created_at,
+            Workflow.initiator_id,
+            end_at.label("end_at"),
+            func.count().over().label("total")
+        ).where(*conditions).order_by(
+            Workflow.created_at.desc(), Workflow.workflow_id
+        ).offset(offset).limit(limit).subquery()
+
+        rows = db.execute(
+            select(page, User.full_name, func.count(Form.form_id).label("total_forms"))
+            .outerjoin(User, User.user_id == page.c.initiator_id)
+            .outerjoin(Form, Form.workflow_id == page.c.workflow_id)
+            .group_by(*page.c, User.full_name)
+            .order_by(page.c.created_at.desc(), page.c.workflow_id)
+        ).all()
+
+        if rows:
+            total = rows[0].total
+        elif offset > 0:
+            # 超出最后一页时没有行可以带回总数
+            total = db.query(func.count(Workflow.workflow_id)).filter(*conditions).scalar()
+        else:
+            total = 0
+
+        return {
+            "total": total,
+            "offset": offset,
+            "limit": limit,
+            "items": [
+                {
+                    "id": str(row.workflow_id),
+                    "name": row.title,
+                    "start": row.created_at.isoformat(),
+                    "end": row.end_at.isoformat(),
+                    "progress": progress(row.status, row.current_step, row.total_forms),
+                    "assignee": row.full_name or "未知用户",
+                    "status": row.status,
+                    "workflow_id": str(row.workflow_id),
+                    "current_step": row.current_step,
+                    "total_forms": row.total_forms
+                }
+                for row in rows
+            ]
+        }
+
+
+# 全局甘特图服务实例
+gantt = GanttService()
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+"""
+图像派生文件服务
+
+上传完成后在后台为表单图片生成缩略图、Deep Zoom 瓦片金字塔与预览图：
+解码与缩放在独立的进程池中执行（不占用API进程的CPU与GIL），
+完成后把金字塔描述写入对应 Form.image_meta 条目的 "pyramid" 字段。
+历史图片没有缩略图时，由缩略图接口首次访问时按需生成（同一图片并发请求只生成一次）。
+
+作者: 王梓涵
+邮箱: wangzh011031@163.com
+时间: 2025年
+"""
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+import asyncio
+import logging
+import multiprocessing
+
+from ..core.config import settings
+from ..core.database import SessionLocal
+from ..models import Form
+from ..utils import image_thumbnails, image_tiles
+from .file_service import file_service
+
+logger = logging.getLogger(__name__)
+
+# 可生成瓦片的图片类型（Pillow可解码）
+TILEABLE_TYPES = {"image/jpeg", "image/png", "image/bmp", "image/tiff", "image/webp"}
+
+
+def image_api_urls(descriptor: dict) -> dict:
+    """金字塔描述 → 前端使用的访问地址（经由 /api/images 接口，带长期缓存）"""
+    base = f"/api/images/{descriptor['key']}"
+    return {
+        "key": descriptor["key"],
+        "width": descriptor["width"],
+        "height": descriptor["height"],
+        "tile_size": descriptor["tile_size"],
+        "overlap": descriptor["overlap"],
+        "tile_format": descriptor["tile_format"],
+        "max_level": descriptor["max_level"],
+        "dzi_url": f"{base}/pyramid.dzi",
+        "tile_url_template": f"{base}/tiles/{{level}}/{{col}}_{{row}}.{descriptor['tile_format']}",
+        "previews": {
+            size: {"url": f"{base}/previews/{size}.jpg", "width": info["width"], "height": info["height"]}
+            for size, info in descriptor.get("previews", {}).items()
+        }
+    }
+
+
+class ImageDerivativeService:
+    """在进程池中生成图像派生文件"""
+
+    def __init__(self, max_workers: int, task_timeout: float):
+        self.max_workers = max_workers
+        self.task_timeout = task_timeout
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._tasks: set = set()
+        self._thumbnail_jobs: Dict[str, asyncio.Future] = {}
+
+    def _pool(self) -> ProcessPoolExecutor:
+        # 延迟创建；使用spawn避免fork时复制存储线程池等线程状态
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._executor
+
+    async def build_pyramid(self, bucket: str, object_name: str) -> dict:
+        """生成（或复用已有的）瓦片金字塔，返回金字塔描述"""
+        key = image_tiles.derived_key(bucket, object_name)
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self._pool(), image_tiles.build_pyramid, bucket, object_name, key)
+        return await asyncio.wait_for(future, self.task_timeout)
+
+    async def build_thumbnails(self, bucket: str, key: str, object_name: Optional[str] = None,
+                               source_path: Optional[str] = None) -> dict:
+        """生成缩略图；同一 key 正在生成时等待已有任务，不重复解码"""
+        job = self._thumbnail_jobs.get(key)
+        if job is None:
+            loop = asyncio.get_running_loop()
+            job = asyncio.ensure_future(asyncio.wait_for(
+                loop.run_in_executor(
+                    self._pool(), image_thumbnails.build_thumbnails, bucket, key, object_name, source_path
+                ),
+                self.task_timeout
+            ))
+            self._thumbnail_jobs[key] = job
+            job.add_done_callback(lambda _: self._thumbnail_jobs.pop(key, None))
+        return await asyncio.shield(job)
+
+    def can_build_thumbnail(self, key: str) -> bool:
+        """缩略图接口能否按需生成：同一 key 已在生成时直接等待，否则正在生成的任务不超过上限"""
+        return key in self._thumbnail_jobs or len(self._thumbnail_jobs) < settings.IMAGE_THUMBNAIL_MAX_PENDING
+
+    def schedule_form_images(self, form_id, image_meta: Optional[List[dict]]):
+        """为表单图片排队生成缩略图与瓦片金字塔（不等待结果）"""
+        entries = [
+            meta for meta in (image_meta or [])
+            if meta.get("url") and meta.get("content_type") in TILEABLE_TYPES and not meta.get("pyramid")
+        ]
+        if not entries:
+            return
+        task = asyncio.create_task(self._process_form_images(form_id, entries))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _process_form_images(self, form_id, entries: List[dict]):
+        pyramids: Dict[str, dict] = {}
+        for meta in entries:
+            location = file_service.parse_file_url(meta["url"])
+            if location is None:
+                continue
+            key = image_tiles.derived_key(location[0], location[1])
+            try:
+                # 缩略图先于金字塔生成，列表页尽快可用
+                await self.build_thumbnails(location[0], key, object_name=location[1])
+            except Exception as e:
+                logger.error(f"生成缩略图失败 {meta['url']}: {e}")
+            try:
+                descriptor = await self.build_pyramid(location[0], location[1])
+                pyramids[meta["url"]] = image_api_urls(descriptor)
+            except Exception as e:
+                logger.error(f"生成瓦片金字塔失败 {meta['url']}: {e}")
+        if pyramids:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, self._attach_to_form, form_id, pyramids)
+
+    @staticmethod
+    def _attach_to_form(form_id, pyramids: Dict[str, dict]):
+        """把金字塔描述写入表单图片元数据（行锁防止并发任务互相覆盖）"""
+        db = SessionLocal()
+        try:
+            form = db.query(Form).filter(Form.form_id == form_id).with_for_update().first()
+            if not form or not form.image_meta:
+                return
+            form.image_meta = [
+                dict(meta, pyramid=pyramids[meta["url"]]) if meta.get("url") in pyramids else meta
+                for meta in form.image_meta
+            ]
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.error(f"更新表单图片元数据失败 {form_id}: {e}")
+        finally:
+            db.close()
+
+    def shutdown(self):
+        """关闭进程池（应用退出时调用）"""
+        for task in self._tasks:
+            task.cancel()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+# 全局图像派生文件服务实例
+image_service = ImageDerivativeService(
+    max_workers=settings.IMAGE_WORKERS,
+    task_timeout=settings.IMAGE_TASK_TIMEOUT
+)
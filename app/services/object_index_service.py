@@ -0,0 +1,389 @@
+# -*- coding: utf-8 -*-
+"""
+对象存储目录索引服务
+
+object_index 表保存 OBJECT_INDEX_BUCKETS 中每个对象的路径、大小、ETag、修改时间、分类与所在目录，
+工作档案的目录树与文件列表改为带索引的数据库查询，不再每次请求都递归遍历整个存储桶。
+
+索引的维护方式：
+- 首次对账时全量扫描存储桶建立索引，完成后在 system_configs 中记录同步时间；
+- 应用自身写入/删除对象时同步更新对应行；
+- 后台定期分段对账（应用之外的改动由此同步）：每轮从 system_configs 中保存的游标起只列举
+  OBJECT_INDEX_RECONCILE_BATCH 个对象，写入有变化的行并删除该名称区间内已不存在的行，
+  到达存储桶末尾后游标回到开头。每轮的存储列举开销与存储桶大小无关，
+  外部改动最迟在 ⌈对象数 / 每轮对象数⌉ × 对账间隔 后反映到索引中。
+未完成首次同步时调用方应回退到直接列举存储桶。
+
+作者: 王梓涵
+邮箱: wangzh011031@163.com
+时间: 2025年
+"""
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, Optional, Tuple
+import asyncio
+import functools
+import logging
+import os
+
+from sqlalchemy import delete, distinct, or_, tuple_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import func
+
+from ..core.config import settings
+from ..core.database import SessionLocal
+from ..core.storage_backends import StorageBackend
+from ..models import IndexedObject, SystemConfig
+from ..utils.file_search import FileFilter, glob_to_like
+from .email_service import redis_client
+
+logger = logging.getLogger(__name__)
+
+# 文件分类对应的扩展名
+CATEGORY_EXTS = {
+    "image": {".jpg", ".jpeg", ".png", ".gif", ".webp", ".svg", ".tif", ".tiff"},
+    "video": {".mp4", ".mov", ".avi", ".mkv", ".webm", ".m4v"},
+    "document": {".pdf", ".doc", ".docx", ".txt", ".md", ".caj"},
+    "code": {".js", ".ts", ".vue", ".html", ".css", ".json", ".yaml", ".yml", ".py"},
+}
+
+SYNCED_CONFIG_KEY = "object_index_synced:{}"
+CURSOR_CONFIG_KEY = "object_index_cursor:{}"
+RECONCILE_LOCK_KEY = "object_index:reconcile_lock"
+BATCH_SIZE = 500
+
+
+def file_category(ext: str) -> str:
+    """扩展名 → 文件分类"""
+    ext = ext.lower()
+    for category, exts in CATEGORY_EXTS.items():
+        if ext in exts:
+            return category
+    return "other"
+
+
+def object_row(bucket: str, path: str, size: Optional[int], etag: Optional[str],
+               mtime: Optional[datetime]) -> dict:
+    """对象信息 → object_index 行"""
+    parent, _, name = path.rpartition("/")
+    ext = os.path.splitext(name)[1].lower()[:20]
+    return {
+        "bucket": bucket,
+        "path": path,
+        "parent": parent,
+        "name": name,
+        "ext": ext,
+        "category": file_category(ext),
+        "size": size or 0,
+        "etag": etag,
+        "mtime": mtime,
+    }
+
+
+def folder_tree(folders: List[str]) -> List[dict]:
+    """目录路径列表 → 前端使用的嵌套目录树 [{label, key, children}]"""
+    roots: List[dict] = []
+    nodes: Dict[str, dict] = {}
+    for path in sorted(folders):
+        parent, _, label = path.rpartition("/")
+        node = {"label": label, "key": path, "children": []}
+        nodes[path] = node
+        (nodes[parent]["children"] if parent in nodes else roots).append(node)
+    return roots
+
+
+class ObjectIndexService:
+    """object_index 表的维护与查询"""
+
+    def __init__(self, buckets: List[str]):
+        self.buckets = set(buckets)
+        # 临时对象与派生文件（瓦片、缩略图）不属于档案内容
+        self.excluded_prefixes = ("tmp/", f"{settings.DERIVED_PREFIX}/")
+
+    def tracks(self, bucket: str, path: str) -> bool:
+        return bucket in self.buckets and not path.endswith("/") and not path.startswith(self.excluded_prefixes)
+
+    # ----- 写入 -----
+
+    @staticmethod
+    def _upsert_rows(db: Session, rows: List[dict]):
+        stmt = pg_insert(IndexedObject).values(rows)
+        db.execute(stmt.on_conflict_do_update(
+            constraint="uq_object_index_bucket_path",
+            set_={
+                "size": stmt.excluded.size,
+                "etag": stmt.excluded.etag,
+                "mtime": stmt.excluded.mtime,
+                "indexed_at": func.now(),
+            }
+        ))
+
+    def upsert(self, bucket: str, path: str, size: Optional[int], etag: Optional[str] = None,
+               mtime: Optional[datetime] = None):
+        """应用写入对象后更新索引"""
+        if not self.tracks(bucket, path):
+            return
+        db = SessionLocal()
+        try:
+            self._upsert_rows(db, [object_row(bucket, path, size, etag, mtime or datetime.now(timezone.utc))])
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def remove(self, bucket: str, path: str):
+        """应用删除对象后更新索引"""
+        if not self.tracks(bucket, path):
+            return
+        db = SessionLocal()
+        try:
+            db.execute(delete(IndexedObject).where(IndexedObject.bucket == bucket, IndexedObject.path == path))
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def discard(self, db: Session, bucket: str, paths: List[str]):
+        """在调用方事务中删除一批对象的索引行（批量删除对象时使用）"""
+        if bucket in self.buckets and paths:
+            db.execute(delete(IndexedObject).where(IndexedObject.bucket == bucket, IndexedObject.path.in_(paths)))
+
+    # ----- 对账 -----
+
+    def _cursor(self, db: Session, bucket: str) -> Tuple[Optional[str], bool]:
+        """(上次对账停下的位置, 是否已完成首次全量同步)"""
+        rows = dict(db.query(SystemConfig.config_key, SystemConfig.config_value).filter(
+            SystemConfig.config_key.in_([CURSOR_CONFIG_KEY.format(bucket), SYNCED_CONFIG_KEY.format(bucket)])
+        ).all())
+        return rows.get(CURSOR_CONFIG_KEY.format(bucket)) or None, SYNCED_CONFIG_KEY.format(bucket) in rows
+
+    def reconcile(self, client: StorageBackend, bucket: str, limit: Optional[int] = None) -> dict:
+        """
+        从上次停下的位置（system_configs 中的游标）起按对象名顺序列举至多 limit 个对象，
+        与索引中同一名称区间的行比对：写入新增/变化的对象，删除区间内已不存在的行。
+        列举到存储桶末尾时游标回到开头并记录同步时间，即每 ⌈对象数 / limit⌉ 轮完整核对一遍。
+        首次同步之前不分段（一次全量建立索引）；limit 为 None 时取 OBJECT_INDEX_RECONCILE_BATCH。
+        阻塞调用，应在线程池中执行。
+        """
+        started = datetime.now(timezone.utc)
+        db = SessionLocal()
+        try:
+            cursor, synced = self._cursor(db, bucket)
+            if not synced:
+                limit = None
+            elif limit is None:
+                limit = int(settings.OBJECT_INDEX_RECONCILE_BATCH) or None
+
+            listed = 0
+            last_key = None
+            exhausted = True
+            seen = set()
+            objects = []
+            if client.bucket_exists(bucket):
+                for obj in client.list_objects(bucket, recursive=True, start_after=cursor):
+                    if limit is not None and listed >= limit:
+                        exhausted = False
+                        break
+                    listed += 1
+                    last_key = obj.object_name
+                    if self.tracks(bucket, obj.object_name):
+                        objects.append(obj)
+
+            # 只取本轮扫描区间 (cursor, last_key] 内的索引行；按字节序（C 排序规则）比较，与 S3 列举顺序一致
+            path = IndexedObject.path.collate("C")
+            query = db.query(IndexedObject.path, IndexedObject.etag, IndexedObject.size).filter(
+                IndexedObject.bucket == bucket
+            )
+            if cursor:
+                query = query.filter(path > cursor)
+            if not exhausted:
+                query = query.filter(path <= last_key)
+            known: Dict[str, Tuple[Optional[str], int]] = {p: (etag, size) for p, etag, size in query}
+
+            pending: List[dict] = []
+            upserted = 0
+            for obj in objects:
+                seen.add(obj.object_name)
+                if known.get(obj.object_name) == (obj.etag, obj.size or 0):
+                    continue
+                pending.append(object_row(bucket, obj.object_name, obj.size, obj.etag, obj.last_modified))
+                if len(pending) >= BATCH_SIZE:
+                    self._upsert_rows(db, pending)
+                    db.commit()
+                    upserted += len(pending)
+                    pending = []
+            if pending:
+                self._upsert_rows(db, pending)
+                upserted += len(pending)
+
+            # 对账期间由应用写入的行（indexed_at 晚于开始时间）不删除
+            missing = [p for p in known if p not in seen]
+            for i in range(0, len(missing), BATCH_SIZE):
+                db.execute(delete(IndexedObject).where(
+                    IndexedObject.bucket == bucket,
+                    IndexedObject.path.in_(missing[i:i + BATCH_SIZE]),
+                    IndexedObject.indexed_at < started
+                ))
+
+            db.merge(SystemConfig(
+                config_key=CURSOR_CONFIG_KEY.format(bucket),
+                config_value="" if exhausted else last_key,
+                description="对象目录索引分段对账的游标（下一轮从该对象名之后继续列举）"
+            ))
+            if exhausted:
+                db.merge(SystemConfig(
+                    config_key=SYNCED_CONFIG_KEY.format(bucket),
+                    config_value=started.isoformat(),
+                    description="对象目录索引最近一次完整对账时间"
+                ))
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+        result = {"bucket": bucket, "listed": listed, "upserted": upserted, "removed": len(missing),
+                  "wrapped": exhausted}
+        if upserted or missing:
+            logger.info(f"目录索引对账完成: {result}")
+        return result
+
+    async def run_reconciler(self, client: StorageBackend):
+        """后台对账循环（在应用启动时创建任务）；多个worker之间通过Redis锁互斥"""
+        interval = int(settings.OBJECT_INDEX_RECONCILE_INTERVAL)
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                locked = await loop.run_in_executor(None, functools.partial(
+                    redis_client.set, RECONCILE_LOCK_KEY, "1", nx=True, ex=max(interval, 60)
+                ))
+                if locked:
+                    for bucket in sorted(self.buckets):
+                        await loop.run_in_executor(None, self.reconcile, client, bucket)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"目录索引对账任务出错: {e}")
+            await asyncio.sleep(interval)
+
+    # ----- 查询 -----
+
+    def is_ready(self, db: Session, bucket: str) -> bool:
+        """该存储桶是否已完成首次全量索引"""
+        if bucket not in self.buckets:
+            return False
+        return db.query(SystemConfig.config_key).filter(
+            SystemConfig.config_key == SYNCED_CONFIG_KEY.format(bucket)
+        ).first() is not None
+
+    def list_folders(self, db: Session, bucket: str) -> List[str]:
+        """全部目录路径（含只有子目录、没有直接文件的中间目录）"""
+        folders = set()
+        for (parent,) in db.query(distinct(IndexedObject.parent)).filter(
+            IndexedObject.bucket == bucket, IndexedObject.parent != ''
+        ):
+            parts = parent.split("/")
+            for i in range(1, len(parts) + 1):
+                folders.add("/".join(parts[:i]))
+        return sorted(folders)
+
+    @staticmethod
+    def search_conditions(file_filter: FileFilter, directory: Optional[str] = None) -> list:
+        """
+        递归搜索的查询条件：directory 目录树（含子目录）+ 通配、大小、修改时间
+        通配转为 lower(...) LIKE（与关键词一样可使用 lower(name) 上的三元组索引），
+        结果仍需 file_filter.matches 精确匹配字符集合
+        """
+        conditions = []
+        directory = (directory or "").strip("/")
+        if directory:
+            conditions.append(or_(
+                IndexedObject.parent == directory,
+                IndexedObject.parent.startswith(directory + "/", autoescape=True)
+            ))
+        if file_filter.glob:
+            column = IndexedObject.path if file_filter.match_path else IndexedObject.name
+            conditions.append(func.lower(column).like(glob_to_like(file_filter.glob).lower(), escape="\\"))
+        if file_filter.min_size is not None:
+            conditions.append(IndexedObject.size >= file_filter.min_size)
+        if file_filter.max_size is not None:
+            conditions.append(IndexedObject.size <= file_filter.max_size)
+        if file_filter.modified_after is not None:
+            conditions.append(IndexedObject.mtime >= file_filter.modified_after)
+        if file_filter.modified_before is not None:
+            conditions.append(IndexedObject.mtime < file_filter.modified_before)
+        return conditions
+
+    @staticmethod
+    def _files_query(db: Session, bucket: str, directory: Optional[str], keyword: Optional[str],
+                     category: Optional[str], exts: Optional[List[str]], conditions: Optional[list] = None,
+                     keyword_paths: Optional[List[str]] = None):
+        query = db.query(IndexedObject).filter(IndexedObject.bucket == bucket, *(conditions or ()))
+        if directory is not None:
+            query = query.filter(IndexedObject.parent == directory.strip("/"))
+        if keyword:
+            # keyword_paths：原始文件名包含关键词的对象（内容寻址对象的 name 是摘要）
+            matched = IndexedObject.name.icontains(keyword, autoescape=True)
+            if keyword_paths:
+                matched = or_(matched, IndexedObject.path.in_(keyword_paths))
+            query = query.filter(matched)
+        if category:
+            query = query.filter(IndexedObject.category == category)
+        if exts:
+            query = query.filter(IndexedObject.ext.in_(exts))
+        return query
+
+    @staticmethod
+    def _page(query, bucket: str, after: Optional[str]):
+        """按 (parent, name) 排序；after 为上一页最后一个对象名（键集分页，可使用复合索引定位）"""
+        if after:
+            parent, _, name = after.rpartition("/")
+            query = query.filter(
+                tuple_(IndexedObject.bucket, IndexedObject.parent, IndexedObject.name) > (bucket, parent, name)
+            )
+        return query.order_by(IndexedObject.bucket, IndexedObject.parent, IndexedObject.name)
+
+    def list_files(self, db: Session, bucket: str, directory: Optional[str] = None,
+                   keyword: Optional[str] = None, category: Optional[str] = None,
+                   exts: Optional[List[str]] = None, offset: int = 0,
+                   limit: Optional[int] = None, after: Optional[str] = None,
+                   keyword_paths: Optional[List[str]] = None) -> Tuple[List[IndexedObject], int]:
+        """
+        查询文件列表，返回 (当前页, 符合条件的总数)
+        directory 为空时列出整个存储桶，否则只列出该目录下一层文件；
+        keyword_paths 中的对象即使文件名不含关键词也算匹配（调用方按原始文件名查出）
+        """
+        query = self._files_query(db, bucket, directory, keyword, category, exts, keyword_paths=keyword_paths)
+        total = query.count()
+        query = self._page(query, bucket, after).offset(offset)
+        if limit is not None:
+            query = query.limit(limit)
+        return query.all(), total
+
+    def iter_files(self, bucket: str, directory: Optional[str] = None, keyword: Optional[str] = None,
+                   category: Optional[str] = None, exts: Optional[List[str]] = None,
+                   after: Optional[str] = None, conditions: Optional[list] = None,
+                   keyword_paths: Optional[List[str]] = None) -> Iterator[IndexedObject]:
+        """按批次逐条返回符合条件的文件（用于流式输出，每批单独查询）；conditions 为附加的查询条件"""
+        db = SessionLocal()
+        try:
+            while True:
+                rows = self._page(
+                    self._files_query(db, bucket, directory, keyword, category, exts, conditions, keyword_paths),
+                    bucket, after
+                ).limit(BATCH_SIZE).all()
+                yield from rows
+                if len(rows) < BATCH_SIZE:
+                    return
+                after = rows[-1].path
+        finally:
+            db.close()
+
+
+# 全局目录索引服务实例
+object_index = ObjectIndexService(settings.OBJECT_INDEX_BUCKETS)
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""
+对象引用计数服务
+
+stored_objects 表记录对象存储中每个文件被业务记录引用的次数。
+内容寻址存储下同一文件可能被多个表单、评估、知识体系文件共享，
+删除业务记录时只释放一次引用，最后一个引用释放时才删除对象。
+
+同一对象的计数变更与对象写入/删除在 PostgreSQL 事务级咨询锁内完成，
+避免“释放者删除对象”与“上传者复用对象”交错。
+
+作者: 王梓涵
+邮箱: wangzh011031@163.com
+时间: 2025年
+"""
+from contextlib import contextmanager
+from typing import Iterator, Optional
+import logging
+
+from sqlalchemy import delete, text, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import func
+
+from ..core.database import SessionLocal
+from ..models import StoredObject
+
+logger = logging.getLogger(__name__)
+
+
+class ObjectRefService:
+    """stored_objects 表的引用计数操作"""
+
+    @contextmanager
+    def locked(self, bucket: str, object_name: str) -> Iterator[Session]:
+        """打开独立事务并对该对象加咨询锁，退出时提交（出错时回滚）"""
+        db = SessionLocal()
+        try:
+            db.execute(text("SELECT pg_advisory_xact_lock(hashtext(:key))"), {"key": f"{bucket}/{object_name}"})
+            yield db
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def acquire(self, db: Session, bucket: str, object_name: str, sha256: Optional[str] = None,
+                size: Optional[int] = None, content_type: Optional[str] = None) -> int:
+        """增加一次引用，返回增加后的引用数（1 表示新对象）"""
+        stmt = pg_insert(StoredObject).values(
+            bucket=bucket,
+            object_name=object_name,
+            sha256=sha256,
+            size=size,
+            content_type=content_type,
+            ref_count=1
+        ).on_conflict_do_update(
+            constraint="uq_stored_objects_bucket_object",
+            set_={"ref_count": StoredObject.ref_count + 1, "updated_at": func.now()}
+        ).returning(StoredObject.ref_count)
+        return db.execute(stmt).scalar()
+
+    def retain(self, db: Session, bucket: str, object_name: str) -> Optional[int]:
+        """为已登记的对象增加一次引用，未登记时返回 None"""
+        return db.execute(
+            update(StoredObject)
+            .where(StoredObject.bucket == bucket, StoredObject.object_name == object_name)
+            .values(ref_count=StoredObject.ref_count + 1, updated_at=func.now())
+            .returning(StoredObject.ref_count)
+        ).scalar()
+
+    def release(self, db: Session, bucket: str, object_name: str) -> Optional[int]:
+        """
+        释放一次引用，返回剩余引用数
+        返回 0 时记录已删除，调用方应在同一事务内删除对象；
+        返回 None 表示该对象没有引用记录（引用计数上线前的旧文件）
+        """
+        remaining = db.execute(
+            update(StoredObject)
+            .where(StoredObject.bucket == bucket, StoredObject.object_name == object_name)
+            .values(ref_count=StoredObject.ref_count - 1, updated_at=func.now())
+            .returning(StoredObject.ref_count)
+        ).scalar()
+        if remaining is None:
+            return None
+        if remaining <= 0:
+            db.execute(
+                delete(StoredObject)
+                .where(StoredObject.bucket == bucket, StoredObject.object_name == object_name)
+            )
+            return 0
+        return remaining
+
+
+# 全局对象引用服务实例
+object_refs = ObjectRefService()
@@ -0,0 +1,333 @@
+# -*- coding: utf-8 -*-
+"""
+孤儿对象清理服务
+
+收集数据库记录中的全部文件地址（表单图片与附件、评估支撑文件、回溯支撑材料、知识体系文件），
+与存储桶列举结果比对，删除超过宽限期仍未被引用的对象：
+
+- 软删除的记录（含已删除工作流下的表单、评估与回溯申请）仍可恢复，其文件照样视为引用；
+- stored_objects 中引用计数大于0的对象一律保留（引用计数只在彻底删除记录时释放）；
+- 默认存储桶中的对象都由系统写入，不满足以上两条即视为孤儿；
+- 其他存储桶（如 knowledge-files，可能有在MinIO中直接维护的档案）只清理系统上传（stored_objects 中有记录）的对象；
+- tmp/ 下超过宽限期的临时对象一律清理；
+- derived/<key>/ 下的派生文件在对应源文件不再保留时清理；工作档案本地文件的缩略图（local-<key>）
+  在提供目录树时按当前文件的路径、修改时间与大小计算仍有效的 key，其余清理，未提供时全部保留。
+
+删除通过 remove_objects 批量进行并限速；每批在同一事务内对涉及的对象加咨询锁，
+与上传时的内容去重互斥，跳过清理开始后被重新引用的对象，并同步删除引用计数与目录索引记录。
+
+作者: 王梓涵
+邮箱: wangzh011031@163.com
+时间: 2025年
+"""
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+import asyncio
+import functools
+import json
+import logging
+import os
+import time
+
+from sqlalchemy import or_, select, text
+from sqlalchemy.sql import func
+
+from ..core.config import settings
+from ..core.database import SessionLocal
+from ..models import Evaluation, Form, KnowledgeSystemFile, RollbackRequest, StoredObject
+from ..utils.archive_tree import ArchiveTree
+from ..utils.image_thumbnails import LOCAL_KEY_PREFIX, is_thumbnailable, local_derived_key
+from ..utils.image_tiles import derived_key
+from .email_service import redis_client
+from .file_service import FileService, file_service
+from .object_index_service import object_index
+
+logger = logging.getLogger(__name__)
+
+GC_LOCK_KEY = "storage_gc:lock"
+GC_REPORT_KEY = "storage_gc:last_report"
+SAMPLE_SIZE = 100
+
+
+class StorageGarbageCollector:
+    """对象存储孤儿对象清理"""
+
+    def __init__(self, storage: FileService):
+        self.storage = storage
+
+    # ----- 引用收集 -----
+
+    def _referenced(self, db) -> Tuple[Set[Tuple[str, str]], Set[str]]:
+        """
+        数据库记录引用的 (存储桶, 对象名) 集合，以及表单图片元数据中记录的内容摘要
+        软删除的记录与已删除工作流下的记录都计入（可恢复，文件不能先被清理）
+        """
+        urls: List[str] = []
+        digests: Set[str] = set()
+
+        forms = db.query(
+            Form.image_url, Form.image_meta, Form.image_desc_file, Form.opinion_file, Form.attachment
+        ).yield_per(1000)
+        for image_url, image_meta, image_desc_file, opinion_file, attachment in forms:
+            for meta in image_meta or []:
+                urls.append(meta.get("url"))
+                if meta.get("sha256"):
+                    digests.add(meta["sha256"])
+            if image_url:
+                try:
+                    urls.extend(json.loads(image_url))
+                except (ValueError, TypeError):
+                    urls.append(image_url)
+            urls += [image_desc_file, opinion_file, attachment]
+
+        urls += [url for (url,) in db.query(Evaluation.evaluation_file).filter(
+            Evaluation.evaluation_file.isnot(None)
+        )]
+        urls += [url for (url,) in db.query(RollbackRequest.support_file_url).filter(
+            RollbackRequest.support_file_url.isnot(None)
+        )]
+        urls += [url for (url,) in db.query(KnowledgeSystemFile.file_url).filter(
+            KnowledgeSystemFile.file_url.isnot(None)
+        )]
+
+        referenced = set()
+        for url in urls:
+            if isinstance(url, str) and url:
+                location = self.storage.parse_file_url(url)
+                if location is not None:
+                    referenced.add(location)
+        return referenced, digests
+
+    @staticmethod
+    def _local_keys(archive_tree: ArchiveTree) -> Set[str]:
+        """工作档案中可生成缩略图的本地文件当前对应的派生目录名（与缩略图接口的计算方式一致）"""
+        keys = set()
+        for root in archive_tree.roots.values():
+            for dir_path, files, _ in archive_tree.walk_files(root):
+                for name, size, mtime_ns in files:
+                    if is_thumbnailable(name):
+                        rel_path = Path(os.path.relpath(os.path.join(dir_path, name), archive_tree.base)).as_posix()
+                        keys.add(local_derived_key(rel_path, mtime_ns, size))
+        return keys
+
+    # ----- 清理 -----
+
+    def collect(self, dry_run: bool = True, buckets: Optional[List[str]] = None,
+                archive_tree: Optional[ArchiveTree] = None) -> dict:
+        """
+        执行一次清理，返回报告（阻塞调用，应在线程池中执行）
+        dry_run=True 时只统计可回收的对象与空间，不删除；
+        未提供 archive_tree 时无法判断本地文件缩略图是否仍有效，全部保留
+        """
+        grace = timedelta(seconds=settings.GC_GRACE_PERIOD)
+        db = SessionLocal()
+        try:
+            # 使用数据库时间，与引用计数表的 updated_at 可直接比较
+            started = db.execute(select(func.now())).scalar()
+            referenced, digests = self._referenced(db)
+        finally:
+            db.close()
+        cutoff = started - grace
+        local_keys = self._local_keys(archive_tree) if archive_tree is not None else None
+
+        report = {
+            "dry_run": dry_run,
+            "started_at": started.isoformat(),
+            "grace_period": settings.GC_GRACE_PERIOD,
+            "buckets": {}
+        }
+        for bucket in buckets or dict.fromkeys([self.storage.bucket_name, "knowledge-files"]):
+            report["buckets"][bucket] = self._collect_bucket(bucket, referenced, digests, local_keys,
+                                                              started, cutoff, dry_run)
+        report["orphans"] = sum(item["orphans"] for item in report["buckets"].values())
+        report["orphan_bytes"] = sum(item["orphan_bytes"] for item in report["buckets"].values())
+        report["deleted"] = sum(item["deleted"] for item in report["buckets"].values())
+        report["bytes_reclaimed"] = sum(item["bytes_reclaimed"] for item in report["buckets"].values())
+        report["finished_at"] = datetime.now(started.tzinfo).isoformat()
+        logger.info(
+            f"孤儿对象清理{'（试运行）' if dry_run else ''}: {report['orphans']} 个对象 / {report['orphan_bytes']} 字节，"
+            f"已删除 {report['deleted']} 个 / {report['bytes_reclaimed']} 字节"
+        )
+        return report
+
+    @staticmethod
+    def _plan(objects: Iterable, bucket: str, owned: bool, referenced: Set[Tuple[str, str]],
+              digests: Set[str], tracked: Dict[str, Tuple[Optional[str], int]],
+              local_keys: Optional[Set[str]], cutoff: datetime, result: dict):
+        """
+        按列举结果划分可清理的对象：返回 (源文件, 临时对象, {派生目录名: 派生文件}, 保留的派生目录名)
+        tracked 为 stored_objects 中该存储桶的 {对象名: (内容摘要, 引用计数)}
+        """
+        derived_prefix = f"{settings.DERIVED_PREFIX}/"
+        sources: List[Tuple[str, int]] = []
+        temporary: List[Tuple[str, int]] = []
+        derived: Dict[str, List[Tuple[str, int]]] = {}
+        retained_keys: Set[str] = set(digests)
+
+        for obj in objects:
+            name = obj.object_name
+            if name.endswith("/"):
+                continue
+            result["scanned"] += 1
+            size = obj.size or 0
+            expired = obj.last_modified is None or obj.last_modified < cutoff
+            if name.startswith(derived_prefix):
+                key = name[len(derived_prefix):].split("/", 1)[0]
+                # 本地文件缩略图只在默认存储桶中，能够确认对应文件已修改或删除时才清理
+                local = key.startswith(LOCAL_KEY_PREFIX)
+                if expired and (not local or (owned and local_keys is not None and key not in local_keys)):
+                    derived.setdefault(key, []).append((name, size))
+                continue
+            if name.startswith("tmp/"):
+                if expired:
+                    temporary.append((name, size))
+                continue
+            digest, ref_count = tracked.get(name, (None, 0))
+            if (expired and (bucket, name) not in referenced and ref_count <= 0
+                    and (owned or name in tracked)):
+                sources.append((name, size))
+                continue
+            retained_keys.add(derived_key(bucket, name))
+            # 早期非内容寻址对象的派生文件按内容摘要存放
+            if digest:
+                retained_keys.add(digest)
+        return sources, temporary, derived, retained_keys
+
+    def _collect_bucket(self, bucket: str, referenced: Set[Tuple[str, str]], digests: Set[str],
+                        local_keys: Optional[Set[str]], started: datetime, cutoff: datetime,
+                        dry_run: bool) -> dict:
+        client = self.storage.client
+        result = {"scanned": 0, "orphans": 0, "orphan_bytes": 0, "deleted": 0, "bytes_reclaimed": 0,
+                  "failed": 0, "sample": []}
+        if not client.bucket_exists(bucket):
+            return result
+
+        db = SessionLocal()
+        try:
+            tracked: Dict[str, Tuple[Optional[str], int]] = {
+                name: (digest, ref_count) for name, digest, ref_count in db.query(
+                    StoredObject.object_name, StoredObject.sha256, StoredObject.ref_count
+                ).filter(StoredObject.bucket == bucket)
+            }
+        finally:
+            db.close()
+
+        sources, temporary, derived, retained_keys = self._plan(
+            client.list_objects(bucket, recursive=True), bucket, bucket == self.storage.bucket_name,
+            referenced, digests, tracked, local_keys, cutoff, result
+        )
+
+        def derived_orphans() -> List[Tuple[str, int]]:
+            return [item for key, items in derived.items() if key not in retained_keys for item in items]
+
+        orphans = sources + temporary + derived_orphans()
+        result["orphans"] = len(orphans)
+        result["orphan_bytes"] = sum(size for _, size in orphans)
+        result["sample"] = [name for name, _ in orphans[:SAMPLE_SIZE]]
+        if dry_run or not orphans:
+            return result
+
+        # 先删除源文件（需加锁复核），复核时被重新引用的源文件保留其派生文件
+        batch_size = max(1, min(settings.GC_DELETE_BATCH_SIZE, 1000))
+        for i in range(0, len(sources), batch_size):
+            began = time.monotonic()
+            batch = sources[i:i + batch_size]
+            for name in self._delete_sources(bucket, batch, started, result):
+                retained_keys.add(derived_key(bucket, name))
+                if tracked.get(name, (None, 0))[0]:
+                    retained_keys.add(tracked[name][0])
+            self._throttle(len(batch), began)
+
+        rest = temporary + derived_orphans()
+        for i in range(0, len(rest), batch_size):
+            began = time.monotonic()
+            batch = rest[i:i + batch_size]
+            self._delete(bucket, batch, result)
+            self._throttle(len(batch), began)
+        return result
+
+    def _delete_sources(self, bucket: str, batch: List[Tuple[str, int]], started: datetime,
+                        result: dict) -> Set[str]:
+        """
+        在咨询锁内复核并删除一批源文件，返回跳过的对象名
+        清理开始后引用计数有变动（被重新引用）或引用计数大于0的对象跳过；删除成功的对象同时删除引用计数与目录索引记录
+        """
+        db = SessionLocal()
+        try:
+            for name, _ in sorted(batch):
+                db.execute(text("SELECT pg_advisory_xact_lock(hashtext(:key))"), {"key": f"{bucket}/{name}"})
+            names = [name for name, _ in batch]
+            touched = {name for (name,) in db.query(StoredObject.object_name).filter(
+                StoredObject.bucket == bucket,
+                StoredObject.object_name.in_(names),
+                or_(StoredObject.updated_at >= started, StoredObject.ref_count > 0)
+            )}
+            batch = [(name, size) for name, size in batch if name not in touched]
+            if batch:
+                failed = self._delete(bucket, batch, result)
+                names = [name for name, _ in batch if name not in failed]
+                db.query(StoredObject).filter(
+                    StoredObject.bucket == bucket, StoredObject.object_name.in_(names)
+                ).delete(synchronize_session=False)
+                object_index.discard(db, bucket, names)
+            db.commit()
+            return touched
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _delete(self, bucket: str, batch: List[Tuple[str, int]], result: dict) -> Set[str]:
+        """批量删除并累计报告，返回删除失败的对象名"""
+        failed = set(self.storage.remove_objects([name for name, _ in batch], bucket))
+        result["failed"] += len(failed)
+        result["deleted"] += len(batch) - len(failed)
+        result["bytes_reclaimed"] += sum(size for name, size in batch if name not in failed)
+        return failed
+
+    @staticmethod
+    def _throttle(count: int, began: float):
+        """按 GC_DELETE_RATE（每秒删除对象数）限速，在释放锁之后等待"""
+        if settings.GC_DELETE_RATE > 0:
+            remaining = count / settings.GC_DELETE_RATE - (time.monotonic() - began)
+            if remaining > 0:
+                time.sleep(remaining)
+
+    # ----- 调度 -----
+
+    async def run(self, dry_run: bool = True, buckets: Optional[List[str]] = None,
+                  archive_tree: Optional[ArchiveTree] = None) -> Optional[dict]:
+        """在线程池中执行一次清理；已有清理在进行时返回 None（多个worker之间通过Redis锁互斥）"""
+        loop = asyncio.get_running_loop()
+        locked = await loop.run_in_executor(None, functools.partial(
+            redis_client.set, GC_LOCK_KEY, "1", nx=True, ex=6 * 3600
+        ))
+        if not locked:
+            return None
+        try:
+            report = await loop.run_in_executor(None, self.collect, dry_run, buckets, archive_tree)
+            await loop.run_in_executor(None, redis_client.set, GC_REPORT_KEY, json.dumps(report, ensure_ascii=False))
+            return report
+        finally:
+            await loop.run_in_executor(None, redis_client.delete, GC_LOCK_KEY)
+
+    def last_report(self) -> Optional[dict]:
+        data = redis_client.get(GC_REPORT_KEY)
+        return json.loads(data) if data else None
+
+    async def run_periodically(self, archive_tree: Optional[ArchiveTree] = None):
+        """后台定期清理（GC_INTERVAL 大于0时在应用启动时创建任务）"""
+        while True:
+            await asyncio.sleep(settings.GC_INTERVAL)
+            try:
+                await self.run(dry_run=settings.GC_DRY_RUN, archive_tree=archive_tree)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"孤儿对象清理任务出错: {e}")
+
+
+# 全局孤儿对象清理服务实例
+storage_gc = StorageGarbageCollector(file_service)
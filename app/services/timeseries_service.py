@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""
+按时间分桶的计数统计
+
+"某段时间内每天/每周/每月新建了多少条记录" 用一条查询回答：
+- 时间范围为半开区间 [start, end)，直接比较 created_at 列，可以使用 created_at 上的索引
+- 分桶为 date_trunc(粒度, created_at 转换到 STATS_TIMEZONE 的本地时间)，按本地日历划分天、周（周一开始）、月
+- 没有记录的桶补0，结果按时间顺序返回
+
+作者: 王梓涵
+邮箱: wangzh011031@163.com
+时间: 2025年
+"""
+from datetime import date, datetime, time, timedelta
+from typing import Dict, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import func
+
+from ..core.config import settings
+from ..models import Evaluation, Form, RollbackRequest, Workflow
+
+# 可统计的实体：名称 → (创建时间列, 固定筛选条件)
+ENTITIES = {
+    "workflows": (Workflow.created_at, (Workflow.deleted_at.is_(None),)),
+    "forms": (Form.created_at, (Form.deleted_at.is_(None),)),
+    "evaluations": (Evaluation.created_at, ()),
+    "rollbacks": (RollbackRequest.created_at, (RollbackRequest.deleted_at.is_(None),)),
+}
+
+GRANULARITIES = ("day", "week", "month")
+
+# 单次查询的最大桶数
+MAX_BUCKETS = 1000
+
+
+class TimeSeriesError(Exception):
+    """统计参数无效"""
+    pass
+
+
+def bucket_floor(day: date, granularity: str) -> date:
+    """日期所在桶的第一天"""
+    if granularity == "week":
+        return day - timedelta(days=day.weekday())
+    if granularity == "month":
+        return day.replace(day=1)
+    return day
+
+
+def next_bucket(day: date, granularity: str) -> date:
+    if granularity == "week":
+        return day + timedelta(days=7)
+    if granularity == "month":
+        return (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return day + timedelta(days=1)
+
+
+def day_after(day: date) -> date:
+    """含当天的结束日期转为开区间的结束日期"""
+    if day >= date.max:
+        raise TimeSeriesError("结束日期超出范围")
+    return day + timedelta(days=1)
+
+
+def buckets(start: date, end: date, granularity: str) -> List[date]:
+    """[start, end) 覆盖的各桶起始日期（start 向下取整到桶边界）"""
+    result = []
+    day = bucket_floor(start, granularity)
+    while day < end:
+        result.append(day)
+        if len(result) > MAX_BUCKETS:
+            raise TimeSeriesError(f"时间范围过大，最多 {MAX_BUCKETS} 个统计区间")
+        try:
+            day = next_bucket(day, granularity)
+        except OverflowError:
+            # 已是可表示日期中的最后一个桶
+            break
+    return result
+
+
+class TimeSeriesService:
+    """按天/周/月分桶的计数（时区 STATS_TIMEZONE）"""
+
+    def __init__(self, timezone: str):
+        self.timezone = timezone
+        self.tz = ZoneInfo(timezone)
+
+    def today(self) -> date:
+        return datetime.now(self.tz).date()
+
+    def local_midnight(self, day: date) -> datetime:
+        """本地日期零点（带时区）"""
+        return datetime.combine(day, time.min, tzinfo=self.tz)
+
+    def default_range(self, granularity: str) -> Tuple[date, date]:
+        """默认范围（含今天）：最近30天 / 12周 / 12个月"""
+        today = self.today()
+        end = today + timedelta(days=1)
+        if granularity == "week":
+            return bucket_floor(today, "week") - timedelta(weeks=11), end
+        if granularity == "month":
+            start = bucket_floor(today, "month")
+            for _ in range(11):
+                start = bucket_floor(start - timedelta(days=1), "month")
+            return start, end
+        return today - timedelta(days=29), end
+
+    def series(self, db: Session, entity: str, granularity: str, start: date, end: date,
+               conditions: tuple = ()) -> List[dict]:
+        """
+        [start, end) 内每个桶新建的记录数：[{"start": 桶起始日期, "count": 数量}, ...]
+        start 向下取整到桶边界；conditions 为附加筛选条件
+        """
+        if entity not in ENTITIES:
+            raise TimeSeriesError(f"不支持的统计对象: {entity}")
+        if granularity not in GRANULARITIES:
+            raise TimeSeriesError(f"不支持的统计粒度: {granularity}")
+        if end <= start:
+            raise TimeSeriesError("结束日期必须晚于开始日期")
+        starts = buckets(start, end, granularity)
+
+        column, fixed = ENTITIES[entity]
+        bucket = func.date_trunc(granularity, func.timezone(self.timezone, column))
+        rows = db.query(bucket, func.count()).filter(
+            column >= self.local_midnight(starts[0]),
+            column < self.local_midnight(end),
+            *fixed,
+            *conditions
+        ).group_by(bucket)
+        counts: Dict[date, int] = {value.date(): count for value, count in rows}
+        return [{"start": day, "count": counts.get(day, 0)} for day in starts]
+
+
+# 全局时间序列统计服务实例
+timeseries = TimeSeriesService(settings.STATS_TIMEZONE)
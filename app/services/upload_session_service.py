@@ -0,0 +1,357 @@
+# -*- coding: utf-8 -*-
+"""
+上传会话服务
+
+断点续传：大文件按固定大小切分为编号分片，客户端可按任意顺序、并行上传分片，
+中断后查询已完成的分片继续上传，全部完成后合并。
+分片直接写入MinIO的multipart上传，会话状态保存在Redis中，过期会话由后台清理任务回收。
+Redis客户端是同步的，命令都在线程池中执行，不阻塞事件循环。
+
+预签名直传：签发短期有效的PUT地址，浏览器直接上传到存储桶，
+上传完成后通过提交接口校验对象并登记到业务表。单次PUT最大5GB，更大的文件只能走断点续传。
+
+作者: 王梓涵
+邮箱: wangzh011031@163.com
+时间: 2025年
+"""
+from datetime import datetime, timedelta
+from typing import Optional
+import asyncio
+import functools
+import json
+import logging
+import math
+import time
+import uuid
+
+from ..core.config import settings
+from .async_file_service import AsyncFileService, async_file_service
+from .email_service import redis_client
+
+logger = logging.getLogger(__name__)
+
+# S3 multipart 限制
+MIN_CHUNK_SIZE = 5 * 1024 * 1024
+MAX_CHUNKS = 10000
+
+# S3 单次 PUT 的对象大小上限，更大的文件只能分片上传
+MAX_SINGLE_PUT_SIZE = 5 * 1024 * 1024 * 1024
+
+# Redis键
+SESSION_KEY = "upload_session:{}"
+PARTS_KEY = "upload_session:{}:parts"
+COMPLETING_KEY = "upload_session:{}:completing"
+INDEX_KEY = "upload_sessions"
+SWEEP_LOCK_KEY = "upload_sessions:sweep_lock"
+PRESIGNED_KEY = "presigned_upload:{}"
+
+# 允许断点续传写入的存储桶
+KNOWLEDGE_BUCKET = "knowledge-files"
+
+
+class UploadSessionError(Exception):
+    """上传会话操作失败，status_code 为建议返回的HTTP状态码"""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class UploadSessionService:
+    """基于Redis会话与MinIO multipart上传的断点续传服务"""
+
+    def __init__(self, redis, storage: AsyncFileService):
+        self.redis = redis
+        self.storage = storage
+
+    # ----- 内部工具 -----
+
+    async def _call(self, func, *args, **kwargs):
+        """在线程池中执行同步的Redis命令（或由多条命令组成的函数）"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, functools.partial(func, *args, **kwargs))
+
+    @staticmethod
+    def _chunk_size_for(total_size: int) -> int:
+        """分片大小：默认 UPLOAD_PART_SIZE，分片数超过上限时按MB向上取整放大"""
+        chunk_size = max(settings.UPLOAD_PART_SIZE, MIN_CHUNK_SIZE)
+        if math.ceil(total_size / chunk_size) > MAX_CHUNKS:
+            mb = 1024 * 1024
+            chunk_size = math.ceil(total_size / MAX_CHUNKS / mb) * mb
+        return chunk_size
+
+    def _key_ttl(self) -> int:
+        # Redis中的键保留到会话有效期的两倍，保证清理任务能读到 upload_id
+        return int(settings.RESUMABLE_SESSION_TTL * 2)
+
+    def _touch(self, session_id: str):
+        pipe = self.redis.pipeline()
+        pipe.zadd(INDEX_KEY, {session_id: time.time()})
+        pipe.expire(SESSION_KEY.format(session_id), self._key_ttl())
+        pipe.expire(PARTS_KEY.format(session_id), self._key_ttl())
+        pipe.execute()
+
+    def _received_parts(self, session_id: str) -> dict:
+        raw = self.redis.hgetall(PARTS_KEY.format(session_id))
+        return {int(number): json.loads(value) for number, value in raw.items()}
+
+    def _forget(self, session_id: str):
+        pipe = self.redis.pipeline()
+        pipe.delete(SESSION_KEY.format(session_id), PARTS_KEY.format(session_id), COMPLETING_KEY.format(session_id))
+        pipe.zrem(INDEX_KEY, session_id)
+        pipe.execute()
+
+    async def get_session(self, session_id: str, user_id: Optional[int] = None) -> dict:
+        """读取会话；指定 user_id 时校验会话归属"""
+        data = await self._call(self.redis.get, SESSION_KEY.format(session_id))
+        if not data:
+            raise UploadSessionError("上传会话不存在或已过期", 404)
+        session = json.loads(data)
+        if user_id is not None and session["user_id"] != user_id:
+            raise UploadSessionError("无权限操作此上传会话", 403)
+        return session
+
+    async def describe(self, session: dict) -> dict:
+        """会话状态：已完成与缺失的分片号"""
+        received = sorted((await self._call(self._received_parts, session["session_id"])).keys())
+        received_set = set(received)
+        last_active = await self._call(self.redis.zscore, INDEX_KEY, session["session_id"]) or time.time()
+        return {
+            "session_id": session["session_id"],
+            "filename": session["filename"],
+            "content_type": session["content_type"],
+            "total_size": session["total_size"],
+            "chunk_size": session["chunk_size"],
+            "total_chunks": session["total_chunks"],
+            "received_chunks": received,
+            "missing_chunks": [n for n in range(1, session["total_chunks"] + 1) if n not in received_set],
+            "expires_at": datetime.fromtimestamp(last_active) + timedelta(seconds=settings.RESUMABLE_SESSION_TTL)
+        }
+
+    def expected_chunk_size(self, session: dict, chunk_no: int) -> int:
+        if chunk_no < 1 or chunk_no > session["total_chunks"]:
+            raise UploadSessionError(f"分片号必须在 1-{session['total_chunks']} 之间")
+        if chunk_no < session["total_chunks"]:
+            return session["chunk_size"]
+        return session["total_size"] - session["chunk_size"] * (session["total_chunks"] - 1)
+
+    # ----- 会话操作 -----
+
+    async def create_session(self, user_id: int, filename: str, content_type: Optional[str], total_size: int,
+                             bucket_name: Optional[str] = None) -> dict:
+        """创建上传会话（同时创建MinIO multipart上传）"""
+        if total_size <= 0:
+            raise UploadSessionError("文件大小必须大于0")
+        if total_size > settings.RESUMABLE_MAX_FILE_SIZE:
+            raise UploadSessionError("文件大小超过限制", 413)
+        if bucket_name not in (None, settings.MINIO_BUCKET, KNOWLEDGE_BUCKET):
+            raise UploadSessionError("不支持的存储桶")
+
+        chunk_size = self._chunk_size_for(total_size)
+        upload = await self.storage.create_multipart_upload(filename, content_type, bucket_name)
+        session = {
+            "session_id": uuid.uuid4().hex,
+            "user_id": user_id,
+            "filename": filename,
+            "content_type": content_type or "application/octet-stream",
+            "total_size": total_size,
+            "chunk_size": chunk_size,
+            "total_chunks": math.ceil(total_size / chunk_size),
+            "upload_id": upload["upload_id"],
+            "object_name": upload["object_name"],
+            "bucket": upload["bucket"],
+            "created_at": datetime.now().isoformat()
+        }
+        await self._call(self.redis.set, SESSION_KEY.format(session["session_id"]), json.dumps(session),
+                         ex=self._key_ttl())
+        await self._call(self._touch, session["session_id"])
+        return session
+
+    async def upload_chunk(self, session_id: str, user_id: int, chunk_no: int, data: bytes) -> dict:
+        """上传一个分片；同一分片重复上传时以最后一次为准"""
+        session = await self.get_session(session_id, user_id)
+        expected = self.expected_chunk_size(session, chunk_no)
+        if len(data) != expected:
+            raise UploadSessionError(f"分片 {chunk_no} 大小应为 {expected} 字节，实际为 {len(data)} 字节")
+        if await self._call(self.redis.exists, COMPLETING_KEY.format(session_id)):
+            raise UploadSessionError("上传会话正在合并", 409)
+
+        etag = await self.storage.upload_part(
+            session["object_name"], session["upload_id"], chunk_no, data, session["bucket"]
+        )
+        await self._call(self.redis.hset, PARTS_KEY.format(session_id), str(chunk_no),
+                         json.dumps({"etag": etag, "size": len(data)}))
+        await self._call(self._touch, session_id)
+        return {"chunk_no": chunk_no, "size": len(data), "etag": etag}
+
+    async def complete(self, session_id: str, user_id: int) -> dict:
+        """合并全部分片，返回文件URL与大小"""
+        session = await self.get_session(session_id, user_id)
+        parts = await self._call(self._received_parts, session_id)
+        missing = [n for n in range(1, session["total_chunks"] + 1) if n not in parts]
+        if missing:
+            raise UploadSessionError(f"还有 {len(missing)} 个分片未上传", 409)
+        if not await self._call(self.redis.set, COMPLETING_KEY.format(session_id), "1", nx=True,
+                                ex=int(settings.STORAGE_UPLOAD_TIMEOUT)):
+            raise UploadSessionError("上传会话正在合并", 409)
+
+        try:
+            await self.storage.complete_multipart_upload(
+                session["object_name"], session["upload_id"],
+                [(number, parts[number]["etag"]) for number in sorted(parts)],
+                session["bucket"]
+            )
+        except Exception:
+            await self._call(self.redis.delete, COMPLETING_KEY.format(session_id))
+            raise
+
+        size = sum(part["size"] for part in parts.values())
+        await self._call(self._forget, session_id)
+        try:
+            await self.storage.record_reference(
+                session["object_name"], session["bucket"], size=size, content_type=session["content_type"]
+            )
+        except Exception as e:
+            logger.error(f"登记对象引用失败 {session['object_name']}: {e}")
+        return {
+            "filename": session["filename"],
+            "url": self.storage.service.get_file_url(session["object_name"], session["bucket"]),
+            "object_name": session["object_name"],
+            "bucket": session["bucket"],
+            "size": size,
+            "content_type": session["content_type"]
+        }
+
+    async def abort(self, session_id: str, user_id: Optional[int] = None):
+        """取消上传会话并释放已上传的分片"""
+        session = await self.get_session(session_id, user_id)
+        await self.storage.abort_multipart_upload(session["object_name"], session["upload_id"], session["bucket"])
+        await self._call(self._forget, session_id)
+
+    # ----- 预签名直传 -----
+
+    async def create_presigned_upload(self, user_id: int, filename: str, content_type: Optional[str], size: int,
+                                bucket_name: str, max_size: int) -> dict:
+        """签发预签名PUT地址，并记录待提交的上传凭据"""
+        if size <= 0:
+            raise UploadSessionError("文件大小必须大于0")
+        if size > max_size:
+            raise UploadSessionError("文件大小超过限制", 413)
+        if size > MAX_SINGLE_PUT_SIZE:
+            raise UploadSessionError("文件超过单次直传上限（5GB），请使用断点续传上传", 413)
+        max_size = min(max_size, MAX_SINGLE_PUT_SIZE)
+
+        object_name = self.storage.service._generate_object_name(filename)
+        expires = settings.PRESIGNED_PUT_EXPIRE
+        ticket = {
+            "ticket_id": uuid.uuid4().hex,
+            "user_id": user_id,
+            "filename": filename,
+            "content_type": content_type or "application/octet-stream",
+            "size": size,
+            "max_size": max_size,
+            "object_name": object_name,
+            "bucket": bucket_name
+        }
+        # Content-Type 参与签名，浏览器只能按凭据中的类型上传
+        upload_url = self.storage.service.presigned_put_url(object_name, bucket_name, expires,
+                                                            content_type=ticket["content_type"])
+        # 凭据比上传地址多保留一个有效期，留出上传完成到提交之间的时间
+        await self._call(self.redis.set, PRESIGNED_KEY.format(ticket["ticket_id"]), json.dumps(ticket), ex=expires * 2)
+        return {
+            "ticket_id": ticket["ticket_id"],
+            "object_name": object_name,
+            "bucket": bucket_name,
+            "upload_url": upload_url,
+            "method": "PUT",
+            "headers": {"Content-Type": ticket["content_type"]},
+            "expires_at": datetime.now() + timedelta(seconds=expires)
+        }
+
+    async def verify_presigned_upload(self, ticket_id: str, user_id: int) -> dict:
+        """校验直传对象已存在、大小与类型符合凭据，返回与 upload_stream 相同结构的上传结果"""
+        data = await self._call(self.redis.get, PRESIGNED_KEY.format(ticket_id))
+        if not data:
+            raise UploadSessionError("上传凭据不存在或已过期", 404)
+        ticket = json.loads(data)
+        if ticket["user_id"] != user_id:
+            raise UploadSessionError("无权限提交此上传", 403)
+
+        stat = await self.storage.stat_object(ticket["object_name"], ticket["bucket"])
+        if stat is None:
+            raise UploadSessionError("文件尚未上传到存储服务", 409)
+        if stat["size"] > ticket["max_size"]:
+            await self._reject_presigned_upload(ticket_id, ticket)
+            raise UploadSessionError("文件大小超过限制", 413)
+        if stat["content_type"] != ticket["content_type"]:
+            await self._reject_presigned_upload(ticket_id, ticket)
+            raise UploadSessionError("文件类型与上传凭据不符", 415)
+
+        # 提交失败重试时不重复登记引用
+        if not ticket.get("recorded"):
+            try:
+                await self.storage.record_reference(
+                    ticket["object_name"], ticket["bucket"], size=stat["size"], content_type=ticket["content_type"]
+                )
+                ticket["recorded"] = True
+                await self._call(self.redis.set, PRESIGNED_KEY.format(ticket_id), json.dumps(ticket), keepttl=True)
+            except Exception as e:
+                logger.error(f"登记对象引用失败 {ticket['object_name']}: {e}")
+            await self.storage.index_object(ticket["object_name"], ticket["bucket"], stat["size"], stat["etag"])
+
+        return {
+            "filename": ticket["filename"],
+            "url": self.storage.service.get_file_url(ticket["object_name"], ticket["bucket"]),
+            "object_name": ticket["object_name"],
+            "bucket": ticket["bucket"],
+            "size": stat["size"],
+            "etag": stat["etag"],
+            "content_type": ticket["content_type"]
+        }
+
+    async def _reject_presigned_upload(self, ticket_id: str, ticket: dict):
+        """删除不符合凭据的直传对象并作废凭据"""
+        await self.storage.delete_objects([ticket])
+        await self._call(self.redis.delete, PRESIGNED_KEY.format(ticket_id))
+
+    async def discard_presigned_upload(self, ticket_id: str):
+        """提交成功后作废上传凭据"""
+        await self._call(self.redis.delete, PRESIGNED_KEY.format(ticket_id))
+
+    # ----- 过期会话清理 -----
+
+    async def sweep_expired(self) -> int:
+        """清理超过有效期未活动的会话，返回清理数量；多个worker之间通过Redis锁互斥"""
+        interval = int(settings.RESUMABLE_SWEEP_INTERVAL)
+        if not await self._call(self.redis.set, SWEEP_LOCK_KEY, "1", nx=True, ex=max(interval, 60)):
+            return 0
+        swept = 0
+        cutoff = time.time() - settings.RESUMABLE_SESSION_TTL
+        for session_id in await self._call(self.redis.zrangebyscore, INDEX_KEY, 0, cutoff):
+            try:
+                await self.abort(session_id)
+            except UploadSessionError:
+                # 会话数据已过期，只能移除索引
+                await self._call(self._forget, session_id)
+            except Exception as e:
+                logger.error(f"清理上传会话失败 {session_id}: {e}")
+                continue
+            swept += 1
+        if swept:
+            logger.info(f"已清理 {swept} 个过期上传会话")
+        return swept
+
+    async def run_sweeper(self):
+        """后台清理循环（在应用启动时创建任务）"""
+        while True:
+            try:
+                await self.sweep_expired()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"上传会话清理任务出错: {e}")
+            await asyncio.sleep(settings.RESUMABLE_SWEEP_INTERVAL)
+
+
+# 全局上传会话服务实例
+upload_session_service = UploadSessionService(redis_client, async_file_service)
@@ -0,0 +1,321 @@
+# -*- coding: utf-8 -*-
+"""
+工作档案本地目录树与文件列表缓存
+
+用 os.scandir 扫描目录（子目录判断使用目录项类型，不额外 stat），结果按目录缓存在进程内：
+- 文件夹树只需要子目录，扫描时不 stat 文件；首次列出某个目录的文件时才记录文件大小与修改时间
+- 安装 watchdog 时由 inotify 等文件系统事件把受影响的目录标记为过期，其余目录不再检查
+- 未安装 watchdog（或监听失败）时按目录修改时间判断：新建、删除、重命名都会改变所在目录的修改时间，
+  同一目录每 WORK_ARCHIVE_CHECK_INTERVAL 秒最多 stat 一次
+- 原地改写文件不改变目录修改时间，未监听时文件列表最长缓存 WORK_ARCHIVE_CACHE_TTL 秒
+- 缓存定期写入磁盘快照（WORK_ARCHIVE_SNAPSHOT），新启动的 worker 读取快照后只需逐个目录校验修改时间，
+  不必重新遍历整个档案
+- walk_files 递归返回缓存的文件列表，作为递归搜索的路径索引；启动时可调用 prebuild 在后台预先扫描
+
+作者: 王梓涵
+邮箱: wangzh011031@163.com
+时间: 2025年
+"""
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+import json
+import logging
+import os
+import threading
+import time
+
+from ..core.config import settings
+
+try:
+    from watchdog.observers import Observer  # 可选依赖，文件系统事件通知
+except ImportError:
+    Observer = None
+
+logger = logging.getLogger(__name__)
+
+# 文件列表中的一项：(文件名, 大小, 修改时间ns)
+FileEntry = Tuple[str, int, int]
+
+# 快照写入的最小间隔（秒）
+SNAPSHOT_INTERVAL = 5.0
+
+# 目录修改时间距扫描时间不足该值时，同一时间粒度内可能还有未扫描到的修改，下次访问重新扫描
+RACY_WINDOW_NS = 1_000_000_000
+
+# 不影响目录内容的文件系统事件
+IGNORED_EVENTS = {"opened", "closed", "closed_no_write"}
+
+
+class _Dir:
+    __slots__ = ("mtime_ns", "scanned_at", "subdirs", "files", "checked_at", "verified", "stale", "_names")
+
+    def __init__(self, mtime_ns: int, scanned_at: float, subdirs: Tuple[str, ...],
+                 files: Optional[Tuple[FileEntry, ...]], verified: bool = True):
+        self.mtime_ns = mtime_ns
+        self.scanned_at = scanned_at
+        self.subdirs = subdirs
+        self.files = files              # None 表示扫描时未记录文件
+        self.checked_at = scanned_at
+        self.verified = verified        # 从快照读取的目录需要先校验一次修改时间
+        self.stale = False              # 文件系统事件标记的过期
+        self._names: Optional[str] = None
+
+    @property
+    def names(self) -> str:
+        """全部文件名（小写，每个以换行结尾），搜索时整体预筛选"""
+        if self._names is None:
+            self._names = "".join(f"{f[0]}\n" for f in self.files or ()).lower()
+        return self._names
+
+    @property
+    def racy(self) -> bool:
+        return int(self.scanned_at * 1e9) - self.mtime_ns < RACY_WINDOW_NS
+
+
+class _EventHandler:
+    """watchdog 事件处理：把事件涉及的目录标记为过期"""
+
+    def __init__(self, tree: "ArchiveTree"):
+        self.tree = tree
+
+    def dispatch(self, event):
+        if event.event_type in IGNORED_EVENTS:
+            return
+        for path in (event.src_path, getattr(event, "dest_path", None)):
+            if not path:
+                continue
+            path = os.fsdecode(path)
+            self.tree.invalidate(os.path.dirname(path))
+            if event.is_directory:
+                self.tree.invalidate(path)
+
+
+class ArchiveTree:
+    """若干根目录下的目录树与文件列表缓存（线程安全）"""
+
+    def __init__(self, base: Path, roots: Dict[str, Path]):
+        self.base = base
+        self.roots = roots
+        self._dirs: Dict[str, _Dir] = {}
+        self._lock = threading.Lock()
+        self._started = False
+        self._observer = None
+        self._tree: Optional[List[dict]] = None
+        self._tree_version = -1
+        self._version = 0               # 子目录结构变化时递增
+        self._tree_dirty = True
+        self._changed = False           # 有未写入快照的扫描结果
+        self._saved_at = 0.0
+
+    @property
+    def watching(self) -> bool:
+        return self._observer is not None
+
+    # ----- 启动与关闭 -----
+
+    def _start(self):
+        if self._started:
+            return
+        with self._lock:
+            if self._started:
+                return
+            # 先开始监听再读取快照：读取之后的变化都会收到事件，读取之前的变化由首次校验发现
+            if settings.WORK_ARCHIVE_WATCH and Observer is not None and self.roots:
+                try:
+                    observer = Observer()
+                    handler = _EventHandler(self)
+                    for root in self.roots.values():
+                        observer.schedule(handler, str(root), recursive=True)
+                    observer.daemon = True
+                    observer.start()
+                    self._observer = observer
+                except Exception as e:
+                    logger.warning(f"工作档案目录监听启动失败，改为按目录修改时间校验: {e}")
+            self._load_snapshot()
+            self._started = True
+
+    def shutdown(self):
+        """停止目录监听并写入快照"""
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer = None
+        self._save_snapshot(force=True)
+
+    def invalidate(self, path: str):
+        """标记目录过期（下次访问时重新扫描）"""
+        d = self._dirs.get(path)
+        if d is not None:
+            d.stale = True
+        self._tree_dirty = True
+
+    # ----- 扫描与校验 -----
+
+    def _scan(self, path: str, with_files: bool) -> Optional[_Dir]:
+        try:
+            # 先取目录修改时间再扫描：扫描期间的修改会使下次校验失败，不会被遗漏
+            mtime_ns = os.stat(path).st_mtime_ns
+            with os.scandir(path) as it:
+                entries = list(it)
+        except (FileNotFoundError, NotADirectoryError, PermissionError):
+            return None
+        subdirs: List[str] = []
+        files: List[FileEntry] = []
+        for entry in entries:
+            try:
+                if entry.is_dir():
+                    if not entry.name.startswith("."):
+                        subdirs.append(entry.name)
+                elif with_files and entry.is_file():
+                    st = entry.stat()
+                    files.append((entry.name, st.st_size, st.st_mtime_ns))
+            except OSError:
+                # 扫描过程中被删除
+                continue
+        subdirs.sort()
+        files.sort()
+        return _Dir(mtime_ns, time.time(), tuple(subdirs), tuple(files) if with_files else None)
+
+    def _fresh(self, path: str, d: _Dir, with_files: bool) -> bool:
+        if d.stale or d.racy:
+            return False
+        now = time.time()
+        if with_files and not self.watching and now - d.scanned_at > settings.WORK_ARCHIVE_CACHE_TTL:
+            return False
+        if d.verified and (self.watching or now - d.checked_at < settings.WORK_ARCHIVE_CHECK_INTERVAL):
+            return True
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except OSError:
+            return False
+        d.checked_at = now
+        d.verified = True
+        return mtime_ns == d.mtime_ns
+
+    def _get(self, path: str, with_files: bool) -> Optional[_Dir]:
+        d = self._dirs.get(path)
+        if d is not None and (d.files is not None or not with_files) and self._fresh(path, d, with_files):
+            return d
+        # 已记录过文件的目录重新扫描时继续记录
+        new = self._scan(path, with_files or (d is not None and d.files is not None))
+        with self._lock:
+            if new is None:
+                if self._dirs.pop(path, None) is not None:
+                    self._version += 1
+            else:
+                if d is None or d.subdirs != new.subdirs:
+                    self._version += 1
+                self._dirs[path] = new
+            self._changed = True
+        return new
+
+    # ----- 查询 -----
+
+    def listing(self, path: Path) -> Optional[Tuple[FileEntry, ...]]:
+        """目录下一层的文件（按文件名排序），目录不存在时返回 None"""
+        self._start()
+        d = self._get(str(path), with_files=True)
+        self._save_snapshot()
+        return d.files if d is not None else None
+
+    def walk_files(self, path: Path) -> Iterator[Tuple[str, Tuple[FileEntry, ...], str]]:
+        """
+        递归返回 (目录路径, 该目录下的文件, 小写文件名列表文本)，目录按名称深度优先；调用方取够即可停止
+        """
+        self._start()
+        stack = [str(path)]
+        while stack:
+            dir_path = stack.pop()
+            d = self._get(dir_path, with_files=True)
+            if d is None:
+                continue
+            if d.files:
+                yield dir_path, d.files, d.names
+            stack.extend(os.path.join(dir_path, name) for name in reversed(d.subdirs))
+        self._save_snapshot()
+
+    def prebuild(self):
+        """在后台线程中扫描全部根目录并记录文件信息，首次搜索不必等待扫描"""
+        def build():
+            try:
+                for root in self.roots.values():
+                    for _ in self.walk_files(root):
+                        pass
+            except Exception as e:
+                logger.warning(f"工作档案目录预扫描失败: {e}")
+
+        threading.Thread(target=build, name="archive-tree-prebuild", daemon=True).start()
+
+    def _validate(self, path: str):
+        d = self._get(path, with_files=False)
+        if d is not None:
+            for name in d.subdirs:
+                self._validate(os.path.join(path, name))
+
+    def _node(self, label: str, path: str) -> dict:
+        d = self._dirs.get(path)
+        children = [self._node(name, os.path.join(path, name)) for name in d.subdirs] if d is not None else []
+        return {
+            "label": label,
+            "key": Path(os.path.relpath(path, self.base)).as_posix(),
+            "children": children
+        }
+
+    def tree(self) -> List[dict]:
+        """各根目录的文件夹树（不含以 . 开头的目录）"""
+        self._start()
+        if self.watching and self._tree is not None and not self._tree_dirty:
+            return self._tree
+        # 校验期间收到的事件会重新标记
+        self._tree_dirty = False
+        for root in self.roots.values():
+            self._validate(str(root))
+        if self._tree is None or self._tree_version != self._version:
+            version = self._version
+            self._tree = [self._node(name, str(root)) for name, root in self.roots.items()]
+            self._tree_version = version
+        self._save_snapshot()
+        return self._tree
+
+    # ----- 磁盘快照 -----
+
+    def _load_snapshot(self):
+        path = settings.WORK_ARCHIVE_SNAPSHOT
+        if not path or not os.path.isfile(path):
+            return
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("base") != str(self.base):
+                return
+            for dir_path, (mtime_ns, scanned_at, subdirs, files) in data["dirs"].items():
+                self._dirs[dir_path] = _Dir(
+                    mtime_ns, scanned_at, tuple(subdirs),
+                    tuple(tuple(f) for f in files) if files is not None else None,
+                    verified=False
+                )
+            self._saved_at = time.time()
+        except Exception as e:
+            logger.warning(f"读取工作档案目录快照失败: {e}")
+
+    def _save_snapshot(self, force: bool = False):
+        path = settings.WORK_ARCHIVE_SNAPSHOT
+        if not path or not self._changed:
+            return
+        if not force and time.time() - self._saved_at < SNAPSHOT_INTERVAL:
+            return
+        with self._lock:
+            self._changed = False
+            self._saved_at = time.time()
+            dirs = {
+                dir_path: [d.mtime_ns, d.scanned_at, d.subdirs, d.files]
+                for dir_path, d in self._dirs.items()
+            }
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            # 先写临时文件再替换，其他 worker 不会读到写了一半的快照
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"base": str(self.base), "dirs": dirs}, f, ensure_ascii=False, separators=(",", ":"))
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"写入工作档案目录快照失败: {e}")
@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+"""
+文档纯文本抽取与分词（全文索引使用）
+
+抽取函数在文档索引进程池中执行：按需从存储下载文件到临时目录，抽取纯文本并分词，
+解析与分词都不占用API进程的CPU与GIL。
+
+- txt / md / csv：按 UTF-8（含BOM）或 GB18030 解码
+- docx：直接读取 word/document.xml 中的文字（不依赖 python-docx）
+- pdf：安装 pypdf 时抽取文本层（扫描件没有文本层时内容为空）
+- caj、doc 等格式无法抽取，只索引文件名
+
+分词不依赖词典：中文连续字符输出单字与相邻二字（bigram），英文与数字按小写单词输出。
+查询时中文词拆为相邻二字、英文词按前缀匹配，再用原词在正文中精确查找，排除二字都出现但不相邻的误匹配。
+
+作者: 王梓涵
+邮箱: wangzh011031@163.com
+时间: 2025年
+"""
+from collections import Counter
+from typing import List, Optional, Tuple
+from xml.etree import ElementTree
+import html
+import os
+import re
+import tempfile
+import zipfile
+
+from ..core.config import settings
+from .image_tiles import _get_client, download_to_file
+
+try:
+    from pypdf import PdfReader  # 可选依赖，PDF文本层抽取
+except ImportError:
+    PdfReader = None
+
+# 可抽取正文的扩展名（小写，含点）
+TEXT_EXTS = {".txt", ".md", ".csv"}
+EXTRACTABLE_EXTS = TEXT_EXTS | {".docx", ".pdf"}
+
+CJK = "\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff"  # 中日韩统一表意文字（含扩展A与兼容区）
+TOKEN_RE = re.compile(f"[{CJK}]+|[0-9a-z]+")
+CJK_RE = re.compile(f"[{CJK}]")
+
+# 单个英文/数字词的最大长度（更长的通常是编码数据，不索引）
+MAX_WORD_LENGTH = 64
+
+# 单个文档的索引词数量上限（每个中文二字约占10字节，保证 tsvector 不超过1MB）
+MAX_TOKENS = 80_000
+
+WORD_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+
+
+def _decode(data: bytes) -> str:
+    for encoding in ("utf-8-sig", "gb18030"):
+        try:
+            return data.decode(encoding)
+        except UnicodeDecodeError:
+            continue
+    return data.decode("utf-8", errors="replace")
+
+
+def _docx_text(path: str) -> str:
+    paragraphs: List[str] = []
+    with zipfile.ZipFile(path) as archive, archive.open("word/document.xml") as xml:
+        for _, element in ElementTree.iterparse(xml):
+            if element.tag == f"{WORD_NS}p":
+                paragraphs.append("".join(t.text or "" for t in element.iter(f"{WORD_NS}t")))
+                element.clear()
+    return "\n".join(p for p in paragraphs if p)
+
+
+def _pdf_text(path: str, max_chars: int) -> str:
+    pages: List[str] = []
+    length = 0
+    for page in PdfReader(path).pages:
+        text = page.extract_text() or ""
+        pages.append(text)
+        length += len(text)
+        if length >= max_chars:
+            break
+    return "\n".join(pages)
+
+
+def extract_text(path: str, ext: str, max_chars: int) -> str:
+    """抽取本地文件的纯文本（最多 max_chars 个字符）"""
+    ext = ext.lower()
+    if ext in TEXT_EXTS:
+        with open(path, "rb") as f:
+            # 按字节多读一些，解码后再截断（中文每字3字节）
+            return _decode(f.read(max_chars * 4))[:max_chars]
+    if ext == ".docx":
+        return _docx_text(path)[:max_chars]
+    if ext == ".pdf":
+        return _pdf_text(path, max_chars)[:max_chars]
+    raise ValueError(f"不支持的文件类型: {ext}")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    文本 → 去重后的索引词（中文单字与二字、小写英文/数字词）
+    超过 MAX_TOKENS 个时只保留出现次数最多的（tsvector 大小上限为1MB）
+    """
+    counts: Counter = Counter()
+    for match in TOKEN_RE.finditer(text.lower()):
+        run = match.group()
+        if CJK_RE.match(run):
+            counts.update(run)
+            counts.update(run[i:i + 2] for i in range(len(run) - 1))
+        elif len(run) <= MAX_WORD_LENGTH:
+            counts[run] += 1
+    if len(counts) > MAX_TOKENS:
+        return sorted(token for token, _ in counts.most_common(MAX_TOKENS))
+    return sorted(counts)
+
+
+def build_query(q: str) -> Optional[Tuple[str, List[str]]]:
+    """
+    搜索词 → (tsquery 文本, 需要在正文中精确出现的小写原词)；没有可检索的词时返回 None
+    空格分隔的多个词之间为“与”关系
+    """
+    lexemes: List[str] = []
+    terms: List[str] = []
+    for term in q.lower().split():
+        runs = TOKEN_RE.findall(term)
+        if not runs:
+            continue
+        terms.append(term)
+        for run in runs:
+            if CJK_RE.match(run):
+                lexemes.extend(f"'{run[i:i + 2]}'" for i in range(max(len(run) - 1, 1)))
+            else:
+                lexemes.append(f"'{run[:MAX_WORD_LENGTH]}':*")
+    if not lexemes:
+        return None
+    # 词只含中文、小写字母与数字，不需要转义
+    query = " & ".join(dict.fromkeys(lexemes))
+    return query, terms
+
+
+def highlight(text: str, terms: List[str]) -> str:
+    """HTML转义文本，并用 <mark> 标记搜索词（不区分大小写）"""
+    if not terms:
+        return html.escape(text)
+    pattern = re.compile("|".join(re.escape(t) for t in sorted(terms, key=len, reverse=True)), re.IGNORECASE)
+    parts: List[str] = []
+    last = 0
+    for match in pattern.finditer(text):
+        parts.append(html.escape(text[last:match.start()]))
+        parts.append(f"<mark>{html.escape(match.group())}</mark>")
+        last = match.end()
+    parts.append(html.escape(text[last:]))
+    return "".join(parts)
+
+
+def extract_document(ext: str, title: str, path: Optional[str] = None, bucket: Optional[str] = None,
+                     object_name: Optional[str] = None) -> dict:
+    """
+    抽取文档（本地文件 path，或存储中的 bucket/object_name）的纯文本并分词（在进程池中执行）
+    返回 {"status", "error", "content", "tokens", "title_tokens"}
+    """
+    result = {"status": "ok", "error": None, "content": None, "tokens": [], "title_tokens": tokenize(title)}
+    ext = ext.lower()
+    if ext not in EXTRACTABLE_EXTS or (ext == ".pdf" and PdfReader is None):
+        result["status"] = "unsupported"
+        return result
+
+    tmp_path = None
+    try:
+        if path is None:
+            client = _get_client()
+            size = client.stat_object(bucket, object_name).size
+        else:
+            size = os.path.getsize(path)
+        if size > settings.DOC_INDEX_MAX_FILE_SIZE:
+            result["status"] = "too_large"
+            return result
+        if path is None:
+            fd, tmp_path = tempfile.mkstemp(suffix=ext)
+            os.close(fd)
+            download_to_file(client, bucket, object_name, tmp_path)
+            path = tmp_path
+        content = extract_text(path, ext, settings.DOC_INDEX_MAX_CHARS).replace("\x00", "")
+        result["content"] = content
+        result["tokens"] = tokenize(content)
+    except Exception as e:
+        result["status"] = "failed"
+        result["error"] = f"{type(e).__name__}: {e}"[:500]
+    finally:
+        if tmp_path is not None:
+            os.unlink(tmp_path)
+    return result
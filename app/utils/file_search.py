@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""
+工作档案文件搜索：筛选条件与流式输出
+
+本地档案（目录缓存）与 knowledge-files 存储桶（目录索引）的递归搜索共用同一套筛选条件：
+- glob：文件名通配（* ? [...]，不区分大小写），包含 / 时匹配相对路径
+- keyword：文件名包含的关键词
+- 扩展名、分类、大小范围、修改时间范围
+结果边查找边输出（NDJSON，请求头 Accept 为 text/event-stream 时输出 SSE），达到 limit 即停止查找。
+
+作者: 王梓涵
+邮箱: wangzh011031@163.com
+时间: 2025年
+"""
+from datetime import datetime
+from typing import Iterator, List, Optional
+import fnmatch
+import json
+import re
+
+from fastapi import Request
+from fastapi.responses import StreamingResponse
+
+
+def glob_to_like(pattern: str) -> str:
+    """
+    通配符 → SQL LIKE 模式（转义字符为反斜杠）
+    字符集合 [...] 转为单个任意字符，结果是原模式的超集，调用方需再用 FileFilter.matches 精确匹配
+    """
+    out: List[str] = []
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        if c == "*":
+            out.append("%")
+        elif c == "?":
+            out.append("_")
+        elif c == "[":
+            j = i + 1
+            if j < len(pattern) and pattern[j] == "!":
+                j += 1
+            if j < len(pattern) and pattern[j] == "]":
+                j += 1
+            j = pattern.find("]", j)
+            if j == -1:
+                out.append("[")
+            else:
+                out.append("_")
+                i = j
+        elif c in "%_\\":
+            out.append("\\" + c)
+        else:
+            out.append(c)
+        i += 1
+    return "".join(out)
+
+
+def parse_exts(value: Optional[str]) -> Optional[List[str]]:
+    """逗号分隔的扩展名（jpg,.PNG）→ ['.jpg', '.png']"""
+    if not value:
+        return None
+    exts = [f".{item.strip().lstrip('.').lower()}" for item in value.split(',') if item.strip()]
+    return exts or None
+
+
+class FileFilter:
+    """搜索筛选条件（未指定的条件不参与筛选）"""
+
+    def __init__(self, glob: Optional[str] = None, keyword: Optional[str] = None,
+                 exts: Optional[List[str]] = None, category: Optional[str] = None,
+                 min_size: Optional[int] = None, max_size: Optional[int] = None,
+                 modified_after: Optional[datetime] = None, modified_before: Optional[datetime] = None):
+        self.glob = glob or None
+        self.match_path = bool(self.glob) and "/" in self.glob
+        self._regex = re.compile(fnmatch.translate(self.glob), re.IGNORECASE) if self.glob else None
+        self.keyword = keyword.lower() if keyword else None
+        self.exts = {e.lower() for e in exts} if exts else None
+        self.category = category or None
+        self.min_size = min_size
+        self.max_size = max_size
+        self.modified_after = modified_after
+        self.modified_before = modified_before
+        self._after_ts = modified_after.timestamp() if modified_after else None
+        self._before_ts = modified_before.timestamp() if modified_before else None
+
+        # 大小与修改时间范围（闭区间 / 左闭右开），逐条筛选时直接比较
+        self.size_range = (min_size or 0, max_size if max_size is not None else float("inf"))
+        self.mtime_range = (
+            self._after_ts if self._after_ts is not None else float("-inf"),
+            self._before_ts if self._before_ts is not None else float("inf")
+        )
+        # 整个目录的文件名（小写、每行一个）上的预筛选：关键词、扩展名、文件名通配都找不到时跳过该目录
+        self._line_regex = None
+        if self.glob and not self.match_path:
+            body = re.fullmatch(r"\(\?s:(.*)\)\\Z", fnmatch.translate(self.glob.lower()), re.DOTALL).group(1)
+            self._line_regex = re.compile(f"^(?:{body})$", re.MULTILINE)
+
+    def may_match_names(self, names: str) -> bool:
+        """names 为目录下全部文件名（小写，每个以换行结尾）；返回 False 时该目录没有符合条件的文件"""
+        if self.keyword and self.keyword not in names:
+            return False
+        if self.exts is not None and not any(f"{ext}\n" in names for ext in self.exts):
+            return False
+        if self._line_regex is not None and self._line_regex.search(names) is None:
+            return False
+        return True
+
+    def matches(self, name: str, ext: str, category: str, size: int, mtime: Optional[float],
+                path: Optional[str] = None) -> bool:
+        """
+        name 为文件名，mtime 为修改时间戳（秒）；
+        match_path 为 True 时需传入相对路径 path
+        """
+        if self.exts is not None and ext.lower() not in self.exts:
+            return False
+        if self.category and category != self.category:
+            return False
+        if self.min_size is not None and size < self.min_size:
+            return False
+        if self.max_size is not None and size > self.max_size:
+            return False
+        if self._after_ts is not None and (mtime is None or mtime < self._after_ts):
+            return False
+        if self._before_ts is not None and (mtime is None or mtime >= self._before_ts):
+            return False
+        if self.keyword and self.keyword not in name.lower():
+            return False
+        if self._regex is not None and not self._regex.match(path if self.match_path else name):
+            return False
+        return True
+
+
+def wants_event_stream(request: Request) -> bool:
+    return "text/event-stream" in request.headers.get("accept", "")
+
+
+def stream_results(items: Iterator[dict], limit: int, sse: bool = False) -> StreamingResponse:
+    """
+    流式输出搜索结果，输出 limit 条后停止迭代（不再继续查找）
+    SSE 模式下每条结果为一个 data 事件，最后输出 end 事件：{"count": 条数, "truncated": 是否达到上限}
+    """
+    def lines():
+        count = 0
+        try:
+            for item in items:
+                data = json.dumps(item, ensure_ascii=False, default=str)
+                yield f"data: {data}\n\n" if sse else data + "\n"
+                count += 1
+                if count >= limit:
+                    break
+        finally:
+            # 提前结束时立即释放数据库会话等资源
+            close = getattr(items, "close", None)
+            if close is not None:
+                close()
+        if sse:
+            yield f"event: end\ndata: {json.dumps({'count': count, 'truncated': count >= limit})}\n\n"
+
+    # 同步生成器由 Starlette 在线程池中迭代；关闭代理缓冲，结果到达即发送
+    return StreamingResponse(
+        lines(),
+        media_type="text/event-stream" if sse else "application/x-ndjson",
+        headers={"Cache-Control": "no-store", "X-Accel-Buffering": "no"}
+    )
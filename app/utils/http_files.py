@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+"""
+文件下载的HTTP缓存与断点续传
+
+- 强ETag 由 inode、修改时间与大小生成，Last-Modified 取文件修改时间
+- If-None-Match / If-Modified-Since 命中时返回 304
+- Range（单个字节范围）返回 206，超出文件大小返回 416；If-Range 不匹配时返回完整文件
+- Cache-Control 按文件分类设置：文档与代码每次回源校验（304 几乎不产生流量），图片与视频允许缓存一段时间
+
+本地文件与对象存储中的对象使用同一套规则（对象的 ETag 由存储服务提供）。
+
+作者: 王梓涵
+邮箱: wangzh011031@163.com
+时间: 2025年
+"""
+from datetime import datetime
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Callable, Iterator, Optional, Tuple
+import os
+import stat as stat_module
+
+import anyio
+from fastapi import Request, Response
+from fastapi.responses import FileResponse, StreamingResponse
+
+# 按文件分类的缓存策略
+CACHE_CONTROL = {
+    "image": "public, max-age=86400",
+    "video": "public, max-age=86400",
+    "document": "no-cache",
+    "code": "no-cache",
+    "other": "public, max-age=3600",
+}
+
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def file_etag(st: os.stat_result) -> str:
+    """本地文件的强ETag（inode、修改时间、大小任一变化都会改变）"""
+    return f'"{st.st_ino:x}-{st.st_mtime_ns:x}-{st.st_size:x}"'
+
+
+def quote_etag(etag: str) -> str:
+    etag = (etag or "").strip()
+    return etag if etag.startswith(('"', 'W/"')) else f'"{etag}"'
+
+
+def _opaque(etag: str) -> str:
+    return etag[2:] if etag.startswith("W/") else etag
+
+
+def etag_matches(header: Optional[str], etag: str) -> bool:
+    """If-None-Match 的弱比较（忽略 W/ 前缀），支持多个值与 *"""
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return _opaque(etag) in {_opaque(value.strip()) for value in header.split(",")}
+
+
+def _http_date(value: Optional[str]) -> Optional[datetime]:
+    try:
+        return parsedate_to_datetime(value) if value else None
+    except (TypeError, ValueError):
+        return None
+
+
+def is_not_modified(request: Request, etag: str, last_modified: Optional[datetime]) -> bool:
+    """条件请求是否可以返回 304（有 If-None-Match 时忽略 If-Modified-Since）"""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return etag_matches(if_none_match, etag)
+    since = _http_date(request.headers.get("if-modified-since"))
+    if since is None or last_modified is None:
+        return False
+    return int(last_modified.timestamp()) <= int(since.timestamp())
+
+
+def requested_range(request: Request, size: int, etag: str,
+                    last_modified: Optional[datetime]) -> Optional[Tuple[int, int]]:
+    """
+    解析 Range 头，返回 [start, end]（闭区间），不需要分段时返回 None
+    只支持单个范围，多个范围时返回完整文件；范围无法满足时抛出 RangeNotSatisfiable
+    """
+    header = request.headers.get("range")
+    if not header or request.method not in ("GET", "HEAD"):
+        return None
+    if_range = request.headers.get("if-range")
+    if if_range:
+        if if_range.strip().startswith(('"', 'W/"')):
+            # If-Range 要求强比较
+            if if_range.strip().startswith("W/") or if_range.strip() != etag:
+                return None
+        else:
+            date = _http_date(if_range)
+            if date is None or last_modified is None or int(last_modified.timestamp()) != int(date.timestamp()):
+                return None
+
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, sep, last = (part.strip() for part in spec.strip().partition("-"))
+    if not sep or not (first or last) or not all(part.isdigit() for part in (first, last) if part):
+        # 语法错误的范围按没有 Range 头处理
+        return None
+    if first == "":
+        # 后缀范围：最后 n 个字节
+        length = int(last)
+        if length == 0 or size == 0:
+            raise RangeNotSatisfiable()
+        return max(0, size - length), size - 1
+    start = int(first)
+    if last and int(last) < start:
+        return None
+    # 先用原始的起点判断能否满足，再把终点截断到文件末尾
+    if start >= size:
+        raise RangeNotSatisfiable()
+    return start, min(int(last), size - 1) if last else size - 1
+
+
+def _headers(etag: str, last_modified: Optional[datetime], cache_control: str) -> dict:
+    headers = {"ETag": etag, "Accept-Ranges": "bytes", "Cache-Control": cache_control}
+    if last_modified is not None:
+        headers["Last-Modified"] = formatdate(last_modified.timestamp(), usegmt=True)
+    return headers
+
+
+class SendfileResponse(FileResponse):
+    """
+    服务器支持 http.response.zerocopysend 扩展时直接交给服务器发送文件（可指定范围），
+    否则与 FileResponse 相同（按块读取发送）
+    """
+
+    def __init__(self, path: str, offset: int = 0, count: Optional[int] = None, **kwargs):
+        super().__init__(path, **kwargs)
+        self.offset = offset
+        self.count = count
+
+    async def __call__(self, scope, receive, send):
+        partial = self.offset or self.count is not None
+        if not partial and (self.send_header_only or "http.response.zerocopysend" not in scope.get("extensions", {})):
+            await super().__call__(scope, receive, send)
+            return
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if self.send_header_only:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+        elif "http.response.zerocopysend" in scope.get("extensions", {}):
+            with open(self.path, "rb") as file:
+                message = {"type": "http.response.zerocopysend", "file": file, "more_body": False}
+                if partial:
+                    message.update(offset=self.offset, count=self.count)
+                await send(message)
+        else:
+            async with await anyio.open_file(self.path, mode="rb") as file:
+                await file.seek(self.offset)
+                remaining = self.count
+                while True:
+                    chunk = await file.read(min(self.chunk_size, remaining) if remaining is not None else self.chunk_size)
+                    if remaining is not None:
+                        remaining -= len(chunk)
+                    more_body = bool(chunk) and remaining != 0
+                    await send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+                    if not more_body:
+                        break
+        if self.background is not None:
+            await self.background()
+
+
+def file_response(request: Request, path: str, media_type: Optional[str], cache_control: str,
+                  st: Optional[os.stat_result] = None) -> Response:
+    """发送本地文件，处理条件请求与 Range"""
+    st = st or os.stat(path)
+    if not stat_module.S_ISREG(st.st_mode):
+        raise FileNotFoundError(path)
+    etag = file_etag(st)
+    last_modified = datetime.fromtimestamp(st.st_mtime).astimezone()
+    headers = _headers(etag, last_modified, cache_control)
+    if is_not_modified(request, etag, last_modified):
+        return Response(status_code=304, headers=headers)
+    try:
+        byte_range = requested_range(request, st.st_size, etag, last_modified)
+    except RangeNotSatisfiable:
+        return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{st.st_size}"})
+
+    media_type = media_type or "application/octet-stream"
+    if byte_range is None:
+        return SendfileResponse(path, headers=headers, media_type=media_type, method=request.method,
+                                stat_result=st)
+    start, end = byte_range
+    headers.update({"Content-Range": f"bytes {start}-{end}/{st.st_size}", "Content-Length": str(end - start + 1)})
+    return SendfileResponse(path, offset=start, count=end - start + 1, status_code=206, headers=headers,
+                            media_type=media_type, method=request.method)
+
+
+def object_response(request: Request, size: int, etag: str, last_modified: Optional[datetime],
+                    content_type: Optional[str], cache_control: str,
+                    open_range: Callable[[int, int], Iterator[bytes]]) -> Response:
+    """
+    发送对象存储中的对象，处理条件请求与 Range
+    open_range(offset, length) 返回对应字节范围的数据块迭代器（在线程池中迭代）
+    """
+    etag = quote_etag(etag)
+    headers = _headers(etag, last_modified, cache_control)
+    if is_not_modified(request, etag, last_modified):
+        return Response(status_code=304, headers=headers)
+    try:
+        byte_range = requested_range(request, size, etag, last_modified)
+    except RangeNotSatisfiable:
+        return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+
+    status_code = 200
+    start, end = 0, size - 1
+    if byte_range is not None:
+        start, end = byte_range
+        status_code = 206
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+    media_type = content_type or "application/octet-stream"
+    if request.method == "HEAD" or size == 0:
+        return Response(status_code=status_code, headers=headers, media_type=media_type)
+    return StreamingResponse(open_range(start, end - start + 1), status_code=status_code, headers=headers,
+                             media_type=media_type)
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+图像缩略图生成
+
+与 image_tiles 相同，生成函数在图像处理进程池中执行。
+每张图片生成若干固定尺寸的 WebP（安装 pillow-avif-plugin 时另有 AVIF）缩略图，
+写入 derived/<key>/thumbs/<size>.<format>，对象名只由源文件决定，可重复生成、长期缓存。
+
+作者: 王梓涵
+邮箱: wangzh011031@163.com
+时间: 2025年
+"""
+from typing import List, Optional
+from urllib.parse import quote
+import hashlib
+import io
+import os
+import tempfile
+
+from PIL import Image
+
+from ..core.config import settings
+from .image_tiles import _get_client, _put, derived_prefix, download_to_file, open_image
+
+try:
+    import pillow_avif  # noqa: F401  可选依赖，注册AVIF编码器
+except ImportError:
+    pass
+
+THUMBNAIL_MIME = {"avif": "image/avif", "webp": "image/webp"}
+
+# 可生成缩略图的扩展名（Pillow可解码）
+THUMBNAIL_EXTS = {".jpg", ".jpeg", ".png", ".bmp", ".gif", ".webp", ".tif", ".tiff"}
+
+
+def available_formats() -> List[str]:
+    """当前环境可编码的缩略图格式，按优先级排列"""
+    Image.init()
+    return [fmt for fmt in ("avif", "webp") if fmt.upper() in Image.SAVE]
+
+
+def thumbnail_object_name(key: str, size: int, fmt: str) -> str:
+    return f"{derived_prefix(key)}/thumbs/{size}.{fmt}"
+
+
+# 本地文件派生对象目录名的前缀（与对象存储中源文件的派生目录区分）
+LOCAL_KEY_PREFIX = "local-"
+
+
+def local_derived_key(rel_path: str, mtime_ns: int, size: int) -> str:
+    """本地文件的派生对象目录名，文件修改后自动换新"""
+    return LOCAL_KEY_PREFIX + hashlib.sha256(f"local:{rel_path}:{mtime_ns}:{size}".encode("utf-8")).hexdigest()
+
+
+def is_thumbnailable(name: str) -> bool:
+    return os.path.splitext(name or "")[1].lower() in THUMBNAIL_EXTS
+
+
+def thumbnail_url(src: str, size: Optional[int] = None) -> str:
+    """对象存储文件的缩略图地址（首次访问时按需生成）"""
+    return f"/api/images/thumbnail?src={quote(src, safe='')}&size={size or settings.IMAGE_THUMBNAIL_SIZES[0]}"
+
+
+def local_thumbnail_url(rel_path: str, mtime_ns: int, size: Optional[int] = None) -> str:
+    """工作档案本地文件的缩略图地址，v 参数随文件修改变化以保证缓存正确"""
+    return (f"/api/images/thumbnail?path={quote(rel_path, safe='')}"
+            f"&size={size or settings.IMAGE_THUMBNAIL_SIZES[0]}&v={mtime_ns}")
+
+
+def _encode(image: Image.Image, fmt: str) -> bytes:
+    buffer = io.BytesIO()
+    if fmt == "avif":
+        image.save(buffer, format="AVIF", quality=60)
+    else:
+        image.save(buffer, format="WEBP", quality=80, method=4)
+    return buffer.getvalue()
+
+
+def build_thumbnails(bucket: str, key: str, object_name: Optional[str] = None,
+                     source_path: Optional[str] = None) -> dict:
+    """
+    生成全部尺寸与格式的缩略图，写入 bucket 的派生前缀
+    源文件为对象存储中的 object_name，或本地路径 source_path（在进程池中执行）
+    """
+    client = _get_client()
+    sizes = sorted(settings.IMAGE_THUMBNAIL_SIZES, reverse=True)
+    formats = available_formats()
+
+    with tempfile.NamedTemporaryFile(suffix=os.path.splitext(object_name or source_path or "")[1]) as source:
+        if source_path is None:
+            download_to_file(client, bucket, object_name, source.name)
+            source_path = source.name
+        image = open_image(source_path, draft_size=(sizes[0], sizes[0]))
+
+        # 从大到小逐级缩小，每一级都基于上一级结果
+        for size in sizes:
+            image.thumbnail((size, size), Image.LANCZOS)
+            for fmt in formats:
+                _put(client, bucket, thumbnail_object_name(key, size, fmt), _encode(image, fmt), THUMBNAIL_MIME[fmt])
+
+    return {"key": key, "sizes": sorted(sizes), "formats": formats}
@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+"""
+壁画图像多分辨率切片（Deep Zoom）
+
+本模块的函数在图像处理进程池中执行，只依赖配置与MinIO客户端，不导入服务层：
+从MinIO下载原图到临时文件，逐级生成瓦片与固定尺寸预览图并写回派生对象前缀，
+最后写入 pyramid.json 作为完成标记（相同内容再次处理时直接复用）。
+
+瓦片布局与 Deep Zoom 一致：第 L 级尺寸为 ceil(原图尺寸 / 2^(max_level - L))，
+瓦片对象名为 tiles/{level}/{col}_{row}.jpg。
+
+作者: 王梓涵
+邮箱: wangzh011031@163.com
+时间: 2025年
+"""
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Optional
+import hashlib
+import io
+import json
+import math
+import os
+import re
+import shutil
+import tempfile
+
+from minio.error import S3Error
+from PIL import Image, ImageOps
+
+from ..core.config import settings
+from ..core.storage_backends import StorageBackend, create_backend
+
+TILE_FORMAT = "jpg"
+TILE_MIME = "image/jpeg"
+PYRAMID_DESCRIPTOR = "pyramid.json"
+CONTENT_ADDRESSED_NAME = re.compile(r"^sha256/[0-9a-f]{2}/([0-9a-f]{64})")
+
+# 每个进程一个存储后端客户端
+_client: Optional[StorageBackend] = None
+
+
+def _get_client() -> StorageBackend:
+    global _client
+    if _client is None:
+        _client = create_backend()
+    return _client
+
+
+def derived_key(bucket: str, object_name: str) -> str:
+    """
+    派生对象目录名：内容寻址对象使用名称中的内容摘要（相同内容共享派生文件），否则使用对象路径的摘要
+    只由对象位置决定，上传后生成与按需生成（缩略图接口只知道文件地址）得到同一个目录
+    """
+    match = CONTENT_ADDRESSED_NAME.match(object_name)
+    if match:
+        return match.group(1)
+    return hashlib.sha256(f"{bucket}/{object_name}".encode("utf-8")).hexdigest()
+
+
+def derived_prefix(key: str) -> str:
+    return f"{settings.DERIVED_PREFIX}/{key}"
+
+
+def read_json(client: StorageBackend, bucket: str, object_name: str) -> Optional[dict]:
+    """读取JSON对象，不存在时返回 None"""
+    try:
+        response = client.get_object(bucket, object_name)
+    except S3Error as e:
+        if e.code in ("NoSuchKey", "NoSuchObject"):
+            return None
+        raise
+    try:
+        return json.loads(response.read())
+    finally:
+        response.close()
+        response.release_conn()
+
+
+def download_to_file(client: StorageBackend, bucket: str, object_name: str, path: str):
+    response = client.get_object(bucket, object_name)
+    try:
+        with open(path, "wb") as f:
+            shutil.copyfileobj(response, f, 1024 * 1024)
+    finally:
+        response.close()
+        response.release_conn()
+
+
+def open_image(path: str, draft_size: Optional[tuple] = None) -> Image.Image:
+    """
+    打开图像并统一为RGB（处理EXIF方向、16位TIFF、透明通道）
+    指定 draft_size 时JPEG按不小于该尺寸的缩小比例解码，大图生成缩略图时显著减少解码开销
+    """
+    Image.MAX_IMAGE_PIXELS = settings.IMAGE_MAX_PIXELS
+    image = Image.open(path)
+    if draft_size:
+        image.draft("RGB", draft_size)
+    image = ImageOps.exif_transpose(image)
+    if image.mode.startswith("I;16"):
+        image = image.convert("I")
+    if image.mode == "I":
+        image = image.point(lambda v: v * (1 / 256)).convert("L")
+    if image.mode in ("RGBA", "LA", "P"):
+        image = image.convert("RGBA")
+        background = Image.new("RGB", image.size, (255, 255, 255))
+        background.paste(image, mask=image.split()[-1])
+        image = background
+    elif image.mode != "RGB":
+        image = image.convert("RGB")
+    return image
+
+
+def encode_jpeg(image: Image.Image) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=settings.IMAGE_TILE_QUALITY, optimize=True)
+    return buffer.getvalue()
+
+
+def _put(client: StorageBackend, bucket: str, object_name: str, data: bytes, content_type: str):
+    client.put_object(bucket, object_name, io.BytesIO(data), length=len(data), content_type=content_type)
+
+
+def build_pyramid(bucket: str, object_name: str, key: str) -> dict:
+    """
+    为一张图像生成 Deep Zoom 瓦片金字塔与预览图，返回金字塔描述
+    （在进程池中执行）
+    """
+    client = _get_client()
+    prefix = derived_prefix(key)
+    existing = read_json(client, bucket, f"{prefix}/{PYRAMID_DESCRIPTOR}")
+    if existing is not None:
+        return existing
+
+    tile_size = settings.IMAGE_TILE_SIZE
+    overlap = settings.IMAGE_TILE_OVERLAP
+    preview_sizes = sorted(settings.IMAGE_PREVIEW_SIZES, reverse=True)
+    previews = {}
+
+    suffix = os.path.splitext(object_name)[1]
+    with tempfile.NamedTemporaryFile(suffix=suffix) as source:
+        download_to_file(client, bucket, object_name, source.name)
+        image = open_image(source.name)
+        width, height = image.size
+        max_level = math.ceil(math.log2(max(width, height))) if max(width, height) > 1 else 0
+
+        # 瓦片上传与编码并行；限制未完成的上传数量以控制内存
+        with ThreadPoolExecutor(max_workers=8) as uploader:
+            pending = deque()
+
+            def submit(name: str, data: bytes, content_type: str):
+                pending.append(uploader.submit(_put, client, bucket, f"{prefix}/{name}", data, content_type))
+                while len(pending) > 64:
+                    pending.popleft().result()
+
+            level_image = image
+            for level in range(max_level, -1, -1):
+                level_width, level_height = level_image.size
+
+                # 预览图取自第一个长边小于两倍目标尺寸的层级，避免每次都从原图缩放
+                for size in preview_sizes:
+                    if size not in previews and (max(level_width, level_height) < size * 2 or level == 0):
+                        preview = level_image.copy()
+                        preview.thumbnail((size, size), Image.LANCZOS)
+                        name = f"previews/{size}.jpg"
+                        submit(name, encode_jpeg(preview), TILE_MIME)
+                        previews[size] = {"name": name, "width": preview.width, "height": preview.height}
+
+                for col in range(math.ceil(level_width / tile_size)):
+                    for row in range(math.ceil(level_height / tile_size)):
+                        box = (
+                            max(col * tile_size - overlap, 0),
+                            max(row * tile_size - overlap, 0),
+                            min((col + 1) * tile_size + overlap, level_width),
+                            min((row + 1) * tile_size + overlap, level_height)
+                        )
+                        submit(f"tiles/{level}/{col}_{row}.{TILE_FORMAT}", encode_jpeg(level_image.crop(box)), TILE_MIME)
+
+                if level > 0:
+                    level_image = level_image.resize(
+                        (max(1, math.ceil(level_width / 2)), max(1, math.ceil(level_height / 2))), Image.BOX
+                    )
+
+            while pending:
+                pending.popleft().result()
+
+    descriptor = {
+        "format": "dzi",
+        "key": key,
+        "width": width,
+        "height": height,
+        "tile_size": tile_size,
+        "overlap": overlap,
+        "tile_format": TILE_FORMAT,
+        "max_level": max_level,
+        "previews": {str(size): info for size, info in sorted(previews.items())},
+        "generated_at": datetime.now().isoformat()
+    }
+    data = json.dumps(descriptor).encode("utf-8")
+    _put(client, bucket, f"{prefix}/{PYRAMID_DESCRIPTOR}", data, "application/json")
+    return descriptor
@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+"""
+流式 multipart/form-data 解析
+
+只读取一次请求体：文本字段收集后交给处理函数，文件分片一边到达一边交给回调
+（通常直接写入对象存储），不经过 python-multipart 的临时文件，
+因此任意数量、任意大小的文件分片都不需要与请求体同等的内存或磁盘空间。
+
+作者: 王梓涵
+邮箱: wangzh011031@163.com
+时间: 2025年
+"""
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+import asyncio
+
+from multipart.multipart import MultipartParser, parse_options_header
+
+
+class MultipartStreamError(ValueError):
+    """请求体不是合法的 multipart/form-data"""
+
+
+class StreamedPart:
+    """一个文件分片的处理结果"""
+
+    def __init__(self, field_name: str, filename: str, content_type: Optional[str]):
+        self.field_name = field_name
+        self.filename = filename
+        self.content_type = content_type
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=4)
+        self._task: Optional[asyncio.Task] = None
+        self._closed = False
+
+    async def chunks(self) -> AsyncIterator[bytes]:
+        """按到达顺序产出该分片的数据块"""
+        while True:
+            data = await self._queue.get()
+            if data is None:
+                return
+            yield data
+
+    async def _feed(self, item: Optional[bytes]):
+        """投递数据块（None 表示结束）；处理任务已提前结束时丢弃剩余数据"""
+        if self._closed:
+            return
+        put = asyncio.ensure_future(self._queue.put(item))
+        await asyncio.wait({put, self._task}, return_when=asyncio.FIRST_COMPLETED)
+        if not put.done():
+            put.cancel()
+            self._closed = True
+
+
+FileHandler = Callable[[StreamedPart], Awaitable[Any]]
+
+
+class StreamingMultipartReader:
+    """
+    单次遍历的 multipart 读取器
+
+    用法:
+        reader = StreamingMultipartReader(request.headers, request.stream())
+        fields, parts = await reader.read(on_file)
+
+    on_file(part) 在文件分片头部解析完成时被调度为独立任务，通过 part.chunks() 消费数据；
+    同时处理中的文件数量不超过 max_concurrency，达到上限时暂停读取请求体（背压）。
+    任意回调失败时停止读取、取消其余回调并抛出该异常，已完成的结果可通过 completed_results() 获取以便清理。
+    """
+
+    def __init__(self, headers, stream: AsyncIterator[bytes], max_concurrency: int = 4,
+                 max_field_size: int = 1024 * 1024, max_parts: int = 1000):
+        self.headers = headers
+        self.stream = stream
+        self.max_field_size = max_field_size
+        self.max_parts = max_parts
+        self.fields: Dict[str, str] = {}
+        self.parts: List[StreamedPart] = []
+        self._limit = asyncio.Semaphore(max_concurrency)
+        self._events: list = []
+        self._charset = "utf-8"
+
+    # ----- python-multipart 回调：只记录事件，异步处理在 read() 中完成 -----
+
+    def _on_part_begin(self):
+        self._headers: Dict[bytes, bytes] = {}
+        self._header_name = b""
+        self._header_value = b""
+
+    def _on_header_field(self, data: bytes, start: int, end: int):
+        self._header_name += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+
+    def _on_header_end(self):
+        self._headers[self._header_name.lower()] = self._header_value
+        self._header_name = b""
+        self._header_value = b""
+
+    def _on_headers_finished(self):
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        if b"name" not in options:
+            raise MultipartStreamError('Content-Disposition 缺少 "name"')
+        name = options[b"name"].decode(self._charset, errors="replace")
+        if b"filename" in options:
+            filename = options[b"filename"].decode(self._charset, errors="replace")
+            content_type = self._headers.get(b"content-type", b"").decode("latin-1") or None
+            self._events.append(("file_begin", (name, filename, content_type)))
+        else:
+            self._events.append(("field_begin", name))
+
+    def _on_part_data(self, data: bytes, start: int, end: int):
+        self._events.append(("data", data[start:end]))
+
+    def _on_part_end(self):
+        self._events.append(("end", None))
+
+    # ----- 主流程 -----
+
+    async def read(self, on_file: FileHandler):
+        content_type = self.headers.get("content-type", "")
+        _, params = parse_options_header(content_type)
+        if b"boundary" not in params:
+            raise MultipartStreamError("缺少 multipart boundary")
+        charset = params.get(b"charset")
+        if charset:
+            self._charset = charset.decode("latin-1")
+
+        parser = MultipartParser(params[b"boundary"], {
+            "on_part_begin": self._on_part_begin,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+        })
+
+        tasks: List[asyncio.Task] = []
+        current_part: Optional[StreamedPart] = None
+        field_name: Optional[str] = None
+        field_data = bytearray()
+        failed: List[BaseException] = []
+
+        async def run_handler(part: StreamedPart):
+            try:
+                part.result = await on_file(part)
+            except BaseException as e:
+                part.error = e
+                failed.append(e)
+                raise
+            finally:
+                self._limit.release()
+
+        try:
+            async for chunk in self.stream:
+                try:
+                    parser.write(chunk)
+                except MultipartStreamError:
+                    raise
+                except Exception as e:
+                    raise MultipartStreamError(f"multipart 解析失败: {e}")
+
+                # 任一文件处理失败时立即停止读取剩余请求体
+                if failed:
+                    raise failed[0]
+
+                events, self._events = self._events, []
+                for kind, value in events:
+                    if kind == "file_begin":
+                        if len(self.parts) >= self.max_parts:
+                            raise MultipartStreamError("文件数量超过限制")
+                        await self._limit.acquire()
+                        current_part = StreamedPart(*value)
+                        current_part._task = asyncio.create_task(run_handler(current_part))
+                        self.parts.append(current_part)
+                        tasks.append(current_part._task)
+                    elif kind == "field_begin":
+                        field_name, field_data = value, bytearray()
+                    elif kind == "data":
+                        if current_part is not None:
+                            await current_part._feed(value)
+                        else:
+                            field_data += value
+                            if len(field_data) > self.max_field_size:
+                                raise MultipartStreamError(f"字段 {field_name} 过大")
+                    elif kind == "end":
+                        if current_part is not None:
+                            await current_part._feed(None)
+                            current_part = None
+                        elif field_name is not None:
+                            self.fields[field_name] = field_data.decode(self._charset, errors="replace")
+                            field_name = None
+            parser.finalize()
+            if current_part is not None:
+                raise MultipartStreamError("请求体不完整")
+        except BaseException:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+        return self.fields, self.parts
+
+    def completed_results(self) -> list:
+        """已成功处理的文件分片结果（出错时用于清理）"""
+        return [p.result for p in self.parts if p.error is None and p.result is not None]
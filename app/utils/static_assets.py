@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+"""
+前端静态资源发送：预压缩、内容协商与缓存头
+
+- precompress 为目录下的文本类资源（js、css、html、svg、json 等）生成 .gz 与 .br 压缩副本，
+  副本的修改时间与原文件一致，原文件更新后旧副本不会再被使用；
+  可在构建后执行 `python -m app.utils.static_assets webapp/dist`，也可在启动时于后台生成（STATIC_PRECOMPRESS，
+  只处理前端构建目录；static/ 同时是工作档案的浏览目录，不在其中写入副本）
+- PrecompressedStaticFiles 按 Accept-Encoding 发送压缩副本（优先 br），
+  文件名带内容哈希的资源（Vite 输出的 /assets/*）标记为 immutable，其余资源每次回源校验
+- CachedPage 把 index.html 及其压缩结果保存在内存中，带 ETag，前端路由每次导航不再读取磁盘
+
+未安装 brotli 时只生成与发送 gzip。
+
+作者: 王梓涵
+邮箱: wangzh011031@163.com
+时间: 2025年
+"""
+from mimetypes import guess_type
+from typing import Dict, Iterable, List, Optional
+import gzip
+import hashlib
+import logging
+import os
+import re
+import sys
+import threading
+import time
+
+from fastapi import Request, Response
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+
+from .http_files import etag_matches
+
+try:
+    import brotli  # 可选依赖，brotli 压缩
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# 值得压缩的文件类型（图片、字体 woff/woff2 等本身已压缩）
+COMPRESSIBLE_EXTS = {
+    ".js", ".mjs", ".css", ".html", ".svg", ".json", ".map", ".txt", ".xml", ".wasm", ".ico", ".ttf", ".otf"
+}
+
+# 小于该大小的文件压缩收益不明显，不生成副本
+MIN_COMPRESS_SIZE = 1024
+
+# 支持的压缩编码与副本后缀（按优先顺序）
+ENCODINGS = (("br", ".br"), ("gzip", ".gz")) if brotli is not None else (("gzip", ".gz"),)
+
+# Vite 输出的文件名形如 index-4f3a2b1c.js / index-BxY_3k9a.css / index-BxY_3k9a.js.map（旧版本用 "." 分隔）：
+# 哈希恰好 8 个字符且含数字或大写字母，my-document.pdf、chunk-vendors.js 这类普通名称不算
+HASHED_NAME_RE = re.compile(r"[-.](?=[A-Za-z0-9_-]*[0-9A-Z])[A-Za-z0-9_-]{8}(?:\.[A-Za-z0-9]+)+$")
+
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE = "no-cache"
+
+
+def accepted_encodings(header: Optional[str]) -> List[str]:
+    """Accept-Encoding 中可用的压缩编码（按服务端优先顺序，q=0 表示拒绝）"""
+    if not header:
+        return []
+    qualities: Dict[str, float] = {}
+    for item in header.split(","):
+        coding, _, params = item.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        qualities[coding.strip().lower()] = q
+    wildcard = qualities.get("*", 0.0)
+    return [name for name, _ in ENCODINGS if qualities.get(name, wildcard) > 0]
+
+
+def is_compressible(path: str) -> bool:
+    return os.path.splitext(path)[1].lower() in COMPRESSIBLE_EXTS
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(data, quality=11)
+    # mtime=0：相同内容生成相同的压缩结果
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def precompress(directory: str) -> int:
+    """为目录下的文本类资源生成压缩副本（已是最新的跳过），返回生成的副本数"""
+    written = 0
+    for dir_path, _, names in os.walk(directory):
+        for name in names:
+            path = os.path.join(dir_path, name)
+            if not is_compressible(path):
+                continue
+            try:
+                st = os.stat(path)
+                if st.st_size < MIN_COMPRESS_SIZE:
+                    continue
+                data = None
+                for encoding, suffix in ENCODINGS:
+                    variant = path + suffix
+                    try:
+                        if os.stat(variant).st_mtime_ns == st.st_mtime_ns:
+                            continue
+                    except FileNotFoundError:
+                        pass
+                    if data is None:
+                        with open(path, "rb") as f:
+                            data = f.read()
+                    compressed = compress(data, encoding)
+                    if len(compressed) >= len(data):
+                        continue
+                    # 先写临时文件再替换（多个 worker 同时生成时不会发送写了一半的副本）
+                    tmp_path = f"{variant}.{os.getpid()}.tmp"
+                    with open(tmp_path, "wb") as f:
+                        f.write(compressed)
+                    os.utime(tmp_path, ns=(st.st_atime_ns, st.st_mtime_ns))
+                    os.replace(tmp_path, variant)
+                    written += 1
+            except OSError as e:
+                logger.warning(f"生成静态资源压缩副本失败 {path}: {e}")
+    return written
+
+
+def precompress_in_background(directories: Iterable[str]):
+    """在后台线程中为各目录生成压缩副本（生成之前按原文件发送）"""
+    def build():
+        for directory in directories:
+            if os.path.isdir(directory):
+                count = precompress(directory)
+                if count:
+                    logger.info(f"已生成 {count} 个静态资源压缩副本: {directory}")
+
+    threading.Thread(target=build, name="static-precompress", daemon=True).start()
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    """
+    发送预压缩副本的 StaticFiles
+    immutable=True 时文件名带内容哈希的资源使用一年期 immutable 缓存，其余资源每次回源校验（命中时返回304）
+    """
+
+    def __init__(self, *args, immutable: bool = False, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.immutable = immutable
+
+    def cache_control(self, path: str) -> str:
+        if self.immutable and HASHED_NAME_RE.search(os.path.basename(path)):
+            return IMMUTABLE_CACHE
+        return REVALIDATE_CACHE
+
+    def file_response(self, full_path, stat_result: os.stat_result, scope, status_code: int = 200) -> Response:
+        full_path = os.fspath(full_path)
+        request_headers = Headers(scope=scope)
+        headers = {"Cache-Control": self.cache_control(full_path)}
+        send_path, send_stat, encoding = full_path, stat_result, None
+        if is_compressible(full_path):
+            headers["Vary"] = "Accept-Encoding"
+            accepted = accepted_encodings(request_headers.get("accept-encoding"))
+            for name, suffix in ENCODINGS:
+                if name not in accepted:
+                    continue
+                try:
+                    variant_stat = os.stat(full_path + suffix)
+                except OSError:
+                    continue
+                # 修改时间不一致说明原文件已更新、副本过期
+                if variant_stat.st_mtime_ns == stat_result.st_mtime_ns:
+                    send_path, send_stat, encoding = full_path + suffix, variant_stat, name
+                    break
+        if encoding is not None:
+            headers["Content-Encoding"] = encoding
+
+        # 各编码的 ETag 由副本自身的大小与修改时间生成，互不相同
+        response = FileResponse(
+            send_path, status_code=status_code, headers=headers,
+            media_type=guess_type(full_path)[0] or "text/plain",
+            method=scope["method"], stat_result=send_stat
+        )
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
+
+
+class _Page:
+    __slots__ = ("mtime_ns", "size", "digest", "bodies")
+
+    def __init__(self, mtime_ns: int, size: int, data: bytes):
+        self.mtime_ns = mtime_ns
+        self.size = size
+        self.digest = hashlib.sha256(data).hexdigest()[:32]
+        self.bodies = {name: compress(data, name) for name, _ in ENCODINGS}
+        self.bodies[None] = data
+
+
+class CachedPage:
+    """
+    内存中的 HTML 页面（SPA 的 index.html），带 ETag 与预先压缩的响应体
+    文件每 check_interval 秒最多 stat 一次，变化时重新读取（重新构建前端后无需重启）
+    """
+
+    def __init__(self, path: str, check_interval: float = 1.0):
+        self.path = path
+        self.check_interval = check_interval
+        self._page: Optional[_Page] = None
+        self._checked_at = 0.0
+
+    def _refresh(self):
+        now = time.monotonic()
+        if self._page is not None and now - self._checked_at < self.check_interval:
+            return
+        self._checked_at = now
+        try:
+            st = os.stat(self.path)
+            if self._page is not None and (st.st_mtime_ns, st.st_size) == (self._page.mtime_ns, self._page.size):
+                return
+            with open(self.path, "rb") as f:
+                self._page = _Page(st.st_mtime_ns, st.st_size, f.read())
+        except OSError:
+            self._page = None
+
+    def response(self, request: Request) -> Response:
+        """页面不存在时抛出 FileNotFoundError"""
+        self._refresh()
+        page = self._page
+        if page is None:
+            raise FileNotFoundError(self.path)
+        encodings = accepted_encodings(request.headers.get("accept-encoding"))
+        encoding = encodings[0] if encodings else None
+        # 不同编码的响应体不同，ETag 也需不同
+        etag = f'"{page.digest}-{encoding}"' if encoding else f'"{page.digest}"'
+        headers = {"ETag": etag, "Cache-Control": REVALIDATE_CACHE, "Vary": "Accept-Encoding"}
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers=headers)
+        if encoding is not None:
+            headers["Content-Encoding"] = encoding
+        return Response(content=page.bodies[encoding], media_type="text/html", headers=headers)
+
+if __name__ == "__main__":
+    # 构建前端后生成压缩副本：python -m app.utils.static_assets webapp/dist
+    for target in sys.argv[1:] or ["webapp/dist"]:
+        print(f"{target}: 生成 {precompress(target)} 个压缩副本")
@@ -0,0 +1,9 @@
+# -*- coding: utf-8 -*-
+"""
+性能基准测试脚本
+在进程内驱动应用并以存根替代外部服务，用于对比优化前后的延迟与吞吐
+
+作者: 王梓涵
+邮箱: wangzh011031@163.com
+时间: 2025年
+"""
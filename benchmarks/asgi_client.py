@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""
+基准测试用的最小ASGI客户端
+
+直接在进程内调用 FastAPI 应用，不经过网络与HTTP服务器，
+便于在没有外部服务的环境中测量接口本身的延迟。
+
+作者: 王梓涵
+邮箱: wangzh011031@163.com
+时间: 2025年
+"""
+from typing import Dict, Iterable, List, Optional, Tuple
+import time
+import uuid
+
+
+async def request(app, method: str, path: str, headers: Optional[Dict[str, str]] = None,
+                  body: bytes = b"", chunk_size: int = 1024 * 1024) -> Tuple[int, Dict[str, str], bytes]:
+    """发送一次请求，返回 (状态码, 响应头, 响应体)"""
+    path, _, query = path.partition("?")
+    raw_headers = [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in (headers or {}).items()]
+    raw_headers.append((b"content-length", str(len(body)).encode()))
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": query.encode(),
+        "root_path": "",
+        "headers": raw_headers,
+        "client": ("127.0.0.1", 50000),
+        "server": ("testserver", 80),
+    }
+    chunks: List[bytes] = [body[i:i + chunk_size] for i in range(0, len(body), chunk_size)] or [b""]
+    state = {"index": 0}
+    response = {"status": 0, "headers": {}, "body": bytearray()}
+
+    async def receive():
+        index = state["index"]
+        if index < len(chunks):
+            state["index"] += 1
+            return {"type": "http.request", "body": chunks[index], "more_body": index + 1 < len(chunks)}
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+            response["headers"] = {k.decode("latin-1"): v.decode("latin-1") for k, v in message.get("headers", [])}
+        elif message["type"] == "http.response.body":
+            response["body"] += message.get("body", b"")
+
+    await app(scope, receive, send)
+    return response["status"], response["headers"], bytes(response["body"])
+
+
+def multipart_body(fields: Iterable[Tuple[str, str]] = (),
+                   files: Iterable[Tuple[str, str, str, bytes]] = ()) -> Tuple[bytes, str]:
+    """构造 multipart/form-data 请求体，files 元素为 (字段名, 文件名, 类型, 内容)"""
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields:
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode()
+        )
+    for name, filename, content_type, content in files:
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+            f'Content-Type: {content_type}\r\n\r\n'.encode() + content + b"\r\n"
+        )
+    parts.append(f"--{boundary}--\r\n".encode())
+    return b"".join(parts), f"multipart/form-data; boundary={boundary}"
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    """计算百分位数（最近秩法）"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[rank]
+
+
+class Timer:
+    """记录代码块耗时（毫秒）"""
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed_ms = (time.perf_counter() - self.start) * 1000
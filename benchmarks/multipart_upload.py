@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""
+基准测试：大文件分片并行上传的吞吐
+
+对真实的 MinIO / S3 兼容服务上传（FileService 与生产环境相同的 MinioBackend 与连接池），
+按不同的 UPLOAD_PART_CONCURRENCY 上传同一大小的文件，UPLOAD_PART_CONCURRENCY=1 即改造前的顺序上传。
+每次上传后删除测试对象；测试存储桶不存在时创建（默认 benchmark-multipart，不影响业务存储桶）。
+--fail-rate 按比例在分片请求发出前注入连接中断，验证只重试失败的分片。
+
+本地启动服务（与 docker-compose.yml 中的 minio 服务相同）:
+    docker compose up -d minio
+    # 或 docker run -p 9000:9000 minio/minio server /data
+
+用法:
+    python -m benchmarks.multipart_upload --endpoint localhost:9000 --size-mb 512 --concurrency 1 2 4 8
+
+作者: 王梓涵
+邮箱: wangzh011031@163.com
+时间: 2025年
+"""
+import argparse
+import os
+import random
+import threading
+import time
+
+from app.core.config import settings
+from app.core.storage_backends import MinioBackend
+from app.services.file_service import FileService
+
+
+class SyntheticReader:
+    """按需生成指定大小的数据（重复的随机块），不占用内存"""
+
+    def __init__(self, size: int):
+        self.remaining = size
+        self.block = os.urandom(1024 * 1024)
+
+    def read(self, size: int = -1) -> bytes:
+        size = self.remaining if size is None or size < 0 else min(size, self.remaining)
+        if size <= 0:
+            return b""
+        data = (self.block * (size // len(self.block) + 1))[:size]
+        self.remaining -= size
+        return data
+
+
+class FaultyMinioBackend(MinioBackend):
+    """按比例在分片请求发出前抛出连接中断（其余请求照常发送到服务端）"""
+
+    def __init__(self, endpoint: str, fail_rate: float):
+        super().__init__(endpoint)
+        self.fail_rate = fail_rate
+        self.failures = 0
+        self._failures_lock = threading.Lock()
+
+    def _upload_part(self, bucket_name, object_name, data, headers, upload_id, part_number):
+        if random.random() < self.fail_rate:
+            with self._failures_lock:
+                self.failures += 1
+            raise ConnectionResetError("注入的分片失败")
+        return super()._upload_part(bucket_name, object_name, data, headers, upload_id, part_number)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="大文件分片并行上传吞吐（MinIO / S3 兼容服务）")
+    parser.add_argument("--endpoint", default=settings.MINIO_ENDPOINT, help="服务地址（访问密钥取自配置）")
+    parser.add_argument("--bucket", default="benchmark-multipart", help="测试存储桶")
+    parser.add_argument("--size-mb", type=int, default=512, help="上传文件大小（MB）")
+    parser.add_argument("--part-mb", type=int, default=16, help="分片大小（MB，不小于5）")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8], help="同时上传的分片数量")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="分片失败比例（0~1）")
+    args = parser.parse_args()
+
+    settings.STORAGE_CONTENT_ADDRESSED = False
+    settings.UPLOAD_PART_SIZE = args.part_mb * 1024 * 1024
+    size = args.size_mb * 1024 * 1024
+    print(f"服务 {args.endpoint}，存储桶 {args.bucket}，文件 {args.size_mb}MB，分片 {args.part_mb}MB，"
+          f"失败比例 {args.fail_rate}")
+    print(f"{'并发分片':>8}{'耗时':>10}{'吞吐':>14}{'分片失败':>10}")
+
+    baseline = None
+    for concurrency in args.concurrency:
+        settings.UPLOAD_PART_CONCURRENCY = concurrency
+        service = FileService()
+        # 连接池大小随 UPLOAD_PART_CONCURRENCY 变化，每轮新建客户端
+        service.client = FaultyMinioBackend(args.endpoint, args.fail_rate)
+        if not service.client.bucket_exists(args.bucket):
+            service.client.make_bucket(args.bucket)
+        # 只测量存储写入，不登记引用计数与目录索引
+        service.record_reference = lambda *a, **k: 1
+        service.index_object = lambda *a, **k: None
+
+        start = time.perf_counter()
+        result = service.upload_stream(SyntheticReader(size), "model.tif", "image/tiff", args.bucket, max_size=size)
+        elapsed = time.perf_counter() - start
+        service.shutdown()
+        service.client.remove_object(args.bucket, result["object_name"])
+
+        throughput = args.size_mb / elapsed
+        baseline = baseline or throughput
+        print(f"{concurrency:>8}{elapsed:>9.2f}s{throughput:>9.1f}MB/s{service.client.failures:>10}"
+              f"  ×{throughput / baseline:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""
+基准测试：外部服务缓慢或不可用时 worker 的冷启动耗时
+
+每个场景在独立子进程中导入 main 并执行 lifespan 启动，分别记录导入耗时与启动耗时：
+- absent：PostgreSQL、MinIO、Redis 指向无人监听的端口（连接被拒绝）
+- slow：三者指向只接受连接、从不响应的本地端口（模拟服务卡死）
+
+对比两种启动方式：
+- eager：导入时同步创建客户端并依次执行全部初始化、不设预热超时（改造前的行为）
+- lazy：导入时不访问外部服务，启动时并发预热，每项最多等待 STARTUP_WARMUP_TIMEOUT 秒
+
+用法:
+    python -m benchmarks.startup --warmup-timeout 2 --cap 30
+
+作者: 王梓涵
+邮箱: wangzh011031@163.com
+时间: 2025年
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def blackhole() -> int:
+    """启动只接受连接、从不发送数据的本地端口"""
+    server = socket.socket()
+    server.bind(("127.0.0.1", 0))
+    server.listen(64)
+    held = []
+
+    def accept():
+        while True:
+            conn, _ = server.accept()
+            held.append(conn)
+
+    threading.Thread(target=accept, daemon=True).start()
+    return server.getsockname()[1]
+
+
+def child(mode: str):
+    """子进程：导入应用并执行启动，输出耗时（JSON）"""
+    began = time.perf_counter()
+    import main
+    if mode == "eager":
+        from app.core.providers import warm_up_steps
+        try:
+            main.init_database()
+            for step in warm_up_steps().values():
+                step()
+        except Exception as e:
+            # 改造前导入阶段的异常会使 worker 无法启动
+            print(json.dumps({"error": f"{type(e).__name__}（{time.perf_counter() - began:.2f}s 后启动失败）"}))
+            sys.stdout.flush()
+            os._exit(1)
+    imported = time.perf_counter()
+
+    async def start():
+        async with main.app.router.lifespan_context(main.app):
+            pass
+
+    if mode == "lazy":
+        asyncio.run(start())
+    ready = time.perf_counter()
+    print(json.dumps({
+        "import": imported - began,
+        "startup": ready - imported,
+        "total": ready - began,
+        "warm_up": getattr(main.app.state, "warm_up", None),
+    }))
+    sys.stdout.flush()
+    # 卡住的连接线程不等待
+    os._exit(0)
+
+
+def run_scenario(mode: str, port: int, warmup_timeout: float, cap: float) -> dict:
+    env = dict(
+        os.environ,
+        POSTGRES_HOST="127.0.0.1", POSTGRES_PORT=str(port),
+        MINIO_ENDPOINT=f"127.0.0.1:{port}",
+        REDIS_HOST="127.0.0.1", REDIS_PORT=str(port),
+        STARTUP_WARMUP_TIMEOUT=str(warmup_timeout),
+        PYTHONPATH=os.getcwd(),
+    )
+    began = time.perf_counter()
+    try:
+        proc = subprocess.run(
+            [sys.executable, "-m", "benchmarks.startup", "--child", mode],
+            env=env, capture_output=True, text=True, timeout=cap
+        )
+    except subprocess.TimeoutExpired:
+        return {"import": None, "startup": None, "total": None, "timed_out": True,
+                "wall": time.perf_counter() - began}
+    lines = [line for line in proc.stdout.splitlines() if line.startswith("{")]
+    result = json.loads(lines[-1]) if lines else {"error": proc.stderr.strip()[-300:]}
+    result["wall"] = time.perf_counter() - began
+    return result
+
+
+def fmt(value) -> str:
+    return "超时" if value is None else f"{value:.2f}s"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="外部服务缓慢或不可用时的冷启动耗时")
+    parser.add_argument("--warmup-timeout", type=float, default=2.0, help="STARTUP_WARMUP_TIMEOUT，秒")
+    parser.add_argument("--cap", type=float, default=30.0, help="单个场景的最长等待时间，秒")
+    parser.add_argument("--child", choices=["eager", "lazy"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child)
+        return
+
+    scenarios = {"absent": free_port(), "slow": blackhole()}
+    print(f"{'场景':<8}{'方式':<7}{'导入':>9}{'启动':>9}{'合计':>9}{'进程墙钟':>10}")
+    for scenario, port in scenarios.items():
+        for mode in ("eager", "lazy"):
+            result = run_scenario(mode, port, args.warmup_timeout, args.cap)
+            if "error" in result:
+                print(f"{scenario:<8}{mode:<7} 失败: {result['error']}")
+                continue
+            wall = f"{result['wall']:.2f}s" + ("（被终止）" if result.get("timed_out") else "")
+            print(f"{scenario:<8}{mode:<7}{fmt(result['import']):>9}{fmt(result['startup']):>9}"
+                  f"{fmt(result['total']):>9}{wall:>10}")
+
+
+if __name__ == "__main__":
+    main()
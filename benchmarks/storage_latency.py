@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""
+基准测试：并发大文件上传期间 /api/user/me 的延迟
+
+对比两种存储调用方式：
+- blocking：在事件循环线程上直接调用同步的 FileService（改造前的行为）
+- facade：通过 AsyncFileService 在有界线程池中执行
+
+MinIO 用一个按分片 sleep 的存根代替（模拟慢速PUT），无需任何外部服务。
+
+用法:
+    python -m benchmarks.storage_latency --uploads 4 --size-mb 50
+
+作者: 王梓涵
+邮箱: wangzh011031@163.com
+时间: 2025年
+"""
+from datetime import datetime
+from types import SimpleNamespace
+from unittest import mock
+import argparse
+import asyncio
+import time
+
+import minio
+
+from benchmarks.asgi_client import multipart_body, percentile, request
+
+
+class SlowStorageStub:
+    """模拟慢速对象存储：每读取1MB数据阻塞 delay_per_mb 秒"""
+
+    def __init__(self, delay_per_mb: float):
+        self.delay_per_mb = delay_per_mb
+
+    def bucket_exists(self, bucket_name):
+        return True
+
+    def put_object(self, bucket_name, object_name, data, length, content_type=None, part_size=0, **kwargs):
+        chunk = part_size or 16 * 1024 * 1024
+        while True:
+            block = data.read(chunk)
+            if not block:
+                break
+            time.sleep(self.delay_per_mb * len(block) / (1024 * 1024))
+        return SimpleNamespace(etag="stub")
+
+
+class BlockingFacade:
+    """改造前的调用方式：在事件循环线程上直接执行同步上传"""
+
+    def __init__(self, service):
+        self.service = service
+
+    async def upload_stream(self, stream, filename, content_type=None, bucket_name=None, max_size=None, timeout=None):
+        return self.service.upload_stream(stream, filename, content_type, bucket_name, max_size)
+
+
+def load_app(delay_per_mb: float):
+    with mock.patch.object(minio.Minio, "bucket_exists", return_value=True):
+        import main
+    from app.auth import get_current_user
+    from app.services import file_service
+
+    file_service.client = SlowStorageStub(delay_per_mb)
+    user = SimpleNamespace(
+        user_id=1, username="bench", full_name="基准测试用户",
+        role=SimpleNamespace(role_key="restorer", role_name="修复专家"),
+        email=None, phone=None, unit=None, is_active=True,
+        email_verified=False, email_verified_at=None, created_at=datetime.now()
+    )
+    main.app.dependency_overrides[get_current_user] = lambda: user
+    return main
+
+
+async def probe(app, stop: asyncio.Event, interval: float) -> list:
+    """按固定间隔请求 /api/user/me，记录每次耗时（毫秒）"""
+    samples = []
+    while not stop.is_set():
+        start = time.perf_counter()
+        status, _, _ = await request(app, "GET", "/api/user/me")
+        assert status == 200, status
+        samples.append((time.perf_counter() - start) * 1000)
+        await asyncio.sleep(interval)
+    return samples
+
+
+async def run_case(main, uploads: int, body: bytes, content_type: str, interval: float, duration: float) -> list:
+    stop = asyncio.Event()
+    prober = asyncio.create_task(probe(main.app, stop, interval))
+    if uploads:
+        headers = {"content-type": content_type}
+        results = await asyncio.gather(*[
+            request(main.app, "POST", "/api/upload", headers=headers, body=body) for _ in range(uploads)
+        ])
+        assert all(status == 200 for status, _, _ in results), [r[0] for r in results]
+    else:
+        await asyncio.sleep(duration)
+    stop.set()
+    return await prober
+
+
+def report(name: str, samples: list):
+    print(f"{name:<10} n={len(samples):<5} p50={percentile(samples, 50):8.2f}ms "
+          f"p99={percentile(samples, 99):8.2f}ms max={max(samples):8.2f}ms")
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="并发上传期间 /api/user/me 延迟基准测试")
+    parser.add_argument("--uploads", type=int, default=4, help="并发上传数量")
+    parser.add_argument("--size-mb", type=int, default=50, help="单个上传文件大小（MB）")
+    parser.add_argument("--delay-per-mb", type=float, default=0.02, help="存根每MB写入耗时（秒）")
+    parser.add_argument("--interval", type=float, default=0.01, help="探测请求间隔（秒）")
+    args = parser.parse_args()
+
+    main = load_app(args.delay_per_mb)
+    from app.core.config import settings
+    settings.MAX_FILE_SIZE = max(settings.MAX_FILE_SIZE, (args.size_mb + 1) * 1024 * 1024)
+
+    content = b"\0" * (args.size_mb * 1024 * 1024)
+    body, content_type = multipart_body(files=[("file", "scan.tif", "image/tiff", content)])
+    expected_ms = args.size_mb * args.delay_per_mb * 1000
+
+    print(f"{args.uploads} 个并发上传 × {args.size_mb}MB，存根写入耗时约 {expected_ms:.0f}ms/个")
+    baseline = asyncio.run(run_case(main, 0, body, content_type, args.interval, 1.0))
+    report("idle", baseline)
+
+    with mock.patch.object(main, "async_file_service", BlockingFacade(main.async_file_service.service)):
+        blocking = asyncio.run(run_case(main, args.uploads, body, content_type, args.interval, 0))
+    report("blocking", blocking)
+
+    facade = asyncio.run(run_case(main, args.uploads, body, content_type, args.interval, 0))
+    report("facade", facade)
+
+
+if __name__ == "__main__":
+    main_cli()
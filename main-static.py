@@ -18,6 +18,7 @@
 # ============================================================================
 # 第三方库导入
 # ============================================================================
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Depends, HTTPException, UploadFile, File, Form as FormField, status
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import HTMLResponse, FileResponse
@@ -34,23 +35,33 @@ from datetime import datetime, timedelta
 # ============================================================================
 from app.core.config import settings
 from app.core.database import get_db, create_tables, init_data
+from app.core.providers import warm_up, warm_up_steps
 from app.models import *
 from app.schemas import *
 from app.auth import *
-from app.services import file_service
+from app.services import async_file_service, FileTooLargeError
 from app.api import router as api_router
 
 # ============================================================================
 # FastAPI应用实例创建和配置
 # ============================================================================
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """应用生命周期：启动时预热外部服务，关闭时释放存储线程池"""
+    await startup_event()
+    yield
+    await shutdown_event()
+
+
 # 创建FastAPI应用实例
 app = FastAPI(
     title=settings.APP_NAME,
     version=settings.APP_VERSION,
     description="克孜尔石窟壁画智慧修复全生命周期管理系统",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    lifespan=lifespan
 )
 
 # 配置CORS中间件
@@ -642,23 +653,25 @@ async def upload_file(
         )
     
     try:
-        # 读取文件内容到内存
-        file_content = await file.read()
-        
-        # 调用文件服务上传到MinIO存储
-        file_url = file_service.upload_file(
-            file_content=file_content,
+        # 以流式方式上传到MinIO存储，避免整个文件读入内存
+        stored = await async_file_service.upload_stream(
+            file.file,
             filename=file.filename,
             content_type=file.content_type
         )
         
         return FileUploadResponse(
             filename=file.filename,
-            file_url=file_url,
-            file_size=len(file_content),
+            file_url=stored["url"],
+            file_size=stored["size"],
             content_type=file.content_type
         )
         
+    except FileTooLargeError:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail="文件大小超过限制"
+        )
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -1068,22 +1081,28 @@ async def admin_batch_delete_workflows(
 # 应用生命周期事件
 # ============================================================================
 
-@app.on_event("startup")
+def init_database():
+    """创建数据库表结构并初始化系统基础数据"""
+    create_tables()
+    init_data()
+
+
 async def startup_event():
     """
     应用启动事件处理器
     
     在FastAPI应用启动时执行以下操作：
-    1. 创建数据库表结构
-    2. 初始化基础数据
-    3. 输出启动信息和默认账号信息
+    1. 并发预热：创建数据库表结构并初始化基础数据、检查默认存储桶、检查Redis连通性
+       （每项最多等待 STARTUP_WARMUP_TIMEOUT 秒，失败只记录告警，相应服务在首次使用时重试）
+    2. 输出启动信息和默认账号信息
     """
     try:
-        # 创建数据库表结构
-        create_tables()
-        
-        # 初始化系统基础数据
-        init_data()
+        app.state.warm_up = await warm_up(
+            {"database": init_database, **warm_up_steps()}, settings.STARTUP_WARMUP_TIMEOUT
+        )
+        for name, result in app.state.warm_up.items():
+            if not result["ok"]:
+                print(f"⚠️  {name} 预热失败: {result['error']}")
         
         # 输出启动成功信息
         print(f"🚀 {settings.APP_NAME} 启动成功")
@@ -1097,6 +1116,15 @@ async def startup_event():
         print(f"❌ 应用启动失败: {e}")
 
 
+async def shutdown_event():
+    """
+    应用关闭事件处理器
+    
+    释放存储线程池等资源
+    """
+    async_file_service.shutdown()
+
+
 # ============================================================================
 # 主程序入口
 # ============================================================================
@@ -15,43 +15,61 @@
 版本: 1.0.0
 """
 
+import time
+
+# 冷启动计时起点（导入本模块时），用于检查 STARTUP_BUDGET
+BOOT_STARTED = time.perf_counter()
+
 # ============================================================================
 # 第三方库导入
 # ============================================================================
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Depends, HTTPException, UploadFile, File, Form as FormField, status, Request
-from fastapi.staticfiles import StaticFiles
 from fastapi.responses import HTMLResponse, FileResponse
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy.orm import Session
 from sqlalchemy import desc, func
 from typing import List, Optional
+import asyncio
 import os
 import shutil
-from datetime import datetime, timedelta, timezone
+from datetime import datetime, timezone
 
 # ============================================================================
 # 本地模块导入
 # ============================================================================
 from app.core.config import settings
 from app.core.database import get_db, create_tables, init_data
+from app.core.providers import warm_up, warm_up_steps
 from app.models import *
 from app.schemas import *
 from app.auth import *
-from app.services import file_service
+from app.services import file_service, async_file_service, upload_session_service, image_service, object_index, storage_gc, document_index, dashboard_stats, dashboard_cache, FileTooLargeError, StorageTimeoutError
 from app.api import router as api_router
 from app.api.email_routes import router as email_router
+from app.api.work_archive import archive_tree
+from app.utils.static_assets import CachedPage, PrecompressedStaticFiles, precompress_in_background
 
 # ============================================================================
 # FastAPI应用实例创建和配置
 # ============================================================================
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """应用生命周期：启动时预热外部服务并启动后台任务，关闭时停止后台任务"""
+    await startup_event()
+    yield
+    await shutdown_event()
+
+
 # 创建FastAPI应用实例
 app = FastAPI(
     title=settings.APP_NAME,
     version=settings.APP_VERSION,
     description="克孜尔石窟壁画智慧修复全生命周期管理系统",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    lifespan=lifespan
 )
 
 # 配置CORS中间件
@@ -67,15 +85,18 @@ app.add_middleware(
 # 静态文件服务配置
 # ============================================================================
 
+WEBAPP_DIST_PATH = "webapp/dist"
+
+# Vue3的index.html缓存在内存中（带ETag与压缩结果），前端路由导航时不再读取磁盘
+vue_index = CachedPage(os.path.join(WEBAPP_DIST_PATH, "index.html"))
+
 # 根据配置决定使用哪种前端
 if settings.VUE_WEB:
     # Vue3前端模式：挂载编译后的dist目录
-    WEBAPP_DIST_PATH = "webapp/dist"
-    
     # 确保dist目录存在
     if os.path.exists(WEBAPP_DIST_PATH):
-        # 挂载Vue3静态资源（CSS、JS文件）
-        app.mount("/assets", StaticFiles(directory=os.path.join(WEBAPP_DIST_PATH, "assets")), name="vue-assets")
+        # 挂载Vue3静态资源（CSS、JS文件）：发送预压缩副本，文件名带哈希的资源长期缓存
+        app.mount("/assets", PrecompressedStaticFiles(directory=os.path.join(WEBAPP_DIST_PATH, "assets"), immutable=True), name="vue-assets")
         print(f"✅ Vue3前端已挂载: {WEBAPP_DIST_PATH}")
         print(f"   - /assets/ → {os.path.join(WEBAPP_DIST_PATH, 'assets')}")
     else:
@@ -85,7 +106,7 @@ else:
     # 传统静态文件模式
     if not os.path.exists("static"):
         os.makedirs("static")
-    app.mount("/static", StaticFiles(directory="static"), name="static")
+    app.mount("/static", PrecompressedStaticFiles(directory="static"), name="static")
     print("✅ 传统静态文件已挂载: static/")
 
 # 注册API路由
@@ -97,7 +118,7 @@ app.include_router(email_router)
 # ============================================================================
 
 @app.get("/", response_class=HTMLResponse)
-async def read_root():
+async def read_root(request: Request):
     """
     根路径路由 - 返回系统主页面
     
@@ -108,10 +129,9 @@ async def read_root():
     """
     if settings.VUE_WEB:
         # Vue3前端模式：返回编译后的index.html
-        vue_index_path = "webapp/dist/index.html"
-        if os.path.exists(vue_index_path):
-            return FileResponse(vue_index_path)
-        else:
+        try:
+            return vue_index.response(request)
+        except FileNotFoundError:
             raise HTTPException(status_code=404, detail="Vue3前端文件不存在，请先构建前端项目")
     else:
         # 传统模式：返回登录页面
@@ -379,377 +399,12 @@ async def get_dashboard_stats(
     Returns:
         DashboardStats: 仪表板统计数据响应模型
     """
-    from datetime import datetime, timedelta
-    import random
-    
-    # 获取当前用户角色
-    user_role = current_user.role.role_key
-    
-    # ========================================================================
-    # 基础统计数据计算
-    # ========================================================================
-    
-    # 工作流基础统计（排除已删除的工作流）
-    total_workflows = db.query(Workflow).filter(Workflow.deleted_at.is_(None)).count()
-    running_workflows = db.query(Workflow).filter(
-        Workflow.status == 'running',
-        Workflow.deleted_at.is_(None)
-    ).count()
-    finished_workflows = db.query(Workflow).filter(
-        Workflow.status == 'finished',
-        Workflow.deleted_at.is_(None)
-    ).count()
-    
-    # 待评估工作流数量（仅管理员和评估专家可见）
-    pending_evaluations = db.query(Workflow).filter(
-        Workflow.status == 'finished',
-        Workflow.deleted_at.is_(None),
-        ~Workflow.evaluations.any()
-    ).count() if user_role in ['admin', 'evaluator'] else 0
-    
-    # 待处理回溯请求数量（仅管理员可见）
-    pending_rollbacks = db.query(RollbackRequest).filter(
-        RollbackRequest.status == 'pending'
-    ).count() if user_role == 'admin' else 0
-    
-    # 计算工作流完成率
-    completion_rate = round((finished_workflows / total_workflows * 100) if total_workflows > 0 else 0, 1)
-    
-    # ========================================================================
-    # 角色特定统计数据初始化
-    # ========================================================================
-    
-    # 修复专家个人统计数据
-    my_workflows = None
-    my_running_workflows = None
-    my_finished_workflows = None
-    my_rollback_requests = None
-    monthly_submissions = None
-    average_score = None
-    
-    # 评估专家统计数据
-    completed_evaluations = None
-    monthly_evaluations = None
-    average_given_score = None
-    high_score_rate = None
-    evaluation_efficiency = None
-    
-    # ========================================================================
-    # 修复专家角色统计计算
-    # ========================================================================
-    
-    if user_role == 'restorer':
-        # 个人工作流统计（排除已删除的工作流）
-        my_workflows = db.query(Workflow).filter(
-            Workflow.initiator_id == current_user.user_id,
-            Workflow.deleted_at.is_(None)
-        ).count()
-        
-        my_running_workflows = db.query(Workflow).filter(
-            Workflow.initiator_id == current_user.user_id,
-            Workflow.status == 'running',
-            Workflow.deleted_at.is_(None)
-        ).count()
-        
-        my_finished_workflows = db.query(Workflow).filter(
-            Workflow.initiator_id == current_user.user_id,
-            Workflow.status == 'finished',
-            Workflow.deleted_at.is_(None)
-        ).count()
-        
-        # 个人回溯请求统计
-        my_rollback_requests = db.query(RollbackRequest).filter(
-            RollbackRequest.requester_id == current_user.user_id
-        ).count()
-        
-        # 计算本月提交的工作流数量
-        current_month = datetime.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-        monthly_submissions = db.query(Workflow).filter(
-            Workflow.initiator_id == current_user.user_id,
-            Workflow.created_at >= current_month,
-            Workflow.deleted_at.is_(None)
-        ).count()
-        
-        # 平均评分（模拟数据，实际应从评估记录计算）
-        average_score = round(random.uniform(7.5, 9.5), 1)
-    
-    # ========================================================================
-    # 评估专家角色统计计算
-    # ========================================================================
-    
-    if user_role == 'evaluator':
-        # 个人评估工作统计
-        completed_evaluations = db.query(Evaluation).filter(
-            Evaluation.evaluator_id == current_user.user_id
-        ).count()
-        
-        # 计算本月完成的评估数量
-        current_month = datetime.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-        monthly_evaluations = db.query(Evaluation).filter(
-            Evaluation.evaluator_id == current_user.user_id,
-            Evaluation.created_at >= current_month
-        ).count()
-        
-        # 评估质量指标（模拟数据，实际应从评估记录计算）
-        average_given_score = round(random.uniform(7.0, 9.0), 1)
-        high_score_rate = round(random.uniform(60, 85), 1)
-        evaluation_efficiency = round(random.uniform(2, 5), 1)
-    
-    # ========================================================================
-    # 最近活动数据获取
-    # ========================================================================
-    
-    recent_activities = []
-    recent_logs = db.query(StepLog).order_by(desc(StepLog.created_at)).limit(10).all()
-    
-    # 处理最近活动日志数据
-    for log in recent_logs:
-        # 获取关联的工作流标题
-        workflow_title = None
-        if log.form and log.form.workflow:
-            workflow_title = log.form.workflow.title
-        
-        recent_activities.append({
-            "action": log.action,
-            "operator": log.operator.full_name,
-            "time": log.created_at.strftime("%Y-%m-%d %H:%M"),
-            "form_id": str(log.form_id),
-            "workflow_title": workflow_title,
-            "comment": log.comment
-        })
-    
-    # ========================================================================
-    # 基础响应数据构建
-    # ========================================================================
-    
-    dashboard_data = {
-        "total_workflows": total_workflows,
-        "running_workflows": running_workflows,
-        "finished_workflows": finished_workflows,
-        "pending_evaluations": pending_evaluations,
-        "pending_rollbacks": pending_rollbacks,
-        "my_workflows": my_workflows,
-        "recent_activities": recent_activities,
-        "completion_rate": completion_rate
-    }
-    
-    # ========================================================================
-    # 角色特定数据添加
-    # ========================================================================
-    
-    if user_role == 'admin':
-        # ====================================================================
-        # 管理员角色：全局趋势分析数据
-        # ====================================================================
-        
-        # 计算最近7天的工作流创建趋势
-        today = datetime.now().date()
-        week_ago = today - timedelta(days=6)
-        
-        # 获取最近7天每天的工作流创建数量
-        daily_workflows = []
-        labels = []
-        
-        for i in range(7):
-            current_date = week_ago + timedelta(days=i)
-            count = db.query(Workflow).filter(
-                func.date(Workflow.created_at) == current_date,
-                Workflow.deleted_at.is_(None)
-            ).count()
-            daily_workflows.append(count)
-            
-            # 生成中文日期标签
-            weekdays = ['周一', '周二', '周三', '周四', '周五', '周六', '周日']
-            labels.append(weekdays[current_date.weekday()])
-        
-        # 计算本周与上周的趋势对比
-        this_week_total = sum(daily_workflows)
-        last_week_start = week_ago - timedelta(days=7)
-        last_week_total = db.query(Workflow).filter(
-            func.date(Workflow.created_at) >= last_week_start,
-            func.date(Workflow.created_at) < week_ago,
-            Workflow.deleted_at.is_(None)
-        ).count()
-        
-        # 计算趋势百分比
-        if last_week_total > 0:
-            workflow_trend = round(((this_week_total - last_week_total) / last_week_total) * 100, 1)
-        else:
-            workflow_trend = 0.0 if this_week_total == 0 else 100.0
-        
-        dashboard_data["workflow_trend"] = workflow_trend
-        
-        # 工作流趋势图表数据（最近7天真实数据）
-        dashboard_data["workflow_trend_data"] = {
-            "labels": labels,
-            "values": daily_workflows
-        }
-        
-        # ====================================================================
-        # 管理员角色：全局评分分布统计
-        # ====================================================================
-        
-        # 初始化评分分布统计
-        score_ranges = {
-            "0-6": 0,   # 0-60分
-            "6-7": 0,   # 60-70分
-            "7-8": 0,   # 70-80分
-            "8-9": 0,   # 80-90分
-            "9-10": 0   # 90-100分
-        }
-        
-        # 统计所有评估记录的评分分布
-        evaluations = db.query(Evaluation).all()
-        for evaluation in evaluations:
-            score = evaluation.score
-            if score < 60:
-                score_ranges["0-6"] += 1
-            elif score < 70:
-                score_ranges["6-7"] += 1
-            elif score < 80:
-                score_ranges["7-8"] += 1
-            elif score < 90:
-                score_ranges["8-9"] += 1
-            else:
-                score_ranges["9-10"] += 1
-        
-        dashboard_data["score_distribution"] = score_ranges
-    
-    elif user_role == 'restorer':
-        # ====================================================================
-        # 修复专家角色：个人工作数据
-        # ====================================================================
-        
-        # 添加个人工作流统计数据
-        dashboard_data.update({
-            "my_running_workflows": my_running_workflows,
-            "my_finished_workflows": my_finished_workflows,
-            "my_rollback_requests": my_rollback_requests,
-            "monthly_submissions": monthly_submissions,
-            "average_score": average_score
-        })
-        
-        # 个人工作进度和质量指标（模拟数据）
-        dashboard_data["personal_progress"] = {
-            "monthly_completion": round(random.uniform(60, 95), 1),
-            "quality_score": round(random.uniform(75, 95), 1)
-        }
-    
-    elif user_role == 'evaluator':
-        # ====================================================================
-        # 评估专家角色：评估工作数据
-        # ====================================================================
-        
-        # 添加评估工作统计数据
-        dashboard_data.update({
-            "completed_evaluations": completed_evaluations,
-            "monthly_evaluations": monthly_evaluations,
-            "average_given_score": average_given_score,
-            "high_score_rate": high_score_rate,
-            "evaluation_efficiency": evaluation_efficiency
-        })
-        
-        # ====================================================================
-        # 评估专家个人评分分布统计
-        # ====================================================================
-        
-        # 初始化个人评分分布统计
-        score_ranges = {
-            "0-6": 0,   # 0-60分
-            "6-7": 0,   # 60-70分
-            "7-8": 0,   # 70-80分
-            "8-9": 0,   # 80-90分
-            "9-10": 0   # 90-100分
-        }
-        
-        # 统计当前评估专家的评估记录评分分布
-        my_evaluations = db.query(Evaluation).filter(
-            Evaluation.evaluator_id == current_user.user_id
-        ).all()
-        
-        for evaluation in my_evaluations:
-            score = evaluation.score
-            if score < 60:
-                score_ranges["0-6"] += 1
-            elif score < 70:
-                score_ranges["6-7"] += 1
-            elif score < 80:
-                score_ranges["7-8"] += 1
-            elif score < 90:
-                score_ranges["8-9"] += 1
-            else:
-                score_ranges["9-10"] += 1
-        
-        dashboard_data["score_distribution"] = score_ranges
-    
-    return DashboardStats(**dashboard_data)
-
-# ============================================================================
-# 甘特图接口
-# ============================================================================
-
-@app.get("/api/gantt/tasks")
-def get_gantt_tasks(db: Session = Depends(get_db)):
-    """
-    获取甘特图任务数据 - 从数据库读取真实工作流数据
-    
-    Returns:
-        List[dict]: 任务列表，包含任务的基本信息和时间范围
-    """
-    try:
-        # 查询所有工作流（包括运行中和已完成的工作流）
-        workflows = db.query(Workflow).filter(
-            Workflow.deleted_at.is_(None)  # 排除已删除的工作流
-        ).order_by(Workflow.created_at.desc()).all()
-        
-        tasks = []
-        for wf in workflows:
-            # 计算工作流进度
-            total_forms = db.query(Form).filter(Form.workflow_id == wf.workflow_id).count()
-            
-            # 更准确的进度计算
-            if wf.status == 'completed':
-                progress = 100
-            elif wf.status == 'cancelled':
-                progress = 0
-            else:
-                # 根据当前步骤和表单数量计算进度
-                base_progress = (wf.current_step / 5) * 80  # 基础进度（5个步骤，前4步占80%）
-                form_progress = min(20, total_forms * 5)  # 表单进度最多20%
-                progress = min(100, base_progress + form_progress)
-            
-            # 计算预计结束时间
-            if wf.status == 'completed':
-                # 已完成的工作流，使用最后更新时间作为结束时间
-                estimated_end = wf.updated_at or wf.created_at
-            else:
-                # 进行中的工作流，基于当前步骤估算剩余时间
-                remaining_steps = 5 - wf.current_step
-                estimated_end = wf.created_at + timedelta(days=wf.current_step * 2 + remaining_steps * 3)
-            
-            tasks.append({
-                "id": str(wf.workflow_id),
-                "name": wf.title,
-                "start": wf.created_at.isoformat(),
-                "end": estimated_end.isoformat(),
-                "progress": round(progress, 1),
-                "assignee": wf.initiator.full_name if wf.initiator else "未知用户",
-                "status": wf.status,
-                "workflow_id": str(wf.workflow_id),
-                "current_step": wf.current_step,
-                "total_forms": total_forms
-            })
-        
-        # 如果没有工作流数据，返回空列表而不是示例数据
-        return tasks
-        
-    except Exception as e:
-        print(f"获取甘特图数据失败: {e}")
-        import traceback
-        traceback.print_exc()
-        # 出错时返回空列表
-        return []
-
+    # 全部计数合并为一条聚合查询（见 services/dashboard_service），结果按角色/用户缓存，写入时失效
+    data = await dashboard_cache.get(
+        current_user.role.role_key, current_user.user_id,
+        lambda: dashboard_stats.build(db, current_user)
+    )
+    return DashboardStats(**data)
 
 # ============================================================================
 # 文件管理接口
@@ -791,23 +446,30 @@ async def upload_file(
         )
     
     try:
-        # 读取文件内容到内存
-        file_content = await file.read()
-        
-        # 调用文件服务上传到MinIO存储
-        file_url = file_service.upload_file(
-            file_content=file_content,
+        # 以流式方式上传到MinIO存储，避免整个文件读入内存
+        stored = await async_file_service.upload_stream(
+            file.file,
             filename=file.filename,
             content_type=file.content_type
         )
         
         return FileUploadResponse(
             filename=file.filename,
-            file_url=file_url,
-            file_size=len(file_content),
+            file_url=stored["url"],
+            file_size=stored["size"],
             content_type=file.content_type
         )
         
+    except FileTooLargeError:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail="文件大小超过限制"
+        )
+    except StorageTimeoutError as e:
+        raise HTTPException(
+            status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+            detail=str(e)
+        )
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -860,6 +522,7 @@ async def create_workflow(
     # 保存到数据库
     db.add(workflow)
     db.commit()
+    await dashboard_cache.invalidate()
     db.refresh(workflow)
     
     return WorkflowResponse(
@@ -1109,6 +772,7 @@ async def admin_update_workflow(
     
     # 提交更改
     db.commit()
+    await dashboard_cache.invalidate()
     db.refresh(workflow)
     
     return WorkflowResponse(
@@ -1157,6 +821,7 @@ async def admin_delete_workflow(
     # 执行软删除操作
     workflow.deleted_at = func.now()
     db.commit()
+    await dashboard_cache.invalidate()
     
     return ResponseModel(
         success=True,
@@ -1203,6 +868,7 @@ async def admin_batch_delete_workflows(
         deleted_count += 1
     
     db.commit()
+    await dashboard_cache.invalidate()
     
     return ResponseModel(
         success=True,
@@ -1217,22 +883,49 @@ async def admin_batch_delete_workflows(
 # 应用生命周期事件
 # ============================================================================
 
-@app.on_event("startup")
+def init_database():
+    """创建数据库表结构并初始化系统基础数据"""
+    create_tables()
+    init_data()
+
+
 async def startup_event():
     """
     应用启动事件处理器
     
     在FastAPI应用启动时执行以下操作：
-    1. 创建数据库表结构
-    2. 初始化基础数据
-    3. 输出启动信息和默认账号信息
+    1. 并发预热：创建数据库表结构并初始化基础数据、检查默认存储桶、检查Redis连通性
+       （每项最多等待 STARTUP_WARMUP_TIMEOUT 秒，失败只记录告警，相应服务在首次使用时重试）
+    2. 启动后台任务
+    3. 输出启动信息、冷启动耗时和默认账号信息
     """
     try:
-        # 创建数据库表结构
-        create_tables()
+        app.state.warm_up = await warm_up(
+            {"database": init_database, **warm_up_steps()}, settings.STARTUP_WARMUP_TIMEOUT
+        )
+        for name, result in app.state.warm_up.items():
+            if not result["ok"]:
+                print(f"⚠️  {name} 预热失败: {result['error']}")
+        
+        # 启动过期上传会话清理任务
+        app.state.upload_sweeper = asyncio.create_task(upload_session_service.run_sweeper())
+        
+        # 启动目录索引对账任务（首次运行时全量建立索引）
+        app.state.object_indexer = asyncio.create_task(object_index.run_reconciler(file_service.client))
+        
+        # 后台预扫描工作档案本地目录（递归搜索使用的路径索引）
+        archive_tree.prebuild()
         
-        # 初始化系统基础数据
-        init_data()
+        # 启动文档全文索引对账任务（知识体系文件与工作档案本地文档）
+        app.state.document_indexer = asyncio.create_task(document_index.run_indexer(archive_tree))
+        
+        # 后台生成前端构建产物的压缩副本（已是最新的跳过；static/ 是工作档案目录，不写入副本）
+        if settings.STATIC_PRECOMPRESS and settings.VUE_WEB:
+            precompress_in_background([WEBAPP_DIST_PATH])
+        
+        # 启动孤儿对象定期清理任务（GC_INTERVAL 为0时只能通过管理接口手动执行）
+        if settings.GC_INTERVAL > 0:
+            app.state.storage_gc = asyncio.create_task(storage_gc.run_periodically(archive_tree))
         
         # 输出启动成功信息
         print(f"🚀 {settings.APP_NAME} 启动成功")
@@ -1242,10 +935,32 @@ async def startup_event():
         print("👨‍🔧 修复专家账号: restorer1 / 123456")
         print("👨‍⚖️ 评估专家账号: evaluator1 / 123456")
         
+        # 冷启动耗时（导入应用到可以接收请求）
+        app.state.boot_seconds = time.perf_counter() - BOOT_STARTED
+        print(f"⏱️  冷启动耗时: {app.state.boot_seconds:.2f} 秒")
+        if app.state.boot_seconds > settings.STARTUP_BUDGET:
+            print(f"⚠️  冷启动耗时超过预算 {settings.STARTUP_BUDGET} 秒")
+        
     except Exception as e:
         print(f"❌ 应用启动失败: {e}")
 
 
+async def shutdown_event():
+    """
+    应用关闭事件处理器
+    
+    停止后台任务并释放存储线程池等资源
+    """
+    for name in ("upload_sweeper", "object_indexer", "storage_gc", "document_indexer"):
+        task = getattr(app.state, name, None)
+        if task is not None:
+            task.cancel()
+    image_service.shutdown()
+    document_index.shutdown()
+    async_file_service.shutdown()
+    archive_tree.shutdown()
+
+
 # ============================================================================
 # SPA路由支持（Vue Router History模式）
 # ============================================================================
@@ -1281,11 +996,10 @@ async def spa_handler(request: Request, full_path: str):
         full_path.endswith(('.js', '.css', '.png', '.jpg', '.jpeg', '.gif', '.ico', '.svg', '.woff', '.woff2', '.ttf'))):
         raise HTTPException(status_code=404, detail="静态资源不存在")
     
-    # 对于其他所有路径，返回Vue3的index.html让前端路由处理
-    vue_index_path = "webapp/dist/index.html"
-    if os.path.exists(vue_index_path):
-        return FileResponse(vue_index_path)
-    else:
+    # 对于其他所有路径，返回Vue3的index.html让前端路由处理（内存缓存，支持304）
+    try:
+        return vue_index.response(request)
+    except FileNotFoundError:
         raise HTTPException(status_code=404, detail="Vue3前端文件不存在，请先构建前端项目")
 
 
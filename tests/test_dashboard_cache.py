@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""
+仪表板统计缓存：版本号失效，Redis命令不在事件循环线程中执行
+
+作者: 王梓涵
+邮箱: wangzh011031@163.com
+时间: 2025年
+"""
+import asyncio
+import threading
+
+import pytest
+
+from app.services import dashboard_cache_service
+from app.services.dashboard_cache_service import DashboardCache
+
+
+class FakeRedis:
+    def __init__(self):
+        self.data = {}
+        self.threads = set()
+
+    def mget(self, *keys):
+        self.threads.add(threading.get_ident())
+        return [self.data.get(key) for key in keys]
+
+    def setex(self, key, ttl, value):
+        self.threads.add(threading.get_ident())
+        self.data[key] = value
+
+    def incr(self, key):
+        self.threads.add(threading.get_ident())
+        self.data[key] = int(self.data.get(key) or 0) + 1
+        return self.data[key]
+
+
+@pytest.fixture
+def redis(monkeypatch):
+    redis = FakeRedis()
+    monkeypatch.setattr(dashboard_cache_service, "redis_client", redis)
+    return redis
+
+
+def test_invalidate_bumps_shared_version_off_the_event_loop(redis):
+    cache = DashboardCache(ttl=60)
+    computed = []
+
+    def compute():
+        computed.append(1)
+        return {"total": len(computed)}
+
+    async def scenario():
+        first = await cache.get("admin", 1, compute)
+        cached = await cache.get("admin", 2, compute)
+        await cache.invalidate()
+        fresh = await cache.get("admin", 1, compute)
+        return threading.get_ident(), first, cached, fresh
+
+    loop_ident, first, cached, fresh = asyncio.run(scenario())
+
+    assert first == cached == {"total": 1}
+    assert fresh == {"total": 2}
+    assert redis.data[dashboard_cache_service.VERSION_KEY] == 1
+    assert redis.threads and loop_ident not in redis.threads
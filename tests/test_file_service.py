@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""
+文件服务：分片上传的重试策略与目录列举
+
+作者: 王梓涵
+邮箱: wangzh011031@163.com
+时间: 2025年
+"""
+import io
+import sys
+
+import pytest
+import urllib3
+from minio.error import S3Error, ServerError
+
+from app.core.config import settings
+from app.core.storage_backends import MemoryBackend
+
+# app.services.file_service 在包中被同名的服务实例替代，从 sys.modules 取模块本身
+import app.services.file_service  # noqa: F401
+file_service_module = sys.modules["app.services.file_service"]
+FileService = file_service_module.FileService
+is_transient_error = file_service_module.is_transient_error
+
+
+def s3_error(code, status):
+    response = urllib3.response.HTTPResponse(status=status)
+    return S3Error(code, code, "/bucket/object", None, None, response, "bucket", "object")
+
+
+@pytest.mark.parametrize("error", [
+    ConnectionResetError("reset"),
+    TimeoutError("timed out"),
+    urllib3.exceptions.ProtocolError("connection aborted"),
+    ServerError("bad gateway", 502),
+    s3_error("InternalError", 500),
+    s3_error("SlowDown", 503),
+])
+def test_transient_errors(error):
+    assert is_transient_error(error)
+
+
+@pytest.mark.parametrize("error", [
+    s3_error("NoSuchUpload", 404),
+    s3_error("AccessDenied", 403),
+    s3_error("EntityTooSmall", 400),
+    ValueError("bad data"),
+])
+def test_permanent_errors(error):
+    assert not is_transient_error(error)
+
+
+class FlakyBackend(MemoryBackend):
+    def __init__(self, errors):
+        super().__init__()
+        self.errors = list(errors)
+        self.calls = 0
+
+    def _upload_part(self, *args):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return super()._upload_part(*args)
+
+
+@pytest.fixture
+def service(monkeypatch):
+    monkeypatch.setattr(settings, "UPLOAD_PART_RETRIES", 3)
+    monkeypatch.setattr(file_service_module.time, "sleep", lambda _: None)
+    return FileService()
+
+
+def start_upload(service, client):
+    service.client = client
+    client.make_bucket("bucket")
+    return client._create_multipart_upload("bucket", "object", {})
+
+
+def test_part_is_retried_after_network_error(service):
+    client = FlakyBackend([ConnectionResetError("reset"), s3_error("InternalError", 500)])
+    upload_id = start_upload(service, client)
+
+    assert service._upload_part_with_retry("bucket", "object", upload_id, 1, b"data")
+    assert client.calls == 3
+
+
+def test_permanent_error_is_not_retried(service):
+    client = FlakyBackend([s3_error("AccessDenied", 403)])
+    upload_id = start_upload(service, client)
+
+    with pytest.raises(S3Error):
+        service._upload_part_with_retry("bucket", "object", upload_id, 1, b"data")
+    assert client.calls == 1
+
+
+def test_iter_files_lists_directory_tree_by_prefix(monkeypatch):
+    service = FileService()
+    service.client = MemoryBackend()
+    service.client.make_bucket("bucket")
+    for name in ("a/x.txt", "a/b/y.txt", "ab/z.txt", "c/w.txt"):
+        service.client.put_object("bucket", name, io.BytesIO(b"data"), 4)
+    prefixes = []
+    list_objects = service.client.list_objects
+
+    def recording_list_objects(bucket_name, prefix=None, **kwargs):
+        prefixes.append(prefix)
+        return list_objects(bucket_name, prefix=prefix, **kwargs)
+    monkeypatch.setattr(service.client, "list_objects", recording_list_objects)
+
+    assert [f["path"] for f in service.iter_files("bucket", "a", recursive=True)] == ["a/b/y.txt", "a/x.txt"]
+    assert [f["path"] for f in service.iter_files("bucket", "a")] == ["a/x.txt"]
+    assert prefixes == ["a/", "a/"]
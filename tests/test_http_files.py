@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""
+文件下载：条件请求与 Range
+
+作者: 王梓涵
+邮箱: wangzh011031@163.com
+时间: 2025年
+"""
+from datetime import datetime, timezone
+import asyncio
+
+import pytest
+from starlette.requests import Request
+
+from app.utils.http_files import (
+    RangeNotSatisfiable, file_etag, file_response, object_response, requested_range
+)
+
+DATA = b"0123456789"
+ETAG = '"abc"'
+MODIFIED = datetime(2025, 6, 1, tzinfo=timezone.utc)
+
+
+def make_request(headers=None, method="GET") -> Request:
+    return Request({
+        "type": "http",
+        "method": method,
+        "path": "/file",
+        "query_string": b"",
+        "headers": [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in (headers or {}).items()],
+    })
+
+
+def call(response):
+    """执行响应，返回 (状态码, 响应头, 响应体)"""
+    result = {"status": 0, "headers": {}, "body": bytearray()}
+
+    async def receive():
+        # 客户端一直保持连接
+        await asyncio.Event().wait()
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            result["status"] = message["status"]
+            result["headers"] = {k.decode("latin-1"): v.decode("latin-1") for k, v in message["headers"]}
+        elif message["type"] == "http.response.body":
+            result["body"] += message.get("body", b"")
+
+    asyncio.run(response({"type": "http", "method": "GET", "extensions": {}}, receive, send))
+    return result["status"], result["headers"], bytes(result["body"])
+
+
+def parse(header, size=len(DATA), **headers):
+    return requested_range(make_request({"range": header, **headers}), size, ETAG, MODIFIED)
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=0-3", (0, 3)),
+    ("bytes=5-", (5, 9)),
+    ("bytes=8-100", (8, 9)),
+    ("bytes=-3", (7, 9)),
+    ("bytes=-100", (0, 9)),
+    ("bytes=9-9", (9, 9)),
+])
+def test_satisfiable_ranges(header, expected):
+    assert parse(header) == expected
+
+
+@pytest.mark.parametrize("header", ["bytes=10-", "bytes=10-20", "bytes=11-21", "bytes=-0"])
+def test_unsatisfiable_ranges(header):
+    with pytest.raises(RangeNotSatisfiable):
+        parse(header)
+
+
+def test_start_past_eof_of_one_byte_file():
+    with pytest.raises(RangeNotSatisfiable):
+        parse("bytes=11-21", size=1)
+
+
+def test_empty_file_has_no_satisfiable_range():
+    with pytest.raises(RangeNotSatisfiable):
+        parse("bytes=0-", size=0)
+    with pytest.raises(RangeNotSatisfiable):
+        parse("bytes=-1", size=0)
+
+
+@pytest.mark.parametrize("header", ["bytes=5-2", "bytes=a-3", "bytes=1--3", "bytes=-", "items=0-1", "bytes=0-1,3-4"])
+def test_invalid_or_multiple_ranges_are_ignored(header):
+    assert parse(header) is None
+
+
+def test_if_range_mismatch_returns_full_file():
+    assert parse("bytes=0-3", **{"if-range": '"other"'}) is None
+    assert parse("bytes=0-3", **{"if-range": ETAG}) == (0, 3)
+
+
+@pytest.fixture
+def local_file(tmp_path):
+    path = tmp_path / "file.bin"
+    path.write_bytes(DATA)
+    return path
+
+
+def test_file_response_partial_content(local_file):
+    status, headers, body = call(file_response(make_request({"range": "bytes=2-4"}), str(local_file),
+                                               "application/octet-stream", "no-cache"))
+    assert status == 206
+    assert headers["content-range"] == "bytes 2-4/10"
+    assert body == b"234"
+
+
+def test_file_response_suffix_range(local_file):
+    status, headers, body = call(file_response(make_request({"range": "bytes=-4"}), str(local_file),
+                                               None, "no-cache"))
+    assert status == 206
+    assert headers["content-range"] == "bytes 6-9/10"
+    assert body == b"6789"
+
+
+def test_file_response_past_eof(local_file):
+    status, headers, _ = call(file_response(make_request({"range": "bytes=10-20"}), str(local_file),
+                                            None, "no-cache"))
+    assert status == 416
+    assert headers["content-range"] == "bytes */10"
+
+
+def test_file_response_not_modified(local_file):
+    etag = file_etag(local_file.stat())
+    status, headers, body = call(file_response(make_request({"if-none-match": etag, "range": "bytes=0-1"}),
+                                               str(local_file), None, "no-cache"))
+    assert status == 304
+    assert headers["etag"] == etag
+    assert body == b""
+
+
+def open_range(offset, length):
+    return iter([DATA[offset:offset + length]])
+
+
+def test_object_response_ranges():
+    def respond(headers):
+        return call(object_response(make_request(headers), len(DATA), "abc", MODIFIED, "text/plain",
+                                    "no-cache", open_range))
+
+    assert respond({"range": "bytes=3-5"})[::2] == (206, b"345")
+    assert respond({"range": "bytes=-2"})[::2] == (206, b"89")
+    assert respond({"range": "bytes=11-21"})[0] == 416
+    assert respond({"if-none-match": 'W/"abc"'})[0] == 304
+    assert respond({})[::2] == (200, DATA)
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""
+图像接口：登录校验、私有缓存与按需生成上限
+
+作者: 王梓涵
+邮箱: wangzh011031@163.com
+时间: 2025年
+"""
+import asyncio
+
+import pytest
+from fastapi import FastAPI
+
+from app.api import image_routes
+from app.auth import get_current_user
+from app.core.config import settings
+from app.services import async_file_service, image_service
+from benchmarks.asgi_client import request
+
+KEY = "0" * 64
+THUMBNAIL = "/images/thumbnail?path=img/a.png&size=200"
+
+
+@pytest.fixture
+def app():
+    app = FastAPI()
+    app.include_router(image_routes.router, prefix="/images")
+    return app
+
+
+@pytest.fixture
+def logged_in(app):
+    app.dependency_overrides[get_current_user] = lambda: object()
+
+
+@pytest.fixture
+def archive(tmp_path, monkeypatch):
+    (tmp_path / "img").mkdir()
+    (tmp_path / "img" / "a.png").write_bytes(b"png")
+    monkeypatch.setattr(image_routes, "PROJECT_ROOT", tmp_path)
+    monkeypatch.setattr(image_routes, "ALLOWED_ROOTS", {"img": tmp_path / "img"})
+    return tmp_path
+
+
+def get(app, path):
+    return asyncio.run(request(app, "GET", path))
+
+
+@pytest.mark.parametrize("path", [THUMBNAIL, f"/images/{KEY}/pyramid.dzi", f"/images/{KEY}/previews/1024.jpg"])
+def test_image_routes_require_login(app, path):
+    assert get(app, path)[0] == 403
+
+
+def test_derived_files_are_cached_privately(app, logged_in, monkeypatch):
+    async def get_object(object_name, bucket_name=None):
+        return {"data": b"jpeg", "etag": "abc"}
+    monkeypatch.setattr(async_file_service, "get_object", get_object)
+
+    status, headers, body = get(app, f"/images/{KEY}/previews/1024.jpg")
+    assert status == 200 and body == b"jpeg"
+    assert headers["cache-control"] == "private, max-age=31536000, immutable"
+
+
+def test_on_demand_thumbnails_are_capped(app, logged_in, archive, monkeypatch):
+    async def get_object(object_name, bucket_name=None):
+        return None
+
+    async def build_thumbnails(*args, **kwargs):
+        raise AssertionError("超出上限时不应生成缩略图")
+
+    monkeypatch.setattr(async_file_service, "get_object", get_object)
+    monkeypatch.setattr(image_service, "build_thumbnails", build_thumbnails)
+    monkeypatch.setattr(settings, "IMAGE_THUMBNAIL_MAX_PENDING", 2)
+    monkeypatch.setattr(image_service, "_thumbnail_jobs", {"a": None, "b": None})
+
+    status, headers, _ = get(app, THUMBNAIL)
+    assert status == 503
+    assert headers["retry-after"] == str(image_routes.THUMBNAIL_RETRY_AFTER)
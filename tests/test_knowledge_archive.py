@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+"""
+知识库存档：内容寻址对象按原始文件名匹配关键词
+
+作者: 王梓涵
+邮箱: wangzh011031@163.com
+时间: 2025年
+"""
+from app.api.routes import archive_file_matcher, original_name_matches
+from app.core.storage_backends import object_url
+
+BUCKET = "knowledge-files"
+DIGEST_PATH = "sha256/ab/abcdef.pdf"
+
+
+class FakeQuery:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def filter(self, *criteria):
+        return self
+
+    def __iter__(self):
+        return iter(self.rows)
+
+
+class FakeSession:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def query(self, *columns):
+        return FakeQuery(self.rows)
+
+
+def file(path):
+    return {"name": path.rsplit("/", 1)[-1], "path": path, "ext": ".pdf", "category": "document"}
+
+
+def test_original_name_matches_only_content_addressed_objects_in_bucket():
+    db = FakeSession([
+        (object_url(BUCKET, DIGEST_PATH), "壁画修复报告.pdf"),
+        (object_url(BUCKET, "2025/报告.pdf"), "报告.pdf"),
+        (object_url("repair-system", "sha256/cd/cdef.pdf"), "报告.pdf"),
+        ("https://example.com/sha256/ef/ef.pdf", "报告.pdf"),
+    ])
+
+    assert original_name_matches(db, BUCKET, "报告") == {DIGEST_PATH: "壁画修复报告.pdf"}
+    assert original_name_matches(db, BUCKET, None) == {}
+
+
+def test_keyword_matches_original_name_of_content_addressed_object():
+    original_names = {DIGEST_PATH: "壁画修复报告.pdf"}
+
+    assert archive_file_matcher("报告", None, None, original_names)(file(DIGEST_PATH))
+    assert not archive_file_matcher("报告", None, None)(file(DIGEST_PATH))
+    assert archive_file_matcher("报告", None, None, original_names)(file("2025/报告.pdf"))
+    assert not archive_file_matcher("报告", "image", None, original_names)(file(DIGEST_PATH))
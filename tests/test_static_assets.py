@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+"""
+前端静态资源：带内容哈希的文件名识别
+
+作者: 王梓涵
+邮箱: wangzh011031@163.com
+时间: 2025年
+"""
+import pytest
+
+from app.utils.static_assets import HASHED_NAME_RE
+
+
+@pytest.mark.parametrize("name", [
+    "index-4f3a2b1c.js",
+    "index-BxY_3k9a.css",
+    "Dashboard-a-B3c_d9.js",
+    "index-4f3a2b1c.js.map",
+    "index.4f3a2b1c.js",
+])
+def test_hashed_names(name):
+    assert HASHED_NAME_RE.search(name)
+
+
+@pytest.mark.parametrize("name", [
+    "my-document.pdf",
+    "chunk-vendors.js",
+    "favicon.ico",
+    "logo-dark.svg",
+    "index-4f3a2b1.js",
+    "index-4f3a2b1c9.js",
+    "photo-2025.jpg",
+])
+def test_ordinary_names(name):
+    assert not HASHED_NAME_RE.search(name)
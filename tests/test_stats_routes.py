@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+"""
+统计与甘特图接口：超出可表示范围的日期返回400
+
+作者: 王梓涵
+邮箱: wangzh011031@163.com
+时间: 2025年
+"""
+from datetime import date
+
+import pytest
+from fastapi import HTTPException
+
+from app.api.gantt_routes import get_gantt_tasks
+from app.api.stats_routes import get_timeseries
+from app.services.timeseries_service import buckets
+
+
+def test_end_at_date_max_is_rejected():
+    with pytest.raises(HTTPException) as e:
+        get_timeseries(entity="workflows", granularity="day", start=date(9999, 12, 1), end=date.max,
+                       current_user=None, db=None)
+    assert e.value.status_code == 400
+
+
+@pytest.mark.parametrize("granularity", ["day", "week", "month"])
+def test_last_bucket_before_date_max_does_not_overflow(granularity):
+    starts = buckets(date(9999, 12, 1), date.max, granularity)
+    assert starts[-1] < date.max
+
+
+def test_gantt_end_at_date_max_is_rejected():
+    with pytest.raises(HTTPException) as e:
+        get_gantt_tasks(request=None, start=None, end=date.max, offset=0, limit=200, current_user=None, db=None)
+    assert e.value.status_code == 400
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+存储后端：接口约束、Content-Type 保存与直传地址签名
+
+作者: 王梓涵
+邮箱: wangzh011031@163.com
+时间: 2025年
+"""
+from datetime import datetime, timedelta, timezone
+from urllib.parse import parse_qs, urlsplit
+import io
+import os
+
+import pytest
+from minio import signer
+from minio.commonconfig import ComposeSource
+from minio.credentials import Credentials
+from minio.datatypes import Part
+
+from app.core.storage_backends import (
+    LocalBackend, MemoryBackend, MinioBackend, StorageBackend, presign_v4, verify_signature
+)
+
+BUCKET = "repair-system"
+
+
+@pytest.fixture(params=["local", "memory"])
+def backend(request, tmp_path):
+    client = LocalBackend(str(tmp_path)) if request.param == "local" else MemoryBackend()
+    client.make_bucket(BUCKET)
+    return client
+
+
+def put(client, name, data=b"data", content_type="application/octet-stream"):
+    return client.put_object(BUCKET, name, io.BytesIO(data), len(data), content_type=content_type)
+
+
+def test_backend_interface_is_abstract():
+    class Partial(StorageBackend):
+        def bucket_exists(self, bucket_name):
+            return True
+
+    with pytest.raises(TypeError):
+        StorageBackend()
+    with pytest.raises(TypeError):
+        Partial()
+    assert not MinioBackend.__abstractmethods__
+
+
+def test_put_object_keeps_content_type(backend):
+    # 扩展名推断不出的类型必须来自写入时的记录
+    put(backend, "2025/06/01/scan.bin", content_type="image/x-custom")
+
+    assert backend.stat_object(BUCKET, "2025/06/01/scan.bin").content_type == "image/x-custom"
+    reader = backend.get_object(BUCKET, "2025/06/01/scan.bin")
+    try:
+        assert reader.headers["Content-Type"] == "image/x-custom"
+        assert reader.read() == b"data"
+    finally:
+        reader.close()
+
+
+def test_multipart_upload_keeps_content_type(backend):
+    upload_id = backend._create_multipart_upload(BUCKET, "big.bin", {"Content-Type": "video/mp4"})
+    etag = backend._upload_part(BUCKET, "big.bin", b"part", None, upload_id, 1)
+    backend._complete_multipart_upload(BUCKET, "big.bin", upload_id, [Part(1, etag)])
+
+    assert backend.stat_object(BUCKET, "big.bin").content_type == "video/mp4"
+
+
+def test_compose_copies_first_source_content_type(backend):
+    put(backend, "tmp/upload", content_type="application/pdf")
+    backend.compose_object(BUCKET, "sha256/ab/abcd.bin", [ComposeSource(BUCKET, "tmp/upload")])
+
+    assert backend.stat_object(BUCKET, "sha256/ab/abcd.bin").content_type == "application/pdf"
+
+
+def test_local_overwrite_and_remove_update_record(tmp_path):
+    client = LocalBackend(str(tmp_path))
+    client.make_bucket(BUCKET)
+    put(client, "a/b/file.bin", content_type="text/plain")
+    put(client, "a/b/file.bin", content_type="application/json")
+    assert client.stat_object(BUCKET, "a/b/file.bin").content_type == "application/json"
+
+    client.remove_object(BUCKET, "a/b/file.bin")
+    assert not os.path.exists(tmp_path / ".meta" / BUCKET / "a")
+    assert [obj.object_name for obj in client.list_objects(BUCKET, recursive=True)] == []
+
+
+def test_local_files_without_record_guess_from_extension(tmp_path):
+    client = LocalBackend(str(tmp_path))
+    client.make_bucket(BUCKET)
+    (tmp_path / BUCKET / "photo.png").write_bytes(b"png")
+
+    assert client.stat_object(BUCKET, "photo.png").content_type == "image/png"
+
+
+def test_local_put_signature_binds_content_type(monkeypatch):
+    url = LocalBackend.presigned_put_object(None, BUCKET, "a.png", timedelta(minutes=5), content_type="image/png")
+    query = parse_qs(urlsplit(url).query)
+    expires, signature = int(query["expires"][0]), query["signature"][0]
+
+    assert verify_signature("PUT", BUCKET, "a.png", expires, signature, "image/png")
+    assert not verify_signature("PUT", BUCKET, "a.png", expires, signature, "text/html")
+    assert not verify_signature("PUT", BUCKET, "a.png", expires, signature)
+
+
+def test_presign_v4_matches_minio_for_host_only():
+    url = urlsplit("https://minio.example.com/bucket/a.png")
+    credentials = Credentials("access", "secret")
+    date = datetime(2025, 6, 1, 12, 0, tzinfo=timezone.utc)
+
+    assert presign_v4("PUT", url, "us-east-1", credentials, date, 600, {}) == \
+        signer.presign_v4("PUT", url, "us-east-1", credentials, date, 600)
+
+
+def test_minio_put_url_signs_content_type():
+    client = MinioBackend("minio.example.com", region="us-east-1", http_client=None)
+    query = parse_qs(urlsplit(client.presigned_put_object(BUCKET, "a.png", timedelta(minutes=5),
+                                                          content_type="image/png")).query)
+
+    assert query["X-Amz-SignedHeaders"] == ["content-type;host"]
+    unbound = parse_qs(urlsplit(client.presigned_put_object(BUCKET, "a.png", timedelta(minutes=5))).query)
+    assert unbound["X-Amz-SignedHeaders"] == ["host"]
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""
+孤儿对象清理：引用收集与可清理对象划分
+
+作者: 王梓涵
+邮箱: wangzh011031@163.com
+时间: 2025年
+"""
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+import os
+
+import pytest
+from minio.datatypes import Object
+
+from app.core.config import settings
+from app.models import Evaluation, Form, KnowledgeSystemFile, RollbackRequest
+from app.services.storage_gc_service import StorageGarbageCollector
+from app.utils.archive_tree import ArchiveTree
+from app.utils.image_thumbnails import local_derived_key
+from app.utils.image_tiles import derived_key
+
+BUCKET = "repair-system"
+NOW = datetime(2025, 6, 1, tzinfo=timezone.utc)
+OLD = NOW - timedelta(days=10)
+CUTOFF = NOW - timedelta(days=1)
+
+
+def obj(name, modified=OLD, size=10):
+    return Object(BUCKET, name, last_modified=modified, size=size)
+
+
+def plan(objects, referenced=(), tracked=None, local_keys=None, owned=True):
+    result = {"scanned": 0}
+    sources, temporary, derived, retained = StorageGarbageCollector._plan(
+        objects, BUCKET, owned, set(referenced), set(), tracked or {}, local_keys, CUTOFF, result
+    )
+    orphans = [name for key, items in derived.items() if key not in retained for name, _ in items]
+    return [name for name, _ in sources], [name for name, _ in temporary], orphans
+
+
+class FakeQuery:
+    """按查询的第一列返回预置的行，并记录过滤条件"""
+
+    def __init__(self, rows, criteria):
+        self.rows = rows
+        self.criteria = criteria
+
+    def filter(self, *criteria):
+        self.criteria.extend(criteria)
+        return self
+
+    def yield_per(self, _):
+        return self
+
+    def __iter__(self):
+        return iter(self.rows)
+
+
+class FakeSession:
+    def __init__(self, rows):
+        self.rows = rows
+        self.criteria = []
+
+    def query(self, *columns):
+        return FakeQuery(self.rows.get(columns[0].class_, []), self.criteria)
+
+
+def test_referenced_includes_soft_deleted_records():
+    storage = SimpleNamespace(
+        parse_file_url=lambda url: (BUCKET, url.rsplit("/", 1)[1]) if url.startswith("/files/") else None
+    )
+    db = FakeSession({
+        Form: [('["/files/a.jpg"]', [{"url": "/files/b.jpg", "sha256": "ab" * 32}], None, "/files/c.pdf", None)],
+        Evaluation: [("/files/d.pdf",)],
+        RollbackRequest: [("/files/e.pdf",)],
+        KnowledgeSystemFile: [("/files/f.docx",)],
+    })
+
+    referenced, digests = StorageGarbageCollector(storage)._referenced(db)
+
+    assert referenced == {(BUCKET, name) for name in ("a.jpg", "b.jpg", "c.pdf", "d.pdf", "e.pdf", "f.docx")}
+    assert digests == {"ab" * 32}
+    assert not any("deleted_at" in str(criterion) for criterion in db.criteria)
+
+
+def test_unreferenced_expired_objects_are_collected():
+    sources, temporary, _ = plan([obj("a.jpg"), obj("b.jpg", modified=NOW), obj("tmp/x"), obj("tmp/y", modified=NOW)])
+    assert sources == ["a.jpg"]
+    assert temporary == ["tmp/x"]
+
+
+def test_referenced_objects_are_kept():
+    sources, _, _ = plan([obj("a.jpg")], referenced=[(BUCKET, "a.jpg")])
+    assert sources == []
+
+
+def test_ref_counted_objects_are_kept_in_owned_bucket():
+    sources, _, _ = plan([obj("a.jpg"), obj("b.jpg")], tracked={"a.jpg": (None, 1), "b.jpg": (None, 0)})
+    assert sources == ["b.jpg"]
+
+
+def test_other_buckets_only_collect_tracked_objects():
+    objects = [obj("manual.pdf"), obj("uploaded.pdf"), obj("live.pdf")]
+    tracked = {"uploaded.pdf": (None, 0), "live.pdf": (None, 2)}
+    sources, _, _ = plan(objects, tracked=tracked, owned=False)
+    assert sources == ["uploaded.pdf"]
+
+
+def test_derived_files_follow_their_source():
+    kept = derived_key(BUCKET, "kept.jpg")
+    gone = derived_key(BUCKET, "gone.jpg")
+    objects = [
+        obj("kept.jpg", modified=NOW),
+        obj(f"derived/{kept}/thumbs/256.webp"),
+        obj(f"derived/{gone}/thumbs/256.webp"),
+    ]
+    _, _, orphans = plan(objects)
+    assert orphans == [f"derived/{gone}/thumbs/256.webp"]
+
+
+def test_local_thumbnails_are_collected_only_when_stale():
+    live = local_derived_key("img/a.jpg", 2, 10)
+    stale = local_derived_key("img/a.jpg", 1, 10)
+    objects = [obj(f"derived/{live}/thumbs/256.webp"), obj(f"derived/{stale}/thumbs/256.webp")]
+
+    assert plan(objects, local_keys={live})[2] == [f"derived/{stale}/thumbs/256.webp"]
+    # 无法得知本地文件现状、或不在默认存储桶时一律保留
+    assert plan(objects, local_keys=None)[2] == []
+    assert plan(objects, local_keys={live}, owned=False)[2] == []
+
+
+def test_local_keys_match_thumbnail_route(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "WORK_ARCHIVE_SNAPSHOT", "")
+    monkeypatch.setattr(settings, "WORK_ARCHIVE_WATCH", False)
+    (tmp_path / "img" / "sub").mkdir(parents=True)
+    image = tmp_path / "img" / "sub" / "a.jpg"
+    image.write_bytes(b"jpeg")
+    (tmp_path / "img" / "notes.txt").write_text("text")
+
+    keys = StorageGarbageCollector._local_keys(ArchiveTree(tmp_path, {"img": tmp_path / "img"}))
+
+    st = os.stat(image)
+    assert keys == {local_derived_key("img/sub/a.jpg", st.st_mtime_ns, st.st_size)}
+
+
+@pytest.mark.parametrize("name", ["sha256/ab/" + "ab" * 32 + ".jpg", "2025/06/01/a.jpg"])
+def test_retained_source_keeps_legacy_digest_directory(name):
+    digest = "cd" * 32
+    objects = [obj(name, modified=NOW), obj(f"derived/{digest}/pyramid.dzi")]
+    _, _, orphans = plan(objects, tracked={name: (digest, 1)})
+    assert orphans == []
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""
+上传会话服务：Redis命令不在事件循环线程中执行
+
+作者: 王梓涵
+邮箱: wangzh011031@163.com
+时间: 2025年
+"""
+import asyncio
+import json
+import threading
+
+import pytest
+
+from app.services.upload_session_service import (
+    MAX_SINGLE_PUT_SIZE, PRESIGNED_KEY, SESSION_KEY, UploadSessionError, UploadSessionService
+)
+
+
+class FakeRedis:
+    """内存中的Redis，记录执行命令的线程"""
+
+    def __init__(self):
+        self.data = {}
+        self.threads = set()
+
+    def _record(self):
+        self.threads.add(threading.get_ident())
+
+    def get(self, key):
+        self._record()
+        return self.data.get(key)
+
+    def set(self, key, value, ex=None, nx=False, keepttl=False):
+        self._record()
+        if nx and key in self.data:
+            return None
+        self.data[key] = value
+        return True
+
+    def delete(self, *keys):
+        self._record()
+        for key in keys:
+            self.data.pop(key, None)
+
+
+@pytest.fixture
+def redis():
+    return FakeRedis()
+
+
+@pytest.fixture
+def service(redis):
+    return UploadSessionService(redis, storage=None)
+
+
+def run(coro):
+    loop_thread = {}
+
+    async def main():
+        loop_thread["ident"] = threading.get_ident()
+        return await coro
+
+    result = asyncio.run(main())
+    return result, loop_thread["ident"]
+
+
+def test_get_session_reads_redis_off_the_event_loop(service, redis):
+    redis.data[SESSION_KEY.format("s1")] = json.dumps({"session_id": "s1", "user_id": 7})
+
+    session, loop_ident = run(service.get_session("s1", 7))
+
+    assert session["session_id"] == "s1"
+    assert redis.threads and loop_ident not in redis.threads
+
+
+def test_get_session_checks_owner(service, redis):
+    redis.data[SESSION_KEY.format("s1")] = json.dumps({"session_id": "s1", "user_id": 7})
+
+    with pytest.raises(UploadSessionError) as e:
+        run(service.get_session("s1", 8))
+    assert e.value.status_code == 403
+
+
+def test_discard_presigned_upload_runs_off_the_event_loop(service, redis):
+    redis.data[PRESIGNED_KEY.format("t1")] = "{}"
+
+    _, loop_ident = run(service.discard_presigned_upload("t1"))
+
+    assert PRESIGNED_KEY.format("t1") not in redis.data
+    assert loop_ident not in redis.threads
+
+
+def test_presigned_put_is_capped_at_single_put_limit(service, redis):
+    with pytest.raises(UploadSessionError) as e:
+        run(service.create_presigned_upload(7, "scan.tif", "image/tiff", MAX_SINGLE_PUT_SIZE + 1,
+                                            "knowledge-files", 50 * MAX_SINGLE_PUT_SIZE))
+    assert e.value.status_code == 413
+    assert "断点续传" in str(e.value)
+    assert not redis.data
+
+
+class FakeStorage:
+    def __init__(self, stat):
+        self.stat = stat
+        self.deleted = []
+
+    async def stat_object(self, object_name, bucket_name=None):
+        return self.stat
+
+    async def delete_objects(self, stored):
+        self.deleted.extend(item["object_name"] for item in stored)
+
+
+def test_presigned_upload_with_other_content_type_is_rejected(redis):
+    ticket = {"ticket_id": "t1", "user_id": 7, "filename": "a.png", "content_type": "image/png", "size": 3,
+              "max_size": 10, "object_name": "2025/06/01/a.png", "bucket": "repair-system"}
+    redis.data[PRESIGNED_KEY.format("t1")] = json.dumps(ticket)
+    storage = FakeStorage({"size": 3, "etag": "abc", "content_type": "text/html"})
+    service = UploadSessionService(redis, storage)
+
+    with pytest.raises(UploadSessionError) as e:
+        run(service.verify_presigned_upload("t1", 7))
+    assert e.value.status_code == 415
+    assert storage.deleted == ["2025/06/01/a.png"]
+    assert PRESIGNED_KEY.format("t1") not in redis.data
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""
+工作档案：本地目录浏览接口由目录缓存应答
+
+作者: 王梓涵
+邮箱: wangzh011031@163.com
+时间: 2025年
+"""
+import asyncio
+import json
+import os
+
+import pytest
+from fastapi import FastAPI
+
+from app.api import router
+from app.api import work_archive
+from app.core.config import settings
+from app.utils import archive_tree as archive_tree_module
+from app.utils.archive_tree import ArchiveTree
+from benchmarks.asgi_client import request
+
+# 早于扫描时间，目录缓存不会因同一时间粒度内的修改而重新扫描
+OLD_MTIME = 1_700_000_000
+
+
+@pytest.fixture
+def app():
+    app = FastAPI()
+    app.include_router(router)
+    return app
+
+
+@pytest.fixture
+def archive(tmp_path, monkeypatch):
+    for rel in ("img", "img/2024", "doc"):
+        (tmp_path / rel).mkdir()
+    (tmp_path / "img" / "a.png").write_bytes(b"png")
+    (tmp_path / "img" / "2024" / "b.tif").write_bytes(b"tif")
+    for rel in ("img/2024", "img", "doc"):
+        os.utime(tmp_path / rel, (OLD_MTIME, OLD_MTIME))
+
+    roots = {"doc": tmp_path / "doc", "img": tmp_path / "img"}
+    monkeypatch.setattr(settings, "WORK_ARCHIVE_SNAPSHOT", "")
+    monkeypatch.setattr(settings, "WORK_ARCHIVE_WATCH", False)
+    monkeypatch.setattr(settings, "WORK_ARCHIVE_CHECK_INTERVAL", 3600)
+    monkeypatch.setattr(settings, "WORK_ARCHIVE_CACHE_TTL", 3600)
+    monkeypatch.setattr(work_archive, "PROJECT_ROOT", tmp_path)
+    monkeypatch.setattr(work_archive, "ALLOWED_ROOTS", roots)
+    monkeypatch.setattr(work_archive, "archive_tree", ArchiveTree(tmp_path, roots))
+    return tmp_path
+
+
+def get(app, path):
+    status, _, body = asyncio.run(request(app, "GET", path))
+    assert status == 200, body
+    return json.loads(body)
+
+
+def forbid_disk_access(monkeypatch):
+    def scandir(path):
+        raise AssertionError(f"目录缓存未命中: {path}")
+    monkeypatch.setattr(archive_tree_module.os, "scandir", scandir)
+
+
+def test_folders_are_answered_from_cache(app, archive, monkeypatch):
+    expected = [
+        {"label": "doc", "key": "doc", "children": []},
+        {"label": "img", "key": "img", "children": [{"label": "2024", "key": "img/2024", "children": []}]},
+    ]
+    assert get(app, "/api/work-archive/folders") == expected
+
+    forbid_disk_access(monkeypatch)
+    assert get(app, "/api/work-archive/folders") == expected
+
+
+def test_folder_click_is_answered_from_cache(app, archive, monkeypatch):
+    first = get(app, "/api/work-archive/files?dir=img")
+    assert [item["path"] for item in first] == ["img/a.png"]
+
+    forbid_disk_access(monkeypatch)
+    assert get(app, "/api/work-archive/files?dir=img") == first
+
+
+def test_knowledge_archive_routes_do_not_shadow_local_archive(app):
+    paths = {route.path: route.endpoint for route in app.routes}
+
+    assert paths["/api/work-archive/folders"] is work_archive.get_folders
+    assert paths["/api/work-archive/files"] is work_archive.get_files
+    assert "/api/knowledge-archive/folders" in paths
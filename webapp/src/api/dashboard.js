@@ -15,6 +15,16 @@ export const getDashboardData = async () => {
   return request('/dashboard')
 }
 
+/**
+ * 获取甘特图任务
+ * @param {Object} params - 查询参数（start、end 为日期，offset、limit 用于分页）
+ * @returns {Promise<Object>} { total, offset, limit, items }
+ */
+export const getGanttTasks = async (params = {}) => {
+  const queryString = new URLSearchParams(params).toString()
+  return request(queryString ? `/gantt/tasks?${queryString}` : '/gantt/tasks')
+}
+
 /**
  * 获取工作流列表
  * @param {Object} params - 查询参数